@@ -15,7 +15,9 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import datetime
 import inspect
+import json
 import math
 import time
 from xml.dom import minidom
@@ -27,6 +29,7 @@ import webob
 from nova import exception
 from nova.openstack.common import jsonutils
 from nova.openstack.common import log as logging
+from nova.openstack.common import timeutils
 from nova import wsgi
 
 
@@ -319,11 +322,27 @@ class DictSerializer(ActionDispatcher):
         return ""
 
 
+def _json_default(value):
+    """Convert a value the json module cannot encode natively.
+
+    View builders return primitives apart from the odd datetime, so
+    handle those here; everything else goes through to_primitive().
+    """
+
+    if isinstance(value, datetime.datetime):
+        return timeutils.strtime(value)
+    return jsonutils.to_primitive(value)
+
+
+# Shared encoder; primitive values never reach _json_default()
+_JSON_ENCODER = json.JSONEncoder(default=_json_default)
+
+
 class JSONDictSerializer(DictSerializer):
     """Default JSON request body serialization."""
 
     def default(self, data):
-        return jsonutils.dumps(data)
+        return _JSON_ENCODER.encode(data)
 
 
 class XMLDictSerializer(DictSerializer):
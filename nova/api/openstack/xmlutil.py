@@ -27,6 +27,11 @@ XMLNS_V11 = 'http://docs.openstack.org/compute/api/v1.1'
 XMLNS_COMMON_V10 = 'http://docs.openstack.org/common/api/v1.0'
 XMLNS_ATOM = 'http://www.w3.org/2005/Atom'
 
+# Bumped whenever a template element which is part of a compiled
+# serialization plan is modified; plans from older generations are
+# discarded and recompiled on next use.
+_plan_generation = 0
+
 
 def validate_schema(xml, schema_name):
     if isinstance(xml, str):
@@ -165,6 +170,9 @@ class TemplateElement(object):
         if subselector is not None and not callable(subselector):
             subselector = Selector(subselector)
 
+        self._compiled = False
+        self._plans = {}
+
         self.tag = tag
         self.selector = selector
         self.subselector = subselector
@@ -207,6 +215,14 @@ class TemplateElement(object):
         else:
             return self._children[idx]
 
+    def _modified(self):
+        """Invalidate compiled plans if this element is part of one."""
+
+        global _plan_generation
+
+        if self._compiled:
+            _plan_generation += 1
+
     def append(self, elem):
         """Append a child to the element."""
 
@@ -217,6 +233,7 @@ class TemplateElement(object):
         if elem.tag in self._childmap:
             raise KeyError(elem.tag)
 
+        self._modified()
         self._children.append(elem)
         self._childmap[elem.tag] = elem
 
@@ -238,6 +255,7 @@ class TemplateElement(object):
             elemlist.append(elem)
 
         # Update the children
+        self._modified()
         self._children.extend(elemlist)
         self._childmap.update(elemmap)
 
@@ -251,6 +269,7 @@ class TemplateElement(object):
         if elem.tag in self._childmap:
             raise KeyError(elem.tag)
 
+        self._modified()
         self._children.insert(idx, elem)
         self._childmap[elem.tag] = elem
 
@@ -264,6 +283,7 @@ class TemplateElement(object):
         if elem.tag not in self._childmap or self._childmap[elem.tag] != elem:
             raise ValueError(_('element is not a child'))
 
+        self._modified()
         self._children.remove(elem)
         del self._childmap[elem.tag]
 
@@ -295,6 +315,7 @@ class TemplateElement(object):
         elif not callable(value):
             value = Selector(value)
 
+        self._modified()
         self.attrib[key] = value
 
     def keys(self):
@@ -452,9 +473,11 @@ class TemplateElement(object):
         if value is not None and not callable(value):
             value = Selector(value)
 
+        self._modified()
         self._text = value
 
     def _text_del(self):
+        self._modified()
         self._text = None
 
     text = property(_text_get, _text_set, _text_del)
@@ -512,6 +535,134 @@ def SubTemplateElement(parent, tag, attrib=None, selector=None,
     return elem
 
 
+def _is_plain(elem):
+    """Determine whether an element renders with the stock methods."""
+
+    cls = type(elem)
+    return (cls.render.im_func is TemplateElement.render.im_func and
+            cls._render.im_func is TemplateElement._render.im_func and
+            cls.apply.im_func is TemplateElement.apply.im_func)
+
+
+class CompiledElement(object):
+    """A template element merged with its siblings.
+
+    Merging the children of a template element with those of its
+    siblings (the corresponding elements of slave templates) only
+    depends on the templates, not on the object being serialized, so
+    it is done once here rather than for every datum.  Elements using
+    the stock rendering methods are additionally rendered directly,
+    with the text and attribute selectors of all siblings flattened
+    into a single list.
+    """
+
+    def __init__(self, siblings):
+        """Compile a list of sibling template elements.
+
+        :param siblings: The TemplateElement instances to compile;
+                         the first one is rendered, the others are
+                         applied to it as patches.
+        """
+
+        self.elem = siblings[0]
+        self.patches = siblings[1:]
+        self.direct = all(_is_plain(sib) for sib in siblings)
+        self.texts = [sib.text for sib in siblings if sib.text is not None]
+        self.attrs = []
+        for sib in siblings:
+            self.attrs.extend(sib.attrib.items())
+            sib._compiled = True
+
+        # Merge the children, in the same order as Template._serialize
+        # historically did
+        self.children = []
+        seen = set()
+        for idx, sibling in enumerate(siblings):
+            for child in sibling:
+                if child.tag in seen:
+                    continue
+                seen.add(child.tag)
+
+                nieces = [child]
+                for sib in siblings[idx + 1:]:
+                    if child.tag in sib:
+                        nieces.append(sib[child.tag])
+                self.children.append(CompiledElement(nieces))
+
+    def _make_element(self, parent, datum, nsmap):
+        """Create an etree.Element for a datum and fill it in."""
+
+        tagname = self.elem.tag
+        if callable(tagname):
+            tagname = tagname(datum)
+
+        if parent is None:
+            elem = etree.Element(tagname, nsmap=nsmap)
+        else:
+            elem = etree.SubElement(parent, tagname, nsmap=nsmap)
+
+        if datum is None:
+            return elem
+
+        for text in self.texts:
+            elem.text = unicode(text(datum))
+        for key, value in self.attrs:
+            try:
+                elem.set(key, unicode(value(datum, True)))
+            except KeyError:
+                # Attribute has no value, so don't include it
+                pass
+
+        return elem
+
+    def _render(self, parent, obj, nsmap):
+        """Equivalent of TemplateElement.render() for plain elements."""
+
+        data = None if obj is None else self.elem.selector(obj)
+
+        if not self.elem.will_render(data):
+            return []
+        elif data is None:
+            return [(self._make_element(parent, None, nsmap), None)]
+
+        if not isinstance(data, list):
+            data = [data]
+        elif parent is None:
+            raise ValueError(_('root element selecting a list'))
+
+        subselector = self.elem.subselector
+        elems = []
+        for datum in data:
+            if subselector is not None:
+                datum = subselector(datum)
+            elems.append((self._make_element(parent, datum, nsmap), datum))
+
+        return elems
+
+    def render(self, parent, obj, nsmap=None):
+        """Render an object and all its children.
+
+        Returns a list of two-item tuples, as TemplateElement.render()
+        does.
+
+        :param parent: The parent for the etree.Element instances.
+        :param obj: The object to render.
+        :param nsmap: An optional namespace dictionary to attach to
+                      the etree.Element instances.
+        """
+
+        if self.direct:
+            elems = self._render(parent, obj, nsmap)
+        else:
+            elems = self.elem.render(parent, obj, self.patches, nsmap)
+
+        for child in self.children:
+            for elem, datum in elems:
+                child.render(elem, datum)
+
+        return elems
+
+
 class Template(object):
     """Represent a template."""
 
@@ -545,27 +696,7 @@ class Template(object):
                       rendered.
         """
 
-        # First step, render the element
-        elems = siblings[0].render(parent, obj, siblings[1:], nsmap)
-
-        # Now, recurse to all child elements
-        seen = set()
-        for idx, sibling in enumerate(siblings):
-            for child in sibling:
-                # Have we handled this child already?
-                if child.tag in seen:
-                    continue
-                seen.add(child.tag)
-
-                # Determine the child's siblings
-                nieces = [child]
-                for sib in siblings[idx + 1:]:
-                    if child.tag in sib:
-                        nieces.append(sib[child.tag])
-
-                # Now we recurse for every data element
-                for elem, datum in elems:
-                    self._serialize(elem, datum, nieces)
+        elems = CompiledElement(siblings).render(parent, obj, nsmap)
 
         # Return the first element; at the top level, this will be the
         # root element
@@ -605,12 +736,32 @@ class Template(object):
         if self.root is None:
             return None
 
-        # Get the siblings and nsmap of the root element
-        siblings = self._siblings()
+        # Get the compiled siblings and nsmap of the root element
+        compiled = self.compile()
         nsmap = self._nsmap()
 
         # Form the element tree
-        return self._serialize(None, obj, siblings, nsmap)
+        elems = compiled.render(None, obj, nsmap)
+        if elems:
+            return elems[0][0]
+
+    def compile(self):
+        """Return the compiled form of the template.
+
+        Compiled templates are cached on the root element, keyed by
+        the root elements of the other siblings (i.e., the attached
+        slave templates), so that copies of a master template with the
+        same set of extensions attached share the same CompiledElement.
+        """
+
+        siblings = self._siblings()
+        key = tuple(siblings[1:])
+        cached = siblings[0]._plans.get(key)
+        if cached is None or cached[0] != _plan_generation:
+            cached = (_plan_generation, CompiledElement(siblings))
+            siblings[0]._plans[key] = cached
+
+        return cached[1]
 
     def _siblings(self):
         """Hook method for computing root siblings.
@@ -50,6 +50,21 @@ CONF = cfg.CONF
 CONF.register_opts(cell_manager_opts, group='cells')
 
 
+def _responses_in_time(responses):
+    """Leave out the cells that did not respond to a broadcast call in
+    time, so that the caller gets the results of the other cells.
+    """
+    for response in responses:
+        value = response.value
+        if isinstance(value, (tuple, list)):
+            value = value[1]
+        if response.failure and isinstance(value, exception.CellTimeout):
+            LOG.warn(_("Leaving out cell %(cell_name)s, it did not "
+                       "respond in time"), {'cell_name': response.cell_name})
+            continue
+        yield response
+
+
 class CellsManager(manager.Manager):
     """The nova-cells manager class.  This class defines RPC
     methods that the local cell may call.  This class is NOT used for
@@ -65,7 +80,7 @@ class CellsManager(manager.Manager):
 
     Scheduling requests get passed to the scheduler class.
     """
-    RPC_API_VERSION = '1.4'
+    RPC_API_VERSION = '1.5'
 
     def __init__(self, *args, **kwargs):
         # Mostly for tests.
@@ -223,6 +238,10 @@ class CellsManager(manager.Manager):
         """Update bandwidth usage at top level cell."""
         self.msg_runner.bw_usage_update_at_top(ctxt, bw_update_info)
 
+    def bw_usage_update_many_at_top(self, ctxt, usages):
+        """Update several bandwidth usages at top level cell."""
+        self.msg_runner.bw_usage_update_many_at_top(ctxt, usages)
+
     def sync_instances(self, ctxt, project_id, updated_since, deleted):
         """Force a sync of all instances, potentially by project_id,
         and potentially since a certain date/time.
@@ -235,7 +254,7 @@ class CellsManager(manager.Manager):
         responses = self.msg_runner.service_get_all(ctxt, filters)
         ret_services = []
         # 1 response per cell.  Each response is a list of services.
-        for response in responses:
+        for response in _responses_in_time(responses):
             services = response.value_or_raise()
             for service in services:
                 cells_utils.add_cell_to_service(service, response.cell_name)
@@ -288,7 +307,7 @@ class CellsManager(manager.Manager):
         # 1 response per cell.  Each response is a list of task log
         # entries.
         ret_task_logs = []
-        for response in responses:
+        for response in _responses_in_time(responses):
             task_logs = response.value_or_raise()
             for task_log in task_logs:
                 cells_utils.add_cell_to_task_log(task_log,
@@ -313,7 +332,7 @@ class CellsManager(manager.Manager):
         # 1 response per cell.  Each response is a list of compute_node
         # entries.
         ret_nodes = []
-        for response in responses:
+        for response in _responses_in_time(responses):
             nodes = response.value_or_raise()
             for node in nodes:
                 cells_utils.add_cell_to_compute_node(node,
@@ -325,7 +344,7 @@ class CellsManager(manager.Manager):
         """Return compute node stats totals from all cells."""
         responses = self.msg_runner.compute_node_stats(ctxt)
         totals = {}
-        for response in responses:
+        for response in _responses_in_time(responses):
             data = response.value_or_raise()
             for key, val in data.iteritems():
                 totals.setdefault(key, 0)
@@ -23,6 +23,7 @@ reached.
 The interface into this module is the MessageRunner class.
 """
 import sys
+import time
 
 from eventlet import queue
 
@@ -50,7 +51,13 @@ cell_messaging_opts = [
             help='Maximum number of hops for cells routing.'),
     cfg.StrOpt('scheduler',
             default='nova.cells.scheduler.CellsScheduler',
-            help='Cells scheduler to use')]
+            help='Cells scheduler to use'),
+    cfg.FloatOpt('broadcast_timeout_margin',
+            default=2.0,
+            help='Seconds less than the cell it came from that a cell '
+                 'waits for the responses to a broadcast call.  This '
+                 'leaves it time to send back the responses it got when '
+                 'some of its neighbor cells do not respond in time.')]
 
 CONF = cfg.CONF
 CONF.import_opt('name', 'nova.cells.opts', group='cells')
@@ -226,7 +233,8 @@ class _BaseMessage(object):
         wait_time = CONF.cells.call_timeout
         try:
             for x in xrange(num_responses):
-                json_responses = self.resp_queue.get(timeout=wait_time)
+                _sender, json_responses, _final = self.resp_queue.get(
+                        timeout=wait_time)
                 responses.extend(json_responses)
         except queue.Empty:
             raise exception.CellTimeout()
@@ -235,7 +243,7 @@ class _BaseMessage(object):
         return responses
 
     def _send_json_responses(self, json_responses, neighbor_only=False,
-            fanout=False):
+            fanout=False, final=True):
         """Send list of responses to this message.  Responses passed here
         are JSON-ified.  Targeted messages have a single response while
         Broadcast messages may have multiple responses.
@@ -248,6 +256,9 @@ class _BaseMessage(object):
         to the neighbor cell, not the original requester.  Broadcast
         messages get aggregated at each hop, so neighbor_only will be
         True for those messages.
+
+        If 'final' is False, more responses will follow.  Only neighbor
+        cells that asked for their responses to be streamed get these.
         """
         if not self.need_response:
             return
@@ -259,6 +270,8 @@ class _BaseMessage(object):
         direction = self.direction == 'up' and 'down' or 'up'
         response_kwargs = {'orig_message': self.to_json(),
                            'responses': json_responses}
+        if not final:
+            response_kwargs['final'] = False
         target_cell = _response_cell_name_from_path(self.routing_path,
                 neighbor_only=neighbor_only)
         response = self.msg_runner._create_response_message(self.ctxt,
@@ -438,13 +451,20 @@ class _BroadcastMessage(_BaseMessage):
     message_type = 'broadcast'
 
     def __init__(self, msg_runner, ctxt, method_name, method_kwargs,
-            direction, run_locally=True, **kwargs):
+            direction, run_locally=True, timeout=None,
+            stream_responses=False, **kwargs):
         super(_BroadcastMessage, self).__init__(msg_runner, ctxt,
                 method_name, method_kwargs, direction, **kwargs)
         # The local cell creating this message has the option
         # to be able to process the message locally or not.
         self.run_locally = run_locally
         self.is_broadcast = True
+        # Seconds we have to wait for responses from neighbor cells, and
+        # whether the cell that sent us this message wants the responses
+        # as they arrive rather than all at once.
+        self.timeout = timeout
+        self.stream_responses = stream_responses
+        self.base_attrs_to_json.extend(['timeout', 'stream_responses'])
 
     def _get_next_hops(self):
         """Set the next hops and return the number of hops.  The next
@@ -462,14 +482,54 @@ class _BroadcastMessage(_BaseMessage):
         for cell in target_cells:
             cell.send_message(self)
 
-    def _send_json_responses(self, json_responses):
+    def _send_json_responses(self, json_responses, final=True):
         """Responses to broadcast messages always need to go to the
         neighbor cell from which we received this message.  That
         cell aggregates the responses and makes sure to forward them
         to the correct source.
         """
         return super(_BroadcastMessage, self)._send_json_responses(
-                json_responses, neighbor_only=True, fanout=True)
+                json_responses, neighbor_only=True, fanout=True,
+                final=final)
+
+    def _wait_for_neighbor_responses(self, next_hops, deadline, stream):
+        """Wait until deadline (a time.time() value) for all neighbor
+        cells to be done sending their responses.  If 'stream' is True,
+        responses are forwarded to the neighbor cell we got this message
+        from as they arrive, otherwise they are returned.
+
+        Each neighbor cell still not done in time gets a CellTimeout
+        failure response, returned along with the responses received.
+        """
+        waiting = set(cell.name for cell in next_hops)
+        responses = []
+        try:
+            while waiting:
+                try:
+                    sender, json_responses, final = self.resp_queue.get(
+                            timeout=max(0, deadline - time.time()))
+                except queue.Empty:
+                    break
+                if final:
+                    waiting.discard(sender)
+                if not stream:
+                    responses.extend(json_responses)
+                elif json_responses:
+                    self._send_json_responses(json_responses, final=False)
+        finally:
+            self._cleanup_response_queue()
+        for cell_name in waiting:
+            LOG.warn(_("Timed out waiting for responses to %(method_name)s "
+                       "from cell %(cell_name)s"),
+                     {'method_name': self.method_name,
+                      'cell_name': cell_name})
+            try:
+                raise exception.CellTimeout()
+            except exception.CellTimeout:
+                response = Response(self.routing_path + _PATH_CELL_SEP +
+                                    cell_name, sys.exc_info(), True)
+            responses.append(response.to_json())
+        return responses
 
     def process(self):
         """Process a broadcast message.  This is called for all cells
@@ -481,9 +541,16 @@ class _BroadcastMessage(_BaseMessage):
 
         If responses from all cells are required, each hop creates an
         eventlet queue and waits for responses from its immediate
-        neighbor cells.  All responses are then aggregated into a
-        single list and are returned to the neighbor cell until the
-        source is reached.
+        neighbor cells.  Each hop forwards the responses to the neighbor
+        cell it got the message from as they arrive, until the source is
+        reached.  Cells that did not stream their responses (older
+        ones) aggregate them into a single list instead.
+
+        Every hop gives its neighbor cells broadcast_timeout_margin
+        seconds less than it has to respond, starting from call_timeout
+        at the source.  The responses of the cells that did respond in
+        time are returned along with a CellTimeout failure for each of
+        the others.
 
         When the source is reached, a list of Response instances are
         returned to the caller.
@@ -511,6 +578,15 @@ class _BroadcastMessage(_BaseMessage):
 
         # We'll need to aggregate all of the responses (from ourself
         # and our sibling cells) into 1 response
+        if self.timeout is None:
+            self.timeout = CONF.cells.call_timeout
+        # Counted from now, running locally takes from the time left to
+        # the neighbor cells rather than adding to it
+        deadline = time.time() + self.timeout
+        stream = self.stream_responses and not self.source_is_us()
+        self.timeout = max(0, self.timeout -
+                              CONF.cells.broadcast_timeout_margin)
+        self.stream_responses = True
         try:
             self._setup_response_queue()
             self._send_to_cells(next_hops)
@@ -523,27 +599,18 @@ class _BroadcastMessage(_BaseMessage):
             self._cleanup_response_queue()
             return self._send_response_from_exception(exc_info)
 
+        responses = []
         if self.run_locally:
             # Run locally and store the Response.
-            local_response = self._process_locally()
-        else:
-            local_response = None
+            responses.append(self._process_locally().to_json())
+            if stream:
+                self._send_json_responses(responses, final=False)
+                responses = []
 
-        try:
-            remote_responses = self._wait_for_json_responses(
-                    num_responses=len(next_hops))
-        except Exception as exc:
-            # Error waiting for responses, most likely a timeout.
-            # Send a single response back with the failure.
-            exc_info = sys.exc_info()
-            err_str = _("Error waiting for responses from neighbor cells: "
-                        "%(exc)s")
-            LOG.exception(err_str, locals())
-            return self._send_response_from_exception(exc_info)
-
-        if local_response:
-            remote_responses.append(local_response.to_json())
-        return self._send_json_responses(remote_responses)
+        responses.extend(self._wait_for_neighbor_responses(next_hops,
+                                                           deadline,
+                                                           stream))
+        return self._send_json_responses(responses)
 
 
 class _ResponseMessage(_TargetedMessage):
@@ -623,9 +690,12 @@ class _ResponseMessageMethods(_BaseMessageMethods):
     the source of a 'call'.  All we do is stuff the response into the
     eventlet queue to signal the caller that's waiting.
     """
-    def parse_responses(self, message, orig_message, responses):
+    def parse_responses(self, message, orig_message, responses, final=True):
+        # Responses to broadcast messages come from the neighbor cell
+        # that starts the routing path
+        sender = message.routing_path.split(_PATH_CELL_SEP)[0]
         self.msg_runner._put_response(message.response_uuid,
-                responses)
+                responses, sender=sender, final=final)
 
 
 class _TargetedMessageMethods(_BaseMessageMethods):
@@ -693,7 +763,8 @@ class _TargetedMessageMethods(_BaseMessageMethods):
         """A parent cell has told us to send our capacity, so let's
         do so.
         """
-        self.msg_runner.tell_parents_our_capacities(message.ctxt)
+        self.msg_runner.tell_parents_our_capacities(message.ctxt,
+                                                    force=True)
 
     def service_get_by_compute_host(self, message, host_name):
         """Return the service entry for a compute host."""
@@ -819,6 +890,19 @@ class _BroadcastMessageMethods(_BaseMessageMethods):
             return
         self.db.bw_usage_update(message.ctxt, **bw_update_info)
 
+    def bw_usage_update_many_at_top(self, message, usages, **kwargs):
+        """Update several bandwidth usages in the DB if we're a top level
+        cell.
+        """
+        if not self._at_the_top():
+            return
+        for usage in usages:
+            for key in ('start_period', 'last_refreshed'):
+                if isinstance(usage.get(key), basestring):
+                    usage[key] = timeutils.parse_strtime(usage[key])
+        self.db.bw_usage_update_many(message.ctxt, usages,
+                                     update_cells=False)
+
     def _sync_instance(self, ctxt, instance):
         if instance['deleted']:
             self.msg_runner.instance_destroy_at_top(ctxt, instance)
@@ -910,6 +994,8 @@ class MessageRunner(object):
         self.response_queues = {}
         self.methods_by_type = {}
         self.our_name = CONF.cells.name
+        # Capacities last sent to each parent cell
+        self.sent_capacities = {}
         for msg_type, cls in _CELL_MESSAGE_TYPE_TO_METHODS_CLS.iteritems():
             self.methods_by_type[msg_type] = cls(self)
 
@@ -924,17 +1010,19 @@ class MessageRunner(object):
         fn = getattr(methods, message.method_name)
         return fn(message, **message.method_kwargs)
 
-    def _put_response(self, response_uuid, response):
+    def _put_response(self, response_uuid, response, sender=None,
+                      final=True):
         """Put a response into a response queue.  This is called when
         a _ResponseMessage is processed in the cell that initiated a
-        'call' to another cell.
+        'call' to another cell.  'sender' is the name of the cell that
+        sent the response and 'final' tells whether it has more to send.
         """
         resp_queue = self.response_queues.get(response_uuid)
         if not resp_queue:
             # Response queue is gone.  We must have restarted or we
             # received a response after our timeout period.
             return
-        resp_queue.put(response)
+        resp_queue.put((sender, response, final))
 
     def _setup_response_queue(self, message):
         """Set up an eventlet queue to use to wait for replies.
@@ -1019,13 +1107,21 @@ class MessageRunner(object):
                     method_kwargs, 'up', cell, fanout=True)
             message.process()
 
-    def tell_parents_our_capacities(self, ctxt):
-        """Send our capacities to parent cells."""
+    def tell_parents_our_capacities(self, ctxt, force=False):
+        """Send our capacities to parent cells.  Unless force is set,
+        a parent cell only gets them if they changed since they were
+        last sent to it.
+        """
         parent_cells = self.state_manager.get_parent_cells()
         if not parent_cells:
             return
         my_cell_info = self.state_manager.get_my_state()
         capacities = self.state_manager.get_our_capacities()
+        if not force:
+            parent_cells = [cell for cell in parent_cells
+                    if self.sent_capacities.get(cell.name) != capacities]
+            if not parent_cells:
+                return
         LOG.debug(_("Updating parents with our capacities: %(capacities)s"),
                 locals())
         method_kwargs = {'cell_name': my_cell_info.name,
@@ -1034,6 +1130,7 @@ class MessageRunner(object):
             message = _TargetedMessage(self, ctxt, 'update_capacities',
                     method_kwargs, 'up', cell, fanout=True)
             message.process()
+            self.sent_capacities[cell.name] = capacities
 
     def schedule_run_instance(self, ctxt, target_cell, host_sched_kwargs):
         """Called by the scheduler to tell a child cell to schedule
@@ -1093,6 +1190,13 @@ class MessageRunner(object):
                                     'up', run_locally=False)
         message.process()
 
+    def bw_usage_update_many_at_top(self, ctxt, usages):
+        """Update several bandwidth usages at top level cell."""
+        message = _BroadcastMessage(self, ctxt, 'bw_usage_update_many_at_top',
+                                    dict(usages=usages),
+                                    'up', run_locally=False)
+        message.process()
+
     def sync_instances(self, ctxt, project_id, updated_since, deleted):
         """Force a sync of all instances, potentially by project_id,
         and potentially since a certain date/time.
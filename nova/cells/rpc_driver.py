@@ -16,8 +16,13 @@
 """
 Cells RPC Communication Driver
 """
+import collections
+
+import eventlet
+
 from nova.cells import driver
 from nova.openstack.common import cfg
+from nova.openstack.common import log as logging
 from nova.openstack.common import rpc
 from nova.openstack.common.rpc import dispatcher as rpc_dispatcher
 from nova.openstack.common.rpc import proxy as rpc_proxy
@@ -27,7 +32,17 @@ cell_rpc_driver_opts = [
                    default='cells.intercell',
                    help="Base queue name to use when communicating between "
                         "cells.  Various topics by message type will be "
-                        "appended to this.")]
+                        "appended to this."),
+        cfg.FloatOpt('rpc_driver_batch_window',
+                     default=0.0,
+                     help="Seconds to hold instance and bandwidth usage "
+                          "updates going to a cell, to send them in a "
+                          "single message.  Only the last update of an "
+                          "instance is sent.  0 sends updates right away.  "
+                          "Every neighbor cell must understand batches of "
+                          "messages (cell to cell RPC API 1.1).")]
+
+LOG = logging.getLogger(__name__)
 
 CONF = cfg.CONF
 CONF.register_opts(cell_rpc_driver_opts, group='cells')
@@ -36,6 +51,24 @@ CONF.import_opt('call_timeout', 'nova.cells.opts', group='cells')
 _CELL_TO_CELL_RPC_API_VERSION = '1.0'
 
 
+def _instance_update_key(message):
+    return message.method_kwargs['instance']['uuid']
+
+
+def _bw_usage_update_key(message):
+    info = message.method_kwargs['bw_update_info']
+    return (info['uuid'], info['mac'], str(info['start_period']))
+
+
+# Broadcast messages that can wait to be sent in a batch, with how to
+# tell which of them a later message supersedes (None if none)
+_BATCHED_METHODS = {
+    'instance_update_at_top': _instance_update_key,
+    'bw_usage_update_at_top': _bw_usage_update_key,
+    'bw_usage_update_many_at_top': None,
+}
+
+
 class CellsRPCDriver(driver.BaseCellsDriver):
     """Driver for cell<->cell communication via RPC.  This is used to
     setup the RPC consumers as well as to send a message to another cell.
@@ -54,6 +87,8 @@ class CellsRPCDriver(driver.BaseCellsDriver):
         self.rpc_connections = []
         self.intercell_rpcapi = InterCellRPCAPI(
                 self.BASE_RPC_API_VERSION)
+        # Messages waiting to be sent, by cell name
+        self._batches = {}
 
     def _start_consumer(self, dispatcher, topic):
         """Start an RPC consumer."""
@@ -91,9 +126,57 @@ class CellsRPCDriver(driver.BaseCellsDriver):
             conn.close()
 
     def send_message_to_cell(self, cell_state, message):
-        """Use the IntercellRPCAPI to send a message to a cell."""
+        """Use the IntercellRPCAPI to send a message to a cell.
+
+        Updates that can wait are batched if rpc_driver_batch_window is
+        set.  Any other message first sends the batch for the cell, so
+        that messages arrive in the order they were sent.
+        """
+        window = CONF.cells.rpc_driver_batch_window
+        if window > 0 and self._batchable(message):
+            self._add_to_batch(cell_state, message, window)
+            return
+        self._send_batch(cell_state.name)
         self.intercell_rpcapi.send_message_to_cell(cell_state, message)
 
+    @staticmethod
+    def _batchable(message):
+        return (message.message_type == 'broadcast' and
+                not message.need_response and
+                message.method_name in _BATCHED_METHODS)
+
+    def _add_to_batch(self, cell_state, message, window):
+        batch = self._batches.get(cell_state.name)
+        if batch is None:
+            batch = {'cell_state': cell_state, 'ctxt': message.ctxt,
+                     'fanout': message.fanout,
+                     'messages': collections.OrderedDict()}
+            self._batches[cell_state.name] = batch
+            eventlet.spawn_after(window, self._send_batch, cell_state.name)
+        get_key = _BATCHED_METHODS[message.method_name]
+        if get_key is None:
+            key = (message.method_name, message.uuid)
+        else:
+            key = (message.method_name, get_key(message))
+        # A later update supersedes the earlier one, and takes its place
+        # after the messages batched in between
+        batch['messages'].pop(key, None)
+        batch['messages'][key] = message.to_json()
+
+    def _send_batch(self, cell_name):
+        batch = self._batches.pop(cell_name, None)
+        if batch is None:
+            return
+        try:
+            self.intercell_rpcapi.send_messages_to_cell(
+                    batch['cell_state'], batch['ctxt'], batch['fanout'],
+                    batch['messages'].values())
+        except Exception:
+            LOG.exception(_("Failed to send %(count)d messages to cell "
+                            "%(cell_name)s"),
+                          {'count': len(batch['messages']),
+                           'cell_name': cell_name})
+
 
 class InterCellRPCAPI(rpc_proxy.RpcProxy):
     """Client side of the Cell<->Cell RPC API.
@@ -102,6 +185,7 @@ class InterCellRPCAPI(rpc_proxy.RpcProxy):
 
     API version history:
         1.0 - Initial version.
+        1.1 - Added process_messages.
     """
     def __init__(self, default_version):
         super(InterCellRPCAPI, self).__init__(None, default_version)
@@ -141,6 +225,20 @@ class InterCellRPCAPI(rpc_proxy.RpcProxy):
             self.cast_to_server(ctxt, server_params,
                     rpc_message, topic=topic)
 
+    def send_messages_to_cell(self, cell_state, ctxt, fanout,
+                              json_messages):
+        """Send several broadcast messages to another cell at once."""
+        rpc_message = self.make_msg('process_messages',
+                                    messages=json_messages)
+        topic = '%s.broadcast' % CONF.cells.rpc_driver_queue_base
+        server_params = self._get_server_params_for_cell(cell_state)
+        if fanout:
+            self.fanout_cast_to_server(ctxt, server_params,
+                    rpc_message, topic=topic, version='1.1')
+        else:
+            self.cast_to_server(ctxt, server_params,
+                    rpc_message, topic=topic, version='1.1')
+
 
 class InterCellRPCDispatcher(object):
     """RPC Dispatcher to handle messages received from other cells.
@@ -151,6 +249,7 @@ class InterCellRPCDispatcher(object):
     logic is defined by the message class in the messaging module.
     """
     BASE_RPC_API_VERSION = _CELL_TO_CELL_RPC_API_VERSION
+    RPC_API_VERSION = '1.1'
 
     def __init__(self, msg_runner):
         """Init the Intercell RPC Dispatcher."""
@@ -163,3 +262,15 @@ class InterCellRPCDispatcher(object):
         """
         message = self.msg_runner.message_from_json(message)
         message.process()
+
+    def process_messages(self, _ctxt, messages):
+        """We received a batch of messages from another cell.  Process
+        them in order; one failing does not keep the others from being
+        processed.
+        """
+        for json_message in messages:
+            try:
+                self.process_message(_ctxt, json_message)
+            except Exception:
+                LOG.exception(_("Failed to process a message from a "
+                                "batch"))
@@ -46,6 +46,7 @@ class CellsAPI(rpc_proxy.RpcProxy):
         1.3 - Adds task_log_get_all()
         1.4 - Adds compute_node_get(), compute_node_get_all(), and
               compute_node_stats()
+        1.5 - Adds bw_usage_update_many_at_top()
     '''
     BASE_RPC_API_VERSION = '1.0'
 
@@ -133,6 +134,15 @@ class CellsAPI(rpc_proxy.RpcProxy):
         self.cast(ctxt, self.make_msg('bw_usage_update_at_top',
                                       bw_update_info=bw_update_info))
 
+    def bw_usage_update_many_at_top(self, ctxt, usages):
+        """Broadcast upwards that several bw_usages were updated."""
+        if not CONF.cells.enable:
+            return
+        usages_p = jsonutils.to_primitive(usages)
+        self.cast(ctxt, self.make_msg('bw_usage_update_many_at_top',
+                                      usages=usages_p),
+                  version='1.5')
+
     def instance_info_cache_update_at_top(self, ctxt, instance_info_cache):
         """Broadcast up that an instance's info_cache has changed."""
         if not CONF.cells.enable:
@@ -94,6 +94,79 @@ class CellState(object):
         return "Cell '%s' (%s)" % (self.name, me)
 
 
+def _free_units(tot, per_inst):
+    if per_inst:
+        return max(0, int(tot / per_inst))
+    else:
+        return 0
+
+
+class CellCapacity(object):
+    """Free RAM and disk of the compute nodes of a cell, and the number
+    of instances of each size that fit in them.
+
+    The numbers are kept between updates: an update only counts again
+    the compute nodes whose free room changed, once per distinct RAM and
+    disk size of the instance types rather than once per instance type.
+    Everything is counted again when the sizes change.
+    """
+
+    def __init__(self):
+        # (free_ram_mb, free_disk_mb) by compute host
+        self.free_by_host = {}
+        self.total_ram_mb_free = 0
+        self.total_disk_mb_free = 0
+        # Units that fit, by RAM and disk size in MB
+        self.ram_units = {}
+        self.disk_units = {}
+
+    def _count(self, free, sign):
+        free_ram_mb, free_disk_mb = free
+        self.total_ram_mb_free += sign * free_ram_mb
+        self.total_disk_mb_free += sign * free_disk_mb
+        for size in self.ram_units:
+            self.ram_units[size] += sign * _free_units(free_ram_mb, size)
+        for size in self.disk_units:
+            self.disk_units[size] += sign * _free_units(free_disk_mb, size)
+
+    def update(self, free_by_host, instance_types):
+        """Update the numbers with the free room of every compute host,
+        a dictionary of (free_ram_mb, free_disk_mb) tuples by host.
+        """
+        ram_sizes = set()
+        disk_sizes = set()
+        for instance_type in instance_types:
+            ram_sizes.add(instance_type['memory_mb'])
+            disk_sizes.add((instance_type['root_gb'] +
+                            instance_type['ephemeral_gb']) * 1024)
+        if (ram_sizes != set(self.ram_units) or
+                disk_sizes != set(self.disk_units)):
+            self.free_by_host = {}
+            self.total_ram_mb_free = 0
+            self.total_disk_mb_free = 0
+            self.ram_units = dict.fromkeys(ram_sizes, 0)
+            self.disk_units = dict.fromkeys(disk_sizes, 0)
+
+        for host, free in self.free_by_host.items():
+            if free_by_host.get(host) != free:
+                self._count(free, -1)
+                del self.free_by_host[host]
+        for host, free in free_by_host.iteritems():
+            if host not in self.free_by_host:
+                self._count(free, 1)
+                self.free_by_host[host] = free
+
+    def get_capacities(self):
+        def _units_by_mb(units):
+            return dict((str(size), count)
+                        for size, count in units.iteritems())
+
+        return {'ram_free': {'total_mb': self.total_ram_mb_free,
+                             'units_by_mb': _units_by_mb(self.ram_units)},
+                'disk_free': {'total_mb': self.total_disk_mb_free,
+                              'units_by_mb': _units_by_mb(self.disk_units)}}
+
+
 def sync_from_db(f):
     """Use as a decorator to wrap methods that use cell information to
     make sure they sync the latest information from the DB periodically.
@@ -116,6 +189,7 @@ class CellStateManager(base.Base):
         self.parent_cells = {}
         self.child_cells = {}
         self.last_cell_db_check = datetime.datetime.min
+        self.capacity = CellCapacity()
         self._cell_db_sync()
         my_cell_capabs = {}
         for cap in CONF.cells.capabilities:
@@ -191,64 +265,30 @@ class CellStateManager(base.Base):
 
         Units are in MB, so 122880 = (10 + 100) * 1024.
 
+        The free disk of a compute node is its disk_available_least when
+        it reports one.  Only the compute nodes whose free room changed
+        since the last update are counted again, see CellCapacity.
+
         NOTE(comstud): Perhaps we should only report a single number
         available per instance_type.
         """
-
         compute_hosts = {}
-
-        def _get_compute_hosts():
-            compute_nodes = self.db.compute_node_get_all(context)
-            for compute in compute_nodes:
-                service = compute['service']
-                if not service or service['disabled']:
-                    continue
-                host = service['host']
-                compute_hosts[host] = {
-                        'free_ram_mb': compute['free_ram_mb'],
-                        'free_disk_mb': compute['free_disk_gb'] * 1024}
-
-        _get_compute_hosts()
-        if not compute_hosts:
-            self.my_cell_state.update_capacities({})
-            return
-
-        ram_mb_free_units = {}
-        disk_mb_free_units = {}
-        total_ram_mb_free = 0
-        total_disk_mb_free = 0
-
-        def _free_units(tot, per_inst):
-            if per_inst:
-                return max(0, int(tot / per_inst))
-            else:
-                return 0
-
-        def _update_from_values(values, instance_type):
-            memory_mb = instance_type['memory_mb']
-            disk_mb = (instance_type['root_gb'] +
-                    instance_type['ephemeral_gb']) * 1024
-            ram_mb_free_units.setdefault(str(memory_mb), 0)
-            disk_mb_free_units.setdefault(str(disk_mb), 0)
-            ram_free_units = _free_units(compute_values['free_ram_mb'],
-                    memory_mb)
-            disk_free_units = _free_units(compute_values['free_disk_mb'],
-                    disk_mb)
-            ram_mb_free_units[str(memory_mb)] += ram_free_units
-            disk_mb_free_units[str(disk_mb)] += disk_free_units
+        for compute in self.db.compute_node_get_all(context):
+            service = compute['service']
+            if not service or service['disabled']:
+                continue
+            free_disk_gb = compute.get('disk_available_least')
+            if free_disk_gb is None:
+                free_disk_gb = compute['free_disk_gb']
+            compute_hosts[service['host']] = (compute['free_ram_mb'],
+                                              free_disk_gb * 1024)
 
         instance_types = self.db.instance_type_get_all(context)
-
-        for compute_values in compute_hosts.values():
-            total_ram_mb_free += compute_values['free_ram_mb']
-            total_disk_mb_free += compute_values['free_disk_mb']
-            for instance_type in instance_types:
-                _update_from_values(compute_values, instance_type)
-
-        capacities = {'ram_free': {'total_mb': total_ram_mb_free,
-                                   'units_by_mb': ram_mb_free_units},
-                      'disk_free': {'total_mb': total_disk_mb_free,
-                                    'units_by_mb': disk_mb_free_units}}
+        self.capacity.update(compute_hosts, instance_types)
+        if compute_hosts:
+            capacities = self.capacity.get_capacities()
+        else:
+            capacities = {}
         self.my_cell_state.update_capacities(capacities)
 
     @lockutils.synchronized('cell-db-sync', 'nova-')
@@ -560,13 +560,18 @@ class API(base.Base):
                 check_policy(context, 'create:forced_host', {})
                 filter_properties['force_hosts'] = [forced_host]
 
-            for i in xrange(num_instances):
-                options = base_options.copy()
-                instance = self.create_db_entry_for_new_instance(
-                        context, instance_type, image, options,
-                        security_group, block_device_mapping)
-                instances.append(instance)
-                instance_uuids.append(instance['uuid'])
+            if num_instances == 1:
+                instances.append(self.create_db_entry_for_new_instance(
+                        context, instance_type, image, base_options.copy(),
+                        security_group, block_device_mapping))
+            else:
+                instances.extend(self.create_db_entries_for_new_instances(
+                        context, instance_type, image,
+                        [base_options.copy() for i in xrange(num_instances)],
+                        security_group, block_device_mapping))
+            instance_uuids.extend(instance['uuid'] for instance in instances)
+
+            for instance in instances:
                 self._validate_bdm(context, instance)
                 # send a state update notification for the initial create to
                 # show it going from non-existent to BUILDING
@@ -855,6 +860,38 @@ class API(base.Base):
 
         return instance
 
+    def create_db_entries_for_new_instances(self, context, instance_type,
+            image, base_options_list, security_group, block_device_mapping):
+        """Create the entries in the DB for several new instances at once.
+
+        Same as create_db_entry_for_new_instance for each of the options
+        in base_options_list, except that the instances are created with
+        one DB call.  The instances are destroyed again if their block
+        device mappings cannot be created.
+        """
+        instances = []
+        for base_options in base_options_list:
+            instance = self._populate_instance_for_create(base_options,
+                    image, security_group)
+            self._populate_instance_names(instance)
+            self._populate_instance_shutdown_terminate(instance, image,
+                                                       block_device_mapping)
+            instances.append(instance)
+
+        self.security_group_api.ensure_default(context)
+        instances = self.db.instance_create_many(context, instances)
+
+        try:
+            for instance in instances:
+                self._populate_instance_for_bdm(context, instance,
+                        instance_type, image, block_device_mapping)
+        except Exception:
+            with excutils.save_and_reraise_exception():
+                for instance in instances:
+                    self.db.instance_destroy(context, instance['uuid'])
+
+        return instances
+
     def _check_create_policies(self, context, availability_zone,
             requested_networks, block_device_mapping):
         """Check policies for create()."""
@@ -1379,9 +1416,11 @@ class API(base.Base):
             uuids = set([r['instance_uuid'] for r in res])
             filters['uuid'] = uuids
 
+        # Only listed, stale instances from the replica will do
         return self.db.instance_get_all_by_filters(context, filters,
                                                    sort_key, sort_dir,
-                                                   limit=limit, marker=marker)
+                                                   limit=limit, marker=marker,
+                                                   use_slave=True)
 
     @wrap_check_policy
     @check_instance_state(vm_state=[vm_states.ACTIVE, vm_states.STOPPED])
@@ -0,0 +1,98 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Copies of the instances an operation updated.
+
+An operation on an instance usually updates it several times, and every
+update used to return the whole instance along with all of its joined
+fields. The cache keeps the copy returned by the last update made with a
+request context, so that the next update with the same context leaves out
+the fields it would not change and gets the instance back without its
+joined fields, which it takes from the cached copy instead. The network
+info cache and the fields an update changes are always returned.
+
+The cached copy may be older than the database row: the API and other
+services update instances too. It only ever makes an update smaller, it
+never decides whether an update is made, and the state fields, which are
+the ones changed behind the back of the compute manager, are always sent.
+
+The copies go away with the request context they were made with.
+"""
+
+import weakref
+
+from nova import db
+
+
+# Fields always sent, whatever their cached value
+ALWAYS_SENT = ('vm_state', 'task_state', 'power_state',
+               'expected_task_state', 'host', 'node')
+
+
+class InstanceCache(object):
+    """Instances last updated by each request context."""
+
+    def __init__(self):
+        self._instances = weakref.WeakKeyDictionary()
+
+    def get(self, context, instance_uuid):
+        """Return a copy of the cached instance, or None."""
+        instance = self._instances.get(context, {}).get(instance_uuid)
+        if instance is not None:
+            return dict(instance)
+
+    def set(self, context, instance):
+        """Cache a copy of an instance returned by an update."""
+        self._instances.setdefault(context, {})[instance['uuid']] = \
+            dict(instance)
+
+    def discard(self, context, instance_uuid):
+        self._instances.get(context, {}).pop(instance_uuid, None)
+
+    @staticmethod
+    def changes(instance, updates):
+        """Return the updates to send, given the cached instance.
+
+        Updates setting a field to its cached value are left out, unless
+        the field is one of ALWAYS_SENT. When that leaves nothing, all of
+        the updates are returned.
+        """
+        changes = dict((key, value) for key, value in updates.iteritems()
+                       if (key in ALWAYS_SENT or
+                           key not in instance or instance[key] != value))
+        return changes or dict(updates)
+
+    @staticmethod
+    def columns_to_join(updates):
+        """Return the joined fields an update has to return.
+
+        The network info cache is always returned, network calls made
+        between two updates may have changed it.
+        """
+        columns = ['info_cache']
+        if 'instance_type_id' in updates:
+            columns.extend(['instance_type', 'extra_specs'])
+        return columns
+
+    @staticmethod
+    def merge(instance, updated):
+        """Return an updated instance with the joined fields it lacks."""
+        result = dict(updated)
+        for key in db.INSTANCE_JOINED_FIELDS:
+            if key not in result and key in instance:
+                result[key] = instance[key]
+        return result
@@ -41,6 +41,7 @@ from eventlet import greenthread
 from nova import block_device
 from nova.cloudpipe import pipelib
 from nova import compute
+from nova.compute import instance_cache
 from nova.compute import instance_types
 from nova.compute import power_state
 from nova.compute import resource_tracker
@@ -56,6 +57,7 @@ from nova.image import glance
 from nova import manager
 from nova import network
 from nova.network import model as network_model
+from nova import notifications
 from nova.openstack.common import cfg
 from nova.openstack.common import excutils
 from nova.openstack.common import jsonutils
@@ -96,6 +98,12 @@ compute_opts = [
     cfg.IntOpt('live_migration_retry_count',
                default=30,
                help="Number of 1 second retries needed in live_migration"),
+    cfg.IntOpt('sync_power_state_chunk_size',
+               default=10,
+               help='Number of instances whose power state is asked to the '
+                    'hypervisor before their database records are read '
+                    'again to act on it. The smaller, the less they can '
+                    'change in between'),
     cfg.BoolOpt('resume_guests_state_on_host_boot',
                 default=False,
                 help='Whether to start guests that were running before the '
@@ -331,6 +339,7 @@ class ComputeManager(manager.SchedulerDependentManager):
         self.compute_rpcapi = compute_rpcapi.ComputeAPI()
         self.scheduler_rpcapi = scheduler_rpcapi.SchedulerAPI()
         self.conductor_api = conductor.API()
+        self._instance_cache = instance_cache.InstanceCache()
 
         super(ComputeManager, self).__init__(service_name="compute",
                                              *args, **kwargs)
@@ -352,11 +361,29 @@ class ComputeManager(manager.SchedulerDependentManager):
         return rt
 
     def _instance_update(self, context, instance_uuid, **kwargs):
-        """Update an instance in the database using kwargs as value."""
+        """Update an instance in the database using kwargs as value.
+
+        The instance returned is kept for the next updates made with the
+        same context: they leave out the fields they would not change,
+        and reuse its joined fields.
+        """
+        cached = self._instance_cache.get(context, instance_uuid)
+        try:
+            if cached is None:
+                instance_ref = self.conductor_api.instance_update(
+                    context, instance_uuid, **kwargs)
+            else:
+                kwargs = self._instance_cache.changes(cached, kwargs)
+                columns_to_join = self._instance_cache.columns_to_join(kwargs)
+                instance_ref = self._instance_cache.merge(
+                    cached, self.conductor_api.instance_update(
+                        context, instance_uuid,
+                        columns_to_join=columns_to_join, **kwargs))
+        except Exception:
+            with excutils.save_and_reraise_exception():
+                self._instance_cache.discard(context, instance_uuid)
+        self._instance_cache.set(context, instance_ref)
 
-        instance_ref = self.conductor_api.instance_update(context,
-                                                          instance_uuid,
-                                                          **kwargs)
         if (instance_ref['host'] == self.host and
             instance_ref['node'] in self.driver.get_available_nodes()):
 
@@ -3205,26 +3232,31 @@ class ComputeManager(manager.SchedulerDependentManager):
                 return
 
             refreshed = timeutils.utcnow()
+            uuids = list(set(bw_ctr['uuid'] for bw_ctr in bw_counters))
+            usages = self._get_bw_usages(context, uuids, start_time)
+            missing = set(bw_ctr['uuid'] for bw_ctr in bw_counters
+                          if (bw_ctr['uuid'], bw_ctr['mac_address'])
+                          not in usages)
+            prev_usages = {}
+            if missing:
+                prev_usages = self._get_bw_usages(context, list(missing),
+                                                  prev_time)
+
+            updates = []
             for bw_ctr in bw_counters:
-                # Allow switching of greenthreads between queries.
-                greenthread.sleep(0)
                 bw_in = 0
                 bw_out = 0
                 last_ctr_in = None
                 last_ctr_out = None
-                usage = self.conductor_api.bw_usage_get(context,
-                                                        bw_ctr['uuid'],
-                                                        start_time,
-                                                        bw_ctr['mac_address'])
+                key = (bw_ctr['uuid'], bw_ctr['mac_address'])
+                usage = usages.get(key)
                 if usage:
                     bw_in = usage['bw_in']
                     bw_out = usage['bw_out']
                     last_ctr_in = usage['last_ctr_in']
                     last_ctr_out = usage['last_ctr_out']
                 else:
-                    usage = self.conductor_api.bw_usage_get(
-                        context, bw_ctr['uuid'], prev_time,
-                        bw_ctr['mac_address'])
+                    usage = prev_usages.get(key)
                     if usage:
                         last_ctr_in = usage['last_ctr_in']
                         last_ctr_out = usage['last_ctr_out']
@@ -3243,40 +3275,58 @@ class ComputeManager(manager.SchedulerDependentManager):
                     else:
                         bw_out += (bw_ctr['bw_out'] - last_ctr_out)
 
-                self.conductor_api.bw_usage_update(context,
-                                                   bw_ctr['uuid'],
-                                                   bw_ctr['mac_address'],
-                                                   start_time,
-                                                   bw_in,
-                                                   bw_out,
-                                                   bw_ctr['bw_in'],
-                                                   bw_ctr['bw_out'],
-                                                   last_refreshed=refreshed)
+                updates.append(dict(uuid=bw_ctr['uuid'],
+                                    mac=bw_ctr['mac_address'],
+                                    start_period=start_time,
+                                    bw_in=bw_in,
+                                    bw_out=bw_out,
+                                    last_ctr_in=bw_ctr['bw_in'],
+                                    last_ctr_out=bw_ctr['bw_out'],
+                                    last_refreshed=refreshed))
+            if updates:
+                self.conductor_api.bw_usage_update_many(context, updates)
+            notifications.cache_bandwidth_usages(start_time, updates)
+
+    def _get_bw_usages(self, context, uuids, start_period):
+        """Return the bandwidth usages of instances keyed by uuid and mac."""
+        usages = self.conductor_api.bw_usage_get_by_uuids(context, uuids,
+                                                          start_period)
+        return dict(((usage['uuid'], usage['mac']), usage)
+                    for usage in usages)
 
     def _get_host_volume_bdms(self, context, host):
         """Return all block device mappings on a compute host."""
         compute_host_bdms = []
         instances = self.conductor_api.instance_get_all_by_host(context,
                                                                 self.host)
+        if not instances:
+            return compute_host_bdms
+
+        bdms_by_uuid = dict((instance['uuid'], []) for instance in instances)
+        bdms = self.conductor_api.\
+                block_device_mapping_get_all_by_instance_uuids(
+                    context, bdms_by_uuid.keys())
+        for bdm in self._get_volume_bdms(bdms):
+            bdms_by_uuid[bdm['instance_uuid']].append(bdm)
         for instance in instances:
-            instance_bdms = self._get_instance_volume_bdms(context, instance)
-            compute_host_bdms.append(dict(instance=instance,
-                                          instance_bdms=instance_bdms))
+            compute_host_bdms.append(dict(
+                instance=instance,
+                instance_bdms=bdms_by_uuid[instance['uuid']]))
 
         return compute_host_bdms
 
     def _update_volume_usage_cache(self, context, vol_usages, refreshed):
         """Updates the volume usage cache table with a list of stats."""
-        for usage in vol_usages:
-            # Allow switching of greenthreads between queries.
-            greenthread.sleep(0)
-            self.conductor_api.vol_usage_update(context, usage['volume'],
-                                                usage['rd_req'],
-                                                usage['rd_bytes'],
-                                                usage['wr_req'],
-                                                usage['wr_bytes'],
-                                                usage['instance'],
-                                                last_refreshed=refreshed)
+        usages = [dict(volume_id=usage['volume'],
+                       instance_uuid=usage['instance']['uuid'],
+                       rd_req=usage['rd_req'],
+                       rd_bytes=usage['rd_bytes'],
+                       wr_req=usage['wr_req'],
+                       wr_bytes=usage['wr_bytes'])
+                  for usage in vol_usages]
+        if usages:
+            self.conductor_api.vol_usage_update_many(context, usages,
+                                                     last_refreshed=refreshed)
 
     def _send_volume_usage_notifications(self, context, start_time):
         """Queries vol usage cache table and sends a vol usage notification."""
@@ -3343,9 +3393,11 @@ class ComputeManager(manager.SchedulerDependentManager):
 
         To sync power state data we make a DB call to get the number of
         virtual machines known by the hypervisor and if the number matches the
-        number of virtual machines known by the database, we proceed in a lazy
-        loop, one database record at a time, checking if the hypervisor has the
-        same power state as is in the database.
+        number of virtual machines known by the database, we ask the
+        hypervisor for the power state of each of them.  After every
+        sync_power_state_chunk_size of them, we re-read these records at once
+        and check if the hypervisor has the same power state as is in the
+        database.
 
         If the instance is not found on the hypervisor, but is in the database,
         then a stop() API will be called on the instance.
@@ -3360,8 +3412,8 @@ class ComputeManager(manager.SchedulerDependentManager):
             LOG.warn(_("Found %(num_db_instances)s in the database and "
                        "%(num_vm_instances)s on the hypervisor.") % locals())
 
+        pending = []
         for db_instance in db_instances:
-            db_power_state = db_instance['power_state']
             if db_instance['task_state'] is not None:
                 LOG.info(_("During sync_power_state the instance has a "
                            "pending task. Skip."), instance=db_instance)
@@ -3372,114 +3424,141 @@ class ComputeManager(manager.SchedulerDependentManager):
                 vm_power_state = vm_instance['state']
             except exception.InstanceNotFound:
                 vm_power_state = power_state.SHUTDOWN
-            # Note(maoy): the above get_info call might take a long time,
-            # for example, because of a broken libvirt driver.
-            # We re-query the DB to get the latest instance info to minimize
-            # (not eliminate) race condition.
-            u = self.conductor_api.instance_get_by_uuid(context,
-                                                        db_instance['uuid'])
-            db_power_state = u["power_state"]
-            vm_state = u['vm_state']
-            if self.host != u['host']:
-                # on the sending end of nova-compute _sync_power_state
-                # may have yielded to the greenthread performing a live
-                # migration; this in turn has changed the resident-host
-                # for the VM; However, the instance is still active, it
-                # is just in the process of migrating to another host.
-                # This implies that the compute source must relinquish
-                # control to the compute destination.
-                LOG.info(_("During the sync_power process the "
-                           "instance has moved from "
-                           "host %(src)s to host %(dst)s") %
-                           {'src': self.host,
-                            'dst': u['host']},
-                         instance=db_instance)
-                continue
-            elif u['task_state'] is not None:
-                # on the receiving end of nova-compute, it could happen
-                # that the DB instance already report the new resident
-                # but the actual VM has not showed up on the hypervisor
-                # yet. In this case, let's allow the loop to continue
-                # and run the state sync in a later round
-                LOG.info(_("During sync_power_state the instance has a "
-                           "pending task. Skip."), instance=db_instance)
+            pending.append((db_instance, vm_power_state))
+            if len(pending) >= CONF.sync_power_state_chunk_size:
+                self._sync_power_states_of(context, pending)
+                pending = []
+        if pending:
+            self._sync_power_states_of(context, pending)
+
+    def _sync_power_states_of(self, context, instances):
+        """Sync the power states of a list of (instance, vm_power_state)."""
+        # Note(maoy): the get_info calls of _sync_power_states might take a
+        # long time, for example, because of a broken libvirt driver.
+        # We re-query the DB to get the latest instance info to minimize
+        # (not eliminate) race condition.
+        current_instances = dict(
+            (instance['uuid'], instance) for instance in
+            self.conductor_api.instance_get_all_by_uuids(
+                context, [db_instance['uuid']
+                          for db_instance, _state in instances]))
+
+        for db_instance, vm_power_state in instances:
+            current = current_instances.get(db_instance['uuid'])
+            if current is None:
+                # The instance was deleted in the meantime
                 continue
-            if vm_power_state != db_power_state:
-                # power_state is always updated from hypervisor to db
-                self._instance_update(context,
-                                      db_instance['uuid'],
-                                      power_state=vm_power_state)
-                db_power_state = vm_power_state
-            # Note(maoy): Now resolve the discrepancy between vm_state and
-            # vm_power_state. We go through all possible vm_states.
-            if vm_state in (vm_states.BUILDING,
-                            vm_states.RESCUED,
-                            vm_states.RESIZED,
-                            vm_states.SUSPENDED,
-                            vm_states.PAUSED,
-                            vm_states.ERROR):
-                # TODO(maoy): we ignore these vm_state for now.
-                pass
-            elif vm_state == vm_states.ACTIVE:
-                # The only rational power state should be RUNNING
-                if vm_power_state in (power_state.SHUTDOWN,
+            self._sync_instance_power_state(context, db_instance,
+                                            vm_power_state, current)
+
+    def _sync_instance_power_state(self, context, db_instance, vm_power_state,
+                                   current):
+        """Align the power state of an instance with the hypervisor's.
+
+        current is the latest database record of db_instance.
+        """
+        db_power_state = current["power_state"]
+        vm_state = current['vm_state']
+        if self.host != current['host']:
+            # on the sending end of nova-compute _sync_power_state
+            # may have yielded to the greenthread performing a live
+            # migration; this in turn has changed the resident-host
+            # for the VM; However, the instance is still active, it
+            # is just in the process of migrating to another host.
+            # This implies that the compute source must relinquish
+            # control to the compute destination.
+            LOG.info(_("During the sync_power process the "
+                       "instance has moved from "
+                       "host %(src)s to host %(dst)s") %
+                       {'src': self.host,
+                        'dst': current['host']},
+                     instance=db_instance)
+            return
+        elif current['task_state'] is not None:
+            # on the receiving end of nova-compute, it could happen
+            # that the DB instance already report the new resident
+            # but the actual VM has not showed up on the hypervisor
+            # yet. In this case, let's allow the loop to continue
+            # and run the state sync in a later round
+            LOG.info(_("During sync_power_state the instance has a "
+                       "pending task. Skip."), instance=db_instance)
+            return
+        if vm_power_state != db_power_state:
+            # power_state is always updated from hypervisor to db
+            self._instance_update(context,
+                                  db_instance['uuid'],
+                                  power_state=vm_power_state)
+            db_power_state = vm_power_state
+        # Note(maoy): Now resolve the discrepancy between vm_state and
+        # vm_power_state. We go through all possible vm_states.
+        if vm_state in (vm_states.BUILDING,
+                        vm_states.RESCUED,
+                        vm_states.RESIZED,
+                        vm_states.SUSPENDED,
+                        vm_states.PAUSED,
+                        vm_states.ERROR):
+            # TODO(maoy): we ignore these vm_state for now.
+            pass
+        elif vm_state == vm_states.ACTIVE:
+            # The only rational power state should be RUNNING
+            if vm_power_state in (power_state.SHUTDOWN,
+                                  power_state.CRASHED):
+                LOG.warn(_("Instance shutdown by itself. Calling "
+                           "the stop API."), instance=db_instance)
+                try:
+                    # Note(maoy): here we call the API instead of
+                    # brutally updating the vm_state in the database
+                    # to allow all the hooks and checks to be performed.
+                    self.compute_api.stop(context, db_instance)
+                except Exception:
+                    # Note(maoy): there is no need to propagate the error
+                    # because the same power_state will be retrieved next
+                    # time and retried.
+                    # For example, there might be another task scheduled.
+                    LOG.exception(_("error during stop() in "
+                                    "sync_power_state."),
+                                  instance=db_instance)
+            elif vm_power_state == power_state.SUSPENDED:
+                LOG.warn(_("Instance is suspended unexpectedly. Calling "
+                           "the stop API."), instance=db_instance)
+                try:
+                    self.compute_api.stop(context, db_instance)
+                except Exception:
+                    LOG.exception(_("error during stop() in "
+                                    "sync_power_state."),
+                                  instance=db_instance)
+            elif vm_power_state == power_state.PAUSED:
+                # Note(maoy): a VM may get into the paused state not only
+                # because the user request via API calls, but also
+                # due to (temporary) external instrumentations.
+                # Before the virt layer can reliably report the reason,
+                # we simply ignore the state discrepancy. In many cases,
+                # the VM state will go back to running after the external
+                # instrumentation is done. See bug 1097806 for details.
+                LOG.warn(_("Instance is paused unexpectedly. Ignore."),
+                         instance=db_instance)
+        elif vm_state == vm_states.STOPPED:
+            if vm_power_state not in (power_state.NOSTATE,
+                                      power_state.SHUTDOWN,
                                       power_state.CRASHED):
-                    LOG.warn(_("Instance shutdown by itself. Calling "
-                               "the stop API."), instance=db_instance)
-                    try:
-                        # Note(maoy): here we call the API instead of
-                        # brutally updating the vm_state in the database
-                        # to allow all the hooks and checks to be performed.
-                        self.compute_api.stop(context, db_instance)
-                    except Exception:
-                        # Note(maoy): there is no need to propagate the error
-                        # because the same power_state will be retrieved next
-                        # time and retried.
-                        # For example, there might be another task scheduled.
-                        LOG.exception(_("error during stop() in "
-                                        "sync_power_state."),
-                                      instance=db_instance)
-                elif vm_power_state == power_state.SUSPENDED:
-                    LOG.warn(_("Instance is suspended unexpectedly. Calling "
-                               "the stop API."), instance=db_instance)
-                    try:
-                        self.compute_api.stop(context, db_instance)
-                    except Exception:
-                        LOG.exception(_("error during stop() in "
-                                        "sync_power_state."),
-                                      instance=db_instance)
-                elif vm_power_state == power_state.PAUSED:
-                    # Note(maoy): a VM may get into the paused state not only
-                    # because the user request via API calls, but also
-                    # due to (temporary) external instrumentations.
-                    # Before the virt layer can reliably report the reason,
-                    # we simply ignore the state discrepancy. In many cases,
-                    # the VM state will go back to running after the external
-                    # instrumentation is done. See bug 1097806 for details.
-                    LOG.warn(_("Instance is paused unexpectedly. Ignore."),
-                             instance=db_instance)
-            elif vm_state == vm_states.STOPPED:
-                if vm_power_state not in (power_state.NOSTATE,
-                                          power_state.SHUTDOWN,
-                                          power_state.CRASHED):
-                    LOG.warn(_("Instance is not stopped. Calling "
-                               "the stop API."), instance=db_instance)
-                    try:
-                        # Note(maoy): this assumes that the stop API is
-                        # idempotent.
-                        self.compute_api.stop(context, db_instance)
-                    except Exception:
-                        LOG.exception(_("error during stop() in "
-                                        "sync_power_state."),
-                                      instance=db_instance)
-            elif vm_state in (vm_states.SOFT_DELETED,
-                              vm_states.DELETED):
-                if vm_power_state not in (power_state.NOSTATE,
-                                          power_state.SHUTDOWN):
-                    # Note(maoy): this should be taken care of periodically in
-                    # _cleanup_running_deleted_instances().
-                    LOG.warn(_("Instance is not (soft-)deleted."),
-                             instance=db_instance)
+                LOG.warn(_("Instance is not stopped. Calling "
+                           "the stop API."), instance=db_instance)
+                try:
+                    # Note(maoy): this assumes that the stop API is
+                    # idempotent.
+                    self.compute_api.stop(context, db_instance)
+                except Exception:
+                    LOG.exception(_("error during stop() in "
+                                    "sync_power_state."),
+                                  instance=db_instance)
+        elif vm_state in (vm_states.SOFT_DELETED,
+                          vm_states.DELETED):
+            if vm_power_state not in (power_state.NOSTATE,
+                                      power_state.SHUTDOWN):
+                # Note(maoy): this should be taken care of periodically in
+                # _cleanup_running_deleted_instances().
+                LOG.warn(_("Instance is not (soft-)deleted."),
+                         instance=db_instance)
 
     @manager.periodic_task
     def _reclaim_queued_deletes(self, context):
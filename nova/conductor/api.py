@@ -32,6 +32,9 @@ conductor_opts = [
     cfg.StrOpt('manager',
                default='nova.conductor.manager.ConductorManager',
                help='full class name for the Manager for conductor'),
+    cfg.IntOpt('workers',
+               default=None,
+               help='Number of workers for OpenStack Conductor service'),
 ]
 conductor_group = cfg.OptGroup(name='conductor',
                                title='Conductor Options')
@@ -58,10 +61,16 @@ class LocalAPI(object):
     def ping(self, context, arg, timeout=None):
         return self._manager.ping(context, arg)
 
-    def instance_update(self, context, instance_uuid, **updates):
-        """Perform an instance update in the database."""
+    def instance_update(self, context, instance_uuid, columns_to_join=None,
+                        **updates):
+        """Perform an instance update in the database.
+
+        The joined fields that are not in columns_to_join are left out of
+        the instance returned, unless columns_to_join is None.
+        """
         return self._manager.instance_update(context, instance_uuid,
-                                             updates, 'compute')
+                                             updates, 'compute',
+                                             columns_to_join)
 
     def instance_get(self, context, instance_id):
         return self._manager.instance_get(context, instance_id)
@@ -75,6 +84,10 @@ class LocalAPI(object):
     def instance_get_all(self, context):
         return self._manager.instance_get_all(context)
 
+    def instance_get_all_by_uuids(self, context, instance_uuids):
+        return self._manager.instance_get_all_by_uuids(context,
+                                                       instance_uuids)
+
     def instance_get_all_by_host(self, context, host):
         return self._manager.instance_get_all_by_host(context, host)
 
@@ -170,6 +183,13 @@ class LocalAPI(object):
                                              last_ctr_in, last_ctr_out,
                                              last_refreshed)
 
+    def bw_usage_get_by_uuids(self, context, uuids, start_period):
+        return self._manager.bw_usage_get_by_uuids(context, uuids,
+                                                   start_period)
+
+    def bw_usage_update_many(self, context, usages):
+        return self._manager.bw_usage_update_many(context, usages)
+
     def get_backdoor_port(self, context, host):
         raise exc.InvalidRequest
 
@@ -206,6 +226,11 @@ class LocalAPI(object):
         return self._manager.block_device_mapping_get_all_by_instance(
             context, instance)
 
+    def block_device_mapping_get_all_by_instance_uuids(self, context,
+                                                       instance_uuids):
+        return self._manager.block_device_mapping_get_all_by_instance_uuids(
+            context, instance_uuids)
+
     def block_device_mapping_destroy(self, context, bdms):
         return self._manager.block_device_mapping_destroy(context, bdms=bdms)
 
@@ -233,6 +258,12 @@ class LocalAPI(object):
                                               instance, last_refreshed,
                                               update_totals)
 
+    def vol_usage_update_many(self, context, usages, last_refreshed=None,
+                              update_totals=False):
+        return self._manager.vol_usage_update_many(context, usages,
+                                                   last_refreshed,
+                                                   update_totals)
+
     def service_get_all(self, context):
         return self._manager.service_get_all_by(context)
 
@@ -347,10 +378,16 @@ class API(object):
     def ping(self, context, arg, timeout=None):
         return self.conductor_rpcapi.ping(context, arg, timeout)
 
-    def instance_update(self, context, instance_uuid, **updates):
-        """Perform an instance update in the database."""
+    def instance_update(self, context, instance_uuid, columns_to_join=None,
+                        **updates):
+        """Perform an instance update in the database.
+
+        The joined fields that are not in columns_to_join are left out of
+        the instance returned, unless columns_to_join is None.
+        """
         return self.conductor_rpcapi.instance_update(context, instance_uuid,
-                                                     updates, 'conductor')
+                                                     updates, 'conductor',
+                                                     columns_to_join)
 
     def instance_destroy(self, context, instance):
         return self.conductor_rpcapi.instance_destroy(context, instance)
@@ -365,6 +402,10 @@ class API(object):
     def instance_get_all(self, context):
         return self.conductor_rpcapi.instance_get_all(context)
 
+    def instance_get_all_by_uuids(self, context, instance_uuids):
+        return self.conductor_rpcapi.instance_get_all_by_uuids(context,
+                                                               instance_uuids)
+
     def instance_get_all_by_host(self, context, host):
         return self.conductor_rpcapi.instance_get_all_by_host(context, host)
 
@@ -469,6 +510,13 @@ class API(object):
             bw_in, bw_out, last_ctr_in, last_ctr_out,
             last_refreshed)
 
+    def bw_usage_get_by_uuids(self, context, uuids, start_period):
+        return self.conductor_rpcapi.bw_usage_get_by_uuids(context, uuids,
+                                                           start_period)
+
+    def bw_usage_update_many(self, context, usages):
+        return self.conductor_rpcapi.bw_usage_update_many(context, usages)
+
     #NOTE(mtreinish): This doesn't work on multiple conductors without any
     # topic calculation in conductor_rpcapi. So the host param isn't used
     # currently.
@@ -510,6 +558,12 @@ class API(object):
         return self.conductor_rpcapi.block_device_mapping_get_all_by_instance(
             context, instance)
 
+    def block_device_mapping_get_all_by_instance_uuids(self, context,
+                                                       instance_uuids):
+        rpcapi = self.conductor_rpcapi
+        return rpcapi.block_device_mapping_get_all_by_instance_uuids(
+            context, instance_uuids)
+
     def block_device_mapping_destroy(self, context, bdms):
         return self.conductor_rpcapi.block_device_mapping_destroy(context,
                                                                   bdms=bdms)
@@ -538,6 +592,12 @@ class API(object):
                                                       instance, last_refreshed,
                                                       update_totals)
 
+    def vol_usage_update_many(self, context, usages, last_refreshed=None,
+                              update_totals=False):
+        return self.conductor_rpcapi.vol_usage_update_many(context, usages,
+                                                           last_refreshed,
+                                                           update_totals)
+
     def service_get_all(self, context):
         return self.conductor_rpcapi.service_get_all_by(context)
 
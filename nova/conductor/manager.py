@@ -16,6 +16,7 @@
 
 from nova.compute import api as compute_api
 from nova.compute import utils as compute_utils
+from nova import db
 from nova import exception
 from nova import manager
 from nova import notifications
@@ -41,12 +42,26 @@ allowed_updates = ['task_state', 'vm_state', 'expected_task_state',
 
 # Fields that we want to convert back into a datetime object.
 datetime_fields = ['launched_at', 'terminated_at']
+usage_datetime_fields = ['start_period', 'last_refreshed']
+
+
+def _usage_datetimes(usages):
+    # NOTE: Timestamps arrive as strings over rpc, the usage tables key
+    # on start_period so compare them as datetimes.
+    result = []
+    for usage in usages:
+        usage = dict(usage)
+        for key in usage_datetime_fields:
+            if isinstance(usage.get(key), basestring):
+                usage[key] = timeutils.parse_strtime(usage[key])
+        result.append(usage)
+    return result
 
 
 class ConductorManager(manager.SchedulerDependentManager):
     """Mission: TBD."""
 
-    RPC_API_VERSION = '1.40'
+    RPC_API_VERSION = '1.42'
 
     def __init__(self, *args, **kwargs):
         super(ConductorManager, self).__init__(service_name='conductor',
@@ -61,7 +76,15 @@ class ConductorManager(manager.SchedulerDependentManager):
                                   exception.InstanceNotFound,
                                   exception.UnexpectedTaskStateError)
     def instance_update(self, context, instance_uuid,
-                        updates, service=None):
+                        updates, service=None, columns_to_join=None):
+        if columns_to_join is None:
+            dropped_fields = []
+        else:
+            # Joined fields that were not asked for are left out of the
+            # result, unless they were updated
+            dropped_fields = [key for key in db.INSTANCE_JOINED_FIELDS
+                              if key not in columns_to_join and
+                              key not in updates]
         for key, value in updates.iteritems():
             if key not in allowed_updates:
                 LOG.error(_("Instance update attempted for "
@@ -73,7 +96,10 @@ class ConductorManager(manager.SchedulerDependentManager):
         old_ref, instance_ref = self.db.instance_update_and_get_original(
             context, instance_uuid, updates)
         notifications.send_update(context, old_ref, instance_ref, service)
-        return jsonutils.to_primitive(instance_ref)
+        result = jsonutils.to_primitive(instance_ref)
+        for key in dropped_fields:
+            result.pop(key, None)
+        return result
 
     @rpc_common.client_exceptions(exception.InstanceNotFound)
     def instance_get(self, context, instance_id):
@@ -88,6 +114,16 @@ class ConductorManager(manager.SchedulerDependentManager):
     def instance_get_all(self, context):
         return jsonutils.to_primitive(self.db.instance_get_all(context))
 
+    def instance_get_all_by_uuids(self, context, instance_uuids):
+        if not instance_uuids:
+            return []
+        result = self.db.instance_get_all_by_filters(
+            context, {'uuid': instance_uuids}, 'created_at', 'desc')
+        # Leave out deleted instances, instance_get_by_uuid would not
+        # find them either
+        return jsonutils.to_primitive([instance for instance in result
+                                       if not instance['deleted']])
+
     def instance_get_all_by_host(self, context, host, node=None):
         if node is not None:
             result = self.db.instance_get_all_by_host_and_node(
@@ -174,6 +210,15 @@ class ConductorManager(manager.SchedulerDependentManager):
         usage = self.db.bw_usage_get(context, uuid, start_period, mac)
         return jsonutils.to_primitive(usage)
 
+    def bw_usage_get_by_uuids(self, context, uuids, start_period):
+        if isinstance(start_period, basestring):
+            start_period = timeutils.parse_strtime(start_period)
+        usages = self.db.bw_usage_get_by_uuids(context, uuids, start_period)
+        return jsonutils.to_primitive(usages)
+
+    def bw_usage_update_many(self, context, usages):
+        self.db.bw_usage_update_many(context, _usage_datetimes(usages))
+
     def get_backdoor_port(self, context):
         return self.backdoor_port
 
@@ -210,6 +255,12 @@ class ConductorManager(manager.SchedulerDependentManager):
             context, instance['uuid'])
         return jsonutils.to_primitive(bdms)
 
+    def block_device_mapping_get_all_by_instance_uuids(self, context,
+                                                       instance_uuids):
+        bdms = self.db.block_device_mapping_get_all_by_instance_uuids(
+            context, instance_uuids)
+        return jsonutils.to_primitive(bdms)
+
     def block_device_mapping_destroy(self, context, bdms=None,
                                      instance=None, volume_id=None,
                                      device_name=None):
@@ -278,6 +329,13 @@ class ConductorManager(manager.SchedulerDependentManager):
                                  wr_bytes, instance['uuid'], last_refreshed,
                                  update_totals)
 
+    def vol_usage_update_many(self, context, usages, last_refreshed=None,
+                              update_totals=False):
+        if isinstance(last_refreshed, basestring):
+            last_refreshed = timeutils.parse_strtime(last_refreshed)
+        self.db.vol_usage_update_many(context, usages, last_refreshed,
+                                      update_totals)
+
     @rpc_common.client_exceptions(exception.HostBinaryNotFound)
     def service_get_all_by(self, context, topic=None, host=None, binary=None):
         if not any((topic, host, binary)):
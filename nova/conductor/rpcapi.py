@@ -74,6 +74,10 @@ class ConductorAPI(nova.openstack.common.rpc.proxy.RpcProxy):
     1.39 - Added notify_usage_exists
     1.40 - Added security_groups_trigger_handler and
                  security_groups_trigger_members_refresh
+    1.41 - Added instance_get_all_by_uuids, bw_usage_get_by_uuids,
+                 bw_usage_update_many, vol_usage_update_many and
+                 block_device_mapping_get_all_by_instance_uuids
+    1.42 - Added columns_to_join to instance_update
     """
 
     BASE_RPC_API_VERSION = '1.0'
@@ -89,14 +93,22 @@ class ConductorAPI(nova.openstack.common.rpc.proxy.RpcProxy):
         return self.call(context, msg, version='1.22', timeout=timeout)
 
     def instance_update(self, context, instance_uuid, updates,
-                        service=None):
+                        service=None, columns_to_join=None):
         updates_p = jsonutils.to_primitive(updates)
+        if columns_to_join is None:
+            return self.call(context,
+                             self.make_msg('instance_update',
+                                           instance_uuid=instance_uuid,
+                                           updates=updates_p,
+                                           service=service),
+                             version='1.38')
         return self.call(context,
                          self.make_msg('instance_update',
                                        instance_uuid=instance_uuid,
                                        updates=updates_p,
-                                       service=service),
-                         version='1.38')
+                                       service=service,
+                                       columns_to_join=columns_to_join),
+                         version='1.42')
 
     def instance_get(self, context, instance_id):
         msg = self.make_msg('instance_get',
@@ -388,3 +400,34 @@ class ConductorAPI(nova.openstack.common.rpc.proxy.RpcProxy):
         msg = self.make_msg('security_groups_trigger_members_refresh',
                             group_ids=group_ids)
         return self.call(context, msg, version='1.40')
+
+    def instance_get_all_by_uuids(self, context, instance_uuids):
+        msg = self.make_msg('instance_get_all_by_uuids',
+                            instance_uuids=instance_uuids)
+        return self.call(context, msg, version='1.41')
+
+    def bw_usage_get_by_uuids(self, context, uuids, start_period):
+        start_period_p = jsonutils.to_primitive(start_period)
+        msg = self.make_msg('bw_usage_get_by_uuids', uuids=uuids,
+                            start_period=start_period_p)
+        return self.call(context, msg, version='1.41')
+
+    def bw_usage_update_many(self, context, usages):
+        usages_p = jsonutils.to_primitive(usages)
+        msg = self.make_msg('bw_usage_update_many', usages=usages_p)
+        return self.call(context, msg, version='1.41')
+
+    def vol_usage_update_many(self, context, usages, last_refreshed=None,
+                              update_totals=False):
+        usages_p = jsonutils.to_primitive(usages)
+        last_refreshed_p = jsonutils.to_primitive(last_refreshed)
+        msg = self.make_msg('vol_usage_update_many', usages=usages_p,
+                            last_refreshed=last_refreshed_p,
+                            update_totals=update_totals)
+        return self.call(context, msg, version='1.41')
+
+    def block_device_mapping_get_all_by_instance_uuids(self, context,
+                                                       instance_uuids):
+        msg = self.make_msg('block_device_mapping_get_all_by_instance_uuids',
+                            instance_uuids=instance_uuids)
+        return self.call(context, msg, version='1.41')
@@ -44,6 +44,7 @@ these objects be simple dictionaries.
 """
 
 from nova.cells import rpcapi as cells_rpcapi
+from nova.db import profiler
 from nova import exception
 from nova.openstack.common import cfg
 from nova.openstack.common import log as logging
@@ -68,10 +69,15 @@ db_opts = [
 CONF = cfg.CONF
 CONF.register_opts(db_opts)
 
-IMPL = utils.LazyPluggable('db_backend',
-                           sqlalchemy='nova.db.sqlalchemy.api')
+IMPL = profiler.ProfiledBackend(
+    utils.LazyPluggable('db_backend', sqlalchemy='nova.db.sqlalchemy.api'))
 LOG = logging.getLogger(__name__)
 
+# Fields of the instances returned by instance_update and
+# instance_update_and_get_original that are loaded from other tables
+INSTANCE_JOINED_FIELDS = ('metadata', 'system_metadata', 'security_groups',
+                          'info_cache', 'instance_type', 'extra_specs')
+
 
 class NoMoreNetworks(exception.NovaException):
     """No more available networks."""
@@ -557,6 +563,32 @@ def virtual_interface_get_all(context):
     return IMPL.virtual_interface_get_all(context)
 
 
+def virtual_interface_get_fixed_ips(context, address=None, address_like=None):
+    """Gets the fixed ips allocated to instance vifs.
+
+    Optionally only those with the given address, or matching the
+    given SQL LIKE pattern.
+    """
+    return IMPL.virtual_interface_get_fixed_ips(context, address,
+                                                address_like)
+
+
+def virtual_interface_get_floating_ips(context, address=None,
+                                       address_like=None):
+    """Gets the floating ips of fixed ips allocated to instance vifs.
+
+    Optionally only those with the given address, or matching the
+    given SQL LIKE pattern.
+    """
+    return IMPL.virtual_interface_get_floating_ips(context, address,
+                                                   address_like)
+
+
+def virtual_interface_get_all_ipv6(context):
+    """Gets the instance vifs on networks with an IPv6 cidr."""
+    return IMPL.virtual_interface_get_all_ipv6(context)
+
+
 ####################
 
 
@@ -565,6 +597,11 @@ def instance_create(context, values):
     return IMPL.instance_create(context, values)
 
 
+def instance_create_many(context, values_list):
+    """Create instances from a list of values dictionaries."""
+    return IMPL.instance_create_many(context, values_list)
+
+
 def instance_data_get_for_project(context, project_id, session=None):
     """Get (instance_count, total_cores, total_ram) for project."""
     return IMPL.instance_data_get_for_project(context, project_id,
@@ -599,11 +636,18 @@ def instance_get_all(context, columns_to_join=None):
 
 
 def instance_get_all_by_filters(context, filters, sort_key='created_at',
-                                sort_dir='desc', limit=None, marker=None):
-    """Get all instances that match all filters."""
+                                sort_dir='desc', limit=None, marker=None,
+                                use_slave=False):
+    """Get all instances that match all filters.
+
+    With use_slave, the instances may be read from the database replica,
+    when one is configured; callers that act on their state must not set
+    it.
+    """
     return IMPL.instance_get_all_by_filters(context, filters, sort_key,
                                             sort_dir, limit=limit,
-                                            marker=marker)
+                                            marker=marker,
+                                            use_slave=use_slave)
 
 
 def instance_get_active_by_window(context, begin, end=None, project_id=None,
@@ -1095,6 +1139,12 @@ def block_device_mapping_get_all_by_instance(context, instance_uuid):
                                                          instance_uuid)
 
 
+def block_device_mapping_get_all_by_instance_uuids(context, instance_uuids):
+    """Get all block device mappings belonging to several instances."""
+    return IMPL.block_device_mapping_get_all_by_instance_uuids(context,
+                                                               instance_uuids)
+
+
 def block_device_mapping_destroy(context, bdm_id):
     """Destroy the block device mapping."""
     return IMPL.block_device_mapping_destroy(context, bdm_id)
@@ -1464,6 +1514,22 @@ def bw_usage_update(context, uuid, mac, start_period, bw_in, bw_out,
     return rv
 
 
+def bw_usage_update_many(context, usages, update_cells=True):
+    """Update cached bandwidth usage for several instances' networks at once.
+
+    usages is a list of dicts holding the arguments of bw_usage_update.
+    Records are created as needed.
+    """
+    rv = IMPL.bw_usage_update_many(context, usages)
+    if update_cells:
+        try:
+            cells_rpcapi.CellsAPI().bw_usage_update_many_at_top(context,
+                                                                usages)
+        except Exception:
+            LOG.exception(_("Failed to notify cells of bw_usage update"))
+    return rv
+
+
 ####################
 
 
@@ -1503,6 +1569,18 @@ def vol_usage_update(context, id, rd_req, rd_bytes, wr_req, wr_bytes,
                                  update_totals=update_totals)
 
 
+def vol_usage_update_many(context, usages, last_refreshed=None,
+                          update_totals=False):
+    """Update cached volume usage for several volumes at once.
+
+    usages is a list of dicts with volume_id, instance_uuid, rd_req,
+    rd_bytes, wr_req and wr_bytes keys.  Creates new records if needed.
+    """
+    return IMPL.vol_usage_update_many(context, usages,
+                                      last_refreshed=last_refreshed,
+                                      update_totals=update_totals)
+
+
 ###################
 
 
@@ -0,0 +1,214 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Profiling of the calls made to the database API.
+
+When db_profiling is set, every call made through nova.db.api is counted
+along with the SQL statements it runs, the rows it returns and the time
+it takes. The numbers are logged, and sent as a db.profile notification
+if db_profiling_notifications is set, every db_profiling_report_interval
+seconds.
+
+A request that runs the same statement more than
+db_profiling_repeat_threshold times is logged as well: it most likely
+queries in a loop what it could fetch at once.
+"""
+
+import bisect
+import re
+import time
+
+from eventlet import corolocal
+
+from nova.openstack.common import cfg
+from nova.openstack.common import log as logging
+from nova.openstack.common.notifier import api as notifier_api
+
+
+db_profiler_opts = [
+    cfg.BoolOpt('db_profiling',
+                default=False,
+                help='Record the calls made to the database API'),
+    cfg.IntOpt('db_profiling_report_interval',
+               default=300,
+               help='Number of seconds between reports of the database API '
+                    'calls'),
+    cfg.IntOpt('db_profiling_repeat_threshold',
+               default=20,
+               help='Report requests running the same database statement '
+                    'more than this number of times'),
+    cfg.BoolOpt('db_profiling_notifications',
+                default=False,
+                help='Send the reports of the database API calls as '
+                     'notifications'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(db_profiler_opts)
+
+LOG = logging.getLogger(__name__)
+
+# Upper bounds, in milliseconds, of the latency histogram buckets
+LATENCY_BUCKETS = (1, 5, 10, 50, 100, 500, 1000, 5000)
+
+# Lists of bind parameters, for statements using IN
+_PARAM_LIST = re.compile(r'\((?:\s*(?:\?|%s|:\w+)\s*,)+\s*(?:\?|%s|:\w+)\s*\)')
+
+_STATS = {}
+_LAST_REPORT = time.time()
+# The database API call running in the greenthread, if any
+_CURRENT = corolocal.local()
+
+
+class FunctionStats(object):
+    """What the calls to one database API function did."""
+
+    def __init__(self):
+        self.calls = 0
+        self.statements = 0
+        self.rows = 0
+        self.time = 0.0
+        self.repeats = 0
+        self.histogram = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def add_call(self, elapsed, rows):
+        self.calls += 1
+        self.rows += rows
+        self.time += elapsed
+        self.histogram[bisect.bisect_left(LATENCY_BUCKETS,
+                                          elapsed * 1000)] += 1
+
+    def to_dict(self):
+        return {'calls': self.calls,
+                'statements': self.statements,
+                'rows': self.rows,
+                'time': self.time,
+                'repeats': self.repeats,
+                'histogram': list(self.histogram)}
+
+
+def _get_stats(name):
+    stats = _STATS.get(name)
+    if stats is None:
+        stats = _STATS[name] = FunctionStats()
+    return stats
+
+
+def _count_rows(result):
+    if result is None:
+        return 0
+    if isinstance(result, (list, tuple)):
+        return len(result)
+    return 1
+
+
+def statement_shape(statement):
+    """Return the statement with its lists of parameters collapsed."""
+    return _PARAM_LIST.sub('(?)', ' '.join(statement.split()))
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context,
+                          executemany):
+    """Count a statement run for the database API call in progress.
+
+    Listener for the before_cursor_execute events of the engines used
+    by the database API backend.
+    """
+    name = getattr(_CURRENT, 'name', None)
+    if name is None or not CONF.db_profiling:
+        return
+    _get_stats(name).statements += 1
+
+    shape = statement_shape(statement)
+    count = _CURRENT.shapes.get(shape, 0) + 1
+    _CURRENT.shapes[shape] = count
+    if count == CONF.db_profiling_repeat_threshold + 1:
+        _get_stats(name).repeats += 1
+        LOG.warn(_('Request %(request_id)s ran this statement more than '
+                   '%(threshold)d times, last in %(name)s: %(shape)s'),
+                 {'request_id': _CURRENT.request_id,
+                  'threshold': CONF.db_profiling_repeat_threshold,
+                  'name': name, 'shape': shape})
+
+
+def get_stats():
+    """Return what the calls to each database API function did."""
+    return dict((name, stats.to_dict()) for name, stats in _STATS.items())
+
+
+def reset():
+    global _LAST_REPORT
+    _STATS.clear()
+    _LAST_REPORT = time.time()
+
+
+def report():
+    """Log the calls made since the last report and start over."""
+    stats = get_stats()
+    reset()
+    if not stats:
+        return
+    for name in sorted(stats, key=lambda name: -stats[name]['time']):
+        LOG.info(_('%(name)s: %(calls)d calls, %(statements)d statements, '
+                   '%(rows)d rows, %(time).3fs, %(repeats)d repeated '
+                   'statements, latency histogram %(histogram)s'),
+                 dict(stats[name], name=name))
+    if CONF.db_profiling_notifications:
+        payload = {'buckets': list(LATENCY_BUCKETS), 'functions': stats}
+        notifier_api.notify(None, notifier_api.publisher_id('db'),
+                            'db.profile', notifier_api.INFO, payload)
+
+
+def _call(name, func, *args, **kwargs):
+    request_id = getattr(args[0], 'request_id', None) if args else None
+    if request_id is None or request_id != getattr(_CURRENT, 'request_id',
+                                                   None):
+        # Repeated statements are looked for within a request
+        _CURRENT.request_id = request_id
+        _CURRENT.shapes = {}
+    _CURRENT.name = name
+    result = None
+    start = time.time()
+    try:
+        result = func(*args, **kwargs)
+        return result
+    finally:
+        _CURRENT.name = None
+        now = time.time()
+        _get_stats(name).add_call(now - start, _count_rows(result))
+        if now - _LAST_REPORT >= CONF.db_profiling_report_interval:
+            report()
+
+
+class ProfiledBackend(object):
+    """Database API backend recording the calls made to it.
+
+    The calls go straight to the backend unless db_profiling is set.
+    """
+
+    def __init__(self, backend):
+        self._backend = backend
+
+    def __getattr__(self, key):
+        attr = getattr(self._backend, key)
+        if (not CONF.db_profiling or not callable(attr) or
+                getattr(_CURRENT, 'name', None) is not None):
+            return attr
+
+        def wrapper(*args, **kwargs):
+            return _call(key, attr, *args, **kwargs)
+        return wrapper
@@ -24,25 +24,32 @@ import copy
 import datetime
 import functools
 import uuid
+import weakref
 
+from eventlet import corolocal
+import sqlalchemy
 from sqlalchemy import and_
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy import or_
 from sqlalchemy.orm import joinedload
 from sqlalchemy.orm import joinedload_all
 from sqlalchemy.sql.expression import asc
+from sqlalchemy.sql.expression import bindparam
 from sqlalchemy.sql.expression import desc
 from sqlalchemy.sql import func
 
 from nova import block_device
+from nova.common import memorycache
 from nova.compute import task_states
 from nova.compute import vm_states
 from nova import db
+from nova.db import profiler
 from nova.db.sqlalchemy import models
 from nova import exception
 from nova.openstack.common import cfg
 from nova.openstack.common.db.sqlalchemy import session as db_session
 from nova.openstack.common.db.sqlalchemy import utils as sqlalchemyutils
+from nova.openstack.common import local
 from nova.openstack.common import log as logging
 from nova.openstack.common import timeutils
 from nova.openstack.common import uuidutils
@@ -53,17 +60,93 @@ db_opts = [
                help='When set, compute API will consider duplicate hostnames '
                     'invalid within the specified scope, regardless of case. '
                     'Should be empty, "project" or "global".'),
+    cfg.IntOpt('sql_slave_max_staleness',
+               default=10,
+               help='Number of seconds the database replica may lag behind. '
+                    'Calls made for a request that wrote to the database '
+                    'within that time, and up to twice that time, read from '
+                    'the database rather than the replica'),
 ]
 
 CONF = cfg.CONF
 CONF.register_opts(db_opts)
 CONF.import_opt('compute_topic', 'nova.compute.rpcapi')
+CONF.import_opt('db_profiling', 'nova.db.profiler')
 CONF.import_opt('sql_connection',
                 'nova.openstack.common.db.sqlalchemy.session')
+CONF.import_opt('sql_slave_connection',
+                'nova.openstack.common.db.sqlalchemy.session')
 
 LOG = logging.getLogger(__name__)
 
-get_session = db_session.get_session
+# Set while a call allowed to read from the replica runs
+_SLAVE_READ = corolocal.local()
+_RECENT_WRITES = None
+# When the write of each request context was last noted
+_NOTED_WRITES = weakref.WeakKeyDictionary()
+_WATCHED_ENGINES = weakref.WeakKeyDictionary()
+_PROFILED_ENGINES = weakref.WeakKeyDictionary()
+
+
+def get_session(autocommit=True, expire_on_commit=False, use_slave=False):
+    slave_session = False
+    if CONF.sql_slave_connection:
+        slave_session = use_slave or getattr(_SLAVE_READ, 'enabled', False)
+        # The engine is created along with the first session
+        _watch_writes(db_session.get_engine())
+    if CONF.db_profiling:
+        _profile_statements(db_session.get_engine(slave_session))
+    return db_session.get_session(autocommit, expire_on_commit,
+                                  slave_session=slave_session)
+
+
+def _watch_writes(engine):
+    """Note the writes made through the engine, see _note_write."""
+    if engine not in _WATCHED_ENGINES:
+        sqlalchemy.event.listen(engine, 'after_cursor_execute', _note_write)
+        _WATCHED_ENGINES[engine] = True
+
+
+def _get_recent_writes():
+    global _RECENT_WRITES
+    if _RECENT_WRITES is None:
+        _RECENT_WRITES = memorycache.get_client()
+    return _RECENT_WRITES
+
+
+def _recent_write_key(request_id):
+    return str('db-write-%s' % request_id)
+
+
+def _note_write(conn, cursor, statement, parameters, context, executemany):
+    """Keep track of the requests that write to the database.
+
+    The write is noted for twice sql_slave_max_staleness, so that a
+    request only has to note it again once that much time went by since
+    it last did, rather than on every statement.
+    """
+    if (not _slave_reads_enabled() or
+            statement.lstrip()[:6].upper() == 'SELECT'):
+        return
+    request_context = getattr(local.store, 'context', None)
+    if request_context is None:
+        return
+    now = timeutils.utcnow_ts()
+    noted = _NOTED_WRITES.get(request_context)
+    if noted is not None and now - noted < CONF.sql_slave_max_staleness:
+        return
+    _get_recent_writes().set(
+        _recent_write_key(request_context.request_id), True,
+        time=2 * CONF.sql_slave_max_staleness)
+    _NOTED_WRITES[request_context] = now
+
+
+def _profile_statements(engine):
+    """Count the statements run by the engine for the profiler."""
+    if engine not in _PROFILED_ENGINES:
+        sqlalchemy.event.listen(engine, 'before_cursor_execute',
+                                profiler.before_cursor_execute)
+        _PROFILED_ENGINES[engine] = True
 
 
 def is_user_context(context):
@@ -138,6 +221,48 @@ def require_context(f):
     return wrapper
 
 
+def _slave_reads_enabled():
+    """Whether reads may go to the replica at all.
+
+    The writes of a request are noted in memcached, for every process
+    serving the request (the API, the conductor workers...) to see them.
+    The in process cache would only let a process see its own, so without
+    memcached_servers everything is read from the database.
+    """
+    return bool(CONF.sql_slave_connection and CONF.memcached_servers)
+
+
+def _slave_read_allowed(context):
+    """Whether the request of context may read from the replica."""
+    if not _slave_reads_enabled():
+        return False
+    return not _get_recent_writes().get(_recent_write_key(context.request_id))
+
+
+def read_from_slave(f):
+    """Decorator to let a read-only call use the database replica.
+
+    The call reads from the replica when sql_slave_connection and
+    memcached_servers are set, unless its request wrote to the database
+    within the last sql_slave_max_staleness seconds (up to twice that, see
+    _note_write); it would not see its own writes.
+
+    The first argument to the wrapped function must be the context.
+    """
+
+    @functools.wraps(f)
+    def wrapper(context, *args, **kwargs):
+        if (getattr(_SLAVE_READ, 'enabled', False) or
+                not _slave_read_allowed(context)):
+            return f(context, *args, **kwargs)
+        _SLAVE_READ.enabled = True
+        try:
+            return f(context, *args, **kwargs)
+        finally:
+            _SLAVE_READ.enabled = False
+    return wrapper
+
+
 def require_instance_exists_using_uuid(f):
     """Decorator to require the specified instance to exist.
 
@@ -452,6 +577,7 @@ def _compute_node_get(context, compute_id, session=None):
 
 
 @require_admin_context
+@read_from_slave
 def compute_node_get_all(context):
     return model_query(context, models.ComputeNode).\
             options(joinedload('service')).\
@@ -1356,6 +1482,97 @@ def virtual_interface_get_all(context):
     return vif_refs
 
 
+def _ip_address_filter(query, column, address=None, address_like=None):
+    """Restrict a query to an exact ip address or a LIKE pattern."""
+    if address is not None:
+        query = query.filter(column == address)
+    if address_like is not None:
+        db_string = CONF.sql_connection.split(':')[0].split('+')[0]
+        if db_string == 'postgresql':
+            # Addresses are stored as inet, which LIKE doesn't apply to
+            column = func.host(column)
+        query = query.filter(column.like(address_like))
+    return query
+
+
+@require_context
+def virtual_interface_get_fixed_ips(context, address=None, address_like=None):
+    """Get the fixed ips allocated to instance vifs.
+
+    Returns a list of dicts with the instance_uuid of the vif and the
+    address of the fixed ip, ordered by vif.
+    """
+    # The first column determines what is joined from
+    query = model_query(context, models.FixedIp.address,
+                        models.VirtualInterface.instance_uuid,
+                        base_model=models.FixedIp, read_deleted="no").\
+                join(models.VirtualInterface,
+                     models.FixedIp.virtual_interface_id ==
+                     models.VirtualInterface.id).\
+                filter(models.VirtualInterface.instance_uuid != None)
+    query = _ip_address_filter(query, models.FixedIp.address,
+                               address, address_like)
+    query = query.order_by(asc(models.VirtualInterface.id),
+                           asc(models.FixedIp.id))
+    return [{'instance_uuid': instance_uuid, 'address': fixed_address}
+            for fixed_address, instance_uuid in query.all()]
+
+
+@require_context
+def virtual_interface_get_floating_ips(context, address=None,
+                                       address_like=None):
+    """Get the floating ips of fixed ips allocated to instance vifs.
+
+    Returns a list of dicts with the instance_uuid of the vif and the
+    addresses of the floating ip and of the fixed ip it maps to,
+    ordered by vif.
+    """
+    query = model_query(context, models.FloatingIp.address,
+                        models.FixedIp.address,
+                        models.VirtualInterface.instance_uuid,
+                        base_model=models.FloatingIp, read_deleted="no").\
+                join(models.FixedIp,
+                     models.FloatingIp.fixed_ip_id == models.FixedIp.id).\
+                join(models.VirtualInterface,
+                     models.FixedIp.virtual_interface_id ==
+                     models.VirtualInterface.id).\
+                filter(models.FixedIp.deleted == 0).\
+                filter(models.VirtualInterface.instance_uuid != None)
+    query = _ip_address_filter(query, models.FloatingIp.address,
+                               address, address_like)
+    query = query.order_by(asc(models.VirtualInterface.id),
+                           asc(models.FixedIp.id),
+                           asc(models.FloatingIp.id))
+    return [{'instance_uuid': instance_uuid,
+             'address': floating_address,
+             'fixed_address': fixed_address}
+            for floating_address, fixed_address, instance_uuid in query.all()]
+
+
+@require_context
+def virtual_interface_get_all_ipv6(context):
+    """Get the instance vifs on networks with an IPv6 cidr.
+
+    Returns a list of dicts with the instance_uuid and (MAC) address
+    of the vif, and the cidr_v6 of its network, ordered by vif.  Only
+    networks visible to the context are included, as for network_get.
+    """
+    query = model_query(context, models.Network.cidr_v6,
+                        models.VirtualInterface.instance_uuid,
+                        models.VirtualInterface.address,
+                        base_model=models.Network,
+                        read_deleted="no", project_only='allow_none').\
+                join(models.VirtualInterface,
+                     models.VirtualInterface.network_id ==
+                     models.Network.id).\
+                filter(models.Network.cidr_v6 != None).\
+                filter(models.VirtualInterface.instance_uuid != None).\
+                order_by(asc(models.VirtualInterface.id))
+    return [{'instance_uuid': instance_uuid, 'address': mac,
+             'cidr_v6': cidr_v6}
+            for cidr_v6, instance_uuid, mac in query.all()]
+
+
 ###################
 
 
@@ -1371,6 +1588,10 @@ def _metadata_refs(metadata_dict, meta_class):
 
 
 def _validate_unique_server_name(context, session, name):
+    _validate_unique_server_names(context, session, [name])
+
+
+def _validate_unique_server_names(context, session, names):
     if not CONF.osapi_compute_unique_server_name_scope:
         return
 
@@ -1392,10 +1613,28 @@ def _validate_unique_server_name(context, session, name):
         LOG.warn(msg)
         return
 
-    lowername = name.lower()
-    for instance in instance_list:
-        if instance['hostname'].lower() == lowername:
-            raise exception.InstanceExists(name=instance['hostname'])
+    existing = dict((instance['hostname'].lower(), instance['hostname'])
+                    for instance in instance_list)
+    for name in names:
+        lowername = name.lower()
+        if lowername in existing:
+            raise exception.InstanceExists(name=existing[lowername])
+        # The names must be unique among the new instances too
+        existing[lowername] = name
+
+
+def _get_sec_group_models(context, session, security_groups):
+    models = []
+    _existed, default_group = security_group_ensure_default(context,
+        session=session)
+    if 'default' in security_groups:
+        models.append(default_group)
+        # Generate a new list, so we don't modify the original
+        security_groups = [x for x in security_groups if x != 'default']
+    if security_groups:
+        models.extend(_security_group_get_by_names(context,
+                session, context.project_id, security_groups))
+    return models
 
 
 @require_context
@@ -1422,25 +1661,12 @@ def instance_create(context, values):
     security_groups = values.pop('security_groups', [])
     instance_ref.update(values)
 
-    def _get_sec_group_models(session, security_groups):
-        models = []
-        _existed, default_group = security_group_ensure_default(context,
-            session=session)
-        if 'default' in security_groups:
-            models.append(default_group)
-            # Generate a new list, so we don't modify the original
-            security_groups = [x for x in security_groups if x != 'default']
-        if security_groups:
-            models.extend(_security_group_get_by_names(context,
-                    session, context.project_id, security_groups))
-        return models
-
     session = get_session()
     with session.begin():
         if 'hostname' in values:
             _validate_unique_server_name(context, session, values['hostname'])
-        instance_ref.security_groups = _get_sec_group_models(session,
-                security_groups)
+        instance_ref.security_groups = _get_sec_group_models(context,
+                session, security_groups)
         instance_ref.save(session=session)
         # NOTE(comstud): This forces instance_type to be loaded so it
         # exists in the ref when we return.  Fixes lazy loading issues.
@@ -1452,6 +1678,88 @@ def instance_create(context, values):
     return instance_ref
 
 
+def _insert_many(session, model, rows):
+    """Insert rows into the table of a model, one insert per set of keys.
+
+    The column defaults of the model are applied as for a single row.
+    """
+    by_keys = {}
+    for row in rows:
+        by_keys.setdefault(tuple(sorted(row)), []).append(row)
+    for keys_rows in by_keys.values():
+        session.execute(model.__table__.insert(), keys_rows)
+
+
+@require_context
+def instance_create_many(context, values_list):
+    """Create several new Instance records in the database.
+
+    The instances are created as by instance_create, but with a single
+    multi-row insert into each table, in one transaction.
+
+    context - request context object
+    values_list - list of dicts containing column values.
+    """
+    columns = set(models.Instance.__table__.columns.keys())
+    instance_rows = []
+    metadata_rows = []
+    system_metadata_rows = []
+    info_cache_rows = []
+    sec_group_rows = []
+    # Security groups are looked up once for each list of names
+    sec_group_ids = {}
+
+    session = get_session()
+    with session.begin():
+        hostnames = [values['hostname'] for values in values_list
+                     if 'hostname' in values]
+        if hostnames:
+            _validate_unique_server_names(context, session, hostnames)
+
+        for values in values_list:
+            instance_uuid = values.get('uuid') or str(uuid.uuid4())
+            instance_rows.append(dict(
+                (key, value) for key, value in values.iteritems()
+                if key in columns and key != 'id'))
+            instance_rows[-1]['uuid'] = instance_uuid
+
+            for rows, key in ((metadata_rows, 'metadata'),
+                              (system_metadata_rows, 'system_metadata')):
+                for meta_key, meta_value in (values.get(key) or {}).items():
+                    rows.append({'instance_uuid': instance_uuid,
+                                 'key': meta_key, 'value': meta_value})
+
+            info_cache = dict(values.get('info_cache') or {})
+            info_cache['instance_uuid'] = instance_uuid
+            info_cache_rows.append(info_cache)
+
+            names = tuple(values.get('security_groups') or [])
+            if names not in sec_group_ids:
+                sec_group_ids[names] = [group['id'] for group in
+                        _get_sec_group_models(context, session, list(names))]
+            for group_id in sec_group_ids[names]:
+                sec_group_rows.append({'instance_uuid': instance_uuid,
+                                       'security_group_id': group_id})
+
+        _insert_many(session, models.Instance, instance_rows)
+        _insert_many(session, models.InstanceMetadata, metadata_rows)
+        _insert_many(session, models.InstanceSystemMetadata,
+                     system_metadata_rows)
+        _insert_many(session, models.InstanceInfoCache, info_cache_rows)
+        _insert_many(session, models.SecurityGroupInstanceAssociation,
+                     sec_group_rows)
+        # create the instance uuid to ec2_id mapping entries
+        _insert_many(session, models.InstanceIdMapping,
+                     [{'uuid': row['uuid']} for row in instance_rows])
+
+        uuids = [row['uuid'] for row in instance_rows]
+        instances = dict((instance['uuid'], instance) for instance in
+                         _build_instance_get(context, session=session).
+                         filter(models.Instance.uuid.in_(uuids)).
+                         all())
+    return [instances[instance_uuid] for instance_uuid in uuids]
+
+
 @require_admin_context
 def instance_data_get_for_project(context, project_id, session=None):
     result = model_query(context,
@@ -1552,15 +1860,18 @@ def instance_get_all(context, columns_to_join=None):
 
 @require_context
 def instance_get_all_by_filters(context, filters, sort_key, sort_dir,
-                                limit=None, marker=None, session=None):
+                                limit=None, marker=None, session=None,
+                                use_slave=False):
     """Return instances that match all filters.  Deleted instances
     will be returned by default, unless there's a filter that says
-    otherwise"""
+    otherwise.  With use_slave, they may be read from the replica, as
+    read_from_slave calls do"""
 
     sort_fn = {'desc': desc, 'asc': asc}
 
     if not session:
-        session = get_session()
+        session = get_session(
+            use_slave=use_slave and _slave_read_allowed(context))
 
     query_prefix = session.query(models.Instance).\
             options(joinedload('info_cache')).\
@@ -1657,6 +1968,7 @@ def regex_filter(query, model, filters):
 
 
 @require_context
+@read_from_slave
 def instance_get_active_by_window(context, begin, end=None,
                                   project_id=None, host=None):
     """Return instances that were active during window."""
@@ -1676,6 +1988,7 @@ def instance_get_active_by_window(context, begin, end=None,
 
 
 @require_admin_context
+@read_from_slave
 def instance_get_active_by_window_joined(context, begin, end=None,
                                          project_id=None, host=None):
     """Return instances and joins that were active during window."""
@@ -3004,6 +3317,16 @@ def block_device_mapping_get_all_by_instance(context, instance_uuid):
                  all()
 
 
+@require_context
+def block_device_mapping_get_all_by_instance_uuids(context, instance_uuids):
+    if not instance_uuids:
+        return []
+    return _block_device_mapping_get_query(context).\
+                 filter(models.BlockDeviceMapping.instance_uuid.in_(
+                        instance_uuids)).\
+                 all()
+
+
 @require_context
 def block_device_mapping_destroy(context, bdm_id):
     session = get_session()
@@ -3978,6 +4301,97 @@ def agent_build_update(context, agent_build_id, values):
 
 ####################
 
+def _insert_or_update_many(context, session, model, key_columns, rows,
+                           update_columns, increment_columns=()):
+    """Write rows to the table of model, updating the existing records.
+
+    Records are matched on key_columns, which must be a unique key of the
+    table and must not repeat within rows.  The update_columns of existing
+    records are set to the values in rows and the values of
+    increment_columns are added to them.  Deleted records hold their key
+    as well: they are undeleted and start over from the values in rows,
+    as if they had been inserted.
+
+    MySQL does it in one INSERT ... ON DUPLICATE KEY UPDATE statement.
+    Other backends look up the existing records with one query and then
+    run one UPDATE (two with deleted records) and one INSERT statement for
+    many rows.
+    """
+    table = model.__table__
+    now = timeutils.utcnow()
+
+    if session.bind.dialect.name == 'mysql':
+        columns = sorted(rows[0].keys()) + ['created_at', 'deleted']
+        params = {'now': now}
+        values = []
+        for i, row in enumerate(rows):
+            row = dict(row, created_at=now, deleted=0)
+            names = []
+            for column in columns:
+                name = '%s_%d' % (column, i)
+                params[name] = row[column]
+                names.append(':' + name)
+            values.append('(%s)' % ', '.join(names))
+        updates = ['updated_at = :now']
+        updates.extend('%s = VALUES(%s)' % (column, column)
+                       for column in update_columns)
+        updates.extend('%s = IF(deleted, VALUES(%s), %s + VALUES(%s))' %
+                       (column, column, column, column)
+                       for column in increment_columns)
+        # Last, as MySQL assigns in order and the ones above need the
+        # value deleted had before
+        updates.extend(['deleted_at = NULL', 'deleted = 0'])
+        session.execute('INSERT INTO %s (%s) VALUES %s '
+                        'ON DUPLICATE KEY UPDATE %s' %
+                        (table.name, ', '.join(columns), ', '.join(values),
+                         ', '.join(updates)), params)
+        return
+
+    query = model_query(context, model.id, model.deleted,
+                        *[getattr(model, column) for column in key_columns],
+                        base_model=model, session=session, read_deleted="yes")
+    for column in key_columns:
+        query = query.filter(getattr(model, column).in_(
+            set(row[column] for row in rows)))
+    existing = dict((tuple(ref[2:]), ref[:2]) for ref in query.all())
+
+    updates = []
+    undeletes = []
+    inserts = []
+    for row in rows:
+        key = tuple(row[column] for column in key_columns)
+        if key in existing:
+            existing_id, deleted = existing[key]
+            update = dict(('new_%s' % column, row[column])
+                          for column in (list(update_columns) +
+                                         list(increment_columns)))
+            update['existing_id'] = existing_id
+            if deleted:
+                undeletes.append(update)
+            else:
+                updates.append(update)
+        else:
+            inserts.append(row)
+
+    for batch, undelete in ((updates, False), (undeletes, True)):
+        if not batch:
+            continue
+        values = {'updated_at': now}
+        for column in update_columns:
+            values[column] = bindparam('new_%s' % column)
+        for column in increment_columns:
+            values[column] = bindparam('new_%s' % column)
+            if not undelete:
+                values[column] = table.c[column] + values[column]
+        if undelete:
+            values.update(deleted=0, deleted_at=None)
+        session.execute(table.update().
+                        where(table.c.id == bindparam('existing_id')).
+                        values(values), batch)
+    if inserts:
+        session.execute(table.insert(), inserts)
+
+
 @require_context
 def bw_usage_get(context, uuid, start_period, mac):
     return model_query(context, models.BandwidthUsage, read_deleted="yes").\
@@ -3999,40 +4413,39 @@ def bw_usage_get_by_uuids(context, uuids, start_period):
 def bw_usage_update(context, uuid, mac, start_period, bw_in, bw_out,
                     last_ctr_in, last_ctr_out, last_refreshed=None,
                     session=None):
+    bw_usage_update_many(context, [{'uuid': uuid,
+                                    'mac': mac,
+                                    'start_period': start_period,
+                                    'bw_in': bw_in,
+                                    'bw_out': bw_out,
+                                    'last_ctr_in': last_ctr_in,
+                                    'last_ctr_out': last_ctr_out,
+                                    'last_refreshed': last_refreshed}],
+                         session=session)
+
+
+@require_context
+def bw_usage_update_many(context, usages, session=None):
+    if not usages:
+        return
     if not session:
         session = get_session()
 
-    if last_refreshed is None:
-        last_refreshed = timeutils.utcnow()
-
-    # NOTE(comstud): More often than not, we'll be updating records vs
-    # creating records.  Optimize accordingly, trying to update existing
-    # records.  Fall back to creation when no rows are updated.
+    now = timeutils.utcnow()
+    rows = [{'uuid': usage['uuid'],
+             'mac': usage['mac'],
+             'start_period': usage['start_period'],
+             'bw_in': usage['bw_in'],
+             'bw_out': usage['bw_out'],
+             'last_ctr_in': usage['last_ctr_in'],
+             'last_ctr_out': usage['last_ctr_out'],
+             'last_refreshed': usage.get('last_refreshed') or now}
+            for usage in usages]
     with session.begin():
-        values = {'last_refreshed': last_refreshed,
-                  'last_ctr_in': last_ctr_in,
-                  'last_ctr_out': last_ctr_out,
-                  'bw_in': bw_in,
-                  'bw_out': bw_out}
-        rows = model_query(context, models.BandwidthUsage,
-                              session=session, read_deleted="yes").\
-                      filter_by(start_period=start_period).\
-                      filter_by(uuid=uuid).\
-                      filter_by(mac=mac).\
-                      update(values, synchronize_session=False)
-        if rows:
-            return
-
-        bwusage = models.BandwidthUsage()
-        bwusage.start_period = start_period
-        bwusage.uuid = uuid
-        bwusage.mac = mac
-        bwusage.last_refreshed = last_refreshed
-        bwusage.bw_in = bw_in
-        bwusage.bw_out = bw_out
-        bwusage.last_ctr_in = last_ctr_in
-        bwusage.last_ctr_out = last_ctr_out
-        bwusage.save(session=session)
+        _insert_or_update_many(context, session, models.BandwidthUsage,
+                               ['uuid', 'mac', 'start_period'], rows,
+                               ['bw_in', 'bw_out', 'last_ctr_in',
+                                'last_ctr_out', 'last_refreshed'])
 
 
 ####################
@@ -4148,64 +4561,61 @@ def vol_get_usage_by_time(context, begin):
 def vol_usage_update(context, id, rd_req, rd_bytes, wr_req, wr_bytes,
                      instance_id, last_refreshed=None, update_totals=False,
                      session=None):
+    vol_usage_update_many(context, [{'volume_id': id,
+                                     'instance_uuid': instance_id,
+                                     'rd_req': rd_req,
+                                     'rd_bytes': rd_bytes,
+                                     'wr_req': wr_req,
+                                     'wr_bytes': wr_bytes}],
+                          last_refreshed=last_refreshed,
+                          update_totals=update_totals, session=session)
+
+
+@require_context
+def vol_usage_update_many(context, usages, last_refreshed=None,
+                          update_totals=False, session=None):
+    if not usages:
+        return
     if not session:
         session = get_session()
 
     if last_refreshed is None:
         last_refreshed = timeutils.utcnow()
 
-    with session.begin():
-        values = {}
-        # NOTE(dricco): We will be mostly updating current usage records vs
-        # updating total or creating records. Optimize accordingly.
-        if not update_totals:
-            values = {'curr_last_refreshed': last_refreshed,
-                      'curr_reads': rd_req,
-                      'curr_read_bytes': rd_bytes,
-                      'curr_writes': wr_req,
-                      'curr_write_bytes': wr_bytes,
-                      'instance_id': instance_id}
-        else:
-            values = {'tot_last_refreshed': last_refreshed,
-                      'tot_reads': models.VolumeUsage.tot_reads + rd_req,
-                      'tot_read_bytes': models.VolumeUsage.tot_read_bytes +
-                                        rd_bytes,
-                      'tot_writes': models.VolumeUsage.tot_writes + wr_req,
-                      'tot_write_bytes': models.VolumeUsage.tot_write_bytes +
-                                         wr_bytes,
-                      'curr_reads': 0,
-                      'curr_read_bytes': 0,
-                      'curr_writes': 0,
-                      'curr_write_bytes': 0,
-                      'instance_id': instance_id}
-
-        rows = model_query(context, models.VolumeUsage,
-                           session=session, read_deleted="yes").\
-                           filter_by(volume_id=id).\
-                           update(values, synchronize_session=False)
-
-        if rows:
-            return
-
-        vol_usage = models.VolumeUsage()
-        vol_usage.tot_last_refreshed = timeutils.utcnow()
-        vol_usage.curr_last_refreshed = timeutils.utcnow()
-        vol_usage.volume_id = id
-
-        if not update_totals:
-            vol_usage.curr_reads = rd_req
-            vol_usage.curr_read_bytes = rd_bytes
-            vol_usage.curr_writes = wr_req
-            vol_usage.curr_write_bytes = wr_bytes
-        else:
-            vol_usage.tot_reads = rd_req
-            vol_usage.tot_read_bytes = rd_bytes
-            vol_usage.tot_writes = wr_req
-            vol_usage.tot_write_bytes = wr_bytes
-
-        vol_usage.save(session=session)
+    # NOTE(dricco): We will be mostly updating current usage records vs
+    # updating total or creating records.
+    if update_totals:
+        prefix, other = 'tot_', 'curr_'
+    else:
+        prefix, other = 'curr_', 'tot_'
+    counters = [('rd_req', 'reads'), ('rd_bytes', 'read_bytes'),
+                ('wr_req', 'writes'), ('wr_bytes', 'write_bytes')]
+
+    rows = []
+    for usage in usages:
+        row = {'volume_id': str(usage['volume_id']),
+               'instance_id': usage['instance_uuid'],
+               'tot_last_refreshed': last_refreshed,
+               'curr_last_refreshed': last_refreshed}
+        for key, column in counters:
+            row[prefix + column] = usage[key]
+            row[other + column] = 0
+        rows.append(row)
+
+    if update_totals:
+        # The totals grow by the usage and the current usage starts over
+        update_columns = ['tot_last_refreshed', 'instance_id']
+        update_columns.extend('curr_' + column for _key, column in counters)
+        increment_columns = ['tot_' + column for _key, column in counters]
+    else:
+        update_columns = ['curr_last_refreshed', 'instance_id']
+        update_columns.extend('curr_' + column for _key, column in counters)
+        increment_columns = []
 
-    return
+    with session.begin():
+        _insert_or_update_many(context, session, models.VolumeUsage,
+                               ['volume_id'], rows, update_columns,
+                               increment_columns)
 
 
 ####################
@@ -4761,6 +5171,7 @@ def task_log_get(context, task_name, period_beginning, period_ending, host,
 
 
 @require_admin_context
+@read_from_slave
 def task_log_get_all(context, task_name, period_beginning, period_ending,
                      host=None, state=None):
     return _task_log_get_query(context, task_name, period_beginning,
@@ -0,0 +1,64 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from sqlalchemy import and_, func, select
+from sqlalchemy import Index, MetaData, Table
+
+
+UNIQUE_KEYS = [
+    ('bw_usage_cache', 'bw_usage_cache_uuid_mac_start_period_idx',
+     ('uuid', 'mac', 'start_period')),
+    ('volume_usage_cache', 'volume_usage_cache_volume_id_idx',
+     ('volume_id',)),
+]
+
+
+def _remove_duplicates(migrate_engine, table, columns):
+    # Keep the most recent record of each key
+    key = [table.c[column] for column in columns]
+    duplicates = select(key + [func.max(table.c.id)]).\
+                 group_by(*key).\
+                 having(func.count(table.c.id) > 1)
+    for row in migrate_engine.execute(duplicates).fetchall():
+        match = [column == row[i] for i, column in enumerate(key)]
+        migrate_engine.execute(table.delete().where(
+            and_(table.c.id != row[len(key)], *match)))
+
+
+def upgrade(migrate_engine):
+    meta = MetaData()
+    meta.bind = migrate_engine
+
+    # Bulk usage updates insert or update records in one statement, which
+    # needs these keys to be unique
+    for table_name, index_name, columns in UNIQUE_KEYS:
+        table = Table(table_name, meta, autoload=True)
+        _remove_duplicates(migrate_engine, table, columns)
+        index = Index(index_name, *[table.c[column] for column in columns],
+                      unique=True)
+        index.create(migrate_engine)
+
+
+def downgrade(migrate_engine):
+    meta = MetaData()
+    meta.bind = migrate_engine
+
+    for table_name, index_name, columns in UNIQUE_KEYS:
+        table = Table(table_name, meta, autoload=True)
+        index = Index(index_name, *[table.c[column] for column in columns],
+                      unique=True)
+        index.drop(migrate_engine)
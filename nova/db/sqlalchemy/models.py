@@ -23,7 +23,7 @@ SQLAlchemy models for nova data.
 
 from sqlalchemy import Column, Integer, BigInteger, String, schema
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy import ForeignKey, DateTime, Boolean, Text, Float
+from sqlalchemy import ForeignKey, DateTime, Boolean, Text, Float, Index
 from sqlalchemy.orm import relationship, backref, object_mapper
 
 from nova.db.sqlalchemy import types
@@ -890,6 +890,8 @@ class AgentBuild(BASE, NovaBase):
 class BandwidthUsage(BASE, NovaBase):
     """Cache for instance bandwidth usage data pulled from the hypervisor."""
     __tablename__ = 'bw_usage_cache'
+    __table_args__ = (Index('bw_usage_cache_uuid_mac_start_period_idx',
+                            'uuid', 'mac', 'start_period', unique=True), )
     id = Column(Integer, primary_key=True, nullable=False)
     uuid = Column(String(36), nullable=False)
     mac = Column(String(255), nullable=False)
@@ -904,6 +906,8 @@ class BandwidthUsage(BASE, NovaBase):
 class VolumeUsage(BASE, NovaBase):
     """Cache for volume usage data pulled from the hypervisor."""
     __tablename__ = 'volume_usage_cache'
+    __table_args__ = (Index('volume_usage_cache_volume_id_idx', 'volume_id',
+                            unique=True), )
     id = Column(Integer, primary_key=True, nullable=False)
     volume_id = Column(String(36), nullable=False)
     instance_id = Column(Integer)
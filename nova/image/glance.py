@@ -20,6 +20,7 @@
 from __future__ import absolute_import
 
 import copy
+import hashlib
 import itertools
 import random
 import shutil
@@ -27,9 +28,11 @@ import sys
 import time
 import urlparse
 
+from eventlet import pools
 import glanceclient
 import glanceclient.exc
 
+from nova.common import memorycache
 from nova import exception
 from nova.openstack.common import cfg
 from nova.openstack.common import jsonutils
@@ -64,6 +67,19 @@ glance_opts = [
                 help='A list of url scheme that can be downloaded directly '
                      'via the direct_url.  Currently supported schemes: '
                      '[file].'),
+    cfg.IntOpt('glance_metadata_cache_ttl',
+               default=0,
+               help='Number of seconds to cache the metadata of active '
+                    'images returned by glance. 0 disables the cache'),
+    cfg.IntOpt('glance_metadata_cache_negative_ttl',
+               default=0,
+               help='Number of seconds to remember that an image was not '
+                    'found in glance. Only used when '
+                    'glance_metadata_cache_ttl is set'),
+    cfg.IntOpt('glance_client_pool_size',
+               default=0,
+               help='Maximum number of glance clients kept for reuse per '
+                    'glance api server. 0 creates a new client per call'),
     ]
 
 LOG = logging.getLogger(__name__)
@@ -108,12 +124,51 @@ def _create_glance_client(context, host, port, use_ssl, version=1):
         scheme = 'http'
     params = {}
     params['insecure'] = CONF.glance_api_insecure
-    if CONF.auth_strategy == 'keystone':
+    if CONF.auth_strategy == 'keystone' and context is not None:
         params['token'] = context.auth_token
     endpoint = '%s://%s:%s' % (scheme, host, port)
     return glanceclient.Client(str(version), endpoint, **params)
 
 
+def _set_client_token(client, context):
+    """Make a pooled glanceclient.Client act on behalf of context."""
+    if CONF.auth_strategy == 'keystone':
+        # v1 clients are an http client themselves, v2 clients wrap one.
+        http_client = getattr(client, 'http_client', client)
+        http_client.auth_token = context and context.auth_token
+
+
+class GlanceClientPool(pools.Pool):
+    """Class that implements a pool of clients for one glance server."""
+
+    def __init__(self, host, port, use_ssl, version, *args, **kwargs):
+        self.host = host
+        self.port = port
+        self.use_ssl = use_ssl
+        self.version = version
+        kwargs.setdefault('max_size', CONF.glance_client_pool_size)
+        kwargs.setdefault('order_as_stack', True)
+        super(GlanceClientPool, self).__init__(*args, **kwargs)
+
+    def create(self):
+        LOG.debug(_('Pool creating new glance client for %(host)s:%(port)s'),
+                  {'host': self.host, 'port': self.port})
+        return _create_glance_client(None, self.host, self.port,
+                                     self.use_ssl, self.version)
+
+
+_CLIENT_POOLS = {}
+
+
+def _get_client_pool(host, port, use_ssl, version):
+    """Return the process-wide client pool for a glance api server."""
+    key = (host, port, use_ssl, version)
+    pool = _CLIENT_POOLS.get(key)
+    if pool is None:
+        pool = _CLIENT_POOLS[key] = GlanceClientPool(*key)
+    return pool
+
+
 def get_api_servers():
     """
     Shuffle a list of CONF.glance_api_servers and return an iterator
@@ -165,6 +220,16 @@ class GlanceClientWrapper(object):
                                      self.host, self.port,
                                      self.use_ssl, version)
 
+    def _get_pooled_client(self, context, version):
+        """Check out a client from the pool of the next api server."""
+        if self.api_servers is None:
+            self.api_servers = get_api_servers()
+        self.host, self.port, self.use_ssl = self.api_servers.next()
+        pool = _get_client_pool(self.host, self.port, self.use_ssl, version)
+        client = pool.get()
+        _set_client_token(client, context)
+        return pool, client
+
     def call(self, context, version, method, *args, **kwargs):
         """
         Call a glance client method.  If we get a connection error,
@@ -176,8 +241,13 @@ class GlanceClientWrapper(object):
         num_attempts = 1 + CONF.glance_num_retries
 
         for attempt in xrange(1, num_attempts + 1):
-            client = self.client or self._create_onetime_client(context,
-                                                                version)
+            pool = None
+            if self.client:
+                client = self.client
+            elif CONF.glance_client_pool_size:
+                pool, client = self._get_pooled_client(context, version)
+            else:
+                client = self._create_onetime_client(context, version)
             try:
                 return getattr(client.images, method)(*args, **kwargs)
             except retry_excs as e:
@@ -193,6 +263,99 @@ class GlanceClientWrapper(object):
                             host=host, port=port, reason=str(e))
                 LOG.exception(error_msg, locals())
                 time.sleep(1)
+            finally:
+                if pool is not None:
+                    _set_client_token(client, None)
+                    pool.put(client)
+
+
+_NOT_FOUND = 'glance-image-not-found'
+
+
+class ImageMetadataCache(object):
+    """Process-wide cache of image metadata returned by glance.
+
+    Entries are keyed by image id and by the visibility scope of the
+    requesting context, so an answer is only shared between tenants when
+    the image is public. Only active images are cached: images that are
+    still being uploaded or snapshotted are always refreshed from glance,
+    since callers poll them for status changes.
+    """
+
+    def __init__(self):
+        self._cache = memorycache.get_client()
+
+    @staticmethod
+    def _scope(context):
+        # Glance decides visibility from the token's tenant and roles,
+        # without a token _is_image_available also checks the user.
+        if getattr(context, 'auth_token', None):
+            return 'project:%s:admin:%s' % (context.project_id,
+                                            context.is_admin)
+        return 'project:%s:user:%s:admin:%s' % (context.project_id,
+                                                context.user_id,
+                                                context.is_admin)
+
+    @staticmethod
+    def _key(image_id, scope):
+        # memcached keys are limited in length and character set.
+        raw = ('%s|%s' % (image_id, scope)).encode('utf-8')
+        return 'glance-image-%s' % hashlib.sha1(raw).hexdigest()
+
+    def _keys(self, context, image_id):
+        return [self._key(image_id, 'public'),
+                self._key(image_id, self._scope(context))]
+
+    def get(self, context, image_id):
+        """Return cached image metadata or None on a cache miss.
+
+        :raises: ImageNotFound if the image is known not to exist.
+        """
+        for key in self._keys(context, image_id):
+            image_meta = self._cache.get(key)
+            if image_meta is None:
+                continue
+            if image_meta == _NOT_FOUND:
+                raise exception.ImageNotFound(image_id=image_id)
+            return copy.deepcopy(image_meta)
+        return None
+
+    def add(self, context, image_meta):
+        """Remember the metadata of an active image."""
+        if image_meta.get('status') != 'active':
+            return
+        if image_meta.get('is_public'):
+            scope = 'public'
+        else:
+            scope = self._scope(context)
+        self._cache.set(self._key(image_meta['id'], scope),
+                        copy.deepcopy(image_meta),
+                        time=CONF.glance_metadata_cache_ttl)
+
+    def add_missing(self, context, image_id):
+        """Remember that an image is not visible to context."""
+        ttl = CONF.glance_metadata_cache_negative_ttl
+        if ttl:
+            self._cache.set(self._key(image_id, self._scope(context)),
+                            _NOT_FOUND, time=ttl)
+
+    def invalidate(self, context, image_id):
+        """Forget what is known about an image after changing it."""
+        for key in self._keys(context, image_id):
+            self._cache.delete(key)
+
+
+_IMAGE_CACHE = None
+
+
+def _get_image_cache():
+    """Return the process-wide image metadata cache, if it is enabled."""
+    global _IMAGE_CACHE
+    if not CONF.glance_metadata_cache_ttl:
+        return None
+    if _IMAGE_CACHE is None:
+        _IMAGE_CACHE = ImageMetadataCache()
+    return _IMAGE_CACHE
 
 
 class GlanceImageService(object):
@@ -233,15 +396,29 @@ class GlanceImageService(object):
 
     def show(self, context, image_id):
         """Returns a dict with image data for the given opaque image id."""
+        cache = _get_image_cache()
+        if cache is not None:
+            base_image_meta = cache.get(context, image_id)
+            if base_image_meta is not None:
+                return base_image_meta
+
         try:
             image = self._client.call(context, 1, 'get', image_id)
+        except glanceclient.exc.NotFound:
+            if cache is not None:
+                cache.add_missing(context, image_id)
+            _reraise_translated_image_exception(image_id)
         except Exception:
             _reraise_translated_image_exception(image_id)
 
         if not self._is_image_available(context, image):
+            if cache is not None:
+                cache.add_missing(context, image_id)
             raise exception.ImageNotFound(image_id=image_id)
 
         base_image_meta = self._translate_from_glance(image)
+        if cache is not None:
+            cache.add(context, base_image_meta)
         return base_image_meta
 
     def get_location(self, context, image_id):
@@ -293,7 +470,9 @@ class GlanceImageService(object):
         recv_service_image_meta = self._client.call(context, 1, 'create',
                                                     **sent_service_image_meta)
 
-        return self._translate_from_glance(recv_service_image_meta)
+        image_meta = self._translate_from_glance(recv_service_image_meta)
+        self._invalidate_cache(context, image_meta['id'])
+        return image_meta
 
     def update(self, context, image_id, image_meta, data=None,
             purge_props=True):
@@ -305,6 +484,7 @@ class GlanceImageService(object):
         image_meta.pop('id', None)
         if data:
             image_meta['data'] = data
+        self._invalidate_cache(context, image_id)
         try:
             image_meta = self._client.call(context, 1, 'update',
                                            image_id, **image_meta)
@@ -321,6 +501,7 @@ class GlanceImageService(object):
         :raises: ImageNotAuthorized if the user is not authorized.
 
         """
+        self._invalidate_cache(context, image_id)
         try:
             self._client.call(context, 1, 'delete', image_id)
         except glanceclient.exc.NotFound:
@@ -329,6 +510,12 @@ class GlanceImageService(object):
             raise exception.ImageNotAuthorized(image_id=image_id)
         return True
 
+    @staticmethod
+    def _invalidate_cache(context, image_id):
+        cache = _get_image_cache()
+        if cache is not None and image_id is not None:
+            cache.invalidate(context, image_id)
+
     @staticmethod
     def _translate_to_glance(image_meta):
         image_meta = _convert_to_string(image_meta)
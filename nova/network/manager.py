@@ -170,6 +170,58 @@ CONF.import_opt('my_ip', 'nova.netconf')
 CONF.import_opt('network_topic', 'nova.network.rpcapi')
 
 
+def _ip_filter_to_sql(ip_filter):
+    """Derive a SQL condition narrowing down matches of an ip filter.
+
+    The ip filters of the servers API are regular expressions matched
+    against the start of an address; what is usually passed is an
+    escaped exact address (see compute.API.get_all) or an address
+    prefix.  Returns an (address, address_like) tuple, where address is
+    set if the filter can only match that exact address and
+    address_like is a LIKE pattern any match must satisfy.  Both are
+    None if nothing useful can be derived, in which case every address
+    has to be checked against the regular expression.
+    """
+    pattern = str(ip_filter)
+    if '|' in pattern or '(?' in pattern:
+        return None, None
+    if pattern.startswith('^'):
+        pattern = pattern[1:]
+
+    # Collect the leading characters matching exactly one character,
+    # with an unescaped '.' matching any character like LIKE's '_'
+    chars = []
+    idx = 0
+    while idx < len(pattern):
+        char = pattern[idx]
+        if char == '\\' and pattern[idx + 1:idx + 2] in ('.', ':'):
+            chars.append(pattern[idx + 1])
+            idx += 2
+        elif char.isalnum() or char == ':':
+            chars.append(char)
+            idx += 1
+        elif char == '.':
+            chars.append('_')
+            idx += 1
+        else:
+            break
+
+    rest = pattern[idx:]
+    if rest[:1] in ('*', '?', '{'):
+        # The last character is optional or repeated
+        chars = chars[:-1]
+        rest = None
+
+    if not chars:
+        return None, None
+    literal = ''.join(chars)
+    if rest == '$':
+        if '_' not in literal:
+            return literal, None
+        return None, literal
+    return None, literal + '%'
+
+
 class RPCAllocateFixedIP(object):
     """Mixin class originally for FlatDCHP and VLAN network managers.
 
@@ -400,52 +452,53 @@ class NetworkManager(manager.SchedulerDependentManager):
 
     def get_instance_uuids_by_ip_filter(self, context, filters):
         fixed_ip_filter = filters.get('fixed_ip')
-        ip_filter = re.compile(str(filters.get('ip')))
-        ipv6_filter = re.compile(str(filters.get('ip6')))
-
-        # NOTE(jkoelker) Should probably figure out a better way to do
-        #                this. But for now it "works", this could suck on
-        #                large installs.
-
-        vifs = self.db.virtual_interface_get_all(context)
+        ip_filter = filters.get('ip')
+        ipv6_filter = filters.get('ip6')
         results = []
 
-        for vif in vifs:
-            if vif['instance_uuid'] is None:
-                continue
-
-            network = self._get_network_by_id(context, vif['network_id'])
-            fixed_ipv6 = None
-            if network['cidr_v6'] is not None:
-                fixed_ipv6 = ipv6.to_global(network['cidr_v6'],
+        if ipv6_filter is not None:
+            # IPv6 addresses are derived from the vif's MAC address and the
+            # network, so they can't be looked up in the database
+            ipv6_regex = re.compile(str(ipv6_filter))
+            for vif in self.db.virtual_interface_get_all_ipv6(context):
+                fixed_ipv6 = ipv6.to_global(vif['cidr_v6'],
                                             vif['address'],
                                             context.project_id)
-
-            if fixed_ipv6 and ipv6_filter.match(fixed_ipv6):
-                results.append({'instance_uuid': vif['instance_uuid'],
-                                'ip': fixed_ipv6})
-
-            vif_id = vif['id']
-            fixed_ips = self.db.fixed_ips_by_virtual_interface(context,
-                                                               vif_id)
-            for fixed_ip in fixed_ips:
-                if not fixed_ip or not fixed_ip['address']:
-                    continue
-                if fixed_ip['address'] == fixed_ip_filter:
+                if ipv6_regex.match(fixed_ipv6):
                     results.append({'instance_uuid': vif['instance_uuid'],
-                                    'ip': fixed_ip['address']})
+                                    'ip': fixed_ipv6})
+
+        matched = set()
+        if fixed_ip_filter is not None:
+            for fixed_ip in self.db.virtual_interface_get_fixed_ips(
+                    context, address=fixed_ip_filter):
+                results.append({'instance_uuid': fixed_ip['instance_uuid'],
+                                'ip': fixed_ip['address']})
+                matched.add(fixed_ip['address'])
+
+        if ip_filter is not None:
+            # Let the database narrow down the candidates, the regular
+            # expression has the final say.
+            ip_regex = re.compile(str(ip_filter))
+            address, address_like = _ip_filter_to_sql(ip_filter)
+            for fixed_ip in self.db.virtual_interface_get_fixed_ips(
+                    context, address=address, address_like=address_like):
+                if fixed_ip['address'] in matched:
                     continue
-                if ip_filter.match(fixed_ip['address']):
-                    results.append({'instance_uuid': vif['instance_uuid'],
+                if ip_regex.match(fixed_ip['address']):
+                    results.append({'instance_uuid': fixed_ip['instance_uuid'],
                                     'ip': fixed_ip['address']})
+                    matched.add(fixed_ip['address'])
+
+            # Floating ips are only reported for fixed ips not matching
+            for floating_ip in self.db.virtual_interface_get_floating_ips(
+                    context, address=address, address_like=address_like):
+                if floating_ip['fixed_address'] in matched:
                     continue
-                for floating_ip in fixed_ip.get('floating_ips', []):
-                    if not floating_ip or not floating_ip['address']:
-                        continue
-                    if ip_filter.match(floating_ip['address']):
-                        results.append({'instance_uuid': vif['instance_uuid'],
-                                        'ip': floating_ip['address']})
-                        continue
+                if ip_regex.match(floating_ip['address']):
+                    results.append({
+                            'instance_uuid': floating_ip['instance_uuid'],
+                            'ip': floating_ip['address']})
 
         return results
 
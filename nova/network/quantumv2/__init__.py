@@ -15,10 +15,12 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+from eventlet import pools
 from nova.openstack.common import cfg
 from nova.openstack.common import excutils
 from nova.openstack.common import log as logging
 from quantumclient import client
+from quantumclient.common import exceptions
 from quantumclient.v2_0 import client as clientv20
 
 CONF = cfg.CONF
@@ -56,9 +58,91 @@ def _get_client(token=None):
     return clientv20.Client(**params)
 
 
+class ClientPool(pools.Pool):
+    """Class that implements a pool of quantum clients.
+
+    The clients keep their HTTP connections to quantum open between
+    requests, the token to use is set each time one is checked out.
+    """
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('max_size', CONF.quantum_client_pool_size)
+        kwargs.setdefault('order_as_stack', True)
+        super(ClientPool, self).__init__(*args, **kwargs)
+
+    def create(self):
+        LOG.debug(_('Pool creating new quantum client for %s'),
+                  CONF.quantum_url)
+        return clientv20.Client(endpoint_url=CONF.quantum_url,
+                                timeout=CONF.quantum_url_timeout,
+                                auth_strategy=None)
+
+
+_CLIENT_POOL = None
+_ADMIN_TOKEN = None
+
+
+def _get_client_pool():
+    global _CLIENT_POOL
+    if _CLIENT_POOL is None:
+        _CLIENT_POOL = ClientPool()
+    return _CLIENT_POOL
+
+
+def _get_admin_token(refresh=False):
+    """Return the admin token shared by pooled clients."""
+    global _ADMIN_TOKEN
+    if refresh or _ADMIN_TOKEN is None:
+        _ADMIN_TOKEN = _get_auth_token()
+    return _ADMIN_TOKEN
+
+
+class PooledClient(object):
+    """Quantum client running each call on a client from the pool.
+
+    Calls made without a user token use the admin token, which is only
+    fetched from keystone again once quantum stops accepting it.
+    """
+
+    def __init__(self, token=None):
+        self.token = token
+
+    def _call(self, method, *args, **kwargs):
+        use_admin_token = not self.token and CONF.quantum_auth_strategy
+        token = self.token
+        if use_admin_token:
+            token = _get_admin_token()
+        pool = _get_client_pool()
+        client = pool.get()
+        try:
+            client.httpclient.auth_token = token
+            try:
+                return getattr(client, method)(*args, **kwargs)
+            except exceptions.Unauthorized:
+                if not use_admin_token:
+                    raise
+                LOG.debug(_('Quantum rejected the admin token, '
+                            'authenticating again'))
+                client.httpclient.auth_token = _get_admin_token(refresh=True)
+                return getattr(client, method)(*args, **kwargs)
+        finally:
+            client.httpclient.auth_token = None
+            pool.put(client)
+
+    def __getattr__(self, name):
+        if not callable(getattr(clientv20.Client, name, None)):
+            raise AttributeError(name)
+
+        def call(*args, **kwargs):
+            return self._call(name, *args, **kwargs)
+        return call
+
+
 def get_client(context, admin=False):
     if admin:
         token = None
     else:
         token = context.auth_token
+    if CONF.quantum_client_pool_size:
+        return PooledClient(token=token)
     return _get_client(token=token)
@@ -16,6 +16,7 @@
 #
 # vim: tabstop=4 shiftwidth=4 softtabstop=4
 
+from nova.common import memorycache
 from nova import conductor
 from nova.db import base
 from nova import exception
@@ -56,6 +57,16 @@ quantum_opts = [
     cfg.StrOpt('quantum_ovs_bridge',
                default='br-int',
                help='Name of Integration Bridge used by Open vSwitch'),
+    cfg.IntOpt('quantum_client_pool_size',
+               default=0,
+               help='Maximum number of quantum clients kept for reuse, '
+                    'along with their connections and the admin token. '
+                    '0 creates a new client per call'),
+    cfg.IntOpt('quantum_cache_ttl',
+               default=0,
+               help='Number of seconds to cache the networks, subnets and '
+                    'dhcp ports used to build instance network info. '
+                    '0 disables the cache'),
     ]
 
 CONF = cfg.CONF
@@ -68,6 +79,45 @@ NET_EXTERNAL = 'router:external'
 refresh_cache = network_api.refresh_cache
 update_instance_info_cache = network_api.update_instance_cache_with_nw_info
 
+_CACHE = None
+
+
+def _get_cache():
+    """Return the process-wide cache of quantum objects, if enabled."""
+    global _CACHE
+    if not CONF.quantum_cache_ttl:
+        return None
+    if _CACHE is None:
+        _CACHE = memorycache.get_client()
+    return _CACHE
+
+
+def _cache_get_many(kind, ids):
+    """Look ids up in the cache.
+
+    Returns a dict of the values found, keyed by id, and the list of ids
+    that were not found.
+    """
+    cache = _get_cache()
+    if cache is None:
+        return {}, list(ids)
+    found = {}
+    missing = []
+    for obj_id in ids:
+        value = cache.get('quantum-%s-%s' % (kind, obj_id))
+        if value is None:
+            missing.append(obj_id)
+        else:
+            found[obj_id] = value
+    return found, missing
+
+
+def _cache_set(kind, obj_id, value):
+    cache = _get_cache()
+    if cache is not None:
+        cache.set('quantum-%s-%s' % (kind, obj_id), value,
+                  time=CONF.quantum_cache_ttl)
+
 
 class API(base.Base):
     """API for interacting with the quantum 2.x API."""
@@ -79,11 +129,18 @@ class API(base.Base):
         """Setup or teardown the network structures."""
 
     def _get_available_networks(self, context, project_id,
-                                net_ids=None):
+                                net_ids=None, use_cache=False):
         """Return a network list available for the tenant.
         The list contains networks owned by the tenant and public networks.
         If net_ids specified, it searches networks with requested IDs only.
+        If use_cache is set, a list cached for the tenant by an earlier
+        call may be returned.
         """
+        if use_cache and not net_ids:
+            cached, _missing = _cache_get_many('networks', [project_id])
+            if cached:
+                return cached[project_id]
+
         quantum = quantumv2.get_client(context)
 
         # If user has specified to attach instance only to specific
@@ -104,6 +161,8 @@ class API(base.Base):
             nets,
             net_ids)
 
+        if use_cache and not net_ids:
+            _cache_set('networks', project_id, nets)
         return nets
 
     def allocate_for_instance(self, context, instance, **kwargs):
@@ -638,7 +697,8 @@ class API(base.Base):
         ports = data.get('ports', [])
         if not networks:
             networks = self._get_available_networks(context,
-                                                    instance['project_id'])
+                                                    instance['project_id'],
+                                                    use_cache=True)
         else:
             # ensure ports are in preferred network order
             _ensure_requested_network_ordering(
@@ -646,6 +706,15 @@ class API(base.Base):
                 ports,
                 [n['id'] for n in networks])
 
+        # Look the subnets and dhcp ports of all the ports up at once
+        subnet_ids = []
+        for port in ports:
+            subnet_ids.extend(ip['subnet_id'] for ip in port['fixed_ips'])
+        ipam_subnets = self._get_subnets(context, subnet_ids)
+        network_ids = [subnet['network_id']
+                       for subnet in ipam_subnets.values()]
+        dhcp_ports = self._get_dhcp_ports(context, network_ids)
+
         nw_info = network_model.NetworkInfo()
         for port in ports:
             network_name = None
@@ -659,7 +728,8 @@ class API(base.Base):
                                               for ip in port['fixed_ips']]]
             # TODO(gongysh) get floating_ips for each fixed_ip
 
-            subnets = self._get_subnets_from_port(context, port)
+            subnets = self._get_subnets_from_port(context, port,
+                                                  ipam_subnets, dhcp_ports)
             for subnet in subnets:
                 subnet['ips'] = [fixed_ip for fixed_ip in network_IPs
                                  if fixed_ip.is_in_subnet(subnet)]
@@ -698,8 +768,39 @@ class API(base.Base):
                 devname=devname))
         return nw_info
 
-    def _get_subnets_from_port(self, context, port):
-        """Return the subnets for a given port."""
+    def _get_subnets(self, context, subnet_ids):
+        """Return the quantum subnets with the given ids, keyed by id."""
+        subnets, missing = _cache_get_many('subnet', set(subnet_ids))
+        if missing:
+            data = quantumv2.get_client(context).list_subnets(id=missing)
+            for subnet in data.get('subnets', []):
+                subnets[subnet['id']] = subnet
+                _cache_set('subnet', subnet['id'], subnet)
+        return subnets
+
+    def _get_dhcp_ports(self, context, network_ids):
+        """Return the dhcp ports of the given networks, keyed by network."""
+        dhcp_ports, missing = _cache_get_many('dhcp-ports', set(network_ids))
+        if missing:
+            search_opts = {'network_id': missing,
+                           'device_owner': 'network:dhcp'}
+            data = quantumv2.get_client(context).list_ports(**search_opts)
+            for network_id in missing:
+                dhcp_ports[network_id] = []
+            for p in data.get('ports', []):
+                dhcp_ports.setdefault(p['network_id'], []).append(p)
+            for network_id in missing:
+                _cache_set('dhcp-ports', network_id, dhcp_ports[network_id])
+        return dhcp_ports
+
+    def _get_subnets_from_port(self, context, port, ipam_subnets=None,
+                               dhcp_ports=None):
+        """Return the subnets for a given port.
+
+        ipam_subnets and dhcp_ports are the results of _get_subnets and
+        _get_dhcp_ports, when the caller already looked them up for a
+        number of ports.
+        """
 
         fixed_ips = port['fixed_ips']
         # No fixed_ips for the port means there is no subnet associated
@@ -709,12 +810,20 @@ class API(base.Base):
         # related to the port. To avoid this, the method returns here.
         if not fixed_ips:
             return []
-        search_opts = {'id': [ip['subnet_id'] for ip in fixed_ips]}
-        data = quantumv2.get_client(context).list_subnets(**search_opts)
-        ipam_subnets = data.get('subnets', [])
+        subnet_ids = []
+        for ip in fixed_ips:
+            if ip['subnet_id'] not in subnet_ids:
+                subnet_ids.append(ip['subnet_id'])
+        if ipam_subnets is None:
+            ipam_subnets = self._get_subnets(context, subnet_ids)
+        port_subnets = [ipam_subnets[subnet_id] for subnet_id in subnet_ids
+                        if subnet_id in ipam_subnets]
+        if dhcp_ports is None:
+            dhcp_ports = self._get_dhcp_ports(
+                context, [subnet['network_id'] for subnet in port_subnets])
         subnets = []
 
-        for subnet in ipam_subnets:
+        for subnet in port_subnets:
             subnet_dict = {'cidr': subnet['cidr'],
                            'gateway': network_model.IP(
                                 address=subnet['gateway_ip'],
@@ -722,11 +831,7 @@ class API(base.Base):
             }
 
             # attempt to populate DHCP server field
-            search_opts = {'network_id': subnet['network_id'],
-                           'device_owner': 'network:dhcp'}
-            data = quantumv2.get_client(context).list_ports(**search_opts)
-            dhcp_ports = data.get('ports', [])
-            for p in dhcp_ports:
+            for p in dhcp_ports.get(subnet['network_id'], []):
                 for ip_pair in p['fixed_ips']:
                     if ip_pair['subnet_id'] == subnet['id']:
                         subnet_dict['dhcp_server'] = ip_pair['ip_address']
@@ -54,6 +54,11 @@ CONF.register_opt(notify_state_opt)
 CONF.register_opt(notify_any_opt)
 CONF.register_opt(notify_api_faults)
 
+# Bandwidth usages of the instances of this host, as last polled by the
+# compute manager: the audit period they are for, and the usages keyed by
+# instance uuid
+_bw_usage_cache = {'start_period': None, 'usages': {}}
+
 
 def send_api_fault(url, status, exception):
     """Send an api.fault notification."""
@@ -208,10 +213,36 @@ def audit_period_bounds(current_period=False):
     return (audit_start, audit_end)
 
 
+def cache_bandwidth_usages(start_period, usages):
+    """Replace the cached bandwidth usages of the instances of this host.
+
+    usages are the bandwidth usages of all of the instances of the host
+    for the audit period starting at start_period, as written to the
+    database.
+    """
+    by_uuid = {}
+    for usage in usages:
+        by_uuid.setdefault(usage['uuid'], []).append(
+            dict(mac=usage['mac'], bw_in=usage['bw_in'],
+                 bw_out=usage['bw_out']))
+    _bw_usage_cache['start_period'] = start_period
+    _bw_usage_cache['usages'] = by_uuid
+
+
+def _get_bandwidth_usages(context, instance_uuid, audit_start):
+    if (_bw_usage_cache['start_period'] == audit_start and
+            instance_uuid in _bw_usage_cache['usages']):
+        return _bw_usage_cache['usages'][instance_uuid]
+    return db.bw_usage_get_by_uuids(context, [instance_uuid], audit_start)
+
+
 def bandwidth_usage(instance_ref, audit_start,
         ignore_missing_network_data=True):
     """Get bandwidth usage information for the instance for the
     specified audit period.
+
+    The usages polled last by the compute manager of this host are used
+    when they are for that period, the database is queried otherwise.
     """
 
     admin_context = nova.context.get_admin_context(read_deleted='yes')
@@ -232,10 +263,10 @@ def bandwidth_usage(instance_ref, audit_start,
             raise
 
     macs = [vif['address'] for vif in nw_info]
-    uuids = [instance_ref["uuid"]]
 
-    bw_usages = db.bw_usage_get_by_uuids(admin_context, uuids, audit_start)
-    bw_usages = [b for b in bw_usages if b.mac in macs]
+    bw_usages = _get_bandwidth_usages(admin_context, instance_ref['uuid'],
+                                      audit_start)
+    bw_usages = [b for b in bw_usages if b['mac'] in macs]
 
     bw = {}
 
@@ -246,7 +277,7 @@ def bandwidth_usage(instance_ref, audit_start,
                 label = vif['network']['label']
                 break
 
-        bw[label] = dict(bw_in=b.bw_in, bw_out=b.bw_out)
+        bw[label] = dict(bw_in=b['bw_in'], bw_out=b['bw_out'])
 
     return bw
 
@@ -271,6 +271,13 @@ sql_opts = [
                        '../', '$sqlite_db')),
                help='The SQLAlchemy connection string used to connect to the '
                     'database'),
+    cfg.StrOpt('sql_slave_connection',
+               default='',
+               help='The SQLAlchemy connection string used to connect to a '
+                    'read-only replica of the database, for the calls that '
+                    'can read from it. Not used if empty. Nova also needs '
+                    'memcached_servers, for all its processes to know the '
+                    'requests that wrote to the database'),
     cfg.StrOpt('sqlite_db',
                default='nova.sqlite',
                help='the filename to use with sqlite'),
@@ -316,6 +323,8 @@ LOG = logging.getLogger(__name__)
 
 _ENGINE = None
 _MAKER = None
+_SLAVE_ENGINE = None
+_SLAVE_MAKER = None
 
 
 def set_defaults(sql_connection, sqlite_db):
@@ -325,9 +334,20 @@ def set_defaults(sql_connection, sqlite_db):
                      sqlite_db=sqlite_db)
 
 
-def get_session(autocommit=True, expire_on_commit=False):
-    """Return a SQLAlchemy session."""
-    global _MAKER
+def get_session(autocommit=True, expire_on_commit=False,
+                slave_session=False):
+    """Return a SQLAlchemy session.
+
+    With slave_session, the session reads from the database replica if
+    sql_slave_connection is set.
+    """
+    global _MAKER, _SLAVE_MAKER
+
+    if slave_session and CONF.sql_slave_connection:
+        if _SLAVE_MAKER is None:
+            engine = get_engine(slave_engine=True)
+            _SLAVE_MAKER = get_maker(engine, autocommit, expire_on_commit)
+        return _SLAVE_MAKER()
 
     if _MAKER is None:
         engine = get_engine()
@@ -436,14 +456,40 @@ def wrap_db_error(f):
     return _wrap
 
 
-def get_engine():
-    """Return a SQLAlchemy engine."""
-    global _ENGINE
+def get_engine(slave_engine=False):
+    """Return a SQLAlchemy engine.
+
+    With slave_engine, return the engine of the database replica if
+    sql_slave_connection is set.
+    """
+    global _ENGINE, _SLAVE_ENGINE
+    if slave_engine and CONF.sql_slave_connection:
+        if _SLAVE_ENGINE is None:
+            _SLAVE_ENGINE = create_engine(CONF.sql_slave_connection)
+        return _SLAVE_ENGINE
     if _ENGINE is None:
         _ENGINE = create_engine(CONF.sql_connection)
     return _ENGINE
 
 
+def cleanup():
+    """Close the connections of the engines, if they were created.
+
+    The next session or engine asked for gets new ones. This is what
+    processes that are about to fork have to do for their children not
+    to share connections with them.
+    """
+    global _ENGINE, _MAKER, _SLAVE_ENGINE, _SLAVE_MAKER
+    _MAKER = None
+    _SLAVE_MAKER = None
+    if _ENGINE is not None:
+        _ENGINE.dispose()
+        _ENGINE = None
+    if _SLAVE_ENGINE is not None:
+        _SLAVE_ENGINE.dispose()
+        _SLAVE_ENGINE = None
+
+
 def synchronous_switch_listener(dbapi_conn, connection_rec):
     """Switch sqlite connections to non-synchronous mode."""
     dbapi_conn.execute("PRAGMA synchronous = OFF")
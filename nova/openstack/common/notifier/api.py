@@ -13,8 +13,12 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import os
 import uuid
 
+import eventlet
+from eventlet import queue
+
 from nova.openstack.common import cfg
 from nova.openstack.common import context
 from nova.openstack.common.gettextutils import _
@@ -37,6 +41,19 @@ notifier_opts = [
     cfg.StrOpt('default_publisher_id',
                default='$host',
                help='Default publisher_id for outgoing notifications'),
+    cfg.IntOpt('notification_queue_size',
+               default=0,
+               help='Number of notifications waiting to be sent in the '
+                    'background; 0 sends them in the caller'),
+    cfg.StrOpt('notification_queue_full_policy',
+               default='block',
+               help='What to do with a notification when the queue is '
+                    'full: "block" waits for room in the queue, "drop" '
+                    'drops the notification'),
+    cfg.IntOpt('notification_batch_size',
+               default=50,
+               help='Maximum number of queued notifications sent together '
+                    'by the drivers supporting it'),
 ]
 
 CONF = cfg.CONF
@@ -134,14 +151,86 @@ def notify(context, publisher_id, event_type, priority, payload):
                payload=payload,
                timestamp=str(timeutils.utcnow()))
 
+    if CONF.notification_queue_size > 0:
+        _enqueue(context, msg)
+        return
+
     for driver in _get_drivers():
+        _notify_driver(driver, context, msg)
+
+
+def _notify_driver(driver, context, msg):
+    try:
+        driver.notify(context, msg)
+    except Exception as e:
+        LOG.exception(_("Problem '%(e)s' attempting to "
+                        "send to notification system. "
+                        "Payload=%(payload)s")
+                      % dict(e=e, payload=msg['payload']))
+
+
+# Notifications waiting to be sent by the sender greenthread, created by
+# the process they are queued in
+_queue = None
+_queue_pid = None
+
+
+def _enqueue(context, msg):
+    global _queue
+    global _queue_pid
+    if _queue_pid != os.getpid():
+        # The queue and its sender, if any, were left by the parent of a
+        # forked process
+        _queue = queue.Queue(CONF.notification_queue_size)
+        _queue_pid = os.getpid()
+        eventlet.spawn_n(_send_queued, _queue)
+
+    if CONF.notification_queue_full_policy == 'drop':
         try:
-            driver.notify(context, msg)
-        except Exception as e:
-            LOG.exception(_("Problem '%(e)s' attempting to "
-                            "send to notification system. "
-                            "Payload=%(payload)s")
-                          % dict(e=e, payload=payload))
+            _queue.put_nowait((context, msg))
+        except queue.Full:
+            LOG.warn(_("Notification queue full, dropping %(event_type)s "
+                       "notification %(message_id)s"), msg)
+    else:
+        _queue.put((context, msg))
+
+
+def _send_queued(notifications):
+    """Send the queued notifications, in batches."""
+    while True:
+        batch = [notifications.get()]
+        while len(batch) < CONF.notification_batch_size:
+            try:
+                batch.append(notifications.get_nowait())
+            except queue.Empty:
+                break
+        try:
+            _send_batch(batch)
+        finally:
+            for _notification in batch:
+                notifications.task_done()
+
+
+def _send_batch(batch):
+    for driver in _get_drivers():
+        if hasattr(driver, 'notify_many'):
+            try:
+                driver.notify_many(batch)
+            except Exception:
+                LOG.exception(_("Problem attempting to send %d notifications "
+                                "to notification system"), len(batch))
+        else:
+            for context, msg in batch:
+                _notify_driver(driver, context, msg)
+
+
+def flush():
+    """Wait for the queued notifications to be sent.
+
+    Called before the process exits.
+    """
+    if _queue is not None and _queue_pid == os.getpid():
+        _queue.join()
 
 
 _drivers = None
@@ -44,3 +44,27 @@ def notify(context, message):
         except Exception:
             LOG.exception(_("Could not send notification to %(topic)s. "
                             "Payload=%(message)s"), locals())
+
+
+def notify_many(messages):
+    """Sends several notifications via RPC, grouped by topic.
+
+    messages is a list of (context, message) pairs.
+    """
+    by_topic = {}
+    for context, message in messages:
+        if not context:
+            context = req_context.get_admin_context()
+        priority = message.get('priority',
+                               CONF.default_notification_level)
+        priority = priority.lower()
+        for topic in CONF.notification_topics:
+            topic = '%s.%s' % (topic, priority)
+            by_topic.setdefault(topic, []).append((context, message))
+    for topic, topic_messages in by_topic.iteritems():
+        try:
+            rpc.notify_many(topic, topic_messages)
+        except Exception:
+            LOG.exception(_("Could not send %(count)d notifications to "
+                            "%(topic)s."),
+                          dict(count=len(topic_messages), topic=topic))
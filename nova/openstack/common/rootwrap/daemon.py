@@ -0,0 +1,360 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Long-lived root wrapper.
+
+The daemon is started once through sudo, loads its configuration and
+filters, and then runs the commands it is sent over a unix socket after
+checking them with the same filters as the one-shot root wrapper. It
+lives as long as the process that started it keeps its stdin open.
+
+The socket sits in a directory only the calling user can enter, the
+daemon checks the uid of every peer, and clients have to answer a
+challenge with the key the daemon printed when it started.
+
+Everything is sent as frames: a type byte, the length of the payload
+and the payload. A request is a REQUEST frame holding the command as
+json followed by a single STDIN frame; the daemon answers with STDOUT
+and STDERR frames as the command produces output and an EXIT frame
+holding the return code.
+"""
+
+import hashlib
+import hmac
+import json
+import logging
+import os
+import pwd
+import select
+import shutil
+import signal
+import socket
+import SocketServer
+import struct
+import subprocess
+import tempfile
+import threading
+
+from nova.openstack.common.rootwrap import wrapper
+
+
+RC_UNAUTHORIZED = 99
+RC_NOEXECFOUND = 96
+
+CHALLENGE = 'C'
+RESPONSE = 'R'
+REQUEST = 'Q'
+STDIN = 'I'
+STDOUT = 'O'
+STDERR = 'E'
+EXIT = 'X'
+
+# Not exported by the socket module of python 2, this is the linux value
+SO_PEERCRED = getattr(socket, 'SO_PEERCRED', 17)
+
+_HEADER = struct.Struct('!cI')
+_CHUNK_SIZE = 65536
+
+
+class ProtocolError(Exception):
+    """The other end sent something unexpected or went away."""
+    pass
+
+
+def _recv_exactly(sock, size):
+    data = []
+    while size:
+        chunk = sock.recv(size)
+        if not chunk:
+            raise ProtocolError('Connection closed')
+        data.append(chunk)
+        size -= len(chunk)
+    return ''.join(data)
+
+
+def send_frame(sock, kind, payload=''):
+    sock.sendall(_HEADER.pack(kind, len(payload)) + payload)
+
+
+def recv_frame(sock, expected=None):
+    kind, size = _HEADER.unpack(_recv_exactly(sock, _HEADER.size))
+    if expected is not None and kind not in expected:
+        raise ProtocolError('Unexpected frame %r' % kind)
+    return kind, _recv_exactly(sock, size) if size else ''
+
+
+def _answer(authkey, challenge):
+    return hmac.new(authkey, challenge, hashlib.sha256).digest()
+
+
+def _compare_digest(a, b):
+    if len(a) != len(b):
+        return False
+    result = 0
+    for x, y in zip(a, b):
+        result |= ord(x) ^ ord(y)
+    return result == 0
+
+
+def _subprocess_setup():
+    # Python installs a SIGPIPE handler by default. This is usually not what
+    # non-Python subprocesses expect.
+    signal.signal(signal.SIGPIPE, signal.SIG_DFL)
+
+
+class _RequestHandler(SocketServer.BaseRequestHandler):
+
+    def handle(self):
+        sock = self.request
+        try:
+            if not self.server.peer_allowed(sock):
+                return
+            challenge = os.urandom(20)
+            send_frame(sock, CHALLENGE, challenge)
+            _kind, response = recv_frame(sock, (RESPONSE,))
+            if not _compare_digest(response,
+                                   _answer(self.server.authkey, challenge)):
+                self.server.log_error('Rejected client with a wrong key')
+                return
+            _kind, request = recv_frame(sock, (REQUEST,))
+            _kind, process_input = recv_frame(sock, (STDIN,))
+            self.run(sock, json.loads(request)['cmd'], process_input)
+        except (ProtocolError, socket.error) as exc:
+            self.server.log_error('Connection dropped: %s' % exc)
+        except Exception as exc:
+            # The client sees the connection drop in the middle of the
+            # command, and reports it as a failure of the command
+            self.server.log_error('Failed to run command: %s' % exc)
+
+    def _refuse(self, sock, message, returncode):
+        # Answer like the one-shot root wrapper does when it exits
+        self.server.log_error(message)
+        send_frame(sock, STDOUT, 'nova-rootwrap-daemon: %s\n' % message)
+        send_frame(sock, EXIT, json.dumps({'returncode': returncode}))
+
+    def run(self, sock, userargs, process_input):
+        config = self.server.config
+        try:
+            filtermatch = wrapper.match_filter(self.server.filters, userargs,
+                                               exec_dirs=config.exec_dirs)
+        except wrapper.FilterMatchNotExecutable as exc:
+            msg = ("Executable not found: %s (filter match = %s)"
+                   % (exc.match.exec_path, exc.match.name))
+            return self._refuse(sock, msg, RC_NOEXECFOUND)
+        except wrapper.NoFilterMatched:
+            msg = ("Unauthorized command: %s (no filter matched)"
+                   % ' '.join(userargs))
+            return self._refuse(sock, msg, RC_UNAUTHORIZED)
+
+        command = filtermatch.get_command(userargs,
+                                          exec_dirs=config.exec_dirs)
+        if config.use_syslog:
+            logging.info("(%s) Executing %s (filter match = %s)" % (
+                self.server.user, command, filtermatch.name))
+
+        try:
+            obj = subprocess.Popen(command,
+                                   stdin=subprocess.PIPE,
+                                   stdout=subprocess.PIPE,
+                                   stderr=subprocess.PIPE,
+                                   close_fds=True,
+                                   preexec_fn=_subprocess_setup,
+                                   env=filtermatch.get_environment(userargs))
+        except OSError as exc:
+            msg = "Unable to execute %s: %s" % (command[0], exc)
+            return self._refuse(sock, msg, RC_NOEXECFOUND)
+        writer = threading.Thread(target=self._write_input,
+                                  args=(obj.stdin, process_input))
+        writer.start()
+
+        # Send the output back as it comes
+        streams = {obj.stdout.fileno(): STDOUT, obj.stderr.fileno(): STDERR}
+        while streams:
+            readable, _w, _x = select.select(streams.keys(), [], [])
+            for fd in readable:
+                data = os.read(fd, _CHUNK_SIZE)
+                if data:
+                    send_frame(sock, streams[fd], data)
+                else:
+                    del streams[fd]
+        writer.join()
+        obj.wait()
+        send_frame(sock, EXIT, json.dumps({'returncode': obj.returncode}))
+
+    @staticmethod
+    def _write_input(stdin, process_input):
+        try:
+            if process_input:
+                stdin.write(process_input)
+        except IOError:
+            # The command does not read all of its input
+            pass
+        finally:
+            stdin.close()
+
+
+class RootwrapServer(SocketServer.ThreadingMixIn,
+                     SocketServer.UnixStreamServer):
+    """Runs the commands allowed by filters for one user."""
+
+    daemon_threads = True
+
+    def __init__(self, address, config, filters, authkey, uid):
+        SocketServer.UnixStreamServer.__init__(self, address,
+                                               _RequestHandler)
+        self.config = config
+        self.filters = filters
+        self.authkey = authkey
+        self.uid = uid
+        try:
+            self.user = pwd.getpwuid(uid)[0]
+        except KeyError:
+            self.user = str(uid)
+
+    def log_error(self, message):
+        if self.config.use_syslog:
+            logging.error(message)
+
+    def peer_allowed(self, sock):
+        creds = sock.getsockopt(socket.SOL_SOCKET, SO_PEERCRED,
+                                struct.calcsize('3i'))
+        _pid, uid, _gid = struct.unpack('3i', creds)
+        if uid not in (self.uid, 0):
+            self.log_error('Rejected client running as uid %d' % uid)
+            return False
+        return True
+
+
+def serve(config, stdin, stdout):
+    """Run the daemon until stdin is closed.
+
+    The socket address and the key clients need are written to stdout as
+    a line of json once the daemon accepts connections.
+    """
+    # The user sudo was run by, or whoever started us
+    uid = int(os.environ.get('SUDO_UID', os.getuid()))
+    gid = int(os.environ.get('SUDO_GID', os.getgid()))
+
+    filters = wrapper.load_filters(config.filters_path)
+    tmpdir = tempfile.mkdtemp(prefix='rootwrap-')
+    try:
+        os.chmod(tmpdir, 0700)
+        os.chown(tmpdir, uid, gid)
+        address = os.path.join(tmpdir, 'rootwrap.sock')
+        authkey = os.urandom(32)
+        server = RootwrapServer(address, config, filters, authkey, uid)
+        os.chown(address, uid, gid)
+
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+        stdout.write(json.dumps({'address': address,
+                                 'authkey': authkey.encode('hex')}) + '\n')
+        stdout.flush()
+        while stdin.read(_CHUNK_SIZE):
+            pass
+        server.shutdown()
+        server.server_close()
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+class Client(object):
+    """Client of a root wrapper daemon it starts on first use.
+
+    The daemon is started again if it went away, for instance because it
+    was killed.  It is started with subprocess_module, eventlet users pass
+    eventlet.green.subprocess so that waiting for it does not block.
+    """
+
+    def __init__(self, daemon_cmd, subprocess_module=subprocess):
+        self.daemon_cmd = daemon_cmd
+        self._subprocess = subprocess_module
+        self._lock = threading.Lock()
+        self._process = None
+        self._address = None
+        self._authkey = None
+
+    def _start(self):
+        self._process = self._subprocess.Popen(
+            self.daemon_cmd, stdin=self._subprocess.PIPE,
+            stdout=self._subprocess.PIPE, close_fds=True,
+            preexec_fn=_subprocess_setup)
+        line = self._process.stdout.readline()
+        if not line:
+            self._process.wait()
+            raise ProtocolError('%s exited with %s' %
+                                (' '.join(self.daemon_cmd),
+                                 self._process.returncode))
+        try:
+            info = json.loads(line)
+        except ValueError:
+            raise ProtocolError(line.strip())
+        self._address = info['address']
+        self._authkey = info['authkey'].decode('hex')
+
+    def _connect(self, restart=False):
+        with self._lock:
+            if restart or (self._process is None or
+                           self._process.poll() is not None):
+                self.stop()
+                self._start()
+            address, authkey = self._address, self._authkey
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(address)
+            _kind, challenge = recv_frame(sock, (CHALLENGE,))
+            send_frame(sock, RESPONSE, _answer(authkey, challenge))
+        except Exception:
+            sock.close()
+            raise
+        return sock
+
+    def stop(self):
+        """Let the daemon exit, if one was started."""
+        if self._process is not None:
+            self._process.stdin.close()
+            self._process.stdout.close()
+            self._process.wait()
+            self._process = None
+
+    def execute(self, cmd, process_input=None):
+        """Run cmd through the daemon.
+
+        Returns a tuple of the return code and of the command's stdout and
+        stderr, like the one-shot root wrapper would. Raises ProtocolError
+        or socket.error when the daemon cannot be reached or goes away
+        before the command ends.
+        """
+        try:
+            sock = self._connect()
+        except (ProtocolError, socket.error):
+            sock = self._connect(restart=True)
+        try:
+            send_frame(sock, REQUEST, json.dumps({'cmd': list(cmd)}))
+            send_frame(sock, STDIN, process_input or '')
+            output = {STDOUT: [], STDERR: []}
+            while True:
+                kind, data = recv_frame(sock, (STDOUT, STDERR, EXIT))
+                if kind == EXIT:
+                    break
+                output[kind].append(data)
+        finally:
+            sock.close()
+        return (json.loads(data)['returncode'],
+                ''.join(output[STDOUT]), ''.join(output[STDERR]))
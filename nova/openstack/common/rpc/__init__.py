@@ -60,6 +60,20 @@ rpc_opts = [
     cfg.StrOpt('control_exchange',
                default='openstack',
                help='AMQP exchange to connect to if using RabbitMQ or Qpid'),
+    cfg.ListOpt('rpc_binary_topics',
+                default=[],
+                help='Topics to send messages to in the binary (msgpack) '
+                     'envelope, along with requests for binary replies. '
+                     'The format is not negotiated: only list a topic once '
+                     'every consumer of it understands envelope 2.1, older '
+                     'ones reject every message sent to it. Messages are '
+                     'sent as JSON if msgpack is not installed'),
+    cfg.IntOpt('rpc_compress_threshold',
+               default=0,
+               help='Compress binary messages bigger than this number of '
+                    'bytes. 0 never compresses them. Uncompressed binary '
+                    'messages are base64 encoded and can be bigger than '
+                    'the same messages in JSON'),
 ]
 
 cfg.CONF.register_opts(rpc_opts)
@@ -192,6 +206,24 @@ def notify(context, topic, msg, envelope=False):
     return _get_impl().notify(cfg.CONF, context, topic, msg, envelope)
 
 
+def notify_many(topic, messages, envelope=False):
+    """Send several notification events on a topic.
+
+    :param topic: The topic to send the notifications to.
+    :param messages: A list of (context, msg) pairs, msg being a dict of
+                     content of event.
+    :param envelope: Set to True to enable message envelope for notifications.
+
+    :returns: None
+    """
+    impl = _get_impl()
+    if not hasattr(impl, 'notify_many'):
+        for context, msg in messages:
+            impl.notify(cfg.CONF, context, topic, msg, envelope)
+        return
+    return impl.notify_many(cfg.CONF, topic, messages, envelope)
+
+
 def cleanup():
     """Clean up resoruces in use by implementation.
 
@@ -31,8 +31,10 @@ import uuid
 
 from eventlet import greenpool
 from eventlet import pools
+from eventlet import queue
 from eventlet import semaphore
 
+from nova.openstack.common import cfg
 from nova.openstack.common import excutils
 from nova.openstack.common.gettextutils import _
 from nova.openstack.common import local
@@ -40,6 +42,18 @@ from nova.openstack.common import log as logging
 from nova.openstack.common.rpc import common as rpc_common
 
 
+amqp_opts = [
+    cfg.BoolOpt('amqp_rpc_single_reply_queue',
+                default=False,
+                help='Receive the replies to all calls made by a process on '
+                     'a single long-lived reply queue instead of declaring '
+                     'a queue per call. Servers older than this option '
+                     'ignore it and would reply to the per-call queue, so '
+                     'only enable it once every service has been upgraded.'),
+]
+
+cfg.CONF.register_opts(amqp_opts)
+
 LOG = logging.getLogger(__name__)
 
 
@@ -48,6 +62,10 @@ class Pool(pools.Pool):
     def __init__(self, conf, connection_cls, *args, **kwargs):
         self.connection_cls = connection_cls
         self.conf = conf
+        self.reply_proxy = None
+        self.server_params = kwargs.pop('server_params', None)
+        # Pools of connections to other servers, by server params
+        self.server_pools = {}
         kwargs.setdefault("max_size", self.conf.rpc_conn_pool_size)
         kwargs.setdefault("order_as_stack", True)
         super(Pool, self).__init__(*args, **kwargs)
@@ -55,14 +73,38 @@ class Pool(pools.Pool):
     # TODO(comstud): Timeout connections not used in a while
     def create(self):
         LOG.debug(_('Pool creating new connection'))
-        return self.connection_cls(self.conf)
+        if self.server_params is None:
+            return self.connection_cls(self.conf)
+        return self.connection_cls(self.conf,
+                                   server_params=self.server_params)
+
+    def get_server_pool(self, server_params):
+        """Return the pool of connections to the server given by
+        server_params, so that casts to the same server (another cell,
+        for instance) reuse their connections.
+        """
+        key = tuple(sorted(server_params.items()))
+        with _pool_create_sem:
+            pool = self.server_pools.get(key)
+            if pool is None:
+                pool = Pool(self.conf, self.connection_cls,
+                            server_params=server_params)
+                self.server_pools[key] = pool
+        return pool
 
     def empty(self):
         while self.free_items:
             self.get().close()
+        if self.reply_proxy:
+            self.reply_proxy.close()
+            self.reply_proxy = None
+        for pool in self.server_pools.values():
+            pool.empty()
+        self.server_pools.clear()
 
 
 _pool_create_sem = semaphore.Semaphore()
+_reply_proxy_create_sem = semaphore.Semaphore()
 
 
 def get_connection_pool(conf, connection_cls):
@@ -148,10 +190,67 @@ class ConnectionContext(rpc_common.Connection):
             raise rpc_common.InvalidRPCConnectionReuse()
 
 
-def msg_reply(conf, msg_id, connection_pool, reply=None, failure=None,
-              ending=False, log_failure=True):
+class ReplyProxy(ConnectionContext):
+    """Connection consuming the replies to all calls made by a process.
+
+    Replies carry the msg_id of the call they answer and are handed to
+    the waiter registered for that msg_id, so a call only costs one
+    publish and one consume, rather than declaring (and the broker
+    deleting) a queue per call.
+    """
+
+    def __init__(self, conf, connection_pool):
+        self._call_waiters = {}
+        self._num_call_waiters_wrn_threshold = 10
+        self._reply_q = 'reply_' + uuid.uuid4().hex
+        super(ReplyProxy, self).__init__(conf, connection_pool, pooled=False)
+        self.declare_direct_consumer(self._reply_q, self._process_data)
+        self.consume_in_thread()
+
+    def _process_data(self, message_data):
+        msg_id = message_data.pop('_msg_id', None)
+        waiter = self._call_waiters.get(msg_id)
+        if not waiter:
+            LOG.warn(_('No calling threads waiting for msg_id %(msg_id)s, '
+                       'message: %(message_data)s') % locals())
+        else:
+            waiter.put(message_data)
+
+    def add_call_waiter(self, waiter, msg_id):
+        self._call_waiters[msg_id] = waiter
+        num_waiters = len(self._call_waiters)
+        if num_waiters > self._num_call_waiters_wrn_threshold:
+            LOG.warn(_('Number of call waiters is greater than warning '
+                       'threshold: %d. There could be a '
+                       'MulticallProxyWaiter leak.') %
+                     self._num_call_waiters_wrn_threshold)
+            self._num_call_waiters_wrn_threshold *= 2
+
+    def del_call_waiter(self, msg_id):
+        self._call_waiters.pop(msg_id, None)
+
+    def get_reply_q(self):
+        return self._reply_q
+
+
+def get_reply_proxy(conf, connection_pool):
+    with _reply_proxy_create_sem:
+        # Make sure only one thread tries to create the reply proxy.
+        if not connection_pool.reply_proxy:
+            connection_pool.reply_proxy = ReplyProxy(conf, connection_pool)
+    return connection_pool.reply_proxy
+
+
+def msg_reply(conf, msg_id, reply_q, connection_pool, reply=None,
+              failure=None, ending=False, log_failure=True, binary=False):
     """Sends a reply or an error on the channel signified by msg_id.
 
+    If the caller gave a reply_q, the reply is sent there, tagged with
+    the msg_id, instead of to the queue named after the msg_id.
+
+    With binary, the reply is sent in the binary envelope the caller
+    asked for.
+
     Failure should be a sys.exc_info() tuple.
 
     """
@@ -168,13 +267,21 @@ def msg_reply(conf, msg_id, connection_pool, reply=None, failure=None,
                    'failure': failure}
         if ending:
             msg['ending'] = True
-        conn.direct_send(msg_id, rpc_common.serialize_msg(msg))
+        if reply_q:
+            msg['_msg_id'] = msg_id
+            conn.direct_send(reply_q,
+                             rpc_common.serialize_msg(msg, binary=binary))
+        else:
+            conn.direct_send(msg_id,
+                             rpc_common.serialize_msg(msg, binary=binary))
 
 
 class RpcContext(rpc_common.CommonRpcContext):
     """Context that supports replying to a rpc.call"""
     def __init__(self, **kwargs):
         self.msg_id = kwargs.pop('msg_id', None)
+        self.reply_q = kwargs.pop('reply_q', None)
+        self.binary_reply = kwargs.pop('binary_reply', False)
         self.conf = kwargs.pop('conf')
         super(RpcContext, self).__init__(**kwargs)
 
@@ -182,13 +289,15 @@ class RpcContext(rpc_common.CommonRpcContext):
         values = self.to_dict()
         values['conf'] = self.conf
         values['msg_id'] = self.msg_id
+        values['reply_q'] = self.reply_q
+        values['binary_reply'] = self.binary_reply
         return self.__class__(**values)
 
     def reply(self, reply=None, failure=None, ending=False,
               connection_pool=None, log_failure=True):
         if self.msg_id:
-            msg_reply(self.conf, self.msg_id, connection_pool, reply, failure,
-                      ending, log_failure)
+            msg_reply(self.conf, self.msg_id, self.reply_q, connection_pool,
+                      reply, failure, ending, log_failure, self.binary_reply)
             if ending:
                 self.msg_id = None
 
@@ -204,6 +313,8 @@ def unpack_context(conf, msg):
             value = msg.pop(key)
             context_dict[key[9:]] = value
     context_dict['msg_id'] = msg.pop('_msg_id', None)
+    context_dict['reply_q'] = msg.pop('_reply_q', None)
+    context_dict['binary_reply'] = msg.pop('_binary_reply', False)
     context_dict['conf'] = conf
     ctx = RpcContext.from_dict(context_dict)
     rpc_common._safe_log(LOG.debug, _('unpacked context: %s'), ctx.to_dict())
@@ -348,6 +459,65 @@ class MulticallWaiter(object):
             yield result
 
 
+class MulticallProxyWaiter(object):
+    """Waits for the replies to a call on the process' ReplyProxy."""
+
+    def __init__(self, conf, msg_id, timeout, connection_pool):
+        self._msg_id = msg_id
+        self._timeout = timeout or conf.rpc_response_timeout
+        self._reply_proxy = connection_pool.reply_proxy
+        self._done = False
+        self._got_ending = False
+        self._conf = conf
+        self._dataqueue = queue.LightQueue()
+        # Add this caller to the reply proxy's call_waiters
+        self._reply_proxy.add_call_waiter(self, self._msg_id)
+
+    def put(self, data):
+        self._dataqueue.put(data)
+
+    def done(self):
+        if self._done:
+            return
+        self._done = True
+        # Remove this caller from reply proxy's call_waiters
+        self._reply_proxy.del_call_waiter(self._msg_id)
+
+    def _process_data(self, data):
+        result = None
+        if data['failure']:
+            failure = data['failure']
+            result = rpc_common.deserialize_remote_exception(self._conf,
+                                                             failure)
+        elif data.get('ending', False):
+            self._got_ending = True
+        else:
+            result = data['result']
+        return result
+
+    def __iter__(self):
+        """Return a result until we get a reply with an 'ending' flag"""
+        if self._done:
+            raise StopIteration
+        while True:
+            try:
+                data = self._dataqueue.get(timeout=self._timeout)
+                result = self._process_data(data)
+            except queue.Empty:
+                self.done()
+                raise rpc_common.Timeout()
+            except Exception:
+                with excutils.save_and_reraise_exception():
+                    self.done()
+            if self._got_ending:
+                self.done()
+                raise StopIteration
+            if isinstance(result, Exception):
+                self.done()
+                raise result
+            yield result
+
+
 def create_connection(conf, new, connection_pool):
     """Create a connection"""
     return ConnectionContext(conf, connection_pool, pooled=not new)
@@ -355,20 +525,35 @@ def create_connection(conf, new, connection_pool):
 
 def multicall(conf, context, topic, msg, timeout, connection_pool):
     """Make a call that returns multiple times."""
-    # Can't use 'with' for multicall, as it returns an iterator
-    # that will continue to use the connection.  When it's done,
-    # connection.close() will get called which will put it back into
-    # the pool
     LOG.debug(_('Making synchronous call on %s ...'), topic)
     msg_id = uuid.uuid4().hex
     msg.update({'_msg_id': msg_id})
     LOG.debug(_('MSG_ID is %s') % (msg_id))
     pack_context(msg, context)
-
-    conn = ConnectionContext(conf, connection_pool)
-    wait_msg = MulticallWaiter(conf, conn, timeout)
-    conn.declare_direct_consumer(msg_id, wait_msg)
-    conn.topic_send(topic, rpc_common.serialize_msg(msg))
+    binary = rpc_common.binary_topic(topic)
+    if binary:
+        # Whoever can send binary messages can read binary replies
+        msg['_binary_reply'] = True
+
+    if not conf.amqp_rpc_single_reply_queue:
+        # Can't use 'with' for multicall, as it returns an iterator
+        # that will continue to use the connection.  When it's done,
+        # connection.close() will get called which will put it back into
+        # the pool
+        conn = ConnectionContext(conf, connection_pool)
+        wait_msg = MulticallWaiter(conf, conn, timeout)
+        conn.declare_direct_consumer(msg_id, wait_msg)
+        conn.topic_send(topic, rpc_common.serialize_msg(msg, binary=binary))
+    else:
+        reply_proxy = get_reply_proxy(conf, connection_pool)
+        msg.update({'_reply_q': reply_proxy.get_reply_q()})
+        # Register the waiter before sending, so a fast reply can't
+        # arrive before anybody is waiting for it
+        wait_msg = MulticallProxyWaiter(conf, msg_id, timeout,
+                                        connection_pool)
+        with ConnectionContext(conf, connection_pool) as conn:
+            conn.topic_send(topic,
+                            rpc_common.serialize_msg(msg, binary=binary))
     return wait_msg
 
 
@@ -386,33 +571,37 @@ def cast(conf, context, topic, msg, connection_pool):
     """Sends a message on a topic without waiting for a response."""
     LOG.debug(_('Making asynchronous cast on %s...'), topic)
     pack_context(msg, context)
+    binary = rpc_common.binary_topic(topic)
     with ConnectionContext(conf, connection_pool) as conn:
-        conn.topic_send(topic, rpc_common.serialize_msg(msg))
+        conn.topic_send(topic, rpc_common.serialize_msg(msg, binary=binary))
 
 
 def fanout_cast(conf, context, topic, msg, connection_pool):
     """Sends a message on a fanout exchange without waiting for a response."""
     LOG.debug(_('Making asynchronous fanout cast...'))
     pack_context(msg, context)
+    binary = rpc_common.binary_topic(topic)
     with ConnectionContext(conf, connection_pool) as conn:
-        conn.fanout_send(topic, rpc_common.serialize_msg(msg))
+        conn.fanout_send(topic, rpc_common.serialize_msg(msg, binary=binary))
 
 
 def cast_to_server(conf, context, server_params, topic, msg, connection_pool):
     """Sends a message on a topic to a specific server."""
     pack_context(msg, context)
-    with ConnectionContext(conf, connection_pool, pooled=False,
-                           server_params=server_params) as conn:
-        conn.topic_send(topic, rpc_common.serialize_msg(msg))
+    binary = rpc_common.binary_topic(topic)
+    with ConnectionContext(conf, connection_pool.get_server_pool(
+            server_params)) as conn:
+        conn.topic_send(topic, rpc_common.serialize_msg(msg, binary=binary))
 
 
 def fanout_cast_to_server(conf, context, server_params, topic, msg,
                           connection_pool):
     """Sends a message on a fanout exchange to a specific server."""
     pack_context(msg, context)
-    with ConnectionContext(conf, connection_pool, pooled=False,
-                           server_params=server_params) as conn:
-        conn.fanout_send(topic, rpc_common.serialize_msg(msg))
+    binary = rpc_common.binary_topic(topic)
+    with ConnectionContext(conf, connection_pool.get_server_pool(
+            server_params)) as conn:
+        conn.fanout_send(topic, rpc_common.serialize_msg(msg, binary=binary))
 
 
 def notify(conf, context, topic, msg, connection_pool, envelope):
@@ -427,6 +616,22 @@ def notify(conf, context, topic, msg, connection_pool, envelope):
         conn.notify_send(topic, msg)
 
 
+def notify_many(conf, topic, messages, connection_pool, envelope):
+    """Sends several notification events on a topic.
+
+    The events are sent on one connection, which is reset once rather than
+    for every event.  messages is a list of (context, msg) pairs.
+    """
+    LOG.debug(_('Sending %(count)d notifications on %(topic)s'),
+              dict(count=len(messages), topic=topic))
+    with ConnectionContext(conf, connection_pool) as conn:
+        for context, msg in messages:
+            pack_context(msg, context)
+            if envelope:
+                msg = rpc_common.serialize_msg(msg, force_envelope=True)
+            conn.notify_send(topic, msg)
+
+
 def cleanup(connection_pool):
     if connection_pool:
         connection_pool.empty()
@@ -17,9 +17,13 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import base64
 import copy
+import datetime
+import struct
 import sys
 import traceback
+import zlib
 
 from nova.openstack.common import cfg
 from nova.openstack.common.gettextutils import _
@@ -27,6 +31,12 @@ from nova.openstack.common import importutils
 from nova.openstack.common import jsonutils
 from nova.openstack.common import local
 from nova.openstack.common import log as logging
+from nova.openstack.common import timeutils
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
 
 
 CONF = cfg.CONF
@@ -62,11 +72,41 @@ payload.
 We will JSON encode the application message payload.  The message envelope,
 which includes the JSON encoded application message body, will be passed down
 to the messaging libraries as a dict.
+
+Version 2.1 adds a binary envelope, sent to the topics listed in
+rpc_binary_topics:
+
+    {
+        'nova.version': '2.1',
+        'nova.format': 'msgpack' or 'msgpack+zlib',
+        'nova.message': <Application Message Payload, msgpack encoded,
+                         possibly zlib compressed, base64 encoded>
+    }
+
+Datetimes and sets keep their type through msgpack extension types instead
+of being turned into strings and lists.  Receivers older than 2.1 reject the
+binary envelope, so JSON keeps being sent with version 2.0 everywhere else.
+The envelope used for requests is not negotiated: a topic may only be listed
+in rpc_binary_topics once all of its consumers are 2.1 or later.  Replies
+are only sent in the binary envelope to callers asking for it.
 '''
 _RPC_ENVELOPE_VERSION = '2.0'
+_BINARY_ENVELOPE_VERSION = '2.1'
 
 _VERSION_KEY = 'nova.version'
 _MESSAGE_KEY = 'nova.message'
+_FORMAT_KEY = 'nova.format'
+
+_MSGPACK_FORMAT = 'msgpack'
+_MSGPACK_ZLIB_FORMAT = 'msgpack+zlib'
+
+# msgpack extension types
+_DATETIME_TYPE = 1
+_SET_TYPE = 2
+
+# Datetimes are sent as microseconds since the epoch
+_EPOCH = datetime.datetime(1970, 1, 1)
+_MICROSECONDS = struct.Struct('!q')
 
 
 # TODO(russellb) Turn this on after Grizzly.
@@ -414,7 +454,77 @@ def version_is_compatible(imp_version, version):
     return True
 
 
-def serialize_msg(raw_msg, force_envelope=False):
+def binary_topic(topic):
+    """Whether messages to a topic are sent in the binary envelope.
+
+    Topics are matched on what comes before the host they may be sent to,
+    'compute' matches 'compute.host1'.
+    """
+    return (msgpack is not None and bool(CONF.rpc_binary_topics) and
+            topic.split('.', 1)[0] in CONF.rpc_binary_topics)
+
+
+def _msgpack_default(obj):
+    if isinstance(obj, datetime.datetime):
+        delta = timeutils.normalize_time(obj) - _EPOCH
+        microseconds = ((delta.days * 86400 + delta.seconds) * 1000000 +
+                        delta.microseconds)
+        return msgpack.ExtType(_DATETIME_TYPE,
+                               _MICROSECONDS.pack(microseconds))
+    if isinstance(obj, (set, frozenset)):
+        return msgpack.ExtType(_SET_TYPE, _msgpack_dumps(list(obj)))
+    return jsonutils.to_primitive(obj, convert_instances=True)
+
+
+def _msgpack_ext_hook(code, data):
+    if code == _DATETIME_TYPE:
+        microseconds = _MICROSECONDS.unpack(data)[0]
+        return _EPOCH + datetime.timedelta(microseconds=microseconds)
+    if code == _SET_TYPE:
+        return set(_msgpack_loads(data))
+    return msgpack.ExtType(code, data)
+
+
+def _msgpack_dumps(obj):
+    return msgpack.packb(obj, default=_msgpack_default, use_bin_type=True)
+
+
+def _msgpack_loads(data):
+    return msgpack.unpackb(data, ext_hook=_msgpack_ext_hook, encoding='utf-8')
+
+
+def _serialize_binary(raw_msg):
+    data = _msgpack_dumps(raw_msg)
+    msg_format = _MSGPACK_FORMAT
+    if 0 < CONF.rpc_compress_threshold < len(data):
+        data = zlib.compress(data)
+        msg_format = _MSGPACK_ZLIB_FORMAT
+    return {_VERSION_KEY: _BINARY_ENVELOPE_VERSION,
+            _FORMAT_KEY: msg_format,
+            _MESSAGE_KEY: base64.b64encode(data)}
+
+
+def _deserialize_binary(msg):
+    msg_format = msg.get(_FORMAT_KEY)
+    if (msgpack is None or
+            msg_format not in (_MSGPACK_FORMAT, _MSGPACK_ZLIB_FORMAT)):
+        raise UnsupportedRpcEnvelopeVersion(version='%s (%s)' % (
+            msg[_VERSION_KEY], msg_format))
+    data = base64.b64decode(msg[_MESSAGE_KEY])
+    if msg_format == _MSGPACK_ZLIB_FORMAT:
+        data = zlib.decompress(data)
+    return _msgpack_loads(data)
+
+
+def serialize_msg(raw_msg, force_envelope=False, binary=False):
+    """Return a message ready to be handed to the messaging library.
+
+    With binary, the message is sent in the binary envelope if msgpack is
+    installed. See binary_topic().
+    """
+    if binary and msgpack is not None:
+        return _serialize_binary(raw_msg)
+
     if not _SEND_RPC_ENVELOPE and not force_envelope:
         return raw_msg
 
@@ -462,9 +572,13 @@ def deserialize_msg(msg):
     # At this point we think we have the message envelope
     # format we were expecting. (#1.a above)
 
-    if not version_is_compatible(_RPC_ENVELOPE_VERSION, msg[_VERSION_KEY]):
+    if not version_is_compatible(_BINARY_ENVELOPE_VERSION,
+                                 msg[_VERSION_KEY]):
         raise UnsupportedRpcEnvelopeVersion(version=msg[_VERSION_KEY])
 
+    if _FORMAT_KEY in msg:
+        return _deserialize_binary(msg)
+
     raw_msg = jsonutils.loads(msg[_MESSAGE_KEY])
 
     return raw_msg
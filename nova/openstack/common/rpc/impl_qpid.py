@@ -600,5 +600,12 @@ def notify(conf, context, topic, msg, envelope):
                            envelope)
 
 
+def notify_many(conf, topic, messages, envelope):
+    """Sends several notification events on a topic."""
+    return rpc_amqp.notify_many(conf, topic, messages,
+                                rpc_amqp.get_connection_pool(conf, Connection),
+                                envelope)
+
+
 def cleanup():
     return rpc_amqp.cleanup(Connection.pool)
@@ -18,6 +18,7 @@ import pprint
 import socket
 import string
 import sys
+import time
 import types
 import uuid
 
@@ -66,7 +67,11 @@ zmq_opts = [
 
     cfg.StrOpt('rpc_zmq_host', default=socket.gethostname(),
                help='Name of this node. Must be a valid hostname, FQDN, or '
-                    'IP address. Must match "host" option, if running Nova.')
+                    'IP address. Must match "host" option, if running Nova.'),
+
+    cfg.IntOpt('rpc_zmq_socket_idle_timeout', default=300,
+               help='Seconds an outbound socket is kept open unused before '
+                    'it is closed')
 ]
 
 
@@ -75,6 +80,10 @@ zmq_opts = [
 CONF = None
 ZMQ_CTX = None  # ZeroMQ Context, must be global.
 matchmaker = None  # memoized matchmaker object
+# Outbound sockets and the subscriber to our replies, kept between
+# messages.
+_CLIENT_CACHE = None
+_REPLY_LISTENER = None
 
 
 def _serialize(data):
@@ -181,9 +190,12 @@ class ZmqSocket(object):
                     pass
             self.subscriptions = []
 
-        # Linger -1 prevents lost/dropped messages
+        # Linger -1 prevents lost/dropped messages.  Sockets that only
+        # receive have none to lose, and would keep the context from
+        # terminating while they try to reconnect.
+        linger = -1 if self.can_send else 0
         try:
-            self.sock.close(linger=-1)
+            self.sock.close(linger=linger)
         except Exception:
             pass
         self.sock = None
@@ -204,17 +216,147 @@ class ZmqClient(object):
 
     def __init__(self, addr, socket_type=zmq.PUSH, bind=False):
         self.outq = ZmqSocket(addr, socket_type, bind=bind)
+        # Greenthreads sharing the client must not interleave the parts
+        # of their messages.
+        self.lock = eventlet.semaphore.Semaphore()
+        self.last_used = time.time()
 
     def cast(self, msg_id, topic, data, serialize=True, force_envelope=False):
         if serialize:
             data = rpc_common.serialize_msg(data, force_envelope)
-        self.outq.send([str(msg_id), str(topic), str('cast'),
-                        _serialize(data)])
+        data = [str(msg_id), str(topic), str('cast'), _serialize(data)]
+        with self.lock:
+            self.outq.send(data)
+        self.last_used = time.time()
 
     def close(self):
         self.outq.close()
 
 
+class ZmqClientCache(object):
+    """
+    Outbound clients kept open by address, so that casting to a host
+    does not open and close a socket every time.  Clients unused for
+    rpc_zmq_socket_idle_timeout seconds are closed.
+    """
+
+    def __init__(self):
+        self.clients = {}
+        self.last_sweep = time.time()
+
+    def get(self, addr):
+        self._sweep()
+        client = self.clients.get(addr)
+        if client is None:
+            client = self.clients[addr] = ZmqClient(addr)
+        return client
+
+    def discard(self, addr):
+        """Close the client of an address, after it failed."""
+        client = self.clients.pop(addr, None)
+        if client is not None:
+            client.close()
+
+    def _sweep(self):
+        now = time.time()
+        idle_timeout = CONF.rpc_zmq_socket_idle_timeout
+        if now - self.last_sweep < idle_timeout:
+            return
+        self.last_sweep = now
+        for addr, client in self.clients.items():
+            if now - client.last_used >= idle_timeout:
+                LOG.debug(_("Closing idle socket to %s"), addr)
+                self.discard(addr)
+
+    def close(self):
+        for addr in self.clients.keys():
+            self.discard(addr)
+
+
+class ZmqReplyListener(object):
+    """
+    Single subscriber to the replies sent to this process, handing each
+    reply to the call waiting for it.
+
+    Replies are published by the local proxy to every subscriber on the
+    host; the msg_id of our calls start with a prefix of our own, which
+    is what we subscribe to.
+    """
+
+    def __init__(self):
+        self.prefix = uuid.uuid4().hex
+        self.waiters = {}
+        self.sock = ZmqSocket(
+            "ipc://%s/zmq_topic_zmq_replies" % CONF.rpc_zmq_ipc_dir,
+            zmq.SUB, subscribe=self.prefix, bind=False)
+        self.closed = False
+        self.thread = eventlet.spawn(self._listen)
+
+    def _listen(self):
+        while not self.closed:
+            try:
+                msg = self.sock.recv()
+            except greenlet.GreenletExit:
+                return
+            except Exception:
+                LOG.exception(_("Failed to receive replies"))
+                self.close()
+                return
+            waiter = self.waiters.pop(msg[0], None)
+            if waiter is None:
+                # The call timed out.
+                LOG.debug(_("No call waiting for reply %s"), msg[0])
+                continue
+            waiter.send(msg)
+
+    def new_msg_id(self):
+        return '%s.%s' % (self.prefix, uuid.uuid4().hex)
+
+    def register(self, msg_id):
+        """Return an event sent the reply with the given msg_id.
+
+        The event is sent an exception instead if the listener is closed
+        before the reply comes.
+        """
+        if self.closed:
+            raise RPCException(_("Reply listener is closed"))
+        waiter = eventlet.event.Event()
+        self.waiters[msg_id] = waiter
+        return waiter
+
+    def unregister(self, msg_id):
+        self.waiters.pop(msg_id, None)
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        if self.thread is not eventlet.getcurrent():
+            self.thread.kill()
+        self.sock.close()
+        # No reply will come anymore, don't let the calls wait for their
+        # timeout.
+        waiters, self.waiters = self.waiters, {}
+        for waiter in waiters.values():
+            waiter.send_exception(
+                RPCException(_("Reply listener closed before the reply "
+                               "came")))
+
+
+def _get_client_cache():
+    global _CLIENT_CACHE
+    if _CLIENT_CACHE is None:
+        _CLIENT_CACHE = ZmqClientCache()
+    return _CLIENT_CACHE
+
+
+def _get_reply_listener():
+    global _REPLY_LISTENER
+    if _REPLY_LISTENER is None or _REPLY_LISTENER.closed:
+        _REPLY_LISTENER = ZmqReplyListener()
+    return _REPLY_LISTENER
+
+
 class RpcContext(rpc_common.CommonRpcContext):
     """Context that supports replying to a rpc.call."""
     def __init__(self, **kwargs):
@@ -538,17 +680,21 @@ def _cast(addr, context, msg_id, topic, msg, timeout=None, serialize=True,
     timeout_cast = timeout or CONF.rpc_cast_timeout
     payload = [RpcContext.marshal(context), msg]
 
+    clients = _get_client_cache()
     with Timeout(timeout_cast, exception=rpc_common.Timeout):
         try:
-            conn = ZmqClient(addr)
+            conn = clients.get(addr)
 
             # assumes cast can't return an exception
             conn.cast(msg_id, topic, payload, serialize, force_envelope)
         except zmq.ZMQError:
+            clients.discard(addr)
             raise RPCException("Cast failed. ZMQ Socket Exception")
-        finally:
-            if 'conn' in vars():
-                conn.close()
+        except BaseException:
+            # A timeout may have cut a message short, the socket can't
+            # be used anymore.
+            clients.discard(addr)
+            raise
 
 
 def _call(addr, context, msg_id, topic, msg, timeout=None):
@@ -556,7 +702,8 @@ def _call(addr, context, msg_id, topic, msg, timeout=None):
     timeout = timeout or CONF.rpc_response_timeout
 
     # The msg_id is used to track replies.
-    msg_id = uuid.uuid4().hex
+    reply_listener = _get_reply_listener()
+    msg_id = reply_listener.new_msg_id()
 
     # Replies always come into the reply service.
     reply_topic = "zmq_replies.%s" % CONF.rpc_zmq_host
@@ -574,23 +721,16 @@ def _call(addr, context, msg_id, topic, msg, timeout=None):
         }
     }
 
-    LOG.debug(_("Creating queue socket for reply waiter"))
-
     # Messages arriving async.
-    # TODO(ewindisch): have reply consumer with dynamic subscription mgmt
     with Timeout(timeout, exception=rpc_common.Timeout):
+        msg_waiter = reply_listener.register(msg_id)
         try:
-            msg_waiter = ZmqSocket(
-                "ipc://%s/zmq_topic_zmq_replies" % CONF.rpc_zmq_ipc_dir,
-                zmq.SUB, subscribe=msg_id, bind=False
-            )
-
             LOG.debug(_("Sending cast"))
             _cast(addr, context, msg_id, topic, payload)
 
             LOG.debug(_("Cast sent; Waiting reply"))
             # Blocks until receives reply
-            msg = msg_waiter.recv()
+            msg = msg_waiter.wait()
             LOG.debug(_("Received message: %s"), msg)
             LOG.debug(_("Unpacking response"))
             responses = _deserialize(msg[-1])
@@ -598,8 +738,7 @@ def _call(addr, context, msg_id, topic, msg, timeout=None):
         except zmq.ZMQError:
             raise RPCException("ZMQ Socket Error")
         finally:
-            if 'msg_waiter' in vars():
-                msg_waiter.close()
+            reply_listener.unregister(msg_id)
 
     # It seems we don't need to do all of the following,
     # but perhaps it would be useful for multicall?
@@ -690,7 +829,15 @@ def cleanup():
     """Clean up resources in use by implementation."""
     global ZMQ_CTX
     global matchmaker
+    global _CLIENT_CACHE
+    global _REPLY_LISTENER
     matchmaker = None
+    if _CLIENT_CACHE is not None:
+        _CLIENT_CACHE.close()
+        _CLIENT_CACHE = None
+    if _REPLY_LISTENER is not None:
+        _REPLY_LISTENER.close()
+        _REPLY_LISTENER = None
     ZMQ_CTX.term()
     ZMQ_CTX = None
 
@@ -34,9 +34,11 @@ from nova import conductor
 from nova import context
 from nova import exception
 from nova.openstack.common import cfg
+from nova.openstack.common.db.sqlalchemy import session as db_session
 from nova.openstack.common import eventlet_backdoor
 from nova.openstack.common import importutils
 from nova.openstack.common import log as logging
+from nova.openstack.common.notifier import api as notifier_api
 from nova.openstack.common import rpc
 from nova import servicegroup
 from nova import utils
@@ -108,6 +110,9 @@ service_opts = [
     cfg.StrOpt('scheduler_manager',
                default='nova.scheduler.manager.SchedulerManager',
                help='full class name for the Manager for scheduler'),
+    cfg.IntOpt('scheduler_workers',
+               default=None,
+               help='Number of workers for scheduler service'),
     cfg.IntOpt('service_down_time',
                default=60,
                help='maximum time since last check-in for up service'),
@@ -216,6 +221,7 @@ class ServiceLauncher(Launcher):
             status = exc.code
         finally:
             self.stop()
+        notifier_api.flush()
         rpc.cleanup()
 
         if status is not None:
@@ -317,6 +323,7 @@ class ProcessLauncher(object):
                 status = 2
             finally:
                 wrap.server.stop()
+                notifier_api.flush()
 
             os._exit(status)
 
@@ -330,6 +337,11 @@ class ProcessLauncher(object):
     def launch_server(self, server, workers=1):
         wrap = ServerWrapper(server, workers)
 
+        # Do what has to happen once for all the workers of the server
+        prepare_workers = getattr(server, 'prepare_workers', None)
+        if prepare_workers is not None:
+            prepare_workers()
+
         LOG.info(_('Starting %d workers'), wrap.workers)
         while self.running and len(wrap.children) < wrap.workers:
             self._start_child(wrap)
@@ -429,12 +441,7 @@ class Service(object):
         self.manager.init_host()
         self.model_disconnected = False
         ctxt = context.get_admin_context()
-        try:
-            self.service_ref = self.conductor_api.service_get_by_args(ctxt,
-                    self.host, self.binary)
-            self.service_id = self.service_ref['id']
-        except exception.NotFound:
-            self.service_ref = self._create_service_ref(ctxt)
+        self._get_service_ref(ctxt)
 
         if self.backdoor_port is not None:
             self.manager.backdoor_port = self.backdoor_port
@@ -478,6 +485,26 @@ class Service(object):
                            periodic_interval_max=self.periodic_interval_max)
             self.timers.append(periodic)
 
+    def prepare_workers(self):
+        """Get ready to be started in several worker processes.
+
+        The workers all consume from the same topics and share the
+        service record, which is created here rather than by each of them.
+        """
+        self._get_service_ref(context.get_admin_context())
+        # Workers must open their own database and rpc connections rather
+        # than share the sockets of the parent (and each other).
+        db_session.cleanup()
+        rpc.cleanup()
+
+    def _get_service_ref(self, context):
+        try:
+            self.service_ref = self.conductor_api.service_get_by_args(context,
+                    self.host, self.binary)
+            self.service_id = self.service_ref['id']
+        except exception.NotFound:
+            self.service_ref = self._create_service_ref(context)
+
     def _create_service_ref(self, context):
         svc_values = {
             'host': self.host,
@@ -1,10 +1,12 @@
 # vim: tabstop=4 shiftwidth=4 softtabstop=4
 
+import datetime
 import inspect
 import webob
 
 from nova.api.openstack import wsgi
 from nova import exception
+from nova.openstack.common import jsonutils
 from nova import test
 from nova.tests.api.openstack import fakes
 
@@ -141,6 +143,13 @@ class JSONDictSerializerTest(test.TestCase):
         result = result.replace('\n', '').replace(' ', '')
         self.assertEqual(result, expected_json)
 
+    def test_json_datetime(self):
+        input_dict = dict(server=dict(created=datetime.datetime(2012, 1, 2,
+                                                                3, 4, 5)))
+        expected_json = jsonutils.dumps(input_dict)
+        serializer = wsgi.JSONDictSerializer()
+        self.assertEqual(serializer.serialize(input_dict), expected_json)
+
 
 class TextDeserializerTest(test.TestCase):
     def test_dispatch_default(self):
@@ -652,6 +652,55 @@ class TemplateTest(test.TestCase):
                          str(obj['test']['image']['id']))
         self.assertEqual(result[idx].text, obj['test']['image']['name'])
 
+    def test_compile_cached(self):
+        root = xmlutil.TemplateElement('test', selector='test')
+        xmlutil.SubTemplateElement(root, 'name', selector='name')
+        master = xmlutil.MasterTemplate(root, 1)
+        slave = xmlutil.SlaveTemplate(xmlutil.TemplateElement('test'), 1)
+
+        # Copies of the master with the same slaves share the plan
+        tmpl1 = master.copy()
+        tmpl1.attach(slave)
+        tmpl2 = master.copy()
+        tmpl2.attach(slave)
+        self.assertTrue(tmpl1.compile() is tmpl2.compile())
+
+        # ...but not with a different set of slaves
+        self.assertFalse(master.compile() is tmpl1.compile())
+
+    def test_compile_invalidated(self):
+        obj = dict(test=dict(name='foo', id=42))
+        root = xmlutil.TemplateElement('test', selector='test')
+        elem = xmlutil.SubTemplateElement(root, 'name')
+        master = xmlutil.MasterTemplate(root, 1)
+        self.assertEqual(master.make_tree(obj)[0].get('id'), None)
+
+        # Modifying any element of the template recompiles it
+        elem.set('id')
+        self.assertEqual(master.make_tree(obj)[0].get('id'), '42')
+
+        xmlutil.SubTemplateElement(elem, 'child')
+        self.assertEqual(master.make_tree(obj)[0][0].tag, 'child')
+
+    def test_serialize_custom_element(self):
+        class UpperTemplateElement(xmlutil.TemplateElement):
+            def apply(self, elem, obj):
+                super(UpperTemplateElement, self).apply(elem, obj)
+                elem.text = elem.text.upper()
+
+        obj = dict(test=dict(name='foo', values=[1, 2]))
+        root = xmlutil.TemplateElement('test', selector='test')
+        name = UpperTemplateElement('name', selector='name')
+        name.text = xmlutil.Selector()
+        root.append(name)
+        value = xmlutil.SubTemplateElement(root, 'value', selector='values')
+        value.text = xmlutil.Selector()
+        master = xmlutil.MasterTemplate(root, 1)
+
+        result = master.make_tree(obj)
+        self.assertEqual(result[0].text, 'FOO')
+        self.assertEqual([elem.text for elem in result[1:]], ['1', '2'])
+
 
 class MasterTemplateBuilder(xmlutil.TemplateBuilder):
     def construct(self):
@@ -18,10 +18,14 @@
 
 import imp
 import os
+import shutil
 import sys
 import tempfile
 import time
 
+import fixtures
+
+from nova.openstack.common.rootwrap import wrapper
 from nova import test
 
 from nova.tests.baremetal.db import base as bm_db_base
@@ -254,3 +258,36 @@ class OtherFunctionTestCase(test.TestCase):
         self.assertEqual(bmdh.get_image_mb('x'), 1)
         size = mb + 1
         self.assertEqual(bmdh.get_image_mb('x'), 2)
+
+    def test_dd_commands_allowed(self):
+        filters_dir = self.useFixture(fixtures.TempDir()).path
+        shutil.copy(os.path.join(TOPDIR, 'etc', 'nova', 'rootwrap.d',
+                                 'baremetal-deploy-helper.filters'),
+                    filters_dir)
+        filters = wrapper.load_filters([filters_dir])
+        commands = []
+
+        def fake_execute(*cmd, **kwargs):
+            commands.append(map(str, cmd))
+
+        class FakeStat(object):
+            st_uid = 0
+
+        orig_stat = os.stat
+
+        def fake_stat(path):
+            if path in ('/tmp/image', '/dev/sdb1'):
+                # Owned by root
+                return FakeStat()
+            return orig_stat(path)
+
+        self.stubs.Set(bmdh.utils, 'execute', fake_execute)
+        self.stubs.Set(os, 'stat', fake_stat)
+        self.stubs.Set(os, 'getuid', lambda: 1000)
+        self.stubs.Set(bmdh.sparsecopy, 'copy',
+                       lambda src, dst, sparse: None)
+        bmdh.dd('/tmp/image', '/dev/sdb1')
+
+        self.assertTrue(commands)
+        for cmd in commands:
+            self.assertTrue([f for f in filters if f.match(cmd)], cmd)
@@ -21,6 +21,7 @@ import datetime
 from nova.cells import messaging
 from nova.cells import utils as cells_utils
 from nova import context
+from nova import exception
 from nova.openstack.common import cfg
 from nova.openstack.common import rpc
 from nova.openstack.common import timeutils
@@ -181,6 +182,15 @@ class CellsManagerClassTestCase(test.TestCase):
         self.cells_manager.bw_usage_update_at_top(
                 self.ctxt, bw_update_info='fake-bw-info')
 
+    def test_bw_usage_update_many_at_top(self):
+        self.mox.StubOutWithMock(self.msg_runner,
+                                 'bw_usage_update_many_at_top')
+        self.msg_runner.bw_usage_update_many_at_top(self.ctxt,
+                                                    'fake-usages')
+        self.mox.ReplayAll()
+        self.cells_manager.bw_usage_update_many_at_top(
+                self.ctxt, usages='fake-usages')
+
     def test_heal_instances(self):
         self.flags(instance_updated_at_threshold=1000,
                    instance_update_num_instances=2,
@@ -275,6 +285,25 @@ class CellsManagerClassTestCase(test.TestCase):
                                                       filters='fake-filters')
         self.assertEqual(expected_response, response)
 
+    def test_service_get_all_leaves_out_timeouts(self):
+        cell_name = 'path!to!cell'
+        services = copy.deepcopy(FAKE_SERVICES)
+        expected_response = copy.deepcopy(FAKE_SERVICES)
+        for service in expected_response:
+            cells_utils.add_cell_to_service(service, cell_name)
+        responses = [messaging.Response(cell_name, services, False),
+                     messaging.Response('path!to!slow-cell',
+                                        exception.CellTimeout(), True)]
+
+        self.mox.StubOutWithMock(self.msg_runner,
+                                 'service_get_all')
+        self.msg_runner.service_get_all(self.ctxt,
+                                        'fake-filters').AndReturn(responses)
+        self.mox.ReplayAll()
+        response = self.cells_manager.service_get_all(self.ctxt,
+                                                      filters='fake-filters')
+        self.assertEqual(expected_response, response)
+
     def test_service_get_by_compute_host(self):
         self.mox.StubOutWithMock(self.msg_runner,
                                  'service_get_by_compute_host')
@@ -14,6 +14,8 @@
 """
 Tests For Cells Messaging module
 """
+import copy
+
 from nova.cells import messaging
 from nova.cells import utils as cells_utils
 from nova import context
@@ -565,6 +567,134 @@ class CellsMessageClassesTestCase(test.TestCase):
             self.assertTrue(response.failure)
             self.assertRaises(test.TestingException, response.value_or_raise)
 
+    def test_broadcast_routing_with_response_timeout(self):
+        self.flags(call_timeout=0, group='cells')
+        method = 'our_fake_method'
+        method_kwargs = dict(arg1=1, arg2=2)
+        direction = 'down'
+
+        def our_fake_method(message, **kwargs):
+            return 'response-%s' % message.routing_path
+
+        fakes.stub_bcast_methods(self, 'our_fake_method', our_fake_method)
+        # These cells never get the message, so they never respond
+        lost_cells = [fakes.get_cell_state('api-cell', 'child-cell4'),
+                      fakes.get_cell_state('child-cell3',
+                                           'grandchild-cell2')]
+        for cell in lost_cells:
+            self.stubs.Set(cell, 'send_message', lambda message: None)
+
+        bcast_message = messaging._BroadcastMessage(self.msg_runner,
+                                                    self.ctxt, method,
+                                                    method_kwargs,
+                                                    direction,
+                                                    run_locally=True,
+                                                    need_response=True)
+        responses = bcast_message.process()
+        self.assertEqual(len(responses), 8)
+        failure_responses = [resp for resp in responses if resp.failure]
+        success_responses = [resp for resp in responses if not resp.failure]
+        self.assertEqual(len(success_responses), 6)
+        for response in success_responses:
+            self.assertEqual('response-%s' % response.cell_name,
+                    response.value_or_raise())
+        self.assertEqual(['api-cell!child-cell3!grandchild-cell2',
+                          'api-cell!child-cell4'],
+                         sorted(resp.cell_name
+                                for resp in failure_responses))
+        for response in failure_responses:
+            self.assertRaises(exception.CellTimeout,
+                              response.value_or_raise)
+
+    def test_broadcast_deadline_includes_local_processing(self):
+        self.flags(call_timeout=10, group='cells')
+        method = 'our_fake_method'
+        method_kwargs = dict(arg1=1, arg2=2)
+        direction = 'down'
+        now = [1000.0]
+        self.stubs.Set(messaging.time, 'time', lambda: now[0])
+
+        def our_fake_method(message, **kwargs):
+            return 'response-%s' % message.routing_path
+
+        def our_slow_fake_method(message, **kwargs):
+            now[0] += 20
+            return 'response-%s' % message.routing_path
+
+        fakes.stub_bcast_methods(self, 'our_fake_method', our_fake_method)
+        fakes.stub_bcast_method(self, 'api-cell', 'our_fake_method',
+                                our_slow_fake_method)
+        # Never gets the message, so never responds
+        lost_cell = fakes.get_cell_state('api-cell', 'child-cell4')
+        self.stubs.Set(lost_cell, 'send_message', lambda message: None)
+
+        deadlines = {}
+        orig_wait = messaging._BroadcastMessage._wait_for_neighbor_responses
+
+        def wait_for_neighbor_responses(message, next_hops, deadline,
+                                        stream):
+            deadlines[message.routing_path] = deadline
+            return orig_wait(message, next_hops, deadline, stream)
+
+        self.stubs.Set(messaging._BroadcastMessage,
+                       '_wait_for_neighbor_responses',
+                       wait_for_neighbor_responses)
+
+        bcast_message = messaging._BroadcastMessage(self.msg_runner,
+                                                    self.ctxt, method,
+                                                    method_kwargs,
+                                                    direction,
+                                                    run_locally=True,
+                                                    need_response=True)
+        responses = bcast_message.process()
+        # Counted from before running locally, so the time it took is not
+        # given to the neighbor cells on top of call_timeout
+        self.assertEqual(deadlines['api-cell'], 1010.0)
+        self.assertEqual(len(responses), 8)
+        failure_responses = [resp for resp in responses if resp.failure]
+        self.assertEqual(['api-cell!child-cell4'],
+                         [resp.cell_name for resp in failure_responses])
+
+    def test_broadcast_routing_streams_responses(self):
+        method = 'our_fake_method'
+        method_kwargs = dict(arg1=1, arg2=2)
+        direction = 'down'
+
+        def our_fake_method(message, **kwargs):
+            return 'response-%s' % message.routing_path
+
+        fakes.stub_bcast_methods(self, 'our_fake_method', our_fake_method)
+        received = []
+        orig_put_response = self.msg_runner._put_response
+
+        def _fake_put_response(response_uuid, response, sender=None,
+                               final=True):
+            cell_names = [messaging.Response.from_json(resp).cell_name
+                          for resp in response]
+            received.append((sender, cell_names, final))
+            orig_put_response(response_uuid, response, sender=sender,
+                              final=final)
+
+        self.stubs.Set(self.msg_runner, '_put_response', _fake_put_response)
+
+        bcast_message = messaging._BroadcastMessage(self.msg_runner,
+                                                    self.ctxt, method,
+                                                    method_kwargs,
+                                                    direction,
+                                                    run_locally=True,
+                                                    need_response=True)
+        responses = bcast_message.process()
+        self.assertEqual(len(responses), 8)
+        # child-cell2 forwards the responses as it gets them, and then
+        # says it is done.
+        child_received = [resp for resp in received
+                          if resp[0] == 'child-cell2']
+        self.assertEqual(
+                [('child-cell2', ['api-cell!child-cell2'], False),
+                 ('child-cell2', ['api-cell!child-cell2!grandchild-cell1'],
+                  False),
+                 ('child-cell2', [], True)], child_received)
+
 
 class CellsTargetedMethodsTestCase(test.TestCase):
     """Test case for _TargetedMessageMethods class.  Most of these
@@ -697,6 +827,34 @@ class CellsTargetedMethodsTestCase(test.TestCase):
 
         self.src_msg_runner.tell_parents_our_capacities(self.ctxt)
 
+    def test_update_capacities_unchanged(self):
+        self._setup_attrs('child-cell2', 'child-cell2!api-cell')
+        capacs = {'ram_free': {'total_mb': 1024}}
+        self.mox.StubOutWithMock(self.src_state_manager,
+                                 'get_our_capacities')
+        self.mox.StubOutWithMock(self.tgt_state_manager,
+                                 'update_cell_capacities')
+        self.mox.StubOutWithMock(self.tgt_msg_runner,
+                                 'tell_parents_our_capacities')
+        self.src_state_manager.get_our_capacities().AndReturn(capacs)
+        self.tgt_state_manager.update_cell_capacities('child-cell2',
+                                                      capacs)
+        self.tgt_msg_runner.tell_parents_our_capacities(self.ctxt)
+        # Not sent again unless they change or a parent asks for them
+        self.src_state_manager.get_our_capacities().AndReturn(
+                copy.deepcopy(capacs))
+        self.src_state_manager.get_our_capacities().AndReturn(capacs)
+        self.tgt_state_manager.update_cell_capacities('child-cell2',
+                                                      capacs)
+        self.tgt_msg_runner.tell_parents_our_capacities(self.ctxt)
+
+        self.mox.ReplayAll()
+
+        self.src_msg_runner.tell_parents_our_capacities(self.ctxt)
+        self.src_msg_runner.tell_parents_our_capacities(self.ctxt)
+        self.src_msg_runner.tell_parents_our_capacities(self.ctxt,
+                                                        force=True)
+
     def test_announce_capabilities(self):
         self._setup_attrs('api-cell', 'api-cell!child-cell1')
         # To make this easier to test, make us only have 1 child cell.
@@ -719,7 +877,8 @@ class CellsTargetedMethodsTestCase(test.TestCase):
 
         self.mox.StubOutWithMock(self.tgt_msg_runner,
                                  'tell_parents_our_capacities')
-        self.tgt_msg_runner.tell_parents_our_capacities(self.ctxt)
+        self.tgt_msg_runner.tell_parents_our_capacities(self.ctxt,
+                                                        force=True)
 
         self.mox.ReplayAll()
 
@@ -1020,6 +1179,31 @@ class CellsBroadcastMethodsTestCase(test.TestCase):
         self.src_msg_runner.bw_usage_update_at_top(self.ctxt,
                                                    fake_bw_update_info)
 
+    def test_bw_usage_update_many_at_top(self):
+        start_period = timeutils.utcnow()
+        fake_usages = [{'uuid': 'fake_uuid',
+                        'mac': 'fake_mac',
+                        'start_period': timeutils.strtime(start_period),
+                        'bw_in': 'fake_bw_in',
+                        'bw_out': 'fake_bw_out',
+                        'last_ctr_in': 'fake_last_ctr_in',
+                        'last_ctr_out': 'fake_last_ctr_out',
+                        'last_refreshed': None}]
+        expected_usages = [dict(fake_usages[0], start_period=start_period)]
+
+        # Shouldn't be called for these 2 cells
+        self.mox.StubOutWithMock(self.src_db_inst, 'bw_usage_update_many')
+        self.mox.StubOutWithMock(self.mid_db_inst, 'bw_usage_update_many')
+
+        self.mox.StubOutWithMock(self.tgt_db_inst, 'bw_usage_update_many')
+        self.tgt_db_inst.bw_usage_update_many(self.ctxt, expected_usages,
+                                              update_cells=False)
+
+        self.mox.ReplayAll()
+
+        self.src_msg_runner.bw_usage_update_many_at_top(self.ctxt,
+                                                        fake_usages)
+
     def test_sync_instances(self):
         # Reset this, as this is a broadcast down.
         self._setup_attrs(up=False)
@@ -1089,7 +1273,8 @@ class CellsBroadcastMethodsTestCase(test.TestCase):
         expected = [('api-cell!child-cell2!grandchild-cell1', [4, 5]),
                     ('api-cell!child-cell2', [3]),
                     ('api-cell', [1, 2])]
-        self.assertEqual(expected, response_values)
+        # Responses are returned as the cells send them
+        self.assertEqual(sorted(expected), sorted(response_values))
 
     def test_service_get_all_without_disabled(self):
         # Reset this, as this is a broadcast down.
@@ -1119,7 +1304,8 @@ class CellsBroadcastMethodsTestCase(test.TestCase):
         expected = [('api-cell!child-cell2!grandchild-cell1', [4, 5]),
                     ('api-cell!child-cell2', [3]),
                     ('api-cell', [1, 2])]
-        self.assertEqual(expected, response_values)
+        # Responses are returned as the cells send them
+        self.assertEqual(sorted(expected), sorted(response_values))
 
     def test_task_log_get_all_broadcast(self):
         # Reset this, as this is a broadcast down.
@@ -1152,7 +1338,8 @@ class CellsBroadcastMethodsTestCase(test.TestCase):
         expected = [('api-cell!child-cell2!grandchild-cell1', [4, 5]),
                     ('api-cell!child-cell2', [3]),
                     ('api-cell', [1, 2])]
-        self.assertEqual(expected, response_values)
+        # Responses are returned as the cells send them
+        self.assertEqual(sorted(expected), sorted(response_values))
 
     def test_compute_node_get_all(self):
         # Reset this, as this is a broadcast down.
@@ -1176,7 +1363,8 @@ class CellsBroadcastMethodsTestCase(test.TestCase):
         expected = [('api-cell!child-cell2!grandchild-cell1', [4, 5]),
                     ('api-cell!child-cell2', [3]),
                     ('api-cell', [1, 2])]
-        self.assertEqual(expected, response_values)
+        # Responses are returned as the cells send them
+        self.assertEqual(sorted(expected), sorted(response_values))
 
     def test_compute_node_get_all_with_hyp_match(self):
         # Reset this, as this is a broadcast down.
@@ -1208,7 +1396,8 @@ class CellsBroadcastMethodsTestCase(test.TestCase):
         expected = [('api-cell!child-cell2!grandchild-cell1', [4, 5]),
                     ('api-cell!child-cell2', [3]),
                     ('api-cell', [1, 2])]
-        self.assertEqual(expected, response_values)
+        # Responses are returned as the cells send them
+        self.assertEqual(sorted(expected), sorted(response_values))
 
     def test_compute_node_stats(self):
         # Reset this, as this is a broadcast down.
@@ -1235,4 +1424,5 @@ class CellsBroadcastMethodsTestCase(test.TestCase):
         expected = [('api-cell!child-cell2!grandchild-cell1', [4, 5]),
                     ('api-cell!child-cell2', [3]),
                     ('api-cell', [1, 2])]
-        self.assertEqual(expected, response_values)
+        # Responses are returned as the cells send them
+        self.assertEqual(sorted(expected), sorted(response_values))
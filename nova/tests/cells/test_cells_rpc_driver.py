@@ -216,3 +216,131 @@ class CellsRPCDriverTestCase(test.TestCase):
         dispatcher.process_message(self.ctxt, message.to_json())
         self.assertEqual(message.to_json(), call_info['json_message'])
         self.assertTrue(call_info['process_called'])
+
+    def test_process_messages(self):
+        msg_runner = fakes.get_message_runner('api-cell')
+        dispatcher = rpc_driver.InterCellRPCDispatcher(msg_runner)
+        processed = []
+
+        def _fake_process_message(_ctxt, json_message):
+            if json_message == 'bad':
+                raise test.TestingException()
+            processed.append(json_message)
+
+        self.stubs.Set(dispatcher, 'process_message', _fake_process_message)
+        dispatcher.process_messages(self.ctxt, ['one', 'bad', 'two'])
+        self.assertEqual(['one', 'two'], processed)
+
+
+class CellsRPCDriverBatchTestCase(test.TestCase):
+    """Test case for the batching of updates sent to other cells."""
+
+    def setUp(self):
+        super(CellsRPCDriverBatchTestCase, self).setUp()
+        fakes.init(self)
+        self.flags(rpc_driver_batch_window=0.5, group='cells')
+        self.ctxt = context.RequestContext('fake', 'fake')
+        self.driver = rpc_driver.CellsRPCDriver()
+        self.msg_runner = fakes.get_message_runner('child-cell2')
+        self.cell_state = fakes.get_cell_state('child-cell2', 'api-cell')
+
+        self.flushes = []
+        self.stubs.Set(rpc_driver.eventlet, 'spawn_after',
+                       lambda window, func, *args: self.flushes.append(
+                           (window, func, args)))
+        self.sent = []
+        self.stubs.Set(self.driver.intercell_rpcapi, 'send_message_to_cell',
+                       lambda cell_state, message: self.sent.append(
+                           message.method_name))
+        self.batches = []
+        self.stubs.Set(self.driver.intercell_rpcapi, 'send_messages_to_cell',
+                       lambda cell_state, ctxt, fanout, messages:
+                           self.batches.append(list(messages)))
+
+    def _message(self, method_name, **kwargs):
+        return messaging._BroadcastMessage(self.msg_runner, self.ctxt,
+                method_name, kwargs, 'up', run_locally=False)
+
+    def _instance_update(self, uuid, **updates):
+        return self._message('instance_update_at_top',
+                             instance=dict(updates, uuid=uuid))
+
+    def _flush(self):
+        window, func, args = self.flushes.pop(0)
+        self.assertEqual(0.5, window)
+        func(*args)
+
+    def test_updates_batched(self):
+        first = self._instance_update('uuid1', vm_state='building')
+        other = self._instance_update('uuid2', vm_state='active')
+        last = self._instance_update('uuid1', vm_state='active')
+        for message in (first, other, last):
+            self.driver.send_message_to_cell(self.cell_state, message)
+        self.assertEqual([], self.sent)
+        self.assertEqual([], self.batches)
+        self.assertEqual(1, len(self.flushes))
+
+        self._flush()
+        # The last update of uuid1 superseded the first one
+        self.assertEqual([[other.to_json(), last.to_json()]], self.batches)
+
+    def test_bw_usage_updates_batched(self):
+        info = {'uuid': 'uuid1', 'mac': 'mac1', 'start_period': 0}
+        first = self._message('bw_usage_update_at_top',
+                              bw_update_info=dict(info, bw_in=1))
+        last = self._message('bw_usage_update_at_top',
+                             bw_update_info=dict(info, bw_in=2))
+        many = self._message('bw_usage_update_many_at_top', usages=[info])
+        for message in (first, many, last):
+            self.driver.send_message_to_cell(self.cell_state, message)
+        self._flush()
+        self.assertEqual([[many.to_json(), last.to_json()]], self.batches)
+
+    def test_other_message_sends_batch(self):
+        update = self._instance_update('uuid1', vm_state='active')
+        other = self._message('instance_destroy_at_top',
+                              instance={'uuid': 'uuid1'})
+        self.driver.send_message_to_cell(self.cell_state, update)
+        self.driver.send_message_to_cell(self.cell_state, other)
+        self.assertEqual([[update.to_json()]], self.batches)
+        self.assertEqual(['instance_destroy_at_top'], self.sent)
+
+        # Nothing is left for the scheduled flush to send
+        self._flush()
+        self.assertEqual(1, len(self.batches))
+
+    def test_batching_disabled(self):
+        self.flags(rpc_driver_batch_window=0, group='cells')
+        update = self._instance_update('uuid1', vm_state='active')
+        self.driver.send_message_to_cell(self.cell_state, update)
+        self.assertEqual(['instance_update_at_top'], self.sent)
+        self.assertEqual([], self.flushes)
+
+    def test_send_messages_to_cell(self):
+        self.stubs.UnsetAll()
+        call_info = {}
+
+        def _fake_make_msg(method, **kwargs):
+            call_info['rpc_method'] = method
+            call_info['rpc_kwargs'] = kwargs
+            return 'fake-message'
+
+        def _fake_cast_to_server(*args, **kwargs):
+            call_info['cast_args'] = args
+            call_info['cast_kwargs'] = kwargs
+
+        self.stubs.Set(self.driver.intercell_rpcapi, 'make_msg',
+                       _fake_make_msg)
+        self.stubs.Set(self.driver.intercell_rpcapi, 'cast_to_server',
+                       _fake_cast_to_server)
+
+        self.driver.intercell_rpcapi.send_messages_to_cell(
+                self.cell_state, self.ctxt, False, ['one', 'two'])
+        self.assertEqual('process_messages', call_info['rpc_method'])
+        self.assertEqual({'messages': ['one', 'two']},
+                         call_info['rpc_kwargs'])
+        self.assertEqual((self.ctxt, 'fake-message'),
+                         (call_info['cast_args'][0],
+                          call_info['cast_args'][2]))
+        self.assertEqual({'topic': 'cells.intercell.broadcast',
+                          'version': '1.1'}, call_info['cast_kwargs'])
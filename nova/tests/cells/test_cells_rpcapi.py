@@ -205,6 +205,17 @@ class CellsAPITestCase(test.TestCase):
         self._check_result(call_info, 'bw_usage_update_at_top',
                 expected_args)
 
+    def test_bw_usage_update_many_at_top(self):
+        usages = [{'uuid': 'fake_uuid', 'mac': 'fake_mac'}]
+        call_info = self._stub_rpc_method('cast', None)
+
+        self.cells_rpcapi.bw_usage_update_many_at_top(self.fake_context,
+                                                      usages)
+
+        expected_args = {'usages': usages}
+        self._check_result(call_info, 'bw_usage_update_many_at_top',
+                expected_args, version='1.5')
+
     def test_get_cell_info_for_neighbors(self):
         call_info = self._stub_rpc_method('call', 'fake_response')
         result = self.cells_rpcapi.get_cell_info_for_neighbors(
@@ -0,0 +1,123 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+Tests For Cells State Manager
+"""
+
+from nova.cells import state
+from nova import context
+from nova import test
+from nova.tests.cells import fakes
+
+
+FAKE_INSTANCE_TYPES = [
+    {'memory_mb': 1024, 'root_gb': 10, 'ephemeral_gb': 0},
+    {'memory_mb': 2048, 'root_gb': 10, 'ephemeral_gb': 0},
+    {'memory_mb': 2048, 'root_gb': 20, 'ephemeral_gb': 20},
+]
+
+
+def _fake_compute_node(host, free_ram_mb, free_disk_gb,
+                       disk_available_least=None, disabled=False):
+    return {'free_ram_mb': free_ram_mb, 'free_disk_gb': free_disk_gb,
+            'disk_available_least': disk_available_least,
+            'service': {'host': host, 'disabled': disabled}}
+
+
+class CellStateManagerTestCase(test.TestCase):
+    """Test case for the capacity of our cell."""
+
+    def setUp(self):
+        super(CellStateManagerTestCase, self).setUp()
+        fakes.init(self)
+        self.ctxt = context.get_admin_context()
+        self.state_manager = fakes.get_state_manager('child-cell2')
+        self.compute_nodes = []
+        self.stubs.Set(self.state_manager.db, 'compute_node_get_all',
+                       lambda ctxt: self.compute_nodes)
+        self.stubs.Set(self.state_manager.db, 'instance_type_get_all',
+                       lambda ctxt: FAKE_INSTANCE_TYPES)
+
+    def _capacities(self):
+        self.state_manager._update_our_capacity(self.ctxt)
+        return self.state_manager.my_cell_state.capacities
+
+    def test_no_compute_nodes(self):
+        self.assertEqual({}, self._capacities())
+
+    def test_capacities(self):
+        self.compute_nodes = [
+            _fake_compute_node('host1', 4096, 100),
+            _fake_compute_node('host2', 3072, 100,
+                               disk_available_least=30),
+            _fake_compute_node('host3', 8192, 100, disabled=True)]
+        expected = {'ram_free': {'total_mb': 7168,
+                                 'units_by_mb': {'1024': 7, '2048': 3}},
+                    'disk_free': {'total_mb': 130 * 1024,
+                                  'units_by_mb': {'10240': 13,
+                                                  '40960': 2}}}
+        self.assertEqual(expected, self._capacities())
+
+    def test_capacities_updated(self):
+        self.compute_nodes = [
+            _fake_compute_node('host1', 4096, 100),
+            _fake_compute_node('host2', 3072, 30)]
+        self._capacities()
+        self.compute_nodes = [
+            _fake_compute_node('host1', 1024, 100),
+            _fake_compute_node('host3', 2048, 40)]
+        expected = {'ram_free': {'total_mb': 3072,
+                                 'units_by_mb': {'1024': 3, '2048': 1}},
+                    'disk_free': {'total_mb': 140 * 1024,
+                                  'units_by_mb': {'10240': 14,
+                                                  '40960': 3}}}
+        self.assertEqual(expected, self._capacities())
+
+    def test_instance_types_changed(self):
+        self.compute_nodes = [_fake_compute_node('host1', 4096, 100)]
+        self._capacities()
+        self.stubs.Set(self.state_manager.db, 'instance_type_get_all',
+                       lambda ctxt: [{'memory_mb': 512, 'root_gb': 0,
+                                      'ephemeral_gb': 0}])
+        expected = {'ram_free': {'total_mb': 4096,
+                                 'units_by_mb': {'512': 8}},
+                    'disk_free': {'total_mb': 100 * 1024,
+                                  'units_by_mb': {'0': 0}}}
+        self.assertEqual(expected, self._capacities())
+
+
+class CellCapacityTestCase(test.TestCase):
+    """Test case for counting the compute nodes that changed only."""
+
+    def test_unchanged_hosts_not_counted(self):
+        capacity = state.CellCapacity()
+        free_by_host = {'host1': (2048, 10240), 'host2': (1024, 10240)}
+        capacity.update(free_by_host, FAKE_INSTANCE_TYPES)
+
+        counted = []
+        orig_count = capacity._count
+
+        def _fake_count(free, sign):
+            counted.append((free, sign))
+            orig_count(free, sign)
+
+        self.stubs.Set(capacity, '_count', _fake_count)
+        capacity.update(dict(free_by_host, host2=(0, 10240)),
+                        FAKE_INSTANCE_TYPES)
+        self.assertEqual([((1024, 10240), -1), ((0, 10240), 1)], counted)
+        self.assertEqual({'1024': 2, '2048': 1},
+                         capacity.get_capacities()['ram_free']['units_by_mb'])
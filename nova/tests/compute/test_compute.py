@@ -45,6 +45,7 @@ from nova import exception
 from nova.image import glance
 from nova.network import api as network_api
 from nova.network import model as network_model
+from nova import notifications
 from nova.openstack.common import cfg
 from nova.openstack.common import importutils
 from nova.openstack.common import jsonutils
@@ -2778,6 +2779,212 @@ class ComputeTestCase(BaseTestCase):
         self.assertEqual(len(instances), 1)
         self.assertEqual(task_states.POWERING_OFF, instances[0]['task_state'])
 
+    def test_sync_power_states_instance_deleted(self):
+        instance = jsonutils.to_primitive(self._create_fake_instance())
+        self.compute.run_instance(self.context, instance=instance)
+
+        def fake_get_info(instance):
+            # The instance goes away while the hypervisor is queried
+            db.instance_destroy(self.context, instance['uuid'])
+            return {'state': power_state.SHUTDOWN}
+
+        self.stubs.Set(self.compute.driver, 'get_info', fake_get_info)
+        self.mox.StubOutWithMock(self.compute.compute_api, 'stop')
+        self.mox.ReplayAll()
+        self.compute._sync_power_states(context.get_admin_context())
+
+    def test_sync_power_states_rereads_in_chunks(self):
+        self.flags(sync_power_state_chunk_size=2)
+        instances = [jsonutils.to_primitive(self._create_fake_instance())
+                     for i in range(3)]
+        for instance in instances:
+            self.compute.run_instance(self.context, instance=instance)
+        calls = []
+
+        def fake_get_info(instance):
+            calls.append(('get_info', instance['uuid']))
+            return {'state': power_state.RUNNING}
+
+        orig_get_all = self.compute.conductor_api.instance_get_all_by_uuids
+
+        def fake_get_all_by_uuids(context, instance_uuids):
+            calls.append(('reread', sorted(instance_uuids)))
+            return orig_get_all(context, instance_uuids)
+
+        self.stubs.Set(self.compute.driver, 'get_info', fake_get_info)
+        self.stubs.Set(self.compute.conductor_api,
+                       'instance_get_all_by_uuids', fake_get_all_by_uuids)
+        self.compute._sync_power_states(context.get_admin_context())
+
+        # Each chunk is read again, and acted on, before the hypervisor is
+        # asked about the next one
+        uuids = [call[1] for call in calls if call[0] == 'get_info']
+        self.assertEqual(calls, [('get_info', uuids[0]),
+                                 ('get_info', uuids[1]),
+                                 ('reread', sorted(uuids[:2])),
+                                 ('get_info', uuids[2]),
+                                 ('reread', [uuids[2]])])
+        self.assertEqual(sorted(uuids),
+                         sorted(instance['uuid'] for instance in instances))
+
+    def _record_instance_updates(self):
+        calls = []
+        orig_update = self.compute.conductor_api.instance_update
+
+        def fake_update(context, instance_uuid, columns_to_join=None,
+                        **kwargs):
+            calls.append((columns_to_join, kwargs))
+            return orig_update(context, instance_uuid,
+                               columns_to_join=columns_to_join, **kwargs)
+
+        self.stubs.Set(self.compute.conductor_api, 'instance_update',
+                       fake_update)
+        return calls
+
+    def test_instance_update_sends_changes(self):
+        instance = jsonutils.to_primitive(self._create_fake_instance(
+                {'system_metadata': {'foo': 'bar'}}))
+        calls = self._record_instance_updates()
+        ctxt = context.get_admin_context()
+
+        first = self.compute._instance_update(ctxt, instance['uuid'],
+                                              vm_state=vm_states.ACTIVE,
+                                              progress=10)
+        second = self.compute._instance_update(
+            ctxt, instance['uuid'], progress=10,
+            task_state=task_states.POWERING_OFF)
+        self.compute._instance_update(ctxt, instance['uuid'], progress=10)
+
+        self.assertEqual(calls, [
+            (None, {'vm_state': vm_states.ACTIVE, 'progress': 10}),
+            (['info_cache'], {'task_state': task_states.POWERING_OFF}),
+            (['info_cache'], {'progress': 10})])
+        self.assertEqual(second['task_state'], task_states.POWERING_OFF)
+        self.assertEqual(second['system_metadata'],
+                         first['system_metadata'])
+
+    def test_instance_update_stale_cache(self):
+        instance = jsonutils.to_primitive(self._create_fake_instance())
+        ctxt = context.get_admin_context()
+        self.compute._instance_update(ctxt, instance['uuid'],
+                                      task_state=None)
+        db.instance_update(ctxt, instance['uuid'],
+                           {'task_state': task_states.DELETING})
+
+        self.compute._instance_update(ctxt, instance['uuid'],
+                                      task_state=None)
+
+        instance = db.instance_get_by_uuid(ctxt, instance['uuid'])
+        self.assertEqual(instance['task_state'], None)
+
+    def test_instance_update_other_context(self):
+        instance = jsonutils.to_primitive(self._create_fake_instance())
+        calls = self._record_instance_updates()
+        for i in range(2):
+            self.compute._instance_update(context.get_admin_context(),
+                                          instance['uuid'],
+                                          vm_state=vm_states.ACTIVE)
+        self.assertEqual(calls, [(None, {'vm_state': vm_states.ACTIVE})] * 2)
+
+    def test_instance_update_expected_task_state(self):
+        instance = jsonutils.to_primitive(self._create_fake_instance())
+        ctxt = context.get_admin_context()
+        self.compute._instance_update(ctxt, instance['uuid'],
+                                      task_state=None)
+        db.instance_update(ctxt, instance['uuid'],
+                           {'task_state': task_states.DELETING})
+        self.assertRaises(exception.UnexpectedTaskStateError,
+                          self.compute._instance_update, ctxt,
+                          instance['uuid'], task_state=None,
+                          expected_task_state=None)
+
+    def test_poll_bandwidth_usage(self):
+        ctxt = context.get_admin_context()
+        instance = jsonutils.to_primitive(self._create_fake_instance())
+        self.compute._last_bw_usage_poll = 0
+        self.addCleanup(notifications.cache_bandwidth_usages, None, [])
+        prev_time, start_time = utils.last_completed_audit_period()
+        # One interface already has usage in this period, the other one
+        # only in the previous period
+        db.bw_usage_update(ctxt, instance['uuid'], 'mac1', start_time,
+                           100, 200, 10, 20, update_cells=False)
+        db.bw_usage_update(ctxt, instance['uuid'], 'mac2', prev_time,
+                           1000, 2000, 30, 40, update_cells=False)
+
+        def fake_get_all_bw_counters(instances):
+            return [dict(uuid=instance['uuid'], mac_address='mac1',
+                         bw_in=15, bw_out=25),
+                    dict(uuid=instance['uuid'], mac_address='mac2',
+                         bw_in=35, bw_out=5)]
+
+        self.stubs.Set(self.compute.driver, 'get_all_bw_counters',
+                       fake_get_all_bw_counters)
+        self.mox.StubOutWithMock(self.compute.conductor_api, 'bw_usage_get')
+        self.mox.StubOutWithMock(self.compute.conductor_api,
+                                 'bw_usage_update')
+        self.mox.ReplayAll()
+        self.compute._poll_bandwidth_usage(ctxt)
+
+        usage = db.bw_usage_get(ctxt, instance['uuid'], start_time, 'mac1')
+        self.assertEqual((usage['bw_in'], usage['bw_out']), (105, 205))
+        self.assertEqual((usage['last_ctr_in'], usage['last_ctr_out']),
+                         (15, 25))
+        usage = db.bw_usage_get(ctxt, instance['uuid'], start_time, 'mac2')
+        # bw_out rolled over
+        self.assertEqual((usage['bw_in'], usage['bw_out']), (5, 5))
+        self.assertEqual((usage['last_ctr_in'], usage['last_ctr_out']),
+                         (35, 5))
+
+        # The usages are cached for the notifications sent by this host
+        self.assertEqual(notifications._bw_usage_cache['start_period'],
+                         start_time)
+        self.assertEqual(
+            notifications._bw_usage_cache['usages'][instance['uuid']],
+            [dict(mac='mac1', bw_in=105, bw_out=205),
+             dict(mac='mac2', bw_in=5, bw_out=5)])
+
+    def test_poll_volume_usage(self):
+        ctxt = context.get_admin_context()
+        instances = [jsonutils.to_primitive(self._create_fake_instance(
+                         {'host': self.compute.host})) for i in range(2)]
+        db.block_device_mapping_create(ctxt,
+                                       {'instance_uuid': instances[0]['uuid'],
+                                        'device_name': '/dev/vdb',
+                                        'volume_id': 'fake-volume'})
+        db.block_device_mapping_create(ctxt,
+                                       {'instance_uuid': instances[0]['uuid'],
+                                        'device_name': '/dev/vdc',
+                                        'virtual_name': 'ephemeral0'})
+        self.flags(volume_usage_poll_interval=10)
+        self.compute._last_vol_usage_poll = 0
+
+        def fake_get_all_volume_usage(context, compute_host_bdms):
+            bdms = dict((host_bdms['instance']['uuid'],
+                         [bdm['volume_id'] for bdm in
+                          host_bdms['instance_bdms']])
+                        for host_bdms in compute_host_bdms)
+            self.assertEqual(bdms, {instances[0]['uuid']: ['fake-volume'],
+                                    instances[1]['uuid']: []})
+            return [dict(volume='fake-volume', instance=instances[0],
+                         rd_req=1, rd_bytes=2, wr_req=3, wr_bytes=4)]
+
+        self.stubs.Set(self.compute.driver, 'get_all_volume_usage',
+                       fake_get_all_volume_usage)
+        self.mox.StubOutWithMock(self.compute.conductor_api,
+                                 'block_device_mapping_get_all_by_instance')
+        self.mox.StubOutWithMock(self.compute.conductor_api,
+                                 'vol_usage_update')
+        self.mox.ReplayAll()
+        self.compute._poll_volume_usage(ctxt)
+
+        usages = db.vol_get_usage_by_time(ctxt, datetime.datetime(1970, 1, 1))
+        self.assertEqual(len(usages), 1)
+        self.assertEqual(usages[0]['volume_id'], 'fake-volume')
+        self.assertEqual((usages[0]['curr_reads'],
+                          usages[0]['curr_read_bytes'],
+                          usages[0]['curr_writes'],
+                          usages[0]['curr_write_bytes']), (1, 2, 3, 4))
+
     def test_add_instance_fault(self):
         instance = self._create_fake_instance()
         exc_info = None
@@ -3655,6 +3862,29 @@ class ComputeAPITestCase(BaseTestCase):
         finally:
             db.instance_destroy(self.context, ref[0]['uuid'])
 
+    def test_create_multiple_instances_at_once(self):
+        group = self._create_group()
+        self.mox.StubOutWithMock(db, 'instance_create')
+        self.mox.ReplayAll()
+        (refs, resv_id) = self.compute_api.create(
+                self.context,
+                instance_type=instance_types.get_default_instance_type(),
+                image_href=None, min_count=3,
+                security_group=['testgroup'])
+        try:
+            self.assertEqual(len(refs), 3)
+            self.assertEqual(len(set(ref['uuid'] for ref in refs)), 3)
+            for ref in refs:
+                self.assertEqual(ref['reservation_id'], resv_id)
+                self.assertEqual(ref['vm_state'], vm_states.BUILDING)
+                self.assertEqual(len(db.security_group_get_by_instance(
+                                 self.context, ref['id'])), 1)
+            group = db.security_group_get(self.context, group['id'])
+            self.assertEqual(len(group['instances']), 3)
+        finally:
+            for ref in refs:
+                db.instance_destroy(self.context, ref['uuid'])
+
     def test_create_instance_associates_security_groups(self):
         # Make sure create associates security groups.
         group = self._create_group()
@@ -83,9 +83,10 @@ class _BaseTestCase(object):
         inst.update(params)
         return db.instance_create(self.context, inst)
 
-    def _do_update(self, instance_uuid, **updates):
+    def _do_update(self, instance_uuid, columns_to_join=None, **updates):
         return self.conductor.instance_update(self.context, instance_uuid,
-                                              updates)
+                                              updates,
+                                              columns_to_join=columns_to_join)
 
     def test_instance_update(self):
         instance = self._create_fake_instance()
@@ -94,6 +95,19 @@ class _BaseTestCase(object):
         instance = db.instance_get_by_uuid(self.context, instance['uuid'])
         self.assertEqual(instance['vm_state'], vm_states.STOPPED)
         self.assertEqual(new_inst['vm_state'], instance['vm_state'])
+        self.assertTrue('system_metadata' in new_inst)
+
+    def test_instance_update_columns_to_join(self):
+        instance = self._create_fake_instance()
+        new_inst = self._do_update(instance['uuid'],
+                                   columns_to_join=['info_cache'],
+                                   vm_state=vm_states.STOPPED,
+                                   system_metadata={'foo': 'bar'})
+        self.assertEqual(new_inst['vm_state'], vm_states.STOPPED)
+        self.assertTrue('info_cache' in new_inst)
+        self.assertTrue('system_metadata' in new_inst)
+        self.assertFalse('metadata' in new_inst)
+        self.assertFalse('security_groups' in new_inst)
 
     def test_action_event_start(self):
         self.mox.StubOutWithMock(db, 'action_event_start')
@@ -405,6 +419,57 @@ class _BaseTestCase(object):
                                         {'uuid': 'fake-id'}, 'fake-refr',
                                         'fake-bool')
 
+    def test_vol_usage_update_many(self):
+        usages = [dict(volume_id='fake-vol', instance_uuid='fake-id',
+                       rd_req=1, rd_bytes=2, wr_req=3, wr_bytes=4)]
+        refreshed = timeutils.utcnow()
+        self.mox.StubOutWithMock(db, 'vol_usage_update_many')
+        db.vol_usage_update_many(self.context, usages, refreshed, True)
+        self.mox.ReplayAll()
+        self.conductor.vol_usage_update_many(self.context, usages,
+                                             refreshed, True)
+
+    def test_bw_usage_get_by_uuids(self):
+        start_period = timeutils.utcnow()
+        self.mox.StubOutWithMock(db, 'bw_usage_get_by_uuids')
+        db.bw_usage_get_by_uuids(self.context, ['uuid1', 'uuid2'],
+                                 start_period).AndReturn('fake-usages')
+        self.mox.ReplayAll()
+        result = self.conductor.bw_usage_get_by_uuids(
+            self.context, ['uuid1', 'uuid2'], start_period)
+        self.assertEqual(result, 'fake-usages')
+
+    def test_bw_usage_update_many(self):
+        now = timeutils.utcnow()
+        usages = [dict(uuid='uuid', mac='mac', start_period=now,
+                       bw_in=10, bw_out=20, last_ctr_in=5, last_ctr_out=10,
+                       last_refreshed=now)]
+        self.mox.StubOutWithMock(db, 'bw_usage_update_many')
+        db.bw_usage_update_many(self.context, usages)
+        self.mox.ReplayAll()
+        self.conductor.bw_usage_update_many(self.context, usages)
+
+    def test_block_device_mapping_get_all_by_instance_uuids(self):
+        self.mox.StubOutWithMock(
+            db, 'block_device_mapping_get_all_by_instance_uuids')
+        db.block_device_mapping_get_all_by_instance_uuids(
+            self.context, ['uuid1', 'uuid2']).AndReturn('fake-result')
+        self.mox.ReplayAll()
+        result = self.conductor.block_device_mapping_get_all_by_instance_uuids(
+            self.context, ['uuid1', 'uuid2'])
+        self.assertEqual(result, 'fake-result')
+
+    def test_instance_get_all_by_uuids(self):
+        self.mox.StubOutWithMock(db, 'instance_get_all_by_filters')
+        db.instance_get_all_by_filters(
+            self.context, {'uuid': ['uuid1', 'uuid2']}, 'created_at',
+            'desc').AndReturn([{'uuid': 'uuid1', 'deleted': 0},
+                               {'uuid': 'uuid2', 'deleted': 2}])
+        self.mox.ReplayAll()
+        result = self.conductor.instance_get_all_by_uuids(self.context,
+                                                          ['uuid1', 'uuid2'])
+        self.assertEqual(result, [{'uuid': 'uuid1', 'deleted': 0}])
+
     def test_ping(self):
         result = self.conductor.ping(self.context, 'foo')
         self.assertEqual(result, {'service': 'conductor', 'arg': 'foo'})
@@ -15,6 +15,8 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import re
+
 from nova.compute import api as compute_api
 from nova.compute import manager as compute_manager
 import nova.context
@@ -148,6 +150,47 @@ class FakeNetworkManager(network_manager.NetworkManager):
             return [ip for ip in self.fixed_ips
                     if ip['virtual_interface_id'] == vif_id]
 
+        def _address_matches(self, ip, address, address_like):
+            if address is not None and ip['address'] != address:
+                return False
+            if address_like is not None:
+                regex = address_like.replace('_', '.').replace('%', '.*')
+                if not re.match(regex + '$', ip['address']):
+                    return False
+            return True
+
+        def virtual_interface_get_fixed_ips(self, context, address=None,
+                                            address_like=None):
+            vifs = dict((vif['id'], vif) for vif in self.vifs)
+            return [{'instance_uuid': vifs[ip['virtual_interface_id']][
+                         'instance_uuid'],
+                     'address': ip['address']}
+                    for ip in self.fixed_ips
+                    if self._address_matches(ip, address, address_like)]
+
+        def virtual_interface_get_floating_ips(self, context, address=None,
+                                               address_like=None):
+            vifs = dict((vif['id'], vif) for vif in self.vifs)
+            fixed_ips = dict((ip['id'], ip) for ip in self.fixed_ips)
+            results = []
+            for floating_ip in self.floating_ips:
+                if not self._address_matches(floating_ip, address,
+                                             address_like):
+                    continue
+                fixed_ip = fixed_ips[floating_ip['fixed_ip_id']]
+                vif = vifs[fixed_ip['virtual_interface_id']]
+                results.append({'instance_uuid': vif['instance_uuid'],
+                                'address': floating_ip['address'],
+                                'fixed_address': fixed_ip['address']})
+            return results
+
+        def virtual_interface_get_all_ipv6(self, context):
+            return [{'instance_uuid': vif['instance_uuid'],
+                     'address': vif['address'],
+                     'cidr_v6': self.network_get(context,
+                                                 vif['network_id'])['cidr_v6']}
+                    for vif in self.vifs]
+
     def __init__(self):
         self.db = self.FakeDB()
         self.deallocate_called = None
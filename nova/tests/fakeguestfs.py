@@ -24,9 +24,14 @@ class GuestFS(object):
         self.mounts = []
         self.files = {}
         self.auginit = False
+        self.labels = {}
+        self.inspected = 0
+        self.vgactive = False
+        self.launched = 0
 
     def launch(self):
         self.running = True
+        self.launched += 1
 
     def shutdown(self):
         self.running = False
@@ -37,9 +42,28 @@ class GuestFS(object):
         self.closed = True
 
     def add_drive_opts(self, file, *args, **kwargs):
+        if self.running and 'label' not in kwargs:
+            raise RuntimeError("Cannot add drives to a running appliance")
         self.drives.append((file, kwargs['format']))
+        if 'label' in kwargs:
+            self.labels[kwargs['label']] = "/dev/sd" + "abcdef"[
+                len(self.drives) - 1]
+
+    def remove_drive(self, label):
+        device = self.labels.pop(label)
+        del self.drives["abcdef".index(device[-1])]
+
+    def list_disk_labels(self):
+        return self.labels
+
+    def vgscan(self):
+        pass
+
+    def vg_activate_all(self, activate):
+        self.vgactive = activate
 
     def inspect_os(self):
+        self.inspected += 1
         return ["/dev/guestvgf/lv_root"]
 
     def inspect_get_mountpoints(self, dev):
@@ -49,6 +73,9 @@ class GuestFS(object):
     def mount_options(self, options, device, mntpoint):
         self.mounts.append((options, device, mntpoint))
 
+    def umount_all(self):
+        self.mounts = []
+
     def mkdir_p(self, path):
         if path not in self.files:
             self.files[path] = {
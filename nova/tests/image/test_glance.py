@@ -29,6 +29,7 @@ from nova import context
 from nova import exception
 from nova.image import glance
 from nova.openstack.common import cfg
+from nova.openstack.common import timeutils
 from nova import test
 from nova.tests.api.openstack import fakes
 from nova.tests.glance import stubs as glance_stubs
@@ -574,6 +575,114 @@ class TestGlanceImageService(test.TestCase):
                 'something-less-likely')
 
 
+class TestGlanceImageMetadataCache(test.TestCase):
+
+    def setUp(self):
+        super(TestGlanceImageMetadataCache, self).setUp()
+        self.flags(glance_metadata_cache_ttl=60,
+                   glance_metadata_cache_negative_ttl=10)
+        self.stubs.Set(glance, '_IMAGE_CACHE', None)
+        self.useFixture(test.TimeOverride())
+
+        self.calls = []
+        test_case = self
+
+        class CountingGlanceStubClient(glance_stubs.StubGlanceClient):
+            def get(self, image_id):
+                test_case.calls.append(image_id)
+                return super(CountingGlanceStubClient, self).get(image_id)
+
+        self.client = CountingGlanceStubClient()
+
+        def _fake_create_glance_client(context, host, port, use_ssl, version):
+            return self.client
+
+        self.stubs.Set(glance, '_create_glance_client',
+                _fake_create_glance_client)
+        client_wrapper = glance.GlanceClientWrapper(
+                'fake', 'fake_host', 9292)
+        self.service = glance.GlanceImageService(client=client_wrapper)
+        self.context = context.RequestContext('fake', 'fake', auth_token=True)
+
+    def _create_image(self, **kwargs):
+        fixture = {'name': 'image', 'properties': {}, 'status': 'active',
+                   'is_public': False}
+        fixture.update(kwargs)
+        return self.client.create(**fixture).id
+
+    def test_show_is_cached(self):
+        image_id = self._create_image()
+        image_meta = self.service.show(self.context, image_id)
+        image_meta['properties']['mutated'] = True
+        self.assertEqual(self.service.show(self.context, image_id),
+                         self.service.show(self.context, image_id))
+        self.assertNotIn('mutated',
+                         self.service.show(self.context, image_id)[
+                             'properties'])
+        self.assertEqual(self.calls, [image_id])
+
+    def test_cache_expires(self):
+        image_id = self._create_image()
+        self.service.show(self.context, image_id)
+        timeutils.advance_time_seconds(61)
+        self.service.show(self.context, image_id)
+        self.assertEqual(self.calls, [image_id, image_id])
+
+    def test_cache_disabled(self):
+        self.flags(glance_metadata_cache_ttl=0)
+        image_id = self._create_image()
+        self.service.show(self.context, image_id)
+        self.service.show(self.context, image_id)
+        self.assertEqual(self.calls, [image_id, image_id])
+
+    def test_inactive_image_is_not_cached(self):
+        image_id = self._create_image(status='saving')
+        self.service.show(self.context, image_id)
+        self.service.show(self.context, image_id)
+        self.assertEqual(self.calls, [image_id, image_id])
+
+    def test_private_image_is_cached_per_project(self):
+        image_id = self._create_image()
+        other = context.RequestContext('fake', 'other', auth_token=True)
+        self.service.show(self.context, image_id)
+        self.service.show(other, image_id)
+        self.service.show(other, image_id)
+        self.assertEqual(self.calls, [image_id, image_id])
+
+    def test_public_image_is_shared(self):
+        image_id = self._create_image(is_public=True)
+        other = context.RequestContext('fake', 'other', auth_token=True)
+        self.service.show(self.context, image_id)
+        self.service.show(other, image_id)
+        self.assertEqual(self.calls, [image_id])
+
+    def test_missing_image_is_cached(self):
+        self.assertRaises(exception.ImageNotFound,
+                          self.service.show, self.context, 'missing')
+        self.assertRaises(exception.ImageNotFound,
+                          self.service.show, self.context, 'missing')
+        self.assertEqual(self.calls, ['missing'])
+        timeutils.advance_time_seconds(11)
+        self.assertRaises(exception.ImageNotFound,
+                          self.service.show, self.context, 'missing')
+        self.assertEqual(self.calls, ['missing', 'missing'])
+
+    def test_update_invalidates(self):
+        image_id = self._create_image()
+        self.service.show(self.context, image_id)
+        self.service.update(self.context, image_id, {'name': 'renamed'})
+        image_meta = self.service.show(self.context, image_id)
+        self.assertEqual(image_meta['name'], 'renamed')
+        self.assertEqual(self.calls, [image_id, image_id])
+
+    def test_delete_invalidates(self):
+        image_id = self._create_image()
+        self.service.show(self.context, image_id)
+        self.service.delete(self.context, image_id)
+        self.assertRaises(exception.ImageNotFound,
+                          self.service.show, self.context, image_id)
+
+
 def _create_failing_glance_client(info):
     class MyGlanceStubClient(glance_stubs.StubGlanceClient):
         """A client that fails the first time, then succeeds."""
@@ -743,6 +852,41 @@ class TestGlanceClientWrapper(test.TestCase):
         client2.call(ctxt, 1, 'get', 'meow')
         self.assertEqual(info['num_calls'], 2)
 
+    def test_pooled_client_is_reused(self):
+        self.flags(glance_client_pool_size=2,
+                   glance_api_servers=['host1:9292'],
+                   auth_strategy='keystone')
+        self.stubs.Set(glance, '_CLIENT_POOLS', {})
+
+        created = []
+
+        def _fake_create_glance_client(context, host, port, use_ssl, version):
+            self.assertEqual(context, None)
+            client = glance_stubs.StubGlanceClient([{'id': 'meow'}])
+            created.append(client)
+            return client
+
+        self.stubs.Set(glance, '_create_glance_client',
+                _fake_create_glance_client)
+
+        ctxt = context.RequestContext('fake', 'fake', auth_token='token1')
+        ctxt2 = context.RequestContext('fake', 'fake', auth_token='token2')
+
+        tokens = []
+        real_get = glance_stubs.StubGlanceClient.get
+
+        def _fake_get(client, image_id):
+            tokens.append(client.auth_token)
+            return real_get(client, image_id)
+
+        self.stubs.Set(glance_stubs.StubGlanceClient, 'get', _fake_get)
+
+        glance.GlanceClientWrapper().call(ctxt, 1, 'get', 'meow')
+        glance.GlanceClientWrapper().call(ctxt2, 1, 'get', 'meow')
+        self.assertEqual(len(created), 1)
+        self.assertEqual(tokens, ['token1', 'token2'])
+        self.assertEqual(created[0].auth_token, None)
+
 
 class TestGlanceUrl(test.TestCase):
 
@@ -1470,6 +1470,59 @@ class CommonNetworkTestCase(test.TestCase):
         self.assertEqual(len(res), 1)
         self.assertEqual(res[0]['instance_uuid'], _vifs[2]['instance_uuid'])
 
+    def test_get_instance_uuids_by_floating_ip(self):
+        manager = fake_network.FakeNetworkManager()
+        _vifs = manager.db.virtual_interface_get_all(None)
+        fake_context = context.RequestContext('user', 'project')
+
+        res = manager.get_instance_uuids_by_ip_filter(fake_context,
+                                                      {'ip': '173.16.1.2'})
+        self.assertEqual(res, [{'instance_uuid': _vifs[2]['instance_uuid'],
+                                'ip': '173.16.1.2'}])
+
+        # Floating ips aren't reported when the fixed ip matched already
+        res = manager.get_instance_uuids_by_ip_filter(fake_context,
+                                                      {'ip': '172.16.'})
+        self.assertEqual(res, [{'instance_uuid': _vifs[0]['instance_uuid'],
+                                'ip': '172.16.0.1'},
+                               {'instance_uuid': _vifs[1]['instance_uuid'],
+                                'ip': '172.16.0.2'}])
+
+    def test_get_instance_uuids_by_ip_narrows_query(self):
+        manager = fake_network.FakeNetworkManager()
+        fake_context = context.RequestContext('user', 'project')
+        self.mox.StubOutWithMock(manager.db,
+                                 'virtual_interface_get_fixed_ips')
+        self.mox.StubOutWithMock(manager.db,
+                                 'virtual_interface_get_floating_ips')
+        manager.db.virtual_interface_get_fixed_ips(
+            fake_context, address='172.16.0.2',
+            address_like=None).AndReturn([])
+        manager.db.virtual_interface_get_floating_ips(
+            fake_context, address='172.16.0.2',
+            address_like=None).AndReturn([])
+        self.mox.ReplayAll()
+        manager.get_instance_uuids_by_ip_filter(fake_context,
+                                                {'ip': '^172\\.16\\.0\\.2$'})
+
+    def test_ip_filter_to_sql(self):
+        cases = [('^10\\.0\\.0\\.1$', ('10.0.0.1', None)),
+                 ('10\\.0\\.0\\.1$', ('10.0.0.1', None)),
+                 ('10\\.0\\.0\\.1', (None, '10.0.0.1%')),
+                 ('10.0.0.1', (None, '10_0_0_1%')),
+                 ('10.0.0.1$', (None, '10_0_0_1')),
+                 ('172.16.0.*', (None, '172_16_0%')),
+                 ('10.0.0.1?', (None, '10_0_0_%')),
+                 ('10.0.[12]', (None, '10_0_%')),
+                 ('fe80::', (None, 'fe80::%')),
+                 ('.*', (None, None)),
+                 ('[0-9]+', (None, None)),
+                 ('10.0.0.1|10.0.0.2', (None, None)),
+                 ('(?i)FE80::', (None, None))]
+        for ip_filter, expected in cases:
+            self.assertEqual(network_manager._ip_filter_to_sql(ip_filter),
+                             expected, ip_filter)
+
     def test_get_network(self):
         manager = fake_network.FakeNetworkManager()
         fake_context = context.RequestContext('user', 'project')
@@ -18,6 +18,8 @@
 import uuid
 
 import mox
+import webob
+import webob.dec
 
 from nova import context
 from nova import exception
@@ -25,7 +27,10 @@ from nova.network import model
 from nova.network import quantumv2
 from nova.network.quantumv2 import api as quantumapi
 from nova.openstack.common import cfg
+from nova.openstack.common import jsonutils
 from nova import test
+from nova import wsgi
+from quantumclient.common import exceptions as quantum_exceptions
 from quantumclient.v2_0 import client
 
 
@@ -164,8 +169,9 @@ class TestQuantumv2(test.TestCase):
                            'fixed_ips': [{'ip_address': self.port_address,
                                           'subnet_id': 'my_subid1'}],
                            'mac_address': 'my_mac1', }]
-        self.dhcp_port_data1 = [{'fixed_ips': [{'ip_address': '10.0.1.9',
-                                               'subnet_id': 'my_subid1'}]}]
+        self.dhcp_port_data1 = [{'network_id': 'my_netid1',
+                                 'fixed_ips': [{'ip_address': '10.0.1.9',
+                                                'subnet_id': 'my_subid1'}]}]
         self.port_data2 = []
         self.port_data2.append(self.port_data1[0])
         self.port_data2.append({'network_id': 'my_netid2',
@@ -255,15 +261,16 @@ class TestQuantumv2(test.TestCase):
             shared=False).AndReturn({'networks': nets})
         self.moxed_client.list_networks(
             shared=True).AndReturn({'networks': []})
-        for i in xrange(1, number + 1):
-            subnet_data = i == 1 and self.subnet_data1 or self.subnet_data2
-            self.moxed_client.list_subnets(
-                id=mox.SameElementsAs(['my_subid%s' % i])).AndReturn(
-                    {'subnets': subnet_data})
-            self.moxed_client.list_ports(
-                network_id=subnet_data[0]['network_id'],
-                device_owner='network:dhcp').AndReturn(
-                    {'ports': []})
+        subnet_data = number == 1 and self.subnet_data1 or (
+            self.subnet_data1 + self.subnet_data2)
+        self.moxed_client.list_subnets(
+            id=mox.SameElementsAs(['my_subid%s' % i
+                                   for i in xrange(1, number + 1)])
+            ).AndReturn({'subnets': subnet_data})
+        self.moxed_client.list_ports(
+            network_id=mox.SameElementsAs(['my_netid%s' % i
+                                           for i in xrange(1, number + 1)]),
+            device_owner='network:dhcp').AndReturn({'ports': []})
         self.mox.ReplayAll()
         nw_inf = api.get_instance_nw_info(self.context, self.instance)
         for i in xrange(0, number):
@@ -298,7 +305,7 @@ class TestQuantumv2(test.TestCase):
             id=mox.SameElementsAs(['my_subid1'])).AndReturn(
                 {'subnets': self.subnet_data1})
         self.moxed_client.list_ports(
-            network_id='my_netid1',
+            network_id=['my_netid1'],
             device_owner='network:dhcp').AndReturn(
                 {'ports': self.dhcp_port_data1})
         quantumv2.get_client(mox.IgnoreArg(),
@@ -1080,3 +1087,197 @@ class TestQuantumv2ModuleMethods(test.TestCase):
             [1, 2, 3])
 
         self.assertEqual(l, [{'id': 1}, {'id': 2}, {'id': 3}])
+
+
+class FakeQuantumServer(object):
+    """Answers quantum list requests from canned data and counts them."""
+
+    def __init__(self, **resources):
+        self.resources = resources
+        self.requests = []
+        self.peers = set()
+
+    @webob.dec.wsgify
+    def __call__(self, req):
+        self.requests.append(req.path_info)
+        self.peers.add(req.environ['REMOTE_PORT'])
+        # GET /v2.0/<resources>.json?<filters>
+        name = req.path_info.split('/')[-1].rsplit('.', 1)[0]
+        result = []
+        for obj in self.resources[name]:
+            for key in req.GET:
+                if str(obj.get(key)) not in req.GET.getall(key):
+                    break
+            else:
+                result.append(obj)
+        return webob.Response(body=jsonutils.dumps({name: result}),
+                              content_type='application/json')
+
+
+class TestQuantumv2FakeServer(test.TestCase):
+
+    def setUp(self):
+        super(TestQuantumv2FakeServer, self).setUp()
+        self.stubs.Set(quantumv2, '_CLIENT_POOL', None)
+        self.stubs.Set(quantumv2, '_ADMIN_TOKEN', None)
+        self.stubs.Set(quantumapi, '_CACHE', None)
+        self.context = context.RequestContext('userid', 'my_tenantid',
+                                              auth_token='token')
+        self.instances = []
+        ports = []
+        for i in xrange(1, 3):
+            instance_uuid = str(uuid.uuid4())
+            self.instances.append({'project_id': 'my_tenantid',
+                                   'uuid': instance_uuid,
+                                   'display_name': 'test_instance%s' % i})
+            for net in xrange(1, 3):
+                ports.append({'id': 'port%s-%s' % (i, net),
+                              'tenant_id': 'my_tenantid',
+                              'device_id': instance_uuid,
+                              'device_owner': 'compute:nova',
+                              'network_id': 'net%s' % net,
+                              'mac_address': 'mac%s-%s' % (i, net),
+                              'fixed_ips': [
+                                  {'ip_address': '10.0.%s.%s' % (net, i + 2),
+                                   'subnet_id': 'subnet%s' % net}]})
+        for net in xrange(1, 3):
+            ports.append({'id': 'dhcp%s' % net,
+                          'tenant_id': 'my_tenantid',
+                          'device_id': 'dhcp',
+                          'device_owner': 'network:dhcp',
+                          'network_id': 'net%s' % net,
+                          'mac_address': 'dhcpmac%s' % net,
+                          'fixed_ips': [{'ip_address': '10.0.%s.2' % net,
+                                         'subnet_id': 'subnet%s' % net}]})
+        networks = [{'id': 'net%s' % net,
+                     'name': 'network%s' % net,
+                     'tenant_id': 'my_tenantid',
+                     'shared': False} for net in xrange(1, 3)]
+        subnets = [{'id': 'subnet%s' % net,
+                    'network_id': 'net%s' % net,
+                    'cidr': '10.0.%s.0/24' % net,
+                    'gateway_ip': '10.0.%s.1' % net,
+                    'dns_nameservers': ['8.8.8.8']} for net in xrange(1, 3)]
+        self.quantum = FakeQuantumServer(ports=ports, networks=networks,
+                                         subnets=subnets)
+        server = wsgi.Server("Fake quantum", self.quantum,
+                             host='127.0.0.1', port=0)
+        server.start()
+        self.addCleanup(server.stop)
+        self.flags(quantum_url='http://127.0.0.1:%d' % server.port,
+                   quantum_auth_strategy=None)
+
+    def _get_nw_info(self, instance):
+        api = quantumapi.API()
+        return api._get_instance_nw_info(self.context, instance)
+
+    def _verify_nw_info(self, nw_info, idx):
+        self.assertEqual(len(nw_info), 2)
+        for net, vif in enumerate(nw_info, 1):
+            self.assertEqual(vif['id'], 'port%s-%s' % (idx, net))
+            self.assertEqual(vif['network']['label'], 'network%s' % net)
+            subnet = vif['network']['subnets'][0]
+            self.assertEqual(subnet['cidr'], '10.0.%s.0/24' % net)
+            self.assertEqual(subnet['ips'][0]['address'],
+                             '10.0.%s.%s' % (net, idx + 2))
+            self.assertEqual(subnet.get_meta('dhcp_server'),
+                             '10.0.%s.2' % net)
+
+    def test_nw_info_batched(self):
+        nw_info = self._get_nw_info(self.instances[0])
+        self._verify_nw_info(nw_info, 1)
+        # The ports, the two network lists, one subnet and one dhcp port
+        # lookup for both ports.
+        self.assertEqual(len(self.quantum.requests), 5)
+
+    def test_nw_info_cached(self):
+        self.flags(quantum_cache_ttl=60)
+        for idx, instance in enumerate(self.instances, 1):
+            self._verify_nw_info(self._get_nw_info(instance), idx)
+        # The second instance only needs its ports looked up.
+        self.assertEqual(len(self.quantum.requests), 6)
+
+    def test_pooled_client_reuses_connection(self):
+        self.flags(quantum_client_pool_size=1)
+        for idx, instance in enumerate(self.instances, 1):
+            self._verify_nw_info(self._get_nw_info(instance), idx)
+        self.assertEqual(len(self.quantum.requests), 10)
+        self.assertEqual(len(self.quantum.peers), 1)
+
+
+class FakePooledQuantumClient(object):
+    """Records the token each call is made with."""
+
+    def __init__(self, results):
+        self.httpclient = client.HTTPClient()
+        self.results = results
+        self.tokens = []
+
+    def list_ports(self, **search_opts):
+        self.tokens.append(self.httpclient.auth_token)
+        result = self.results.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+
+class TestQuantumPooledClient(test.TestCase):
+
+    def setUp(self):
+        super(TestQuantumPooledClient, self).setUp()
+        self.stubs.Set(quantumv2, '_CLIENT_POOL', None)
+        self.stubs.Set(quantumv2, '_ADMIN_TOKEN', None)
+        self.flags(quantum_client_pool_size=1)
+        self.context = context.RequestContext('userid', 'my_tenantid')
+        self.clients = []
+        self.results = []
+
+        def fake_create(pool):
+            self.clients.append(FakePooledQuantumClient(self.results))
+            return self.clients[-1]
+
+        self.stubs.Set(quantumv2.ClientPool, 'create', fake_create)
+        self.mox.StubOutWithMock(quantumv2, '_get_auth_token')
+
+    def test_user_token(self):
+        self.results.extend([{'ports': []}, {'ports': []}])
+        self.mox.ReplayAll()
+        self.context.auth_token = 'token'
+        quantum = quantumv2.get_client(self.context)
+        self.assertEqual(quantum.list_ports(network_id='net1'),
+                         {'ports': []})
+        self.context.auth_token = 'other_token'
+        quantumv2.get_client(self.context).list_ports()
+        self.assertEqual(len(self.clients), 1)
+        self.assertEqual(self.clients[0].tokens, ['token', 'other_token'])
+        self.assertEqual(self.clients[0].httpclient.auth_token, None)
+
+    def test_admin_token_reused(self):
+        quantumv2._get_auth_token().AndReturn('admin_token')
+        self.results.extend([{'ports': []}, {'ports': []}])
+        self.mox.ReplayAll()
+        quantumv2.get_client(self.context, admin=True).list_ports()
+        quantumv2.get_client(self.context, admin=True).list_ports()
+        self.assertEqual(self.clients[0].tokens,
+                         ['admin_token', 'admin_token'])
+
+    def test_admin_token_refreshed(self):
+        quantumv2._get_auth_token().AndReturn('expired_token')
+        quantumv2._get_auth_token().AndReturn('admin_token')
+        self.results.extend([quantum_exceptions.Unauthorized(),
+                             {'ports': []}])
+        self.mox.ReplayAll()
+        quantum = quantumv2.get_client(self.context, admin=True)
+        self.assertEqual(quantum.list_ports(), {'ports': []})
+        self.assertEqual(self.clients[0].tokens,
+                         ['expired_token', 'admin_token'])
+
+    def test_user_token_not_refreshed(self):
+        self.results.append(quantum_exceptions.Unauthorized())
+        self.mox.ReplayAll()
+        self.context.auth_token = 'token'
+        quantum = quantumv2.get_client(self.context)
+        self.assertRaises(quantum_exceptions.Unauthorized,
+                          quantum.list_ports)
+        # The client went back to the pool
+        self.assertEqual(quantumv2._CLIENT_POOL.free(), 1)
@@ -0,0 +1,194 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Tests for the single reply queue of the amqp rpc drivers."""
+
+import sys
+
+from nova.openstack.common.rpc import amqp as rpc_amqp
+from nova.openstack.common.rpc import common as rpc_common
+from nova import test
+
+
+class FakeBroker(object):
+    """Routes messages between FakeConnections, without queueing them."""
+
+    def __init__(self):
+        self.consumers = {}
+        self.declared = []
+        self.sent = []
+        # Called with the message sent to a topic, as a server would be
+        self.server = None
+
+
+class FakeConnection(object):
+    broker = None
+
+    def __init__(self, conf, server_params=None):
+        self.conf = conf
+
+    def declare_direct_consumer(self, topic, callback):
+        self.broker.declared.append(topic)
+        self.broker.consumers[topic] = callback
+
+    def consume_in_thread(self):
+        pass
+
+    def direct_send(self, msg_id, msg):
+        self.broker.sent.append((msg_id, msg))
+        callback = self.broker.consumers.get(msg_id)
+        if callback is not None:
+            callback(rpc_common.deserialize_msg(msg))
+
+    def topic_send(self, topic, msg):
+        self.broker.sent.append((topic, msg))
+        if self.broker.server is not None:
+            self.broker.server(rpc_common.deserialize_msg(msg))
+
+    def reset(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class ReplyQueueTestCase(test.TestCase):
+
+    def setUp(self):
+        super(ReplyQueueTestCase, self).setUp()
+        self.flags(amqp_rpc_single_reply_queue=True)
+        self.broker = FakeBroker()
+        self.stubs.Set(FakeConnection, 'broker', self.broker)
+        self.pool = rpc_amqp.Pool(test.CONF, FakeConnection)
+        self.addCleanup(self.pool.empty)
+        self.context = rpc_common.CommonRpcContext()
+
+    def _serve(self, *replies, **kwargs):
+        """Answer the calls made with replies, then with ending."""
+        failure = kwargs.get('failure')
+
+        def server(msg):
+            ctxt = rpc_amqp.unpack_context(test.CONF, msg)
+            self.server_contexts.append(ctxt)
+            for reply in replies:
+                ctxt.reply(reply, connection_pool=self.pool)
+            if failure is not None:
+                try:
+                    raise failure
+                except Exception:
+                    ctxt.reply(failure=sys.exc_info(),
+                               connection_pool=self.pool, log_failure=False)
+            ctxt.reply(ending=True, connection_pool=self.pool)
+
+        self.server_contexts = []
+        self.broker.server = server
+
+    def _call(self, timeout=None):
+        return rpc_amqp.call(test.CONF, self.context, 'topic',
+                             {'method': 'echo', 'args': {}}, timeout,
+                             self.pool)
+
+    def _waiters(self):
+        return self.pool.reply_proxy._call_waiters
+
+    def test_call(self):
+        self._serve('pong')
+        self.assertEqual(self._call(), 'pong')
+        self.assertEqual(self._call(), 'pong')
+
+        reply_q = self.pool.reply_proxy.get_reply_q()
+        # One reply queue for all the calls, given to the servers
+        self.assertEqual(self.broker.declared, [reply_q])
+        self.assertEqual([ctxt.reply_q for ctxt in self.server_contexts],
+                         [reply_q, reply_q])
+        self.assertEqual(self._waiters(), {})
+
+    def test_waiter_registered_before_send(self):
+        registered = []
+
+        def server(msg):
+            registered.append(msg['_msg_id'] in self._waiters())
+            ctxt = rpc_amqp.unpack_context(test.CONF, msg)
+            ctxt.reply('pong', connection_pool=self.pool)
+            ctxt.reply(ending=True, connection_pool=self.pool)
+
+        self.broker.server = server
+        self.assertEqual(self._call(), 'pong')
+        self.assertEqual(registered, [True])
+
+    def test_replies_routed_by_msg_id(self):
+        proxy = rpc_amqp.get_reply_proxy(test.CONF, self.pool)
+        first = rpc_amqp.MulticallProxyWaiter(test.CONF, 'first', None,
+                                              self.pool)
+        second = rpc_amqp.MulticallProxyWaiter(test.CONF, 'second', None,
+                                               self.pool)
+
+        proxy._process_data({'_msg_id': 'second', 'result': 2,
+                             'failure': None})
+        proxy._process_data({'_msg_id': 'first', 'result': 1,
+                             'failure': None})
+        # Nobody waits for it, it is dropped
+        proxy._process_data({'_msg_id': 'third', 'result': 3,
+                             'failure': None})
+        for waiter in (first, second):
+            waiter.put({'failure': None, 'ending': True})
+
+        self.assertEqual(list(first), [1])
+        self.assertEqual(list(second), [2])
+        self.assertEqual(self._waiters(), {})
+
+    def test_timeout_removes_waiter(self):
+        self.broker.server = lambda msg: None
+        self.assertRaises(rpc_common.Timeout, self._call, timeout=0.01)
+        self.assertEqual(self._waiters(), {})
+
+    def test_multicall(self):
+        self._serve(1, 2, 3)
+        results = rpc_amqp.multicall(test.CONF, self.context, 'topic',
+                                     {'method': 'echo', 'args': {}}, None,
+                                     self.pool)
+        self.assertEqual(list(results), [1, 2, 3])
+        self.assertEqual(self._waiters(), {})
+
+    def test_remote_exception(self):
+        self._serve(failure=ValueError('bad value'))
+        self.assertRaises(ValueError, self._call)
+        self.assertEqual(self._waiters(), {})
+
+    def test_reply_without_reply_q(self):
+        # What a caller without the option sends
+        ctxt = rpc_amqp.unpack_context(test.CONF, {'_msg_id': 'msg_id'})
+        self.assertEqual(ctxt.reply_q, None)
+        ctxt.reply('pong', connection_pool=self.pool)
+
+        queue, reply = self.broker.sent[-1]
+        self.assertEqual(queue, 'msg_id')
+        self.assertFalse('_msg_id' in reply)
+        self.assertEqual(reply['result'], 'pong')
+        self.assertEqual(self.pool.reply_proxy, None)
+
+    def test_per_call_queue_without_option(self):
+        self.flags(amqp_rpc_single_reply_queue=False)
+        self.stubs.Set(rpc_amqp, 'MulticallWaiter', lambda *args: None)
+        rpc_amqp.multicall(test.CONF, self.context, 'topic',
+                           {'method': 'echo', 'args': {}}, None, self.pool)
+
+        _topic, msg = self.broker.sent[-1]
+        msg = rpc_common.deserialize_msg(msg)
+        self.assertFalse('_reply_q' in msg)
+        self.assertEqual(self.broker.declared, [msg['_msg_id']])
+        self.assertEqual(self.pool.reply_proxy, None)
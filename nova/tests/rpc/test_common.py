@@ -0,0 +1,180 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Tests for the binary rpc envelope."""
+
+import datetime
+
+import iso8601
+
+from nova.openstack.common import jsonutils
+from nova.openstack.common.rpc import amqp as rpc_amqp
+from nova.openstack.common.rpc import common as rpc_common
+from nova import test
+
+
+class FakeConnection(object):
+    """Records what is sent instead of sending it."""
+
+    def __init__(self):
+        self.sent = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def direct_send(self, msg_id, msg):
+        self.sent.append((msg_id, msg))
+
+    def topic_send(self, topic, msg):
+        self.sent.append((topic, msg))
+
+
+class BinaryEnvelopeTestCase(test.TestCase):
+
+    def setUp(self):
+        super(BinaryEnvelopeTestCase, self).setUp()
+        if rpc_common.msgpack is None:
+            self.skipTest('msgpack is not installed')
+
+    def _round_trip(self, raw_msg):
+        msg = rpc_common.serialize_msg(raw_msg, binary=True)
+        # What the messaging libraries do to the envelope
+        msg = jsonutils.loads(jsonutils.dumps(msg))
+        return msg, rpc_common.deserialize_msg(msg)
+
+    def test_round_trip(self):
+        raw_msg = {'method': 'instance_update',
+                   'args': {'uuid': u'\xe9t\xe9', 'count': 3,
+                            'progress': 0.5, 'nothing': None,
+                            'metadata': [{'key': 'k', 'value': 'v'}]}}
+        msg, result = self._round_trip(raw_msg)
+        self.assertEqual(msg['nova.version'], '2.1')
+        self.assertEqual(msg['nova.format'], 'msgpack')
+        self.assertEqual(result, raw_msg)
+
+    def test_datetime(self):
+        when = datetime.datetime(2013, 2, 3, 4, 5, 6, 789)
+        _msg, result = self._round_trip({'created_at': when})
+        self.assertEqual(result['created_at'], when)
+
+    def test_datetime_with_timezone(self):
+        when = datetime.datetime(2013, 2, 3, 4, 5, 6,
+                                 tzinfo=iso8601.iso8601.FixedOffset(
+                                     2, 0, '+02:00'))
+        _msg, result = self._round_trip({'created_at': when})
+        # Sent as UTC, like timeutils.normalize_time() does
+        self.assertEqual(result['created_at'],
+                         datetime.datetime(2013, 2, 3, 2, 5, 6))
+
+    def test_set(self):
+        _msg, result = self._round_trip({'hosts': set(['a', 'b'])})
+        self.assertEqual(result['hosts'], set(['a', 'b']))
+
+    def test_compressed(self):
+        self.flags(rpc_compress_threshold=100)
+        raw_msg = {'args': {'data': 'x' * 1000}}
+        msg, result = self._round_trip(raw_msg)
+        self.assertEqual(msg['nova.format'], 'msgpack+zlib')
+        self.assertTrue(len(msg['nova.message']) < 1000)
+        self.assertEqual(result, raw_msg)
+
+    def test_not_compressed_below_threshold(self):
+        self.flags(rpc_compress_threshold=100000)
+        raw_msg = {'args': {'data': 'x' * 1000}}
+        msg, result = self._round_trip(raw_msg)
+        self.assertEqual(msg['nova.format'], 'msgpack')
+        self.assertEqual(result, raw_msg)
+
+    def test_json_when_not_binary(self):
+        raw_msg = {'method': 'ping', 'args': {'arg': 1}}
+        self.assertEqual(rpc_common.serialize_msg(raw_msg), raw_msg)
+        msg = rpc_common.serialize_msg(raw_msg, force_envelope=True)
+        self.assertEqual(msg['nova.version'], '2.0')
+        self.assertFalse('nova.format' in msg)
+        self.assertEqual(rpc_common.deserialize_msg(msg), raw_msg)
+
+    def test_json_without_msgpack(self):
+        self.stubs.Set(rpc_common, 'msgpack', None)
+        raw_msg = {'method': 'ping'}
+        self.assertEqual(rpc_common.serialize_msg(raw_msg, binary=True),
+                         raw_msg)
+
+    def test_unknown_format_rejected(self):
+        msg = rpc_common.serialize_msg({'method': 'ping'}, binary=True)
+        msg['nova.format'] = 'bson'
+        self.assertRaises(rpc_common.UnsupportedRpcEnvelopeVersion,
+                          rpc_common.deserialize_msg, msg)
+
+    def test_newer_version_rejected(self):
+        msg = rpc_common.serialize_msg({'method': 'ping'}, binary=True)
+        msg['nova.version'] = '2.2'
+        self.assertRaises(rpc_common.UnsupportedRpcEnvelopeVersion,
+                          rpc_common.deserialize_msg, msg)
+
+    def test_binary_topic(self):
+        self.flags(rpc_binary_topics=['conductor'])
+        self.assertTrue(rpc_common.binary_topic('conductor'))
+        self.assertTrue(rpc_common.binary_topic('conductor.host1'))
+        self.assertFalse(rpc_common.binary_topic('compute'))
+
+
+class BinaryReplyTestCase(test.TestCase):
+    """Replies are only binary when the caller asked for it."""
+
+    def setUp(self):
+        super(BinaryReplyTestCase, self).setUp()
+        if rpc_common.msgpack is None:
+            self.skipTest('msgpack is not installed')
+        self.conn = FakeConnection()
+        self.stubs.Set(rpc_amqp, 'ConnectionContext',
+                       lambda *args, **kwargs: self.conn)
+
+    def _reply(self, msg):
+        ctxt = rpc_amqp.unpack_context(test.CONF, msg)
+        ctxt.reply('result', connection_pool=None)
+        _reply_q, reply = self.conn.sent[-1]
+        return reply
+
+    def test_binary_reply_asked_for(self):
+        reply = self._reply({'_msg_id': 'id', '_binary_reply': True})
+        self.assertEqual(reply['nova.version'], '2.1')
+        self.assertEqual(rpc_common.deserialize_msg(reply)['result'],
+                         'result')
+
+    def test_json_reply_by_default(self):
+        reply = self._reply({'_msg_id': 'id'})
+        self.assertEqual(reply, {'result': 'result', 'failure': None})
+
+    def test_call_asks_for_binary_reply(self):
+        self.flags(rpc_binary_topics=['conductor'],
+                   amqp_rpc_single_reply_queue=False)
+        self.stubs.Set(rpc_amqp, 'MulticallWaiter',
+                       lambda *args: None)
+        self.conn.declare_direct_consumer = lambda *args: None
+
+        rpc_amqp.multicall(test.CONF, rpc_common.CommonRpcContext(),
+                           'conductor', {'method': 'ping'}, None, None)
+        rpc_amqp.multicall(test.CONF, rpc_common.CommonRpcContext(),
+                           'compute', {'method': 'ping'}, None, None)
+
+        binary_msg = rpc_common.deserialize_msg(self.conn.sent[0][1])
+        self.assertTrue(binary_msg['_binary_reply'])
+        json_msg = rpc_common.deserialize_msg(self.conn.sent[1][1])
+        self.assertFalse('_binary_reply' in json_msg)
@@ -0,0 +1,174 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Tests for the sockets the zmq rpc driver keeps between messages."""
+
+import eventlet
+from eventlet import queue
+
+from nova import test
+
+try:
+    from nova.openstack.common.rpc import impl_zmq
+except ImportError:
+    impl_zmq = None
+
+
+class FakeSocket(object):
+    """Stands for a ZmqSocket, recv() returns what is put in incoming."""
+
+    def __init__(self, addr, zmq_type, bind=True, subscribe=None):
+        self.addr = addr
+        self.subscribe = subscribe
+        self.sent = []
+        self.closed = False
+        self.incoming = queue.LightQueue()
+
+    def send(self, data):
+        self.sent.append(data)
+
+    def recv(self):
+        msg = self.incoming.get()
+        if isinstance(msg, Exception):
+            raise msg
+        return msg
+
+    def close(self):
+        self.closed = True
+
+
+class _ZmqTestCase(test.TestCase):
+
+    def setUp(self):
+        super(_ZmqTestCase, self).setUp()
+        if impl_zmq is None:
+            self.skipTest('zmq is not installed')
+        self.stubs.Set(impl_zmq, 'ZmqSocket', FakeSocket)
+
+
+class ZmqClientCacheTestCase(_ZmqTestCase):
+
+    def setUp(self):
+        super(ZmqClientCacheTestCase, self).setUp()
+        self.flags(rpc_zmq_socket_idle_timeout=300)
+        self.cache = impl_zmq.ZmqClientCache()
+
+    def test_reuse(self):
+        client = self.cache.get('tcp://host1:9501')
+        client.cast('msg_id', 'topic', {'method': 'ping'})
+        self.assertTrue(self.cache.get('tcp://host1:9501') is client)
+        self.assertFalse(self.cache.get('tcp://host2:9501') is client)
+        self.assertEqual(len(client.outq.sent), 1)
+
+    def test_idle_eviction(self):
+        idle = self.cache.get('tcp://host1:9501')
+        busy = self.cache.get('tcp://host2:9501')
+        idle.last_used -= 400
+        self.cache.last_sweep -= 400
+
+        self.assertTrue(self.cache.get('tcp://host2:9501') is busy)
+        self.assertTrue(idle.outq.closed)
+        self.assertFalse(busy.outq.closed)
+        self.assertFalse(self.cache.get('tcp://host1:9501') is idle)
+
+    def test_no_sweep_before_idle_timeout(self):
+        client = self.cache.get('tcp://host1:9501')
+        client.last_used -= 400
+        self.assertTrue(self.cache.get('tcp://host1:9501') is client)
+        self.assertFalse(client.outq.closed)
+
+    def test_discard_on_failure(self):
+        client = self.cache.get('tcp://host1:9501')
+
+        def fail(data):
+            raise impl_zmq.zmq.ZMQError()
+
+        self.stubs.Set(client.outq, 'send', fail)
+        self.stubs.Set(impl_zmq, '_get_client_cache', lambda: self.cache)
+        self.assertRaises(impl_zmq.RPCException, impl_zmq._cast,
+                          'tcp://host1:9501', impl_zmq.RpcContext(),
+                          'msg_id', 'topic', {'method': 'ping'})
+        self.assertTrue(client.outq.closed)
+        self.assertFalse(self.cache.get('tcp://host1:9501') is client)
+
+    def test_close(self):
+        client = self.cache.get('tcp://host1:9501')
+        self.cache.close()
+        self.assertTrue(client.outq.closed)
+        self.assertEqual(self.cache.clients, {})
+
+
+class ZmqReplyListenerTestCase(_ZmqTestCase):
+
+    def setUp(self):
+        super(ZmqReplyListenerTestCase, self).setUp()
+        self.listener = impl_zmq.ZmqReplyListener()
+        self.addCleanup(self.listener.close)
+
+    def test_subscribes_to_prefix(self):
+        msg_id = self.listener.new_msg_id()
+        self.assertEqual(self.listener.sock.subscribe, self.listener.prefix)
+        self.assertTrue(msg_id.startswith(self.listener.prefix + '.'))
+        self.assertNotEqual(self.listener.new_msg_id(), msg_id)
+
+    def test_dispatch_by_msg_id(self):
+        first_id = self.listener.new_msg_id()
+        second_id = self.listener.new_msg_id()
+        first = self.listener.register(first_id)
+        second = self.listener.register(second_id)
+
+        self.listener.sock.incoming.put([second_id, 'second'])
+        # The call timed out, nobody waits for it anymore
+        self.listener.sock.incoming.put(['%s.gone' % self.listener.prefix,
+                                         'gone'])
+        self.listener.sock.incoming.put([first_id, 'first'])
+
+        with eventlet.Timeout(5, AssertionError('No reply')):
+            self.assertEqual(first.wait(), [first_id, 'first'])
+            self.assertEqual(second.wait(), [second_id, 'second'])
+        self.assertEqual(self.listener.waiters, {})
+
+    def test_unregister(self):
+        msg_id = self.listener.new_msg_id()
+        self.listener.register(msg_id)
+        self.listener.unregister(msg_id)
+        self.assertEqual(self.listener.waiters, {})
+
+    def test_failure_fails_waiters(self):
+        waiter = self.listener.register(self.listener.new_msg_id())
+        self.listener.sock.incoming.put(impl_zmq.zmq.ZMQError())
+
+        with eventlet.Timeout(5, AssertionError('No reply')):
+            self.assertRaises(impl_zmq.RPCException, waiter.wait)
+        self.assertTrue(self.listener.closed)
+        self.assertTrue(self.listener.sock.closed)
+        self.assertRaises(impl_zmq.RPCException, self.listener.register,
+                          self.listener.new_msg_id())
+
+    def test_close_fails_waiters(self):
+        waiter = self.listener.register(self.listener.new_msg_id())
+        self.listener.close()
+        with eventlet.Timeout(5, AssertionError('No reply')):
+            self.assertRaises(impl_zmq.RPCException, waiter.wait)
+
+    def test_new_listener_after_failure(self):
+        self.stubs.Set(impl_zmq, '_REPLY_LISTENER', self.listener)
+        self.listener.close()
+        listener = impl_zmq._get_reply_listener()
+        self.addCleanup(listener.close)
+        self.assertFalse(listener is self.listener)
+        self.assertFalse(listener.closed)
@@ -18,6 +18,7 @@
 
 import mox
 import os
+import struct
 import tempfile
 
 from nova import test
@@ -33,6 +34,7 @@ class ConfigDriveTestCase(test.TestCase):
 
     def test_create_configdrive_iso(self):
         imagefile = None
+        self.flags(config_drive_external_tools=True)
 
         try:
             self.mox.StubOutWithMock(utils, 'execute')
@@ -60,6 +62,7 @@ class ConfigDriveTestCase(test.TestCase):
 
     def test_create_configdrive_vfat(self):
         imagefile = None
+        self.flags(config_drive_external_tools=True)
         try:
             self.mox.StubOutWithMock(utils, 'mkfs')
             self.mox.StubOutWithMock(utils, 'execute')
@@ -91,3 +94,72 @@ class ConfigDriveTestCase(test.TestCase):
         finally:
             if imagefile:
                 utils.delete_if_exists(imagefile)
+
+    def _make_drive(self, drive_format):
+        self.flags(config_drive_format=drive_format)
+        self.mox.StubOutWithMock(utils, 'execute')
+        self.mox.StubOutWithMock(utils, 'trycmd')
+        self.mox.StubOutWithMock(utils, 'mkfs')
+        self.mox.ReplayAll()
+
+        with configdrive.ConfigDriveBuilder() as c:
+            c._add_file('openstack/latest/meta_data.json', '{"a": 1}')
+            c._add_file('openstack/latest/user_data', 'x' * 5000)
+            self.assertEqual(c.tempdir, None)
+            with utils.tempdir() as tmpdir:
+                imagefile = os.path.join(tmpdir, 'disk.config')
+                c.make_drive(imagefile)
+                with open(imagefile, 'rb') as f:
+                    return f.read()
+
+    def test_create_configdrive_iso_in_process(self):
+        image = self._make_drive('iso9660')
+
+        primary = image[16 * 2048:17 * 2048]
+        self.assertEqual(primary[:6], '\x01CD001')
+        self.assertEqual(primary[40:72].rstrip(), 'config-2')
+        joliet = image[17 * 2048:18 * 2048]
+        self.assertEqual(joliet[:6], '\x02CD001')
+        self.assertEqual(joliet[88:91], '%/E')
+        self.assertEqual(image[18 * 2048:18 * 2048 + 6], '\xffCD001')
+        self.assertEqual(len(image) % 2048, 0)
+        self.assertEqual(struct.unpack('<I', primary[80:84])[0] * 2048,
+                         len(image))
+
+        # Look the file up through the Joliet directories
+        extent, size = struct.unpack('<I4xI', joliet[158:170])
+        for name in ('openstack', 'latest', 'user_data'):
+            name = name.encode('utf-16-be')
+            directory = image[extent * 2048:extent * 2048 + size]
+            offset = 0
+            while True:
+                length = ord(directory[offset])
+                if not length:
+                    # The rest of the sector is padding
+                    offset += -offset % 2048
+                    continue
+                name_length = ord(directory[offset + 32])
+                if directory[offset + 33:offset + 33 + name_length] == name:
+                    extent, size = struct.unpack(
+                        '<I4xI', directory[offset + 2:offset + 14])
+                    break
+                offset += length
+        self.assertEqual(image[extent * 2048:extent * 2048 + size],
+                         'x' * 5000)
+
+    def test_create_configdrive_vfat_in_process(self):
+        image = self._make_drive('vfat')
+
+        self.assertEqual(len(image), configdrive.CONFIGDRIVESIZE_BYTES)
+        self.assertEqual(image[510:512], '\x55\xaa')
+        self.assertEqual(image[43:54], 'config-2   ')
+        self.assertEqual(image[54:62], 'FAT16   ')
+        (sector_size, cluster_sectors, reserved, fats, root_entries,
+         fat_sectors) = struct.unpack('<HBHBH3xH', image[11:24])
+        root = (reserved + fats * fat_sectors) * sector_size
+        # The volume label, then the long name and short name entries of
+        # the openstack directory
+        self.assertEqual(image[root:root + 11], 'config-2   ')
+        self.assertEqual(ord(image[root + 32 + 11]), 0x0f)
+        self.assertEqual(image[root + 64:root + 75], 'OPENST~1   ')
+        self.assertEqual(ord(image[root + 64 + 11]), 0x10)
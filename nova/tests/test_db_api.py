@@ -20,12 +20,21 @@
 """Unit tests for the DB API."""
 
 import datetime
+import os
+import shutil
 import uuid as stdlib_uuid
 
+import fixtures
+import sqlalchemy
+
+from nova.common import memorycache
 from nova import context
 from nova import db
+from nova.db.sqlalchemy import api as sqlalchemy_api
+from nova.db.sqlalchemy import models
 from nova import exception
 from nova.openstack.common import cfg
+from nova.openstack.common.db.sqlalchemy import session as db_session
 from nova.openstack.common import timeutils
 from nova import test
 from nova.tests import matchers
@@ -86,6 +95,48 @@ class DbApiTestCase(test.TestCase):
 
         self.flags(osapi_compute_unique_server_name_scope=None)
 
+    def test_instance_create_many(self):
+        values = {'reservation_id': 'a', 'image_ref': 1,
+                  'project_id': self.project_id,
+                  'metadata': {'key': 'value'},
+                  'system_metadata': {'image_key': 'image_value'},
+                  'info_cache': {'network_info': '[]'},
+                  'security_groups': ['default'],
+                  'launch_time': 'not a column'}
+        instances = db.instance_create_many(self.context, [
+            dict(values, hostname='name1'),
+            dict(values, hostname='name2', uuid='fake-uuid')])
+
+        self.assertEqual([instance['hostname'] for instance in instances],
+                         ['name1', 'name2'])
+        self.assertEqual(instances[1]['uuid'], 'fake-uuid')
+        for instance in instances:
+            instance = db.instance_get_by_uuid(self.context,
+                                               instance['uuid'])
+            self.assertEqual(instance['metadata'][0]['key'], 'key')
+            self.assertEqual(instance['system_metadata'][0]['value'],
+                             'image_value')
+            self.assertEqual(instance['info_cache']['network_info'], '[]')
+            self.assertEqual([group['name'] for group in
+                              instance['security_groups']], ['default'])
+            self.assertEqual(instance['deleted'], 0)
+            self.assertTrue(db.get_ec2_instance_id_by_uuid(
+                self.context, instance['uuid']))
+
+    def test_instance_create_many_unique_hostname(self):
+        self.flags(osapi_compute_unique_server_name_scope='project')
+        self.create_instances_with_args(hostname='fake_name')
+        self.assertRaises(exception.InstanceExists,
+                          db.instance_create_many, self.context,
+                          [{'hostname': 'other_name'},
+                           {'hostname': 'fake_name'}])
+        self.assertRaises(exception.InstanceExists,
+                          db.instance_create_many, self.context,
+                          [{'hostname': 'other_name'},
+                           {'hostname': 'Other_name'}])
+        # Nothing was created
+        self.assertEqual(len(db.instance_get_all(self.context)), 1)
+
     def test_ec2_ids_not_found_are_printable(self):
         def check_exc_format(method):
             try:
@@ -1044,6 +1095,80 @@ class DbApiTestCase(test.TestCase):
         _compare(bw_usages[2], expected_bw_usages[2])
         timeutils.clear_time_override()
 
+    def test_bw_usage_update_many(self):
+        ctxt = context.get_admin_context()
+        now = timeutils.utcnow()
+        start_period = now - datetime.timedelta(seconds=10)
+        db.bw_usage_update(ctxt, 'fake_uuid1', 'fake_mac1', start_period,
+                           100, 200, 12345, 67890, update_cells=False)
+
+        usages = [dict(uuid='fake_uuid1', mac='fake_mac1',
+                       start_period=start_period, bw_in=110, bw_out=220,
+                       last_ctr_in=12355, last_ctr_out=67910,
+                       last_refreshed=now),
+                  dict(uuid='fake_uuid2', mac='fake_mac2',
+                       start_period=start_period, bw_in=0, bw_out=0,
+                       last_ctr_in=42, last_ctr_out=43,
+                       last_refreshed=now)]
+        db.bw_usage_update_many(ctxt, usages, update_cells=False)
+
+        bw_usages = db.bw_usage_get_by_uuids(ctxt,
+                ['fake_uuid1', 'fake_uuid2'], start_period)
+        self.assertEqual(len(bw_usages), 2)
+        for bw_usage, expected in zip(bw_usages, usages):
+            for key, value in expected.items():
+                self.assertEqual(bw_usage[key], value)
+
+    def test_bw_usage_update_many_mysql(self):
+        ctxt = context.get_admin_context()
+        now = timeutils.utcnow()
+        statements = []
+
+        class FakeDialect(object):
+            name = 'mysql'
+
+        class FakeEngine(object):
+            dialect = FakeDialect()
+
+        class FakeSession(object):
+            bind = FakeEngine()
+
+            def begin(self):
+                return self
+
+            def __enter__(self):
+                pass
+
+            def __exit__(self, *exc_info):
+                pass
+
+            def execute(self, statement, params):
+                statements.append((statement, params))
+
+        usages = [dict(uuid='fake_uuid%d' % i, mac='fake_mac',
+                       start_period=now, bw_in=i, bw_out=i, last_ctr_in=i,
+                       last_ctr_out=i, last_refreshed=now)
+                  for i in range(2)]
+        sqlalchemy_api.bw_usage_update_many(ctxt, usages,
+                                            session=FakeSession())
+
+        # A single statement inserts or updates every record
+        self.assertEqual(len(statements), 1)
+        statement, params = statements[0]
+        self.assertTrue(statement.startswith(
+            'INSERT INTO bw_usage_cache (bw_in, bw_out, last_ctr_in, '
+            'last_ctr_out, last_refreshed, mac, start_period, uuid, '
+            'created_at, deleted) VALUES (:bw_in_0, '))
+        self.assertTrue(statement.endswith(
+            ' ON DUPLICATE KEY UPDATE updated_at = :now, '
+            'bw_in = VALUES(bw_in), bw_out = VALUES(bw_out), '
+            'last_ctr_in = VALUES(last_ctr_in), '
+            'last_ctr_out = VALUES(last_ctr_out), '
+            'last_refreshed = VALUES(last_refreshed), '
+            'deleted_at = NULL, deleted = 0'))
+        self.assertEqual(params['uuid_1'], 'fake_uuid1')
+        self.assertEqual(params['bw_in_1'], 1)
+
 
 def _get_fake_aggr_values():
     return {'name': 'fake_aggregate'}
@@ -1626,6 +1751,83 @@ class TestIpAllocation(test.TestCase):
         self.assertEqual(fixed_ip['network_id'], self.network['id'])
 
 
+class VirtualInterfaceIpsTestCase(test.TestCase):
+
+    def setUp(self):
+        super(VirtualInterfaceIpsTestCase, self).setUp()
+        self.ctxt = context.get_admin_context()
+        self.network = db.network_create_safe(self.ctxt,
+                                              {'cidr_v6': 'fd00::/64'})
+        self.vifs = []
+        for idx in xrange(3):
+            instance = db.instance_create(self.ctxt, {})
+            vif = db.virtual_interface_create(self.ctxt, {
+                    'address': 'DE:AD:BE:EF:00:%02X' % idx,
+                    'network_id': self.network['id'],
+                    'instance_uuid': instance['uuid']})
+            db.fixed_ip_create(self.ctxt, {
+                    'address': '10.0.%d.1' % idx,
+                    'network_id': self.network['id'],
+                    'virtual_interface_id': vif['id']})
+            self.vifs.append(vif)
+
+        # A fixed ip not allocated to any vif
+        db.fixed_ip_create(self.ctxt, {'address': '10.0.9.1',
+                                       'network_id': self.network['id']})
+
+        fixed_ip = db.fixed_ip_get_by_address(self.ctxt, '10.0.1.1')
+        db.floating_ip_create(self.ctxt, {'address': '172.16.0.1',
+                                          'fixed_ip_id': fixed_ip['id']})
+        db.floating_ip_create(self.ctxt, {'address': '172.16.0.2'})
+
+    def test_get_fixed_ips(self):
+        ips = db.virtual_interface_get_fixed_ips(self.ctxt)
+        self.assertEqual(ips, [
+                {'instance_uuid': self.vifs[0]['instance_uuid'],
+                 'address': '10.0.0.1'},
+                {'instance_uuid': self.vifs[1]['instance_uuid'],
+                 'address': '10.0.1.1'},
+                {'instance_uuid': self.vifs[2]['instance_uuid'],
+                 'address': '10.0.2.1'}])
+
+    def test_get_fixed_ips_by_address(self):
+        ips = db.virtual_interface_get_fixed_ips(self.ctxt,
+                                                 address='10.0.1.1')
+        self.assertEqual(ips, [
+                {'instance_uuid': self.vifs[1]['instance_uuid'],
+                 'address': '10.0.1.1'}])
+        ips = db.virtual_interface_get_fixed_ips(self.ctxt,
+                                                 address='10.0.9.1')
+        self.assertEqual(ips, [])
+
+    def test_get_fixed_ips_by_address_like(self):
+        ips = db.virtual_interface_get_fixed_ips(self.ctxt,
+                                                 address_like='10_0_2%')
+        self.assertEqual([ip['address'] for ip in ips], ['10.0.2.1'])
+        ips = db.virtual_interface_get_fixed_ips(self.ctxt,
+                                                 address_like='10.0.%')
+        self.assertEqual([ip['address'] for ip in ips],
+                         ['10.0.0.1', '10.0.1.1', '10.0.2.1'])
+
+    def test_get_floating_ips(self):
+        ips = db.virtual_interface_get_floating_ips(self.ctxt)
+        self.assertEqual(ips, [
+                {'instance_uuid': self.vifs[1]['instance_uuid'],
+                 'address': '172.16.0.1',
+                 'fixed_address': '10.0.1.1'}])
+        ips = db.virtual_interface_get_floating_ips(self.ctxt,
+                                                    address_like='172.17%')
+        self.assertEqual(ips, [])
+
+    def test_get_all_ipv6(self):
+        db.network_create_safe(self.ctxt, {})
+        vifs = db.virtual_interface_get_all_ipv6(self.ctxt)
+        self.assertEqual(vifs, [{'instance_uuid': vif['instance_uuid'],
+                                 'address': vif['address'],
+                                 'cidr_v6': 'fd00::/64'}
+                                for vif in self.vifs])
+
+
 class InstanceDestroyConstraints(test.TestCase):
 
     def test_destroy_with_equal_any_constraint_met(self):
@@ -1748,6 +1950,92 @@ class VolumeUsageDBApiTestCase(test.TestCase):
             self.assertEqual(vol_usages[0][key], value)
         timeutils.clear_time_override()
 
+    def test_vol_usage_update_many(self):
+        ctxt = context.get_admin_context()
+        now = timeutils.utcnow()
+        start_time = now - datetime.timedelta(seconds=10)
+        db.vol_usage_update(ctxt, 1, rd_req=10, rd_bytes=20, wr_req=30,
+                            wr_bytes=40, instance_id=1)
+
+        db.vol_usage_update_many(ctxt, [
+            dict(volume_id=1, instance_uuid=1, rd_req=100, rd_bytes=200,
+                 wr_req=300, wr_bytes=400),
+            dict(volume_id=2, instance_uuid=1, rd_req=1000, rd_bytes=2000,
+                 wr_req=3000, wr_bytes=4000)])
+        db.vol_usage_update_many(ctxt, [
+            dict(volume_id=1, instance_uuid=1, rd_req=1, rd_bytes=2,
+                 wr_req=3, wr_bytes=4)], update_totals=True)
+
+        vol_usages = db.vol_get_usage_by_time(ctxt, start_time)
+        self.assertEqual(len(vol_usages), 2)
+        self.assertEqual((vol_usages[0]['tot_reads'],
+                          vol_usages[0]['tot_read_bytes'],
+                          vol_usages[0]['curr_reads']), (1, 2, 0))
+        self.assertEqual((vol_usages[1]['curr_reads'],
+                          vol_usages[1]['curr_read_bytes'],
+                          vol_usages[1]['curr_writes'],
+                          vol_usages[1]['curr_write_bytes']),
+                         (1000, 2000, 3000, 4000))
+
+    def test_vol_usage_update_many_deleted(self):
+        ctxt = context.get_admin_context()
+        start_time = timeutils.utcnow() - datetime.timedelta(seconds=10)
+        db.vol_usage_update(ctxt, 1, rd_req=10, rd_bytes=20, wr_req=30,
+                            wr_bytes=40, instance_id=1, update_totals=True)
+        session = sqlalchemy_api.get_session()
+        session.query(models.VolumeUsage).one().soft_delete(session=session)
+
+        # The deleted record holds the volume id, it starts over
+        db.vol_usage_update_many(ctxt, [
+            dict(volume_id=1, instance_uuid=1, rd_req=1, rd_bytes=2,
+                 wr_req=3, wr_bytes=4)], update_totals=True)
+
+        vol_usages = db.vol_get_usage_by_time(ctxt, start_time)
+        self.assertEqual(len(vol_usages), 1)
+        self.assertEqual(vol_usages[0]['deleted'], 0)
+        self.assertEqual(vol_usages[0]['deleted_at'], None)
+        self.assertEqual((vol_usages[0]['tot_reads'],
+                          vol_usages[0]['tot_read_bytes'],
+                          vol_usages[0]['tot_writes'],
+                          vol_usages[0]['tot_write_bytes']), (1, 2, 3, 4))
+
+    def test_vol_usage_update_many_mysql(self):
+        ctxt = context.get_admin_context()
+        statements = []
+
+        class FakeDialect(object):
+            name = 'mysql'
+
+        class FakeEngine(object):
+            dialect = FakeDialect()
+
+        class FakeSession(object):
+            bind = FakeEngine()
+
+            def begin(self):
+                return self
+
+            def __enter__(self):
+                pass
+
+            def __exit__(self, *exc_info):
+                pass
+
+            def execute(self, statement, params):
+                statements.append(statement)
+
+        sqlalchemy_api.vol_usage_update_many(ctxt, [
+            dict(volume_id=1, instance_uuid=1, rd_req=1, rd_bytes=2,
+                 wr_req=3, wr_bytes=4)], update_totals=True,
+            session=FakeSession())
+
+        self.assertEqual(len(statements), 1)
+        # Deleted records start over rather than add to their totals
+        self.assertTrue('tot_reads = IF(deleted, VALUES(tot_reads), '
+                        'tot_reads + VALUES(tot_reads))' in statements[0])
+        self.assertTrue(statements[0].endswith(
+            'deleted_at = NULL, deleted = 0'))
+
 
 class TaskLogTestCase(test.TestCase):
 
@@ -1791,3 +2079,106 @@ class TaskLogTestCase(test.TestCase):
         result = db.task_log_get(self.context, self.task_name, self.begin,
                                  self.end, self.host)
         self.assertEqual(result['errors'], 1)
+
+
+class SlaveReadTestCase(test.TestCase):
+    """Tests for the calls that can read from the database replica."""
+
+    def setUp(self):
+        super(SlaveReadTestCase, self).setUp()
+        tmpdir = self.useFixture(fixtures.TempDir()).path
+        master = os.path.join(tmpdir, 'master.sqlite')
+        slave = os.path.join(tmpdir, 'slave.sqlite')
+        self.flags(sql_connection='sqlite:///%s' % master,
+                   sql_slave_connection='sqlite:///%s' % slave,
+                   sql_slave_max_staleness=10,
+                   memcached_servers=['memcached:11211'])
+        for name in ('_ENGINE', '_MAKER', '_SLAVE_ENGINE', '_SLAVE_MAKER'):
+            self.stubs.Set(db_session, name, None)
+        # Stands for memcached
+        self.stubs.Set(sqlalchemy_api, '_RECENT_WRITES', memorycache.Client())
+        self.addCleanup(db_session.cleanup)
+        timeutils.set_time_override()
+        self.addCleanup(timeutils.clear_time_override)
+
+        models.BASE.metadata.create_all(db_session.get_engine())
+        # The replica has not seen any of the writes made by the tests
+        shutil.copyfile(master, slave)
+
+        self.context = context.RequestContext('fake', 'fake')
+        self.instance = db.instance_create(self.context,
+                                           {'project_id': 'fake'})
+
+    def _instances(self, ctxt):
+        return db.instance_get_all_by_filters(ctxt, {}, 'created_at', 'desc',
+                                              use_slave=True)
+
+    def test_other_request_reads_from_slave(self):
+        other = context.RequestContext('fake', 'fake')
+        self.assertEqual(self._instances(other), [])
+
+    def test_writing_request_reads_from_master(self):
+        self.assertEqual(len(self._instances(self.context)), 1)
+
+    def test_writing_request_reads_from_slave_later(self):
+        timeutils.advance_time_seconds(21)
+        self.assertEqual(self._instances(self.context), [])
+
+    def test_write_noted_once(self):
+        sets = []
+        recent_writes = sqlalchemy_api._get_recent_writes()
+        orig_set = recent_writes.set
+
+        def fake_set(key, value, time=0):
+            sets.append(key)
+            return orig_set(key, value, time)
+
+        self.stubs.Set(recent_writes, 'set', fake_set)
+        for i in range(3):
+            db.instance_update(self.context, self.instance['uuid'],
+                               {'progress': i})
+        self.assertEqual(sets, [])
+
+        # Noted again once the first note could expire too early
+        timeutils.advance_time_seconds(11)
+        db.instance_update(self.context, self.instance['uuid'],
+                           {'progress': 4})
+        self.assertEqual(len(sets), 1)
+        timeutils.advance_time_seconds(15)
+        self.assertEqual(len(self._instances(self.context)), 1)
+
+    def test_writes_noted_before_first_slave_read(self):
+        # The write made in setUp, before any call could read from the
+        # replica, was noted
+        self.assertTrue(sqlalchemy_api._get_recent_writes().get(
+            sqlalchemy_api._recent_write_key(self.context.request_id)))
+
+    def test_listing_reads_from_master_by_default(self):
+        # What the conductor does for the compute manager, which acts on
+        # the state of the instances
+        other = context.RequestContext('fake', 'fake')
+        instances = db.instance_get_all_by_filters(other, {}, 'created_at',
+                                                   'desc')
+        self.assertEqual(len(instances), 1)
+
+    def test_reads_from_master_without_memcached(self):
+        self.flags(memcached_servers=None)
+        other = context.RequestContext('fake', 'fake')
+        self.assertEqual(len(self._instances(other)), 1)
+
+    def test_other_engines_not_watched(self):
+        other = context.RequestContext('fake', 'fake')
+        engine = sqlalchemy.create_engine('sqlite://')
+        engine.execute('CREATE TABLE nodes (id INTEGER)')
+        engine.execute('INSERT INTO nodes VALUES (1)')
+        self.assertEqual(self._instances(other), [])
+
+    def test_other_calls_read_from_master(self):
+        other = context.RequestContext('fake', 'fake')
+        instance = db.instance_get_by_uuid(other, self.instance['uuid'])
+        self.assertEqual(instance['id'], self.instance['id'])
+
+    def test_no_slave(self):
+        self.flags(sql_slave_connection='')
+        other = context.RequestContext('fake', 'fake')
+        self.assertEqual(len(self._instances(other)), 1)
@@ -0,0 +1,88 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Tests for the profiling of the database API calls."""
+
+from nova import context
+from nova import db
+from nova.db import profiler
+from nova.openstack.common.notifier import test_notifier
+from nova import test
+
+
+class DBProfilerTestCase(test.TestCase):
+
+    def setUp(self):
+        super(DBProfilerTestCase, self).setUp()
+        self.flags(db_profiling=True)
+        self.context = context.get_admin_context()
+        self.instance = db.instance_create(self.context, {})
+        profiler.reset()
+        self.addCleanup(profiler.reset)
+
+    def test_calls_recorded(self):
+        db.instance_get_all(self.context)
+        db.instance_get_all(self.context)
+        stats = profiler.get_stats()['instance_get_all']
+        self.assertEqual(stats['calls'], 2)
+        self.assertEqual(stats['rows'], 2)
+        self.assertTrue(stats['statements'] >= 2)
+        self.assertEqual(sum(stats['histogram']), 2)
+        self.assertEqual(stats['repeats'], 0)
+
+    def test_disabled(self):
+        self.flags(db_profiling=False)
+        db.instance_get_all(self.context)
+        self.assertEqual(profiler.get_stats(), {})
+
+    def test_repeated_statements(self):
+        self.flags(db_profiling_repeat_threshold=2)
+        for i in range(3):
+            db.instance_get_by_uuid(self.context, self.instance['uuid'])
+        stats = profiler.get_stats()['instance_get_by_uuid']
+        self.assertEqual(stats['repeats'], 1)
+
+    def test_repeated_statements_other_requests(self):
+        self.flags(db_profiling_repeat_threshold=2)
+        for i in range(3):
+            db.instance_get_by_uuid(context.get_admin_context(),
+                                    self.instance['uuid'])
+        stats = profiler.get_stats()['instance_get_by_uuid']
+        self.assertEqual(stats['repeats'], 0)
+
+    def test_report(self):
+        self.flags(db_profiling_notifications=True,
+                   notification_driver=[test_notifier.__name__])
+        test_notifier.NOTIFICATIONS = []
+        self.stubs.Set(profiler, '_LAST_REPORT', 0)
+        db.instance_get_all(self.context)
+        self.assertEqual(profiler.get_stats(), {})
+        self.assertEqual(len(test_notifier.NOTIFICATIONS), 1)
+        notification = test_notifier.NOTIFICATIONS[0]
+        self.assertEqual(notification['event_type'], 'db.profile')
+        functions = notification['payload']['functions']
+        self.assertEqual(functions['instance_get_all']['calls'], 1)
+
+    def test_statement_shape(self):
+        self.assertEqual(
+            profiler.statement_shape('SELECT a\n  FROM t WHERE id IN '
+                                     '(?, ?, ?) AND b = ?'),
+            'SELECT a FROM t WHERE id IN (?) AND b = ?')
+        self.assertEqual(
+            profiler.statement_shape('SELECT a FROM t WHERE id IN '
+                                     '(%s,%s)'),
+            'SELECT a FROM t WHERE id IN (?)')
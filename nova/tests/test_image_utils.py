@@ -14,9 +14,15 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import cStringIO
+import hashlib
 import os
+import urllib2
 
+from nova import context
+from nova import exception
 from nova import test
+from nova.tests.image import fake as fake_image
 from nova import utils
 
 from nova.virt import images
@@ -236,3 +242,168 @@ ID        TAG                 VM SIZE                DATE       VM CLOCK
         self.assertEquals(67108864, image_info.virtual_size)
         self.assertEquals(98304, image_info.disk_size)
         self.assertEquals(3, len(image_info.snapshots))
+
+
+class ImageFetchTestCase(test.TestCase):
+    def setUp(self):
+        super(ImageFetchTestCase, self).setUp()
+        fake_image.stub_out_image_service(self.stubs)
+        self.addCleanup(fake_image.FakeImageService_reset)
+        self.context = context.get_admin_context()
+        self.data = 'x' * 10000
+
+    def _create_image(self, **kwargs):
+        image_meta = {'id': 'fetch-image', 'status': 'active'}
+        image_meta.update(kwargs)
+        fake_image.FakeImageService().create(self.context, image_meta,
+                                             cStringIO.StringIO(self.data))
+        return image_meta['id']
+
+    def test_image_writer_aligns_writes(self):
+        writes = []
+
+        class FakeFile(object):
+            def write(self, data):
+                writes.append(str(data))
+
+            def flush(self):
+                pass
+
+        writer = images.ImageWriter(FakeFile(), 4096)
+        for i in range(10):
+            writer.write('y' * 1000)
+        self.assertEqual([len(w) for w in writes], [4096, 4096])
+        writer.flush()
+        self.assertEqual([len(w) for w in writes], [4096, 4096, 1808])
+        self.assertEqual(''.join(writes), 'y' * 10000)
+        self.assertEqual(writer.size, 10000)
+        self.assertEqual(writer.md5.hexdigest(),
+                         hashlib.md5('y' * 10000).hexdigest())
+
+    def _checksums(self, data):
+        return {'md5': hashlib.md5(data).hexdigest(),
+                'sha1': hashlib.sha1(data).hexdigest()}
+
+    def test_fetch_returns_checksums(self):
+        self.flags(image_fetch_buffer_size=4096)
+        image_id = self._create_image(
+            checksum=hashlib.md5(self.data).hexdigest())
+        with utils.tempdir() as tmpdir:
+            path = os.path.join(tmpdir, 'image')
+            checksums = images.fetch(self.context, image_id, path,
+                                     None, None)
+            self.assertEqual(checksums, self._checksums(self.data))
+            with open(path) as f:
+                self.assertEqual(f.read(), self.data)
+
+    def _test_fetch_mirror(self, mirror_data=None, checksum=True,
+                           secret='secret'):
+        self.flags(image_mirror_servers=['mirror1:9393'],
+                   image_mirror_secret=secret)
+        md5 = hashlib.md5(self.data).hexdigest()
+        image_id = self._create_image(checksum=md5 if checksum else None)
+        urls = []
+        self.signatures = []
+
+        def fake_urlopen(request, timeout):
+            url = request.get_full_url()
+            urls.append(url)
+            self.signatures.append(
+                request.get_header('X-image-mirror-signature'))
+            if mirror_data is None:
+                raise urllib2.HTTPError(url, 404, 'Not Found', {}, None)
+            return cStringIO.StringIO(mirror_data)
+
+        self.stubs.Set(urllib2, 'urlopen', fake_urlopen)
+        with utils.tempdir() as tmpdir:
+            path = os.path.join(tmpdir, 'image')
+            checksums = images.fetch(self.context, image_id, path,
+                                     None, None)
+            self.assertEqual(checksums, self._checksums(self.data))
+            with open(path) as f:
+                self.assertEqual(f.read(), self.data)
+        return urls
+
+    def test_fetch_from_mirror(self):
+        self.mox.StubOutWithMock(fake_image._FakeImageService, 'download')
+        self.mox.ReplayAll()
+        urls = self._test_fetch_mirror(mirror_data=self.data)
+        self.assertEqual(urls, ['http://mirror1:9393/images/fetch-image'
+                                '?checksum=%s' %
+                                hashlib.md5(self.data).hexdigest()])
+        self.assertEqual(self.signatures, [images.mirror_signature(
+            'fetch-image', hashlib.md5(self.data).hexdigest())])
+
+    def test_fetch_mirror_missing_falls_back(self):
+        urls = self._test_fetch_mirror()
+        self.assertEqual(len(urls), 1)
+
+    def test_fetch_mirror_corrupt_falls_back(self):
+        urls = self._test_fetch_mirror(mirror_data='corrupt')
+        self.assertEqual(len(urls), 1)
+
+    def test_fetch_mirror_needs_checksum(self):
+        urls = self._test_fetch_mirror(mirror_data='corrupt', checksum=False)
+        self.assertEqual(urls, [])
+
+    def test_fetch_mirror_needs_secret(self):
+        urls = self._test_fetch_mirror(mirror_data='corrupt', secret=None)
+        self.assertEqual(urls, [])
+
+    def test_mirror_signature(self):
+        self.flags(image_mirror_secret='secret')
+        signature = images.mirror_signature('image1', 'md5')
+        self.assertEqual(signature, images.mirror_signature('image1', 'md5'))
+        self.assertNotEqual(signature,
+                            images.mirror_signature('image2', 'md5'))
+        self.assertNotEqual(signature,
+                            images.mirror_signature('image1', 'other'))
+        self.flags(image_mirror_secret='other')
+        self.assertNotEqual(signature,
+                            images.mirror_signature('image1', 'md5'))
+
+    def test_fetch_checksum_mismatch(self):
+        image_id = self._create_image(checksum='not-the-checksum')
+        with utils.tempdir() as tmpdir:
+            path = os.path.join(tmpdir, 'image')
+            self.assertRaises(exception.ImageUnacceptable, images.fetch,
+                              self.context, image_id, path, None, None)
+            self.assertFalse(os.path.exists(path))
+
+    def test_fetch_preallocates(self):
+        self.flags(image_fetch_preallocate=True)
+        image_id = self._create_image(size=len(self.data))
+        self.mox.StubOutWithMock(utils, 'execute')
+        with utils.tempdir() as tmpdir:
+            path = os.path.join(tmpdir, 'image')
+            utils.execute('fallocate', '-n', '-l', len(self.data), path)
+            self.mox.ReplayAll()
+            images.fetch(self.context, image_id, path, None, None)
+
+    def _test_fetch_to_raw(self, fmt):
+        image_id = self._create_image()
+
+        def fake_qemu_img_info(path):
+            info = images.QemuImgInfo(None)
+            info.file_format = fmt if path.endswith('.part') else 'raw'
+            return info
+
+        def fake_convert_image(source, dest, out_format):
+            with open(dest, 'w') as f:
+                f.write('converted')
+
+        self.stubs.Set(images, 'qemu_img_info', fake_qemu_img_info)
+        self.stubs.Set(images, 'convert_image', fake_convert_image)
+        with utils.tempdir() as tmpdir:
+            path = os.path.join(tmpdir, 'image')
+            checksum = images.fetch_to_raw(self.context, image_id, path,
+                                           None, None)
+            self.assertEqual(os.listdir(tmpdir), ['image'])
+            return checksum
+
+    def test_fetch_to_raw_raw(self):
+        self.assertEqual(self._test_fetch_to_raw('raw'),
+                         self._checksums(self.data))
+
+    def test_fetch_to_raw_converted(self):
+        self.assertEqual(self._test_fetch_to_raw('qcow2'), None)
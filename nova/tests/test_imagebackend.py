@@ -98,6 +98,32 @@ class _ImageTestCase(object):
 
         self.mox.VerifyAll()
 
+    def test_cache_records_checksum(self):
+        self.flags(checksum_base_images=True)
+        self.mox.StubOutWithMock(os.path, 'exists')
+        os.path.exists(self.TEMPLATE_DIR).AndReturn(True)
+        os.path.exists(self.PATH).AndReturn(False)
+        os.path.exists(self.TEMPLATE_PATH).AndReturn(False)
+        fn = self.mox.CreateMockAnything()
+        fn(target=self.TEMPLATE_PATH).AndReturn({'md5': 'fake-md5',
+                                                 'sha1': 'fake-sha1'})
+        self.mox.StubOutWithMock(imagebackend.imagecache,
+                                 'write_stored_info')
+        self.mox.StubOutWithMock(imagebackend.imagecache,
+                                 'write_stored_checksum')
+        imagebackend.imagecache.write_stored_info(self.TEMPLATE_PATH,
+                                                  field='md5',
+                                                  value='fake-md5')
+        imagebackend.imagecache.write_stored_checksum(self.TEMPLATE_PATH,
+                                                      'fake-sha1')
+        self.mox.ReplayAll()
+
+        image = self.image_class(self.INSTANCE, self.NAME)
+        self.mock_create_image(image)
+        image.cache(fn, self.TEMPLATE)
+
+        self.mox.VerifyAll()
+
     def test_cache_template_exists(self):
         self.mox.StubOutWithMock(os.path, 'exists')
         os.path.exists(self.TEMPLATE_DIR).AndReturn(True)
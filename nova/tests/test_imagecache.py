@@ -94,6 +94,20 @@ class ImageCacheManagerTestCase(test.TestCase):
             info_fname = imagecache.get_info_filename(fname)
             self.assertTrue(os.path.exists(info_fname))
 
+    def test_write_stored_checksum_known(self):
+        with utils.tempdir() as tmpdir:
+            self.flags(instances_path=tmpdir)
+            self.flags(image_info_filename_pattern=('$instances_path/'
+                                                    '%(image)s.info'))
+
+            # The image itself does not exist, so it can't have been read.
+            fname = os.path.join(tmpdir, 'aaa')
+            imagecache.write_stored_checksum(fname, 'fdghkfhkgjjksfdgjksjkg')
+
+            csum_output = imagecache.read_stored_checksum(fname,
+                                                          timestamped=False)
+            self.assertEquals(csum_output, 'fdghkfhkgjjksfdgjksjkg')
+
     def test_list_base_images(self):
         listing = ['00000001',
                    'ephemeral_0_20_None',
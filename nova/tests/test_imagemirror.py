@@ -0,0 +1,142 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import cStringIO
+import hashlib
+import os
+
+import fixtures
+import webob
+
+from nova import context
+from nova import exception
+from nova import test
+from nova.tests.image import fake as fake_image
+from nova import utils
+from nova.virt import images
+from nova.virt.libvirt import imagecache
+from nova.virt.libvirt import imagemirror
+from nova import wsgi
+
+
+class ImageMirrorTestCase(test.TestCase):
+
+    def setUp(self):
+        super(ImageMirrorTestCase, self).setUp()
+        self.base_dir = self.useFixture(fixtures.TempDir()).path
+        self.flags(instances_path=self.base_dir,
+                   image_info_filename_pattern=('$instances_path/'
+                                                '%(image)s.info'),
+                   image_mirror_secret='secret')
+        self.data = 'image data' * 1000
+        self.checksum = hashlib.md5(self.data).hexdigest()
+        self.app = imagemirror.ImageMirrorApplication(self.base_dir)
+
+    def _store_base_image(self, image_id, md5=None):
+        base_file = os.path.join(self.base_dir,
+                                 hashlib.sha1(image_id).hexdigest())
+        with open(base_file, 'w') as f:
+            f.write(self.data)
+        if md5:
+            imagecache.write_stored_info(base_file, field='md5', value=md5)
+
+    def _get(self, path, signature=None):
+        req = webob.Request.blank(path)
+        if signature is None:
+            image_id = req.path_info.strip('/').split('/')[-1]
+            signature = images.mirror_signature(image_id,
+                                                req.params.get('checksum'))
+        if signature:
+            req.headers['X-Image-Mirror-Signature'] = signature
+        return req.get_response(self.app)
+
+    def test_serve_image(self):
+        self._store_base_image('image1', md5=self.checksum)
+        resp = self._get('/images/image1?checksum=%s' % self.checksum)
+        self.assertEqual(resp.status_int, 200)
+        self.assertEqual(resp.body, self.data)
+        self.assertEqual(resp.content_length, len(self.data))
+
+    def test_unsigned_request_refused(self):
+        self._store_base_image('image1', md5=self.checksum)
+        resp = self._get('/images/image1?checksum=%s' % self.checksum,
+                         signature='')
+        self.assertEqual(resp.status_int, 403)
+
+    def test_wrong_signature_refused(self):
+        self._store_base_image('image1', md5=self.checksum)
+        signature = images.mirror_signature('image2', self.checksum)
+        resp = self._get('/images/image1?checksum=%s' % self.checksum,
+                         signature=signature)
+        self.assertEqual(resp.status_int, 403)
+
+    def test_refused_without_secret(self):
+        self._store_base_image('image1', md5=self.checksum)
+        self.flags(image_mirror_secret=None)
+        resp = self._get('/images/image1?checksum=%s' % self.checksum)
+        self.assertEqual(resp.status_int, 403)
+
+    def test_server_needs_secret(self):
+        self.flags(image_mirror_secret=None)
+        self.assertRaises(exception.NovaException,
+                          imagemirror.get_wsgi_server)
+
+    def test_missing_image(self):
+        resp = self._get('/images/image1?checksum=%s' % self.checksum)
+        self.assertEqual(resp.status_int, 404)
+
+    def test_checksum_required(self):
+        self._store_base_image('image1', md5=self.checksum)
+        resp = self._get('/images/image1')
+        self.assertEqual(resp.status_int, 404)
+
+    def test_checksum_mismatch(self):
+        self._store_base_image('image1', md5=self.checksum)
+        resp = self._get('/images/image1?checksum=other')
+        self.assertEqual(resp.status_int, 404)
+
+    def test_converted_image_not_served(self):
+        self._store_base_image('image1')
+        resp = self._get('/images/image1?checksum=%s' % self.checksum)
+        self.assertEqual(resp.status_int, 404)
+
+    def test_bad_path(self):
+        self.assertEqual(self._get('/images/').status_int, 404)
+        self.assertEqual(self._get('/image1').status_int, 404)
+
+    def test_fetch_from_peer(self):
+        # A peer serving its _base over http, and a host fetching from it
+        # without ever asking glance for the image data.
+        fake_image.stub_out_image_service(self.stubs)
+        self.addCleanup(fake_image.FakeImageService_reset)
+        ctxt = context.get_admin_context()
+        fake_image.FakeImageService().create(
+            ctxt, {'id': 'image1', 'checksum': self.checksum},
+            cStringIO.StringIO('glance data'))
+        self._store_base_image('image1', md5=self.checksum)
+
+        server = wsgi.Server("Image mirror", self.app,
+                             host='127.0.0.1', port=0)
+        server.start()
+        self.addCleanup(server.stop)
+        self.flags(image_mirror_servers=['127.0.0.1:%d' % server.port])
+
+        with utils.tempdir() as tmpdir:
+            path = os.path.join(tmpdir, 'image')
+            images.fetch(ctxt, 'image1', path, None, None)
+            with open(path) as f:
+                self.assertEqual(f.read(), self.data)
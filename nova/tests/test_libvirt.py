@@ -51,6 +51,7 @@ from nova.tests import matchers
 from nova import utils
 from nova import version
 from nova.virt.disk import api as disk
+from nova.virt.disk import sparsecopy
 from nova.virt import driver
 from nova.virt import fake
 from nova.virt import firewall as base_firewall
@@ -4263,12 +4264,16 @@ class LibvirtDriverTestCase(test.TestCase):
         def fake_execute(*args, **kwargs):
             pass
 
+        def fake_copy(src_path, dst_path):
+            pass
+
         self.stubs.Set(self.libvirtconnection, 'get_instance_disk_info',
                        fake_get_instance_disk_info)
         self.stubs.Set(self.libvirtconnection, '_destroy', fake_destroy)
         self.stubs.Set(self.libvirtconnection, 'get_host_ip_addr',
                        fake_get_host_ip_addr)
         self.stubs.Set(utils, 'execute', fake_execute)
+        self.stubs.Set(sparsecopy, 'copy', fake_copy)
 
         ins_ref = self._create_instance()
         # dest is different host case
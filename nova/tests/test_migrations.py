@@ -43,6 +43,7 @@ postgres=# create database openstack_citest with owner openstack_citest;
 import collections
 import commands
 import ConfigParser
+import datetime
 import os
 import urlparse
 
@@ -573,3 +574,41 @@ class TestMigrations(test.TestCase):
                 self.assertIn(prop_name, inst_sys_meta)
                 self.assertEqual(str(inst_sys_meta[prop_name]),
                                  str(inst_type[prop]))
+
+    # migration 155 - unique keys for the usage caches
+    def _prerun_155(self, engine):
+        start_period = datetime.datetime(2013, 1, 1)
+        bw_usages = [
+            dict(id=1, uuid='m155-uuid', mac='mac1',
+                 start_period=start_period, bw_in=1, deleted=0),
+            dict(id=2, uuid='m155-uuid', mac='mac1',
+                 start_period=start_period, bw_in=2, deleted=0),
+            dict(id=3, uuid='m155-uuid', mac='mac2',
+                 start_period=start_period, bw_in=3, deleted=0),
+            ]
+        vol_usages = [
+            dict(id=1, volume_id='m155-vol', curr_reads=1, deleted=0),
+            dict(id=2, volume_id='m155-vol', curr_reads=2, deleted=0),
+            ]
+        bw_usage_cache = get_table(engine, 'bw_usage_cache')
+        engine.execute(bw_usage_cache.insert(), bw_usages)
+        volume_usage_cache = get_table(engine, 'volume_usage_cache')
+        engine.execute(volume_usage_cache.insert(), vol_usages)
+        return bw_usages, vol_usages
+
+    def _check_155(self, engine, data):
+        bw_usages, vol_usages = data
+        # The most recent duplicate is kept
+        bw_usage_cache = get_table(engine, 'bw_usage_cache')
+        rows = bw_usage_cache.select().order_by(
+            bw_usage_cache.c.id).execute().fetchall()
+        self.assertEqual([(row['mac'], row['bw_in']) for row in rows],
+                         [('mac1', 2), ('mac2', 3)])
+        self.assertRaises(sqlalchemy.exc.IntegrityError,
+                          bw_usage_cache.insert().execute, bw_usages[0])
+
+        volume_usage_cache = get_table(engine, 'volume_usage_cache')
+        rows = volume_usage_cache.select().execute().fetchall()
+        self.assertEqual([row['curr_reads'] for row in rows], [2])
+        self.assertRaises(sqlalchemy.exc.IntegrityError,
+                          volume_usage_cache.insert().execute, vol_usages[0])
@@ -56,6 +56,7 @@ class NotificationsTestCase(test.TestCase):
 
         notifier_api._reset_drivers()
         self.addCleanup(notifier_api._reset_drivers)
+        self.addCleanup(notifications.cache_bandwidth_usages, None, [])
         self.flags(compute_driver='nova.virt.fake.FakeDriver',
                    notification_driver=[test_notifier.__name__],
                    network_manager='nova.network.manager.FlatManager',
@@ -317,3 +318,102 @@ class NotificationsTestCase(test.TestCase):
 
         notifications.send_update(self.context, self.instance, self.instance)
         self.assertEquals(0, len(test_notifier.NOTIFICATIONS))
+
+    def _bw_usages(self):
+        mac = self.net_info[0]['address']
+        label = self.net_info[0]['network']['label']
+        start_period = notifications.audit_period_bounds(True)[0]
+        return mac, label, start_period
+
+    def test_bandwidth_usage_from_cache(self):
+        mac, label, start_period = self._bw_usages()
+        notifications.cache_bandwidth_usages(start_period, [
+            dict(uuid=self.instance['uuid'], mac=mac, bw_in=10, bw_out=20)])
+        self.mox.StubOutWithMock(db, 'bw_usage_get_by_uuids')
+        self.mox.ReplayAll()
+
+        bw = notifications.bandwidth_usage(self.instance, start_period)
+        self.assertEqual(bw, {label: dict(bw_in=10, bw_out=20)})
+
+    def test_bandwidth_usage_not_cached(self):
+        mac, label, start_period = self._bw_usages()
+        notifications.cache_bandwidth_usages(start_period, [
+            dict(uuid='other-uuid', mac=mac, bw_in=10, bw_out=20)])
+        db.bw_usage_update(self.context, self.instance['uuid'], mac,
+                           start_period, 30, 40, 3, 4, update_cells=False)
+
+        bw = notifications.bandwidth_usage(self.instance, start_period)
+        self.assertEqual(bw, {label: dict(bw_in=30, bw_out=40)})
+
+    def test_bandwidth_usage_cached_for_other_period(self):
+        mac, label, start_period = self._bw_usages()
+        prev_period = notifications.audit_period_bounds(False)[0]
+        notifications.cache_bandwidth_usages(prev_period, [
+            dict(uuid=self.instance['uuid'], mac=mac, bw_in=10, bw_out=20)])
+        db.bw_usage_update(self.context, self.instance['uuid'], mac,
+                           start_period, 30, 40, 3, 4, update_cells=False)
+
+        bw = notifications.bandwidth_usage(self.instance, start_period)
+        self.assertEqual(bw, {label: dict(bw_in=30, bw_out=40)})
+
+
+class NotificationQueueTestCase(test.TestCase):
+
+    def setUp(self):
+        super(NotificationQueueTestCase, self).setUp()
+        notifier_api._reset_drivers()
+        self.addCleanup(notifier_api._reset_drivers)
+        self.flags(notification_driver=[test_notifier.__name__],
+                   notification_queue_size=2)
+        test_notifier.NOTIFICATIONS = []
+        self.stubs.Set(notifier_api, '_queue', None)
+        self.stubs.Set(notifier_api, '_queue_pid', None)
+
+    def _notify(self, event_type):
+        notifier_api.notify(None, 'compute.testhost', event_type,
+                            notifier_api.INFO, {})
+
+    def _sent(self):
+        return [notification['event_type']
+                for notification in test_notifier.NOTIFICATIONS]
+
+    def test_queued(self):
+        self._notify('event.one')
+        self.assertEqual(self._sent(), [])
+        notifier_api.flush()
+        self.assertEqual(self._sent(), ['event.one'])
+
+    def test_synchronous(self):
+        self.flags(notification_queue_size=0)
+        self._notify('event.one')
+        self.assertEqual(self._sent(), ['event.one'])
+        self.assertEqual(notifier_api._queue, None)
+
+    def test_full_queue_dropped(self):
+        self.flags(notification_queue_full_policy='drop')
+        for i in range(3):
+            self._notify('event.%d' % i)
+        notifier_api.flush()
+        self.assertEqual(self._sent(), ['event.0', 'event.1'])
+
+    def test_full_queue_blocks(self):
+        for i in range(3):
+            self._notify('event.%d' % i)
+        notifier_api.flush()
+        self.assertEqual(self._sent(), ['event.0', 'event.1', 'event.2'])
+
+    def test_batches(self):
+        batches = []
+
+        class BatchingDriver(object):
+            def notify_many(self, messages):
+                batches.append([message['event_type']
+                                for context, message in messages])
+
+        self.flags(notification_driver=[], notification_queue_size=10,
+                   notification_batch_size=2)
+        notifier_api.add_driver(BatchingDriver())
+        for i in range(3):
+            self._notify('event.%d' % i)
+        notifier_api.flush()
+        self.assertEqual(batches, [['event.0', 'event.1'], ['event.2']])
@@ -0,0 +1,169 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+import socket
+import sys
+
+import eventlet
+from eventlet.green import subprocess
+import fixtures
+
+from nova.openstack.common.rootwrap import daemon
+from nova import test
+from nova import utils
+
+
+BIN_DIR = os.path.join(os.path.dirname(__file__), os.pardir, os.pardir, 'bin')
+
+
+class RootwrapDaemonTestCase(test.TestCase):
+
+    def setUp(self):
+        super(RootwrapDaemonTestCase, self).setUp()
+        tmpdir = self.useFixture(fixtures.TempDir()).path
+        filters_dir = os.path.join(tmpdir, 'rootwrap.d')
+        os.mkdir(filters_dir)
+        # Executable, but not a program the kernel can run
+        broken = os.path.join(tmpdir, 'broken')
+        with open(broken, 'w') as f:
+            f.write('\x7fELF garbage')
+        os.chmod(broken, 0755)
+        with open(os.path.join(filters_dir, 'test.filters'), 'w') as f:
+            f.write('[Filters]\n'
+                    'echo: CommandFilter, /bin/echo, root\n'
+                    'cat: CommandFilter, /bin/cat, root\n'
+                    'sh: CommandFilter, /bin/sh, root\n'
+                    'missing: CommandFilter, /nonexistent/missing, root\n'
+                    'broken: CommandFilter, %s, root\n' % broken)
+        self.config = os.path.join(tmpdir, 'rootwrap.conf')
+        with open(self.config, 'w') as f:
+            f.write('[DEFAULT]\n'
+                    'filters_path=%s\n'
+                    'exec_dirs=/bin,/usr/bin\n' % filters_dir)
+        # Started the way nova.utils does
+        self.client = daemon.Client([
+            sys.executable, os.path.join(BIN_DIR, 'nova-rootwrap-daemon'),
+            self.config], subprocess_module=subprocess)
+        self.addCleanup(self.client.stop)
+
+    def test_execute(self):
+        self.assertEqual(self.client.execute(['echo', 'hello']),
+                         (0, 'hello\n', ''))
+
+    def test_process_input(self):
+        data = 'x' * 300000
+        self.assertEqual(self.client.execute(['cat'], process_input=data),
+                         (0, data, ''))
+
+    def test_output_and_return_code(self):
+        returncode, out, err = self.client.execute(
+            ['sh', '-c', 'echo out; echo err >&2; exit 3'])
+        self.assertEqual((returncode, out, err), (3, 'out\n', 'err\n'))
+
+    def test_unauthorized(self):
+        returncode, out, _err = self.client.execute(['ls', '/'])
+        self.assertEqual(returncode, daemon.RC_UNAUTHORIZED)
+        self.assertTrue('Unauthorized command' in out)
+
+    def test_not_executable(self):
+        returncode, _out, _err = self.client.execute(['missing'])
+        self.assertEqual(returncode, daemon.RC_NOEXECFOUND)
+
+    def test_exec_failure(self):
+        returncode, out, _err = self.client.execute(['broken'])
+        self.assertEqual(returncode, daemon.RC_NOEXECFOUND)
+        self.assertTrue('Unable to execute' in out)
+        # The daemon still serves commands afterwards
+        self.assertEqual(self.client.execute(['echo', 'hello']),
+                         (0, 'hello\n', ''))
+
+    def test_concurrent(self):
+        pool = eventlet.GreenPool()
+        results = list(pool.imap(
+            lambda i: self.client.execute(['sh', '-c', 'sleep 0.2; echo %d'
+                                           % i]), range(10)))
+        self.assertEqual(results, [(0, '%d\n' % i, '') for i in range(10)])
+
+    def test_wrong_key(self):
+        self.client.execute(['echo'])
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(self.client._address)
+        _kind, challenge = daemon.recv_frame(sock, (daemon.CHALLENGE,))
+        daemon.send_frame(sock, daemon.RESPONSE,
+                          daemon._answer('wrong key', challenge))
+        try:
+            daemon.send_frame(sock, daemon.REQUEST, '{"cmd": ["echo"]}')
+        except socket.error:
+            # The daemon already hung up
+            return
+        self.assertRaises((daemon.ProtocolError, socket.error),
+                          daemon.recv_frame, sock)
+
+    def test_restart(self):
+        self.client.execute(['echo'])
+        self.client._process.kill()
+        self.client._process.wait()
+        self.assertEqual(self.client.execute(['echo', 'again']),
+                         (0, 'again\n', ''))
+
+    def test_stop_removes_socket(self):
+        self.client.execute(['echo'])
+        address = self.client._address
+        self.client.stop()
+        self.assertFalse(os.path.exists(os.path.dirname(address)))
+
+    def test_utils_import_without_pwd(self):
+        # As on Windows, where nova.utils is used by the Hyper-V driver
+        subprocess.check_call(
+            [sys.executable, '-c',
+             'import sys; sys.modules["pwd"] = None; import nova.utils'],
+            cwd=os.path.join(BIN_DIR, os.pardir))
+
+    def test_utils_client(self):
+        self.stubs.Set(utils, '_ROOTWRAP_DAEMON', None)
+        client = utils._get_rootwrap_daemon()
+        self.assertTrue(client._subprocess is subprocess)
+        self.assertEqual(client.daemon_cmd[:2],
+                         ['sudo', 'nova-rootwrap-daemon'])
+
+    def test_utils_execute(self):
+        self.flags(use_rootwrap_daemon=True)
+        self.stubs.Set(os, 'geteuid', lambda: 1000)
+        self.stubs.Set(utils, '_ROOTWRAP_DAEMON', self.client)
+        out, err = utils.execute('cat', process_input='data',
+                                 run_as_root=True)
+        self.assertEqual((out, err), ('data', ''))
+        self.assertRaises(utils.exception.ProcessExecutionError,
+                          utils.execute, 'sh', '-c', 'exit 1',
+                          run_as_root=True)
+
+    def test_utils_execute_lost_daemon(self):
+        self.flags(use_rootwrap_daemon=True)
+        self.stubs.Set(os, 'geteuid', lambda: 1000)
+        self.stubs.Set(utils, '_ROOTWRAP_DAEMON', self.client)
+        calls = []
+
+        def fake_execute(cmd, process_input=None):
+            calls.append(cmd)
+            raise daemon.ProtocolError('Connection closed')
+
+        self.stubs.Set(self.client, 'execute', fake_execute)
+        self.assertRaises(utils.exception.ProcessExecutionError,
+                          utils.execute, 'echo', run_as_root=True,
+                          attempts=2, delay_on_retry=False)
+        self.assertEqual(calls, [['echo'], ['echo']])
@@ -21,6 +21,7 @@ Unit Tests for remote procedure calls using queue
 """
 
 import mox
+import signal
 import sys
 
 from nova import context
@@ -28,6 +29,8 @@ from nova import db
 from nova import exception
 from nova import manager
 from nova.openstack.common import cfg
+from nova.openstack.common.db.sqlalchemy import session as db_session
+from nova.openstack.common import rpc
 from nova import service
 from nova import test
 from nova import wsgi
@@ -171,6 +174,39 @@ class ServiceTestCase(test.TestCase):
                                'nova.tests.test_service.FakeManager')
         serv.start()
 
+    def test_prepare_workers(self):
+        self._service_start_mocks()
+        self.mox.StubOutWithMock(db_session, 'cleanup')
+        self.mox.StubOutWithMock(rpc, 'cleanup')
+        db_session.cleanup()
+        rpc.cleanup()
+        self.mox.ReplayAll()
+
+        serv = service.Service(self.host,
+                               self.binary,
+                               self.topic,
+                               'nova.tests.test_service.FakeManager')
+        serv.prepare_workers()
+        self.assertEqual(serv.service_id, 1)
+
+    def test_launch_workers_prepares_once(self):
+        calls = []
+
+        class FakeServer(object):
+            def prepare_workers(self):
+                calls.append('prepare')
+
+        def fake_start_child(launcher, wrap):
+            calls.append('fork')
+            wrap.children.add(len(wrap.children))
+
+        self.stubs.Set(signal, 'signal', lambda *args: None)
+        self.stubs.Set(service.ProcessLauncher, '_start_child',
+                       fake_start_child)
+        launcher = service.ProcessLauncher()
+        launcher.launch_server(FakeServer(), workers=2)
+        self.assertEqual(calls, ['prepare', 'fork', 'fork'])
+
 
 class TestWSGIService(test.TestCase):
 
@@ -463,6 +463,11 @@ class GenericUtilsTestCase(test.TestCase):
         h2 = hashlib.sha1(data).hexdigest()
         self.assertEquals(h1, h2)
 
+    def test_strcmp_const_time(self):
+        self.assertTrue(utils.strcmp_const_time('abc123', 'abc123'))
+        self.assertFalse(utils.strcmp_const_time('a', 'aaaaa'))
+        self.assertFalse(utils.strcmp_const_time('ABC123', 'abc123'))
+
     def test_is_valid_boolstr(self):
         self.assertTrue(utils.is_valid_boolstr('true'))
         self.assertTrue(utils.is_valid_boolstr('false'))
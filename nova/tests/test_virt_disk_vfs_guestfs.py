@@ -14,11 +14,16 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import os
+import struct
 import sys
 
+import fixtures
+
 from nova import test
 
 from nova.tests import fakeguestfs
+from nova.virt.disk.vfs import api as vfsapi
 from nova.virt.disk.vfs import guestfs as vfsimpl
 
 
@@ -28,6 +33,14 @@ class VirtDiskVFSGuestFSTest(test.TestCase):
         super(VirtDiskVFSGuestFSTest, self).setUp()
         sys.modules['guestfs'] = fakeguestfs
         vfsimpl.guestfs = fakeguestfs
+        self.stubs.Set(vfsimpl, '_pool', vfsimpl.AppliancePool())
+        self.stubs.Set(vfsimpl, '_inspection_cache',
+                       vfsimpl.InspectionCache())
+        # Launch the pooled appliances right away
+        self.stubs.Set(vfsimpl.greenthread, 'spawn_n',
+                       lambda func, *args: func(*args))
+        self.stubs.Set(vfsimpl.tpool, 'execute',
+                       lambda func, *args: func(*args))
 
     def test_appliance_setup_inspect(self):
         vfs = vfsimpl.VFSGuestFS(imgfile="/dummy.qcow2",
@@ -174,3 +187,115 @@ class VirtDiskVFSGuestFSTest(test.TestCase):
         self.assertEquals(vfs.handle.files["/some/file"]["gid"], 600)
 
         vfs.teardown()
+
+    def test_appliance_pool(self):
+        self.flags(libguestfs_pool_size=2)
+        vfs = vfsimpl.VFSGuestFS(imgfile="/dummy.qcow2",
+                                 imgfmt="qcow2",
+                                 partition=2)
+        vfs.setup()
+
+        handle = vfs.handle
+        self.assertEqual(handle.drives, [("/dummy.qcow2", "qcow2")])
+        self.assertEqual(handle.mounts[0][1], "/dev/sda2")
+        self.assertTrue(handle.vgactive)
+        # The pool was filled while the image was in use
+        self.assertEqual(len(vfsimpl._pool.idle), 2)
+
+        vfs.teardown()
+
+        self.assertEqual(vfs.handle, None)
+        self.assertEqual(handle.running, True)
+        self.assertEqual(handle.drives, [])
+        self.assertEqual(len(handle.mounts), 0)
+        self.assertFalse(handle.vgactive)
+        # The pool was full already
+        self.assertEqual(handle.closed, True)
+        self.assertFalse(handle in vfsimpl._pool.idle)
+
+        idle = list(vfsimpl._pool.idle)
+        vfs.setup()
+        self.assertTrue(vfs.handle in idle)
+        self.assertEqual(vfs.handle.launched, 1)
+        vfs.teardown()
+
+    def test_appliance_pool_no_hotplug(self):
+        self.flags(libguestfs_pool_size=2)
+
+        def fake_add_drive_opts(self, file, *args, **kwargs):
+            if self.running:
+                raise RuntimeError("hot-plugging is not supported")
+            self.drives.append((file, kwargs['format']))
+        self.stubs.Set(fakeguestfs.GuestFS, 'add_drive_opts',
+                       fake_add_drive_opts)
+
+        vfs = vfsimpl.VFSGuestFS(imgfile="/dummy.qcow2",
+                                 imgfmt="qcow2",
+                                 partition=None)
+        vfs.setup()
+
+        self.assertEqual(vfs.handle.drives, [("/dummy.qcow2", "qcow2")])
+        self.assertEqual(vfs.handle.mounts[0][1], "/dev/sda")
+        self.assertFalse(vfsimpl._pool.enabled())
+        self.assertEqual(vfsimpl._pool.idle, [])
+
+        handle = vfs.handle
+        vfs.teardown()
+        self.assertEqual(handle.closed, True)
+
+    def _make_qcow2(self, backing_file):
+        path = os.path.join(self.useFixture(fixtures.TempDir()).path,
+                            'disk')
+        with open(path, 'wb') as f:
+            f.write(vfsimpl.QCOW2_MAGIC)
+            f.write(struct.pack('>IQI', 2, 72, len(backing_file)))
+            f.write('\0' * 52)
+            f.write(backing_file)
+        return path
+
+    def test_inspection_cache(self):
+        imgfile = self._make_qcow2("/var/lib/nova/instances/_base/1234")
+        self.assertEqual(vfsimpl._backing_file(imgfile),
+                         "/var/lib/nova/instances/_base/1234")
+
+        vfs = vfsimpl.VFSGuestFS(imgfile=imgfile,
+                                 imgfmt="qcow2",
+                                 partition=-1)
+        vfs.setup()
+        self.assertEqual(vfs.handle.inspected, 1)
+        mounts = vfs.handle.mounts
+        vfs.teardown()
+
+        vfs.setup()
+        self.assertEqual(vfs.handle.inspected, 0)
+        self.assertEqual(vfs.handle.mounts, mounts)
+        vfs.teardown()
+
+    def test_inspection_cache_devices(self):
+        cache = vfsimpl.InspectionCache()
+        cache.set("/base", "/dev/sda",
+                  [["/", "/dev/sda2"], ["/usr", "/dev/mapper/vg-usr"]])
+
+        self.assertEqual(cache.get("/base", "/dev/sdb"),
+                         [("/", "/dev/sdb2"), ("/usr", "/dev/mapper/vg-usr")])
+        self.assertEqual(cache.get("/other", "/dev/sda"), None)
+
+    def test_inspection_cache_size(self):
+        self.flags(libguestfs_inspect_cache_size=2)
+        cache = vfsimpl.InspectionCache()
+        for base in ("/base1", "/base2", "/base3"):
+            cache.set(base, "/dev/sda", [["/", "/dev/sda1"]])
+
+        self.assertEqual(cache.get("/base1", "/dev/sda"), None)
+        self.assertEqual(cache.get("/base3", "/dev/sda"),
+                         [("/", "/dev/sda1")])
+
+    def test_localfs_raw_images(self):
+        self.flags(vfs_localfs_raw_images=True)
+
+        vfs = vfsapi.VFS.instance_for_image("/dummy.img", "raw", None)
+        self.assertEqual(vfs.__class__.__name__, "VFSLocalFS")
+        vfs = vfsapi.VFS.instance_for_image("/dummy.img", "raw", -1)
+        self.assertEqual(vfs.__class__.__name__, "VFSGuestFS")
+        vfs = vfsapi.VFS.instance_for_image("/dummy.qcow2", "qcow2", None)
+        self.assertEqual(vfs.__class__.__name__, "VFSGuestFS")
@@ -1834,6 +1834,90 @@ class XenAPIBWCountersTestCase(stubs.XenAPITestBase):
         self.assertEqual(result, [])
 
 
+class XenAPIRecordCacheTestCase(stubs.XenAPITestBase):
+    """Unit tests for the XenAPI record cache."""
+
+    def setUp(self):
+        super(XenAPIRecordCacheTestCase, self).setUp()
+        self.flags(xenapi_record_cache=True,
+                   xenapi_connection_url='test_url',
+                   xenapi_connection_password='test_pass')
+        stubs.stubout_session(self.stubs, stubs.FakeSessionForVMTests)
+        self.session = xenapi_conn.XenAPISession('test_url', 'root',
+                                                 'test_pass',
+                                                 fake.FakeVirtAPI())
+        self.vm_ref = xenapi_fake.create_vm('instance-00000001',
+                                            'Running')
+        self.records = self.session.records
+
+    def _count_calls(self):
+        calls = []
+        orig_call_xenapi = self.session.call_xenapi
+
+        def fake_call_xenapi(method, *args):
+            calls.append(method)
+            return orig_call_xenapi(method, *args)
+
+        self.stubs.Set(self.session, 'call_xenapi', fake_call_xenapi)
+        return calls
+
+    def test_not_ready_before_poll(self):
+        self.assertFalse(self.records.ready)
+        self.assertEqual(self.records.get('VM', self.vm_ref), None)
+        self.assertEqual(self.records.refs('VM'), None)
+
+    def test_records_served_from_cache(self):
+        self.records.poll()
+        calls = self._count_calls()
+
+        vm_rec = self.session.get_rec('VM', self.vm_ref)
+        self.assertEqual(vm_rec['name_label'], 'instance-00000001')
+        self.assertEqual(vm_utils.lookup(self.session, 'instance-00000001'),
+                         self.vm_ref)
+        self.assertEqual(calls, [])
+
+    def test_changed_record_is_stale_until_next_poll(self):
+        self.records.poll()
+        self.session.call_xenapi('VM.set_name_label', self.vm_ref, 'renamed')
+        calls = self._count_calls()
+
+        self.assertEqual(self.session.get_rec('VM', self.vm_ref)['name_label'],
+                         'renamed')
+        self.assertEqual(calls, ['VM.get_record'])
+
+        self.records.poll()
+        self.assertEqual(self.records.get('VM', self.vm_ref)['name_label'],
+                         'renamed')
+
+    def test_new_record_listed_before_next_poll(self):
+        self.records.poll()
+        vm_ref = self.session.call_xenapi('VM.create',
+                                          {'name_label': 'new',
+                                           'power_state': 'Halted'})
+
+        self.assertIn(vm_ref, self.records.refs('VM'))
+        self.assertEqual(vm_utils.lookup(self.session, 'new'), vm_ref)
+
+    def test_destroyed_record_removed(self):
+        self.records.poll()
+        self.session.call_xenapi('VM.destroy', self.vm_ref)
+
+        self.assertEqual(self.session.get_rec('VM', self.vm_ref), None)
+        self.records.poll()
+        self.assertNotIn(self.vm_ref, self.records.refs('VM'))
+        self.assertEqual(vm_utils.lookup(self.session, 'instance-00000001'),
+                         None)
+
+    def test_reset_gets_all_records_again(self):
+        self.records.poll()
+        self.records.reset()
+        self.assertFalse(self.records.ready)
+
+        self.records.poll()
+        self.assertTrue(self.records.ready)
+        self.assertIn(self.vm_ref, self.records.refs('VM'))
+
+
 # TODO(salvatore-orlando): this class and
 # nova.tests.test_libvirt.IPTablesFirewallDriverTestCase share a lot of code.
 # Consider abstracting common code in a base class for firewall driver testing.
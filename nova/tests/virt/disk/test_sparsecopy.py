@@ -0,0 +1,120 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+import stat
+
+import fixtures
+
+from nova import test
+from nova.virt.disk import sparsecopy
+
+MB = 1024 * 1024
+
+
+class SparseCopyTestCase(test.TestCase):
+
+    def setUp(self):
+        super(SparseCopyTestCase, self).setUp()
+        self.flags(disk_copy_buffer_size=MB, disk_copy_block_size=65536)
+        tempdir = self.useFixture(fixtures.TempDir()).path
+        self.src_path = os.path.join(tempdir, 'src')
+        self.dst_path = os.path.join(tempdir, 'dst')
+
+        # A hole, some data with a run of zeros in it, another hole and
+        # a last block of data, which does not end on a block boundary
+        with open(self.src_path, 'wb') as f:
+            f.seek(3 * MB)
+            f.write('a' * 100000 + '\0' * 300000 + 'b' * 1000)
+            f.seek(6 * MB)
+            f.write('c' * 5000)
+        with open(self.src_path, 'rb') as f:
+            self.data = f.read()
+
+    def _read_dst(self):
+        with open(self.dst_path, 'rb') as f:
+            return f.read()
+
+    def test_sparse_copy(self):
+        written, skipped = sparsecopy.copy(self.src_path, self.dst_path)
+
+        self.assertEqual(self._read_dst(), self.data)
+        self.assertEqual(written + skipped, len(self.data))
+        # The holes and the blocks of zeros in the data are not written
+        self.assertTrue(written <= 4 * 65536, written)
+
+    def test_copy_not_sparse(self):
+        written, skipped = sparsecopy.copy(self.src_path, self.dst_path,
+                                           sparse=False)
+
+        self.assertEqual(self._read_dst(), self.data)
+        self.assertEqual(written, len(self.data))
+        self.assertEqual(skipped, 0)
+
+    def test_copy_length(self):
+        sparsecopy.copy(self.src_path, self.dst_path, 3 * MB + 150000)
+
+        self.assertEqual(self._read_dst(), self.data[:3 * MB + 150000])
+
+    def test_copy_truncates_dst(self):
+        with open(self.dst_path, 'wb') as f:
+            f.write('x' * 8 * MB)
+
+        sparsecopy.copy(self.src_path, self.dst_path)
+
+        self.assertEqual(self._read_dst(), self.data)
+
+    def _test_copy_mode(self, mode, expected):
+        os.chmod(self.src_path, mode)
+        old_umask = os.umask(022)
+        try:
+            sparsecopy.copy(self.src_path, self.dst_path)
+        finally:
+            os.umask(old_umask)
+        self.assertEqual(stat.S_IMODE(os.stat(self.dst_path).st_mode),
+                         expected)
+
+    def test_copy_mode(self):
+        # Like cp, not executable
+        self._test_copy_mode(0644, 0644)
+
+    def test_copy_mode_umask(self):
+        self._test_copy_mode(0666, 0644)
+
+    def test_copy_without_seek_data(self):
+        self.stubs.Set(sparsecopy, 'SEEK_DATA', -1)
+
+        written, skipped = sparsecopy.copy(self.src_path, self.dst_path)
+
+        self.assertEqual(self._read_dst(), self.data)
+        self.assertTrue(written <= 4 * 65536, written)
+
+    def test_copy_direct_io(self):
+        sparsecopy.copy(self.src_path, self.dst_path, direct_io=True)
+
+        self.assertEqual(self._read_dst(), self.data)
+
+    def test_sparse_file(self):
+        with sparsecopy.SparseFile(self.dst_path, offset=512) as f:
+            for pos in xrange(0, len(self.data), 65536):
+                f.write(self.data[pos:pos + 65536])
+
+        self.assertEqual(self._read_dst(), '\0' * 512 + self.data)
+        self.assertEqual(f.writer.written + f.writer.skipped, len(self.data))
+        self.assertTrue(f.writer.written <= 4 * 65536, f.writer.written)
+        self.assertEqual(stat.S_IMODE(os.stat(self.dst_path).st_mode) & 0111,
+                         0)
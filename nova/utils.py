@@ -79,6 +79,11 @@ utils_opts = [
                default="/etc/nova/rootwrap.conf",
                help='Path to the rootwrap configuration file to use for '
                     'running commands as root'),
+    cfg.BoolOpt('use_rootwrap_daemon',
+                default=False,
+                help='Run commands as root through a long-lived '
+                     'nova-rootwrap-daemon instead of starting '
+                     'nova-rootwrap for each of them'),
     cfg.StrOpt('tempdir',
                default=None,
                help='Explicitly specify the temporary working directory'),
@@ -154,6 +159,32 @@ def _subprocess_setup():
     signal.signal(signal.SIGPIPE, signal.SIG_DFL)
 
 
+_ROOTWRAP_DAEMON = None
+
+
+def _get_rootwrap_daemon():
+    global _ROOTWRAP_DAEMON
+    if _ROOTWRAP_DAEMON is None:
+        # Not imported with this module, it needs pwd which Windows lacks
+        from nova.openstack.common.rootwrap import daemon as rootwrap_daemon
+        _ROOTWRAP_DAEMON = rootwrap_daemon.Client(
+            ['sudo', 'nova-rootwrap-daemon', CONF.rootwrap_config],
+            subprocess_module=subprocess)
+    return _ROOTWRAP_DAEMON
+
+
+def _execute_with_rootwrap_daemon(cmd, process_input):
+    from nova.openstack.common.rootwrap import daemon as rootwrap_daemon
+    try:
+        return _get_rootwrap_daemon().execute(cmd, process_input)
+    except (rootwrap_daemon.ProtocolError, socket.error) as exc:
+        # Whether or not the command ran, it did not end as far as we
+        # know: fail it like a command that died
+        raise exception.ProcessExecutionError(
+            description=_('Lost the rootwrap daemon: %s') % exc,
+            cmd=' '.join(cmd))
+
+
 def execute(*cmd, **kwargs):
     """Helper method to execute command with optional retry.
 
@@ -171,7 +202,9 @@ def execute(*cmd, **kwargs):
                                before retrying.
     :param attempts:           How many times to retry cmd.
     :param run_as_root:        True | False. Defaults to False. If set to True,
-                               the command is run with rootwrap.
+                               the command is run with rootwrap, or with
+                               the rootwrap daemon if use_rootwrap_daemon
+                               is set.
 
     :raises exception.NovaException: on receiving unknown arguments
     :raises exception.ProcessExecutionError:
@@ -196,38 +229,49 @@ def execute(*cmd, **kwargs):
         raise exception.NovaException(_('Got unknown keyword args '
                                         'to utils.execute: %r') % kwargs)
 
+    use_rootwrap_daemon = False
     if run_as_root and os.geteuid() != 0:
-        cmd = ['sudo', 'nova-rootwrap', CONF.rootwrap_config] + list(cmd)
+        if CONF.use_rootwrap_daemon:
+            use_rootwrap_daemon = True
+        else:
+            cmd = ['sudo', 'nova-rootwrap', CONF.rootwrap_config] + list(cmd)
 
     cmd = map(str, cmd)
 
     while attempts > 0:
         attempts -= 1
         try:
-            LOG.debug(_('Running cmd (subprocess): %s'), ' '.join(cmd))
-            _PIPE = subprocess.PIPE  # pylint: disable=E1101
-
-            if os.name == 'nt':
-                preexec_fn = None
-                close_fds = False
-            else:
-                preexec_fn = _subprocess_setup
-                close_fds = True
-
-            obj = subprocess.Popen(cmd,
-                                   stdin=_PIPE,
-                                   stdout=_PIPE,
-                                   stderr=_PIPE,
-                                   close_fds=close_fds,
-                                   preexec_fn=preexec_fn,
-                                   shell=shell)
-            result = None
-            if process_input is not None:
-                result = obj.communicate(process_input)
+            if use_rootwrap_daemon:
+                LOG.debug(_('Running cmd (rootwrap daemon): %s'),
+                          ' '.join(cmd))
+                _returncode, stdout, stderr = \
+                    _execute_with_rootwrap_daemon(cmd, process_input)
+                result = (stdout, stderr)
             else:
-                result = obj.communicate()
-            obj.stdin.close()  # pylint: disable=E1101
-            _returncode = obj.returncode  # pylint: disable=E1101
+                LOG.debug(_('Running cmd (subprocess): %s'), ' '.join(cmd))
+                _PIPE = subprocess.PIPE  # pylint: disable=E1101
+
+                if os.name == 'nt':
+                    preexec_fn = None
+                    close_fds = False
+                else:
+                    preexec_fn = _subprocess_setup
+                    close_fds = True
+
+                obj = subprocess.Popen(cmd,
+                                       stdin=_PIPE,
+                                       stdout=_PIPE,
+                                       stderr=_PIPE,
+                                       close_fds=close_fds,
+                                       preexec_fn=preexec_fn,
+                                       shell=shell)
+                result = None
+                if process_input is not None:
+                    result = obj.communicate(process_input)
+                else:
+                    result = obj.communicate()
+                obj.stdin.close()  # pylint: disable=E1101
+                _returncode = obj.returncode  # pylint: disable=E1101
             LOG.debug(_('Result was %s') % _returncode)
             if not ignore_exit_code and _returncode not in check_exit_code:
                 (stdout, stderr) = result
@@ -1070,6 +1114,17 @@ def hash_file(file_like_object):
     return checksum.hexdigest()
 
 
+def strcmp_const_time(s1, s2):
+    """Compare two strings in a time that does not depend on where they
+    differ, so that comparing secrets does not leak them."""
+    if len(s1) != len(s2):
+        return False
+    result = 0
+    for (a, b) in zip(s1, s2):
+        result |= ord(a) ^ ord(b)
+    return result == 0
+
+
 @contextlib.contextmanager
 def temporary_mutation(obj, **kwargs):
     """Temporarily set the attr on a particular object to a given value then
@@ -27,6 +27,7 @@ from nova.openstack.common import fileutils
 from nova.openstack.common import log as logging
 from nova import utils
 from nova import version
+from nova.virt.disk import fsimage
 
 LOG = logging.getLogger(__name__)
 
@@ -47,7 +48,11 @@ configdrive_opts = [
     cfg.StrOpt('mkisofs_cmd',
                default='genisoimage',
                help='Name and optionally path of the tool used for '
-                    'ISO image creation')
+                    'ISO image creation'),
+    cfg.BoolOpt('config_drive_external_tools',
+                default=False,
+                help='Build config drives with mkisofs_cmd, or mkfs and a '
+                     'loop mount for vfat, rather than in the nova process'),
     ]
 
 CONF = cfg.CONF
@@ -62,12 +67,17 @@ class ConfigDriveBuilder(object):
 
     def __init__(self, instance_md=None):
         self.imagefile = None
-
-        # TODO(mikal): I don't think I can use utils.tempdir here, because
-        # I need to have the directory last longer than the scope of this
-        # method call
-        self.tempdir = tempfile.mkdtemp(dir=CONF.config_drive_tempdir,
-                                        prefix='cd_gen_')
+        # The files of the drive, built in memory unless the external
+        # tools are used
+        self.files = []
+        self.tempdir = None
+
+        if CONF.config_drive_external_tools:
+            # TODO(mikal): I don't think I can use utils.tempdir here,
+            # because I need to have the directory last longer than the
+            # scope of this method call
+            self.tempdir = tempfile.mkdtemp(dir=CONF.config_drive_tempdir,
+                                            prefix='cd_gen_')
 
         if instance_md is not None:
             self.add_instance_metadata(instance_md)
@@ -84,6 +94,9 @@ class ConfigDriveBuilder(object):
         self.cleanup()
 
     def _add_file(self, path, data):
+        if self.tempdir is None:
+            self.files.append((path, data))
+            return
         filepath = os.path.join(self.tempdir, path)
         dirname = os.path.dirname(filepath)
         fileutils.ensure_tree(dirname)
@@ -102,6 +115,11 @@ class ConfigDriveBuilder(object):
             'version': version.version_string_with_package()
             }
 
+        if self.tempdir is None:
+            writer = fsimage.ISO9660Writer('config-2', publisher=publisher)
+            self._write_image(writer, path)
+            return
+
         utils.execute(CONF.mkisofs_cmd,
                       '-o', path,
                       '-ldots',
@@ -119,6 +137,11 @@ class ConfigDriveBuilder(object):
                       run_as_root=False)
 
     def _make_vfat(self, path):
+        if self.tempdir is None:
+            writer = fsimage.VFATWriter('config-2', CONFIGDRIVESIZE_BYTES)
+            self._write_image(writer, path)
+            return
+
         # NOTE(mikal): This is a little horrible, but I couldn't find an
         # equivalent to genisoimage for vfat filesystems.
         with open(path, 'w') as f:
@@ -151,6 +174,12 @@ class ConfigDriveBuilder(object):
                 utils.execute('umount', mountdir, run_as_root=True)
             shutil.rmtree(mountdir)
 
+    def _write_image(self, writer, path):
+        for filepath, data in self.files:
+            writer.add_file(filepath, data)
+        with open(path, 'wb') as f:
+            writer.write(f)
+
     def make_drive(self, path):
         """Make the config drive.
 
@@ -170,6 +199,8 @@ class ConfigDriveBuilder(object):
         if self.imagefile:
             utils.delete_if_exists(self.imagefile)
 
+        if self.tempdir is None:
+            return
         try:
             shutil.rmtree(self.tempdir)
         except OSError, e:
@@ -0,0 +1,574 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Filesystem images written without external tools.
+
+The writers lay out a whole filesystem image from the files added to
+them, which are kept in memory, and write it in one pass.  They are meant
+for small images such as config drives, which otherwise take genisoimage,
+or mkfs and a loop mount as root.
+
+ISO9660Writer writes an ISO 9660 image with Rock Ridge and Joliet names,
+as genisoimage -J -r does.  VFATWriter writes a FAT16 image with long
+file names.
+"""
+
+import re
+import struct
+
+from nova import exception
+from nova.openstack.common import timeutils
+
+
+def _split_path(path):
+    parts = [part for part in path.split('/') if part]
+    if not parts:
+        raise exception.NovaException(_('Invalid path: %s') % path)
+    return parts
+
+
+class _Directory(object):
+    """A directory of the filesystem being written."""
+
+    def __init__(self):
+        self.dirs = {}
+        self.files = {}
+
+    def add_file(self, path, data):
+        if isinstance(data, unicode):
+            data = data.encode('utf-8')
+        parts = _split_path(path)
+        directory = self
+        for part in parts[:-1]:
+            if part in directory.files:
+                raise exception.NovaException(
+                    _('%s is both a file and a directory') % path)
+            if part not in directory.dirs:
+                directory.dirs[part] = _Directory()
+            directory = directory.dirs[part]
+        if parts[-1] in directory.dirs:
+            raise exception.NovaException(
+                _('%s is both a file and a directory') % path)
+        directory.files[parts[-1]] = data
+
+
+def _both16(value):
+    return struct.pack('<H', value) + struct.pack('>H', value)
+
+
+def _both32(value):
+    return struct.pack('<I', value) + struct.pack('>I', value)
+
+
+def _sectors(size, sector_size):
+    return (size + sector_size - 1) // sector_size
+
+
+def _unique_name(name, used, max_length):
+    """Return name, or name with a numbered tail if it is already used."""
+    number = 0
+    unique = name
+    while unique in used:
+        number += 1
+        tail = '%d' % number
+        unique = name[:max_length - len(tail)] + tail
+    used.add(unique)
+    return unique
+
+
+class _IsoDirectory(object):
+    """A directory of one of the trees of an ISO 9660 image."""
+
+    def __init__(self, directory, ident, name, parent):
+        self.directory = directory
+        self.ident = ident
+        self.name = name
+        self.parent = parent or self
+        # (ident, name, subdirectory or file data), sorted by ident
+        self.entries = []
+        self.number = 0
+        self.extent = 0
+        self.size = 0
+
+    @property
+    def subdirs(self):
+        return [entry for _ident, _name, entry in self.entries
+                if isinstance(entry, _IsoDirectory)]
+
+
+class ISO9660Writer(object):
+    """Write an ISO 9660 image with Rock Ridge and Joliet extensions.
+
+    The primary volume descriptor has ISO 9660 level 2 names, along with
+    the Rock Ridge names and POSIX attributes: the files are readable by
+    all and owned by root.  The Joliet volume descriptor has the names as
+    given, up to 64 characters.  Both refer to the same file data.
+    """
+
+    SECTOR_SIZE = 2048
+    # Sectors before the volume descriptors
+    SYSTEM_AREA = 16
+
+    RRIP_ID = 'RRIP_1991A'
+    RRIP_DESCRIPTION = ('THE ROCK RIDGE INTERCHANGE PROTOCOL PROVIDES '
+                        'SUPPORT FOR POSIX FILE SYSTEM SEMANTICS')
+    RRIP_SOURCE = ('PLEASE CONTACT DISC PUBLISHER FOR SPECIFICATION SOURCE.  '
+                   'SEE PUBLISHER IDENTIFIER IN PRIMARY VOLUME DESCRIPTOR '
+                   'FOR CONTACT INFORMATION.')
+
+    def __init__(self, volume_id, publisher='', application=''):
+        self.volume_id = volume_id
+        self.publisher = publisher
+        self.application = application
+        self.root = _Directory()
+
+    def add_file(self, path, data):
+        """Add a file, path being relative to the root of the image."""
+        self.root.add_file(path, data)
+
+    @staticmethod
+    def _primary_ident(name, is_dir, used):
+        name = name.upper()
+        if is_dir:
+            base, ext = name, None
+        else:
+            base, dot, ext = name.rpartition('.')
+            if not dot:
+                base, ext = ext, ''
+        base = re.sub('[^A-Z0-9_]', '_', base) or '_'
+        if ext is None:
+            return _unique_name(base[:31], used, 31)
+        ext = re.sub('[^A-Z0-9_]', '_', ext)[:3]
+        base = _unique_name(base[:30 - len(ext) - 1], used,
+                            30 - len(ext) - 1)
+        return '%s.%s;1' % (base, ext)
+
+    @staticmethod
+    def _joliet_ident(name, is_dir, used):
+        name = _unique_name(name.decode('utf-8')[:64], used, 64)
+        return name.encode('utf-16-be')
+
+    def _build_tree(self, naming):
+        """Return the directories of a tree, in path table order."""
+        root = _IsoDirectory(self.root, '\0', '', None)
+        ordered = [root]
+        for node in ordered:
+            used = set()
+            directory = node.directory
+            for name in sorted(directory.dirs):
+                ident = naming(name, True, used)
+                node.entries.append((ident, name, _IsoDirectory(
+                    directory.dirs[name], ident, name, node)))
+            for name in sorted(directory.files):
+                ident = naming(name, False, used)
+                node.entries.append((ident, name, directory.files[name]))
+            node.entries.sort()
+            ordered.extend(node.subdirs)
+        for number, node in enumerate(ordered):
+            node.number = number + 1
+        return ordered
+
+    def _date(self):
+        return struct.pack('7B', self.now.year - 1900, self.now.month,
+                           self.now.day, self.now.hour, self.now.minute,
+                           self.now.second, 0)
+
+    def _volume_date(self):
+        return self.now.strftime('%Y%m%d%H%M%S') + '00\0'
+
+    def _record(self, extent, size, is_dir, ident, system_use=''):
+        record = (_both32(extent) + _both32(size) + self._date() +
+                  struct.pack('BBB', 2 if is_dir else 0, 0, 0) +
+                  _both16(1) + struct.pack('B', len(ident)) + ident)
+        if len(ident) % 2 == 0:
+            record += '\0'
+        record += system_use
+        if len(record) % 2:
+            record += '\0'
+        if len(record) + 2 > 255:
+            raise exception.NovaException(
+                _('Name too long for an ISO 9660 image: %s') % ident)
+        return struct.pack('BB', len(record) + 2, 0) + record
+
+    def _rock_ridge(self, is_dir, nlinks, name=None):
+        mode = 040555 if is_dir else 0100444
+        entries = ('PX' + struct.pack('BB', 36, 1) + _both32(mode) +
+                   _both32(nlinks) + _both32(0) + _both32(0))
+        # Modification, access and attribute change times
+        entries += 'TF' + struct.pack('BBB', 26, 1, 0x0e) + self._date() * 3
+        if name is not None:
+            entries += 'NM' + struct.pack('BBB', 5 + len(name), 1, 0) + name
+        return entries
+
+    def _dir_records(self, node, rock_ridge, ce_extent=0):
+        """Return the records of a directory, each in a list of sectors."""
+        records = []
+        dot_su = dotdot_su = ''
+        if rock_ridge:
+            dot_su = self._rock_ridge(True, 2 + len(node.subdirs))
+            dotdot_su = self._rock_ridge(True,
+                                         2 + len(node.parent.subdirs))
+            if node.parent is node:
+                # The root directory says the other records have Rock
+                # Ridge entries, the ER entry naming the extension is in
+                # a continuation area
+                dot_su = ('SP' + struct.pack('BBBBB', 7, 1, 0xbe, 0xef, 0) +
+                          'CE' + struct.pack('BB', 28, 1) +
+                          _both32(ce_extent) + _both32(0) +
+                          _both32(len(self._er_entry())) + dot_su)
+        records.append(self._record(node.extent, node.size, True, '\0',
+                                    dot_su))
+        records.append(self._record(node.parent.extent, node.parent.size,
+                                    True, '\1', dotdot_su))
+        for ident, name, entry in node.entries:
+            is_dir = isinstance(entry, _IsoDirectory)
+            system_use = ''
+            if rock_ridge:
+                nlinks = 2 + len(entry.subdirs) if is_dir else 1
+                system_use = self._rock_ridge(is_dir, nlinks, name)
+            if is_dir:
+                extent, size = entry.extent, entry.size
+            else:
+                extent = self.file_extents.get(id(entry), 0)
+                size = len(entry)
+            records.append(self._record(extent, size, is_dir, ident,
+                                        system_use))
+
+        data = ''
+        for record in records:
+            used = len(data) % self.SECTOR_SIZE
+            if used + len(record) > self.SECTOR_SIZE:
+                # Records do not cross sector boundaries
+                data += '\0' * (self.SECTOR_SIZE - used)
+            data += record
+        return data
+
+    def _er_entry(self):
+        return ('ER' + struct.pack('BBBBBB', 8 + len(self.RRIP_ID) +
+                                   len(self.RRIP_DESCRIPTION) +
+                                   len(self.RRIP_SOURCE), 1,
+                                   len(self.RRIP_ID),
+                                   len(self.RRIP_DESCRIPTION),
+                                   len(self.RRIP_SOURCE), 1) +
+                self.RRIP_ID + self.RRIP_DESCRIPTION + self.RRIP_SOURCE)
+
+    @staticmethod
+    def _path_table(nodes, fmt):
+        table = ''
+        for node in nodes:
+            table += (struct.pack(fmt + 'BBIH', len(node.ident), 0,
+                                  node.extent, node.parent.number) +
+                      node.ident)
+            if len(node.ident) % 2:
+                table += '\0'
+        return table
+
+    def _volume_descriptor(self, vtype, encode, escape, space_size,
+                           path_table_size, l_table, m_table, root):
+        descriptor = (struct.pack('B', vtype) + 'CD001\1\0' +
+                      encode('', 32) + encode(self.volume_id, 32) +
+                      '\0' * 8 + _both32(space_size) +
+                      escape.ljust(32, '\0') + _both16(1) + _both16(1) +
+                      _both16(self.SECTOR_SIZE) + _both32(path_table_size) +
+                      struct.pack('<I', l_table) + '\0' * 4 +
+                      struct.pack('>I', m_table) + '\0' * 4 +
+                      self._record(root.extent, root.size, True, '\0') +
+                      encode('', 128) + encode(self.publisher, 128) +
+                      encode('', 128) + encode(self.application, 128) +
+                      encode('', 37) * 3 + self._volume_date() * 2 +
+                      '0' * 16 + '\0' + '0' * 16 + '\0' + '\1\0')
+        return descriptor.ljust(self.SECTOR_SIZE, '\0')
+
+    @staticmethod
+    def _primary_string(text, length):
+        return text[:length].ljust(length)
+
+    @staticmethod
+    def _joliet_string(text, length):
+        text = text.decode('utf-8').encode('utf-16-be')
+        return (text[:length - length % 2] + '\0 ' * length)[:length]
+
+    def write(self, f):
+        """Write the image to a file object."""
+        sector = self.SECTOR_SIZE
+        self.now = timeutils.utcnow()
+        primary = self._build_tree(self._primary_ident)
+        joliet = self._build_tree(self._joliet_ident)
+
+        # After the descriptors
+        next_extent = self.SYSTEM_AREA + 3
+
+        tables = []
+        for nodes in (primary, joliet):
+            size = len(self._path_table(nodes, '<'))
+            tables.append((size, next_extent,
+                           next_extent + _sectors(size, sector)))
+            next_extent += 2 * _sectors(size, sector)
+
+        # The size of the directories does not depend on where they are
+        self.file_extents = {}
+        for nodes, rock_ridge in ((primary, True), (joliet, False)):
+            for node in nodes:
+                node.size = _sectors(len(self._dir_records(node,
+                                                           rock_ridge)),
+                                     sector) * sector
+        for nodes in (primary, joliet):
+            for node in nodes:
+                node.extent = next_extent
+                next_extent += node.size // sector
+        # The Rock Ridge continuation area comes after the directories
+        # referring to it, for the readers going through the image in order
+        ce_extent = next_extent
+        next_extent += 1
+
+        # The Joliet tree refers to the same data
+        files = []
+        for node in primary:
+            for _ident, _name, entry in node.entries:
+                if (not isinstance(entry, _IsoDirectory) and
+                        id(entry) not in self.file_extents):
+                    files.append(entry)
+                    self.file_extents[id(entry)] = next_extent
+                    next_extent += _sectors(len(entry), sector)
+
+        def pad(data):
+            return data + '\0' * (-len(data) % sector)
+
+        f.write('\0' * sector * self.SYSTEM_AREA)
+        for vtype, nodes, (size, l_table, m_table), encode, escape in (
+                (1, primary, tables[0], self._primary_string, ''),
+                (2, joliet, tables[1], self._joliet_string, '%/E')):
+            f.write(self._volume_descriptor(vtype, encode, escape,
+                                            next_extent, size, l_table,
+                                            m_table, nodes[0]))
+        f.write(pad('\xffCD001\1'))
+        for nodes in (primary, joliet):
+            f.write(pad(self._path_table(nodes, '<')))
+            f.write(pad(self._path_table(nodes, '>')))
+        for nodes, rock_ridge in ((primary, True), (joliet, False)):
+            for node in nodes:
+                f.write(pad(self._dir_records(node, rock_ridge, ce_extent)))
+        f.write(pad(self._er_entry()))
+        for data in files:
+            f.write(pad(data))
+
+
+class VFATWriter(object):
+    """Write a FAT16 image with long file names.
+
+    The files are written one after the other, each in contiguous
+    clusters.  Only the clusters in use are written: the rest of the image
+    is left sparse.
+    """
+
+    SECTOR_SIZE = 512
+    ROOT_ENTRIES = 512
+    RESERVED_SECTORS = 1
+    NUM_FATS = 2
+    # Cluster counts FAT16 is defined for
+    MIN_CLUSTERS = 4085
+    MAX_CLUSTERS = 65524
+
+    ATTR_VOLUME_ID = 0x08
+    ATTR_DIRECTORY = 0x10
+    ATTR_LONG_NAME = 0x0f
+
+    def __init__(self, label, size):
+        self.label = label
+        self.size = size
+        self.root = _Directory()
+
+        self.total_sectors = size // self.SECTOR_SIZE
+        self.root_sectors = self.ROOT_ENTRIES * 32 // self.SECTOR_SIZE
+        for self.cluster_sectors in (1, 2, 4, 8, 16, 32, 64):
+            # Sizing of the FAT from the FAT specification
+            self.fat_sectors = _sectors(
+                self.total_sectors - self.RESERVED_SECTORS -
+                self.root_sectors,
+                256 * self.cluster_sectors + self.NUM_FATS)
+            self.data_start = (self.RESERVED_SECTORS +
+                               self.NUM_FATS * self.fat_sectors +
+                               self.root_sectors)
+            self.clusters = ((self.total_sectors - self.data_start) //
+                             self.cluster_sectors)
+            if self.clusters <= self.MAX_CLUSTERS:
+                break
+        if not self.MIN_CLUSTERS <= self.clusters <= self.MAX_CLUSTERS:
+            raise exception.NovaException(
+                _('Cannot make a FAT16 filesystem of %d bytes') % size)
+        self.cluster_size = self.cluster_sectors * self.SECTOR_SIZE
+
+    def add_file(self, path, data):
+        """Add a file, path being relative to the root of the image."""
+        self.root.add_file(path, data)
+
+    @staticmethod
+    def _short_name(name, used):
+        """Return the 8.3 name of a file, and whether it needs a long one."""
+        upper = name.upper()
+        base, dot, ext = upper.rpartition('.')
+        if not dot or not base:
+            base, ext = upper, ''
+        invalid = '[^A-Z0-9_!#$%&\'()@^`{}~-]'
+        clean_base = re.sub(invalid, '_', base.replace('.', '')) or '_'
+        clean_ext = re.sub(invalid, '_', ext)
+        short = clean_base[:8].ljust(8) + clean_ext[:3].ljust(3)
+        if (clean_base != base or len(base) > 8 or clean_ext != ext or
+                len(ext) > 3 or short in used):
+            number = 0
+            while short in used or number == 0:
+                number += 1
+                tail = '~%d' % number
+                short = (clean_base[:8 - len(tail)] + tail).ljust(8) + \
+                    clean_ext[:3].ljust(3)
+        used.add(short)
+        return short, name != upper or '~' in short
+
+    @staticmethod
+    def _long_name_entries(name, short):
+        checksum = 0
+        for char in short:
+            checksum = (((checksum & 1) << 7) + (checksum >> 1) +
+                        ord(char)) & 0xff
+
+        name = name.decode('utf-8').encode('utf-16-le')
+        if len(name) % 26:
+            name += '\0\0'
+            name += '\xff' * (-len(name) % 26)
+        chunks = [name[i:i + 26] for i in range(0, len(name), 26)]
+        entries = []
+        for number, chunk in enumerate(chunks):
+            order = number + 1
+            if order == len(chunks):
+                order |= 0x40
+            entries.append(struct.pack('<B10sBBB12sH4s', order, chunk[:10],
+                                       VFATWriter.ATTR_LONG_NAME, 0,
+                                       checksum, chunk[10:22], 0,
+                                       chunk[22:]))
+        # The entries come before the short one, the last part first
+        entries.reverse()
+        return ''.join(entries)
+
+    def _entry(self, short, attr, cluster, size):
+        date = ((self.now.year - 1980) << 9 | self.now.month << 5 |
+                self.now.day)
+        time = (self.now.hour << 11 | self.now.minute << 5 |
+                self.now.second // 2)
+        return struct.pack('<11sBBBHHHHHHHI', short, attr, 0, 0, time, date,
+                           date, 0, time, date, cluster, size)
+
+    def _allocate(self, data):
+        """Give data the next free clusters, and return the first one."""
+        if not data:
+            return 0
+        count = _sectors(len(data), self.cluster_size)
+        cluster = self.next_cluster
+        if cluster - 2 + count > self.clusters:
+            raise exception.NovaException(
+                _('The files do not fit in a %d bytes FAT16 filesystem')
+                % self.size)
+        for number in range(cluster, cluster + count - 1):
+            self.fat[number] = number + 1
+        self.fat[cluster + count - 1] = 0xffff
+        self.next_cluster += count
+        self.chunks.append(data)
+        return cluster
+
+    def _dir_entry_count(self, directory):
+        count = 0
+        used = set()
+        for name in sorted(directory.dirs) + sorted(directory.files):
+            short, long_name = self._short_name(name, used)
+            count += 1
+            if long_name:
+                count += _sectors(len(name.decode('utf-8')), 13)
+        return count
+
+    def _write_dir(self, directory, cluster, parent_cluster):
+        """Allocate the contents of a directory, return its entries."""
+        entries = ''
+        if cluster is not None:
+            entries += self._entry('.          ', self.ATTR_DIRECTORY,
+                                   cluster, 0)
+            entries += self._entry('..         ', self.ATTR_DIRECTORY,
+                                   parent_cluster, 0)
+        used = set()
+        subdirs = []
+        for name in sorted(directory.dirs):
+            subdir = directory.dirs[name]
+            short, long_name = self._short_name(name, used)
+            # A directory takes at least one cluster, even if empty
+            size = max((self._dir_entry_count(subdir) + 2) * 32, 1)
+            subdir_cluster = self._allocate('\0' * size)
+            subdirs.append((subdir, subdir_cluster,
+                            len(self.chunks) - 1))
+            if long_name:
+                entries += self._long_name_entries(name, short)
+            entries += self._entry(short, self.ATTR_DIRECTORY,
+                                   subdir_cluster, 0)
+        for name in sorted(directory.files):
+            data = directory.files[name]
+            short, long_name = self._short_name(name, used)
+            if long_name:
+                entries += self._long_name_entries(name, short)
+            entries += self._entry(short, 0, self._allocate(data),
+                                   len(data))
+        for subdir, subdir_cluster, chunk in subdirs:
+            self.chunks[chunk] = self._write_dir(subdir, subdir_cluster,
+                                                 cluster or 0)
+        return entries
+
+    def write(self, f):
+        """Write the image to a file object opened for writing."""
+        self.now = timeutils.utcnow()
+        self.fat = {0: 0xfff8, 1: 0xffff}
+        self.next_cluster = 2
+        self.chunks = []
+
+        label = self.label[:11].ljust(11)
+        root = self._entry(label, self.ATTR_VOLUME_ID, 0, 0)
+        root += self._write_dir(self.root, None, 0)
+        if len(root) > self.ROOT_ENTRIES * 32:
+            raise exception.NovaException(
+                _('Too many files in the root directory'))
+
+        volume_id = int(timeutils.utcnow_ts()) & 0xffffffff
+        boot = struct.pack('<3s8sHBHBHHBHHHII', '\xeb\x3c\x90', 'MSWIN4.1',
+                           self.SECTOR_SIZE, self.cluster_sectors,
+                           self.RESERVED_SECTORS, self.NUM_FATS,
+                           self.ROOT_ENTRIES,
+                           self.total_sectors
+                           if self.total_sectors < 0x10000 else 0,
+                           0xf8, self.fat_sectors, 32, 64, 0,
+                           self.total_sectors
+                           if self.total_sectors >= 0x10000 else 0)
+        boot += struct.pack('<BBBI11s8s', 0x80, 0, 0x29, volume_id, label,
+                            'FAT16   ')
+        boot = boot.ljust(510, '\0') + '\x55\xaa'
+        boot = boot.ljust(self.RESERVED_SECTORS * self.SECTOR_SIZE, '\0')
+
+        fat = ''.join(struct.pack('<H', self.fat.get(number, 0))
+                      for number in range(self.next_cluster))
+        fat = fat.ljust(self.fat_sectors * self.SECTOR_SIZE, '\0')
+
+        f.write(boot)
+        for _i in range(self.NUM_FATS):
+            f.write(fat)
+        f.write(root.ljust(self.root_sectors * self.SECTOR_SIZE, '\0'))
+        for data in self.chunks:
+            f.write(data + '\0' * (-len(data) % self.cluster_size))
+        f.truncate(self.size)
@@ -0,0 +1,333 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Copy disk images without writing their runs of zeros.
+
+Data is moved in large page aligned buffers, so that the copy can also be
+made with O_DIRECT. The holes of a sparse source are found with SEEK_DATA
+and SEEK_HOLE where the filesystem supports them and are not read at all;
+the blocks of zeros in the data read are found by comparing whole buffers,
+then blocks, to a buffer of zeros.
+
+A sparse copy seeks over the zeros instead of writing them, which is only
+right when the destination reads back zeros where nothing was written: a
+regular file, which is truncated first, or a device that was just created.
+"""
+
+import ctypes
+import errno
+import fcntl
+import io
+import mmap
+import os
+import stat
+import time
+
+from eventlet import greenthread
+
+from nova.openstack.common import cfg
+from nova.openstack.common import log as logging
+
+
+LOG = logging.getLogger(__name__)
+
+sparse_copy_opts = [
+    cfg.IntOpt('disk_copy_buffer_size',
+               default=4 * 1024 * 1024,
+               help='Size in bytes of the reads and writes made when '
+                    'copying disk images'),
+    cfg.IntOpt('disk_copy_block_size',
+               default=64 * 1024,
+               help='Size in bytes of the blocks of zeros not written by '
+                    'a sparse copy of a disk image'),
+    cfg.BoolOpt('disk_copy_direct_io',
+                default=False,
+                help='Whether to bypass the page cache (O_DIRECT) when '
+                     'copying disk images'),
+    ]
+
+CONF = cfg.CONF
+CONF.register_opts(sparse_copy_opts)
+
+# Python 2 does not define them; these are their Linux values
+SEEK_DATA = getattr(os, 'SEEK_DATA', 3)
+SEEK_HOLE = getattr(os, 'SEEK_HOLE', 4)
+
+# Alignment of the offsets and sizes of O_DIRECT reads and writes
+ALIGNMENT = 4096
+
+
+def _round_up(value, alignment=ALIGNMENT):
+    return (value + alignment - 1) // alignment * alignment
+
+
+def _buffer_size():
+    # Buffers are whole blocks, and blocks whole aligned units
+    block_size = _round_up(max(CONF.disk_copy_block_size, 1))
+    buffer_size = max(CONF.disk_copy_buffer_size, block_size)
+    return block_size, _round_up(buffer_size, block_size)
+
+
+def _window(buf, size):
+    """Return the first size bytes of buf, to read into."""
+    return (ctypes.c_char * size).from_buffer(buf)
+
+
+def _open(path, flags, direct_io, mode=0644):
+    """Open path, with mode (less the umask) if it gets created."""
+    if direct_io:
+        try:
+            return os.open(path, flags | os.O_DIRECT, mode)
+        except OSError as e:
+            # Filesystems like tmpfs do not support O_DIRECT
+            if e.errno != errno.EINVAL:
+                raise
+            LOG.debug(_("%s cannot be opened with O_DIRECT"), path)
+    return os.open(path, flags, mode)
+
+
+def _is_direct(fd):
+    return bool(fcntl.fcntl(fd, fcntl.F_GETFL) & getattr(os, 'O_DIRECT', 0))
+
+
+def _clear_direct(fd):
+    flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+    fcntl.fcntl(fd, fcntl.F_SETFL, flags & ~getattr(os, 'O_DIRECT', 0))
+
+
+def _size(fd):
+    """Return the size of a file or of a device."""
+    size = os.fstat(fd).st_size
+    if not size:
+        size = os.lseek(fd, 0, os.SEEK_END)
+    return size
+
+
+def _is_regular(fd):
+    return stat.S_ISREG(os.fstat(fd).st_mode)
+
+
+def data_extents(fd, start, end):
+    """Yield the (offset, length) of the data between start and end.
+
+    Where the filesystem cannot tell the holes from the data, everything
+    is data.
+    """
+    offset = start
+    while offset < end:
+        try:
+            data = os.lseek(fd, offset, SEEK_DATA)
+        except OSError as e:
+            if e.errno == errno.ENXIO:
+                # Nothing but a hole after offset
+                return
+            yield offset, end - offset
+            return
+        if data >= end:
+            return
+        try:
+            hole = min(os.lseek(fd, data, SEEK_HOLE), end)
+        except OSError:
+            hole = end
+        yield data, hole - data
+        offset = hole
+
+
+class _Writer(object):
+    """Writes buffers at given offsets, seeking over their zeros."""
+
+    def __init__(self, fd, sparse, block_size, zeros):
+        self.fd = fd
+        self.file = io.FileIO(fd, 'w', closefd=False)
+        self.sparse = sparse
+        self.block_size = block_size
+        self.zeros = zeros
+        self.written = 0
+        self.skipped = 0
+
+    def _write(self, buf, start, length, offset):
+        if length % ALIGNMENT and _is_direct(self.fd):
+            # Only the last write of a copy can be partial
+            _clear_direct(self.fd)
+        self.file.seek(offset)
+        end = start + length
+        while start < end:
+            start += self.file.write(buffer(buf, start, end - start))
+        self.written += length
+
+    def write(self, buf, length, offset):
+        """Write the first length bytes of buf at offset."""
+        if not self.sparse:
+            self._write(buf, 0, length, offset)
+            return
+        if buffer(buf, 0, length) == buffer(self.zeros, 0, length):
+            self.skipped += length
+            return
+
+        run = None
+        for pos in xrange(0, length, self.block_size):
+            size = min(self.block_size, length - pos)
+            if buffer(buf, pos, size) == buffer(self.zeros, 0, size):
+                if run is not None:
+                    self._write(buf, run, pos - run, offset + run)
+                    run = None
+                self.skipped += size
+            elif run is None:
+                run = pos
+        if run is not None:
+            self._write(buf, run, length - run, offset + run)
+
+    def write_zeros(self, length, offset):
+        """Write length zeros at offset, unless the copy is sparse."""
+        if self.sparse:
+            self.skipped += length
+            return
+        end = offset + length
+        while offset < end:
+            size = min(len(self.zeros), end - offset)
+            self._write(self.zeros, 0, size, offset)
+            offset += size
+
+
+def _log_copy(src, dst, writer, length, duration):
+    rate = length / max(duration, 0.001) / (1024 * 1024)
+    written = writer.written
+    skipped = writer.skipped
+    LOG.debug(_("Copied %(length)d bytes from %(src)s to %(dst)s in "
+                "%(duration).2f secs (%(rate).1f MB/s), %(written)d bytes "
+                "written, %(skipped)d bytes of zeros skipped"), locals())
+
+
+def copy(src_path, dst_path, length=None, sparse=True, direct_io=None):
+    """Copy the first length bytes of src_path, or all of it, to dst_path.
+
+    dst_path is created, with the permissions of src_path like cp does,
+    when it does not exist and truncated when it is a regular file. With
+    sparse, the zeros of src_path are not written.
+
+    :returns: a tuple of the number of bytes written and of zeros skipped
+    """
+    if direct_io is None:
+        direct_io = CONF.disk_copy_direct_io
+    block_size, buffer_size = _buffer_size()
+    start_time = time.time()
+
+    src_fd = _open(src_path, os.O_RDONLY, direct_io)
+    try:
+        dst_fd = _open(dst_path, os.O_WRONLY | os.O_CREAT, direct_io,
+                       stat.S_IMODE(os.fstat(src_fd).st_mode))
+        try:
+            if length is None:
+                length = _size(src_fd)
+            if _is_regular(dst_fd):
+                os.ftruncate(dst_fd, 0)
+
+            buf = mmap.mmap(-1, buffer_size)
+            zeros = mmap.mmap(-1, buffer_size)
+            src = io.FileIO(src_fd, 'r', closefd=False)
+            writer = _Writer(dst_fd, sparse, block_size, zeros)
+            copied = 0
+            for offset, size in data_extents(src_fd, 0, length):
+                # SEEK_DATA only returns offsets of filesystem blocks,
+                # rounding down keeps the O_DIRECT reads aligned
+                aligned = max(offset - offset % ALIGNMENT, copied)
+                size += offset - aligned
+                offset = aligned
+                writer.write_zeros(offset - copied, copied)
+                src.seek(offset)
+                end = offset + size
+                while offset < end:
+                    count = min(buffer_size, _round_up(end - offset))
+                    read = src.readinto(_window(buf, count))
+                    if not read:
+                        break
+                    read = min(read, end - offset)
+                    writer.write(buf, read, offset)
+                    offset += read
+                    greenthread.sleep(0)
+                copied = offset
+            writer.write_zeros(length - copied, copied)
+            if _is_regular(dst_fd):
+                os.ftruncate(dst_fd, length)
+        finally:
+            os.close(dst_fd)
+    finally:
+        os.close(src_fd)
+
+    _log_copy(src_path, dst_path, writer, length, time.time() - start_time)
+    return writer.written, writer.skipped
+
+
+class SparseFile(object):
+    """A file to stream a disk image to, written from offset on.
+
+    Writes are gathered in a buffer, which is written as with copy() once
+    full and when the file is closed.
+    """
+
+    def __init__(self, path, offset=0, sparse=True, direct_io=None):
+        if direct_io is None:
+            direct_io = CONF.disk_copy_direct_io
+        block_size, buffer_size = _buffer_size()
+        self.path = path
+        self.start = self.offset = offset
+        self.start_time = time.time()
+        self.fd = _open(path, os.O_WRONLY | os.O_CREAT,
+                        direct_io and not offset % ALIGNMENT)
+        self.buf = mmap.mmap(-1, buffer_size)
+        self.used = 0
+        self.writer = _Writer(self.fd, sparse, block_size,
+                              mmap.mmap(-1, buffer_size))
+
+    def write(self, data):
+        data = buffer(data)
+        pos = 0
+        while pos < len(data):
+            count = min(len(data) - pos, len(self.buf) - self.used)
+            self.buf[self.used:self.used + count] = data[pos:pos + count]
+            self.used += count
+            pos += count
+            if self.used == len(self.buf):
+                self.flush()
+
+    def flush(self):
+        if self.used:
+            self.writer.write(self.buf, self.used, self.offset)
+            self.offset += self.used
+            self.used = 0
+            greenthread.sleep(0)
+
+    def close(self):
+        if self.fd is None:
+            return
+        try:
+            self.flush()
+            # Skipped zeros at the end of a regular file still count
+            if (_is_regular(self.fd) and
+                    os.fstat(self.fd).st_size < self.offset):
+                os.ftruncate(self.fd, self.offset)
+        finally:
+            os.close(self.fd)
+            self.fd = None
+        _log_copy('stream', self.path, self.writer, self.offset - self.start,
+                  time.time() - self.start_time)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -14,11 +14,23 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+from nova.openstack.common import cfg
 from nova.openstack.common import importutils
 from nova.openstack.common import log as logging
 
 LOG = logging.getLogger(__name__)
 
+vfs_opts = [
+    cfg.BoolOpt('vfs_localfs_raw_images',
+                default=False,
+                help='Whether to access raw disk images with a known '
+                     'partition by mounting them on the host, which is '
+                     'faster than launching a libguestfs appliance'),
+    ]
+
+CONF = cfg.CONF
+CONF.register_opts(vfs_opts)
+
 
 class VFS(object):
 
@@ -27,6 +39,15 @@ class VFS(object):
         LOG.debug(_("Instance for image imgfile=%(imgfile)s "
                     "imgfmt=%(imgfmt)s partition=%(partition)s")
                   % locals())
+        # A loop mount gets there much faster than libguestfs, but it
+        # cannot inspect the image for its partitions
+        if (CONF.vfs_localfs_raw_images and imgfmt == "raw" and
+                partition != -1):
+            LOG.debug(_("Using VFSLocalFS for raw image"))
+            return importutils.import_object(
+                "nova.virt.disk.vfs.localfs.VFSLocalFS",
+                imgfile, imgfmt, partition)
+
         hasGuestfs = False
         try:
             LOG.debug(_("Trying to import guestfs"))
@@ -14,16 +14,172 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import collections
+import itertools
+import struct
+
+from eventlet import greenthread
+from eventlet import tpool
 import guestfs
 
 from nova import exception
+from nova.openstack.common import cfg
 from nova.openstack.common import log as logging
 from nova.virt.disk.vfs import api as vfs
 
 LOG = logging.getLogger(__name__)
 
+guestfs_opts = [
+    cfg.IntOpt('libguestfs_pool_size',
+               default=0,
+               help='Number of launched libguestfs appliances kept ready '
+                    'to have disk images hot-plugged into them. 0 launches '
+                    'an appliance for each image'),
+    cfg.IntOpt('libguestfs_inspect_cache_size',
+               default=64,
+               help='Number of base images whose operating system '
+                    'inspection results are remembered'),
+    ]
+
+CONF = cfg.CONF
+CONF.register_opts(guestfs_opts)
+
 guestfs = None
 
+# Stands for the device of the disk image in the inspection cache
+_DISK = '<disk>'
+
+QCOW2_MAGIC = 'QFI\xfb'
+
+
+def _backing_file(imgfile):
+    """Return the backing file of a qcow2 image, or None."""
+    try:
+        with open(imgfile, 'rb') as f:
+            header = f.read(20)
+            if len(header) < 20 or header[:4] != QCOW2_MAGIC:
+                return None
+            offset, size = struct.unpack('>QI', header[8:20])
+            if not offset:
+                return None
+            f.seek(offset)
+            return f.read(size)
+    except IOError:
+        return None
+
+
+def _close(handle):
+    try:
+        handle.close()
+    except (AttributeError, RuntimeError):
+        # Older libguestfs versions haven't an explicit close, and the
+        # handle goes away with its last reference
+        pass
+
+
+class AppliancePool(object):
+    """Launched appliances, to which disk images are hot-plugged.
+
+    Launching an appliance boots a small VM, which takes seconds. Pooled
+    appliances are launched in the background ahead of their use and get
+    the disk images they work on added and removed while running. That
+    needs libguestfs to support hot-plugging; the first appliance which
+    does not turns the pool off.
+    """
+
+    def __init__(self):
+        self.idle = []
+        self.launching = 0
+        self.hotplug = True
+        self._labels = itertools.count()
+
+    def enabled(self):
+        return CONF.libguestfs_pool_size > 0 and self.hotplug
+
+    def get(self):
+        """Return a launched appliance, or None if there is no pool."""
+        if not self.enabled():
+            return None
+        if self.idle:
+            handle = self.idle.pop()
+        else:
+            handle = guestfs.GuestFS()
+            handle.launch()
+        self.fill()
+        return handle
+
+    def put(self, handle):
+        """Keep an appliance without disk images for later."""
+        if self.enabled() and len(self.idle) < CONF.libguestfs_pool_size:
+            self.idle.append(handle)
+        else:
+            _close(handle)
+
+    def disable(self):
+        LOG.warn(_("libguestfs does not support hot-plugging disk images, "
+                   "not keeping launched appliances"))
+        self.hotplug = False
+        while self.idle:
+            _close(self.idle.pop())
+
+    def new_label(self):
+        return 'nova%d' % self._labels.next()
+
+    def fill(self):
+        """Launch appliances in the background until the pool is full."""
+        missing = CONF.libguestfs_pool_size - len(self.idle) - self.launching
+        for _i in xrange(max(missing, 0)):
+            self.launching += 1
+            greenthread.spawn_n(self._launch)
+
+    def _launch(self):
+        try:
+            handle = guestfs.GuestFS()
+            # Launching blocks in libguestfs for as long as the appliance
+            # takes to boot
+            tpool.execute(handle.launch)
+        except RuntimeError, e:
+            LOG.warn(_("Failed to launch appliance %s"), e)
+            return
+        finally:
+            self.launching -= 1
+        self.put(handle)
+
+
+class InspectionCache(object):
+    """Mount points found by inspection, by base image.
+
+    Instances made from the same base image have the same filesystems,
+    so that inspect_os only runs once for all of them. The devices of
+    the disk image itself are remembered relative to it, since it is not
+    always the first disk of the appliance.
+    """
+
+    def __init__(self):
+        self.mounts = collections.OrderedDict()
+
+    def get(self, base, device):
+        mounts = self.mounts.get(base)
+        if mounts is None:
+            return None
+        return [(mountpoint, dev.replace(_DISK, device, 1))
+                for mountpoint, dev in mounts]
+
+    def set(self, base, device, mounts):
+        if CONF.libguestfs_inspect_cache_size <= 0:
+            return
+        self.mounts.pop(base, None)
+        while len(self.mounts) >= CONF.libguestfs_inspect_cache_size:
+            self.mounts.popitem(last=False)
+        self.mounts[base] = [
+            (mountpoint,
+             _DISK + dev[len(device):] if dev.startswith(device) else dev)
+            for mountpoint, dev in mounts]
+
+
+_pool = AppliancePool()
+_inspection_cache = InspectionCache()
+
 
 class VFSGuestFS(vfs.VFS):
 
@@ -41,6 +197,10 @@ class VFSGuestFS(vfs.VFS):
             guestfs = __import__('guestfs')
 
         self.handle = None
+        # Device of the disk image in the appliance
+        self.device = '/dev/sda'
+        # Label of the disk image when it was hot-plugged
+        self.label = None
 
     def setup_os(self):
         if self.partition == -1:
@@ -53,11 +213,22 @@ class VFSGuestFS(vfs.VFS):
                   {'imgfile': self.imgfile, 'part': str(self.partition)})
 
         if self.partition:
-            self.handle.mount_options("", "/dev/sda%d" % self.partition, "/")
+            self.handle.mount_options("", "%s%d" % (self.device,
+                                                    self.partition), "/")
         else:
-            self.handle.mount_options("", "/dev/sda", "/")
+            self.handle.mount_options("", self.device, "/")
 
     def setup_os_inspect(self):
+        base = _backing_file(self.imgfile)
+        if base is not None:
+            mounts = _inspection_cache.get(base, self.device)
+            if mounts is not None:
+                LOG.debug(_("Using the inspection of %(base)s for "
+                            "%(imgfile)s"),
+                          {'base': base, 'imgfile': self.imgfile})
+                self.mount_all(mounts)
+                return
+
         LOG.debug(_("Inspecting guest OS image %s"), self.imgfile)
         roots = self.handle.inspect_os()
 
@@ -71,7 +242,9 @@ class VFSGuestFS(vfs.VFS):
                 _("Multi-boot operating system found in %s"),
                 self.imgfile)
 
-        self.setup_os_root(roots[0])
+        mounts = self.setup_os_root(roots[0])
+        if base is not None:
+            _inspection_cache.set(base, self.device, mounts)
 
     def setup_os_root(self, root):
         LOG.debug(_("Inspecting guest OS root filesystem %s"), root)
@@ -82,20 +255,54 @@ class VFSGuestFS(vfs.VFS):
                 _("No mount points found in %(root)s of %(imgfile)s") %
                 {'root': root, 'imgfile': self.imgfile})
 
-        mounts.sort(key=lambda mount: mount[1])
+        self.mount_all(mounts)
+        return mounts
+
+    def mount_all(self, mounts):
+        mounts = sorted(mounts, key=lambda mount: mount[1])
         for mount in mounts:
             LOG.debug(_("Mounting %(dev)s at %(dir)s") %
                       {'dev': mount[1], 'dir': mount[0]})
             self.handle.mount_options("", mount[1], mount[0])
 
+    def setup_pooled(self):
+        """Hot-plug the disk image into a pooled appliance.
+
+        Returns False if there is no pool.
+        """
+        handle = _pool.get()
+        if handle is None:
+            return False
+
+        label = _pool.new_label()
+        try:
+            handle.add_drive_opts(self.imgfile, format=self.imgfmt,
+                                  label=label)
+        except RuntimeError, e:
+            LOG.debug(_("Failed to hot-plug %(imgfile)s (%(e)s)") %
+                      {'imgfile': self.imgfile, 'e': e})
+            _close(handle)
+            _pool.disable()
+            return False
+
+        self.handle = handle
+        self.label = label
+        self.device = dict(handle.list_disk_labels())[label]
+        # Volume groups are only activated by launch
+        handle.vgscan()
+        handle.vg_activate_all(True)
+        return True
+
     def setup(self):
         LOG.debug(_("Setting up appliance for %(imgfile)s %(imgfmt)s") %
                   {'imgfile': self.imgfile, 'imgfmt': self.imgfmt})
-        self.handle = guestfs.GuestFS()
 
         try:
-            self.handle.add_drive_opts(self.imgfile, format=self.imgfmt)
-            self.handle.launch()
+            if not self.setup_pooled():
+                self.device = '/dev/sda'
+                self.handle = guestfs.GuestFS()
+                self.handle.add_drive_opts(self.imgfile, format=self.imgfmt)
+                self.handle.launch()
 
             self.setup_os()
 
@@ -103,16 +310,43 @@ class VFSGuestFS(vfs.VFS):
         except RuntimeError, e:
             # dereference object and implicitly close()
             self.handle = None
+            self.label = None
             raise exception.NovaException(
                 _("Error mounting %(imgfile)s with libguestfs (%(e)s)") %
                 {'imgfile': self.imgfile, 'e': e})
         except Exception:
             self.handle = None
+            self.label = None
             raise
 
+    def teardown_pooled(self):
+        """Remove the disk image and give the appliance back to the pool."""
+        try:
+            try:
+                self.handle.aug_close()
+            except RuntimeError, e:
+                LOG.warn(_("Failed to close augeas %s"), e)
+
+            self.handle.umount_all()
+            self.handle.vg_activate_all(False)
+            self.handle.remove_drive(self.label)
+        except RuntimeError, e:
+            LOG.warn(_("Failed to remove %(imgfile)s from appliance "
+                       "(%(e)s)") % {'imgfile': self.imgfile, 'e': e})
+            _close(self.handle)
+        else:
+            _pool.put(self.handle)
+        finally:
+            self.handle = None
+            self.label = None
+
     def teardown(self):
         LOG.debug(_("Tearing down appliance"))
 
+        if self.label is not None:
+            self.teardown_pooled()
+            return
+
         try:
             try:
                 self.handle.aug_close()
@@ -21,8 +21,12 @@
 Handling of VM disk images.
 """
 
+import hashlib
+import hmac
 import os
+import random
 import re
+import urllib2
 
 from nova import exception
 from nova.image import glance
@@ -37,6 +41,31 @@ image_opts = [
     cfg.BoolOpt('force_raw_images',
                 default=True,
                 help='Force backing images to raw format'),
+    cfg.IntOpt('image_fetch_buffer_size',
+               default=4 * 1024 * 1024,
+               help='Downloaded images are written to disk in multiples of '
+                    'this many bytes. Should be a multiple of the page '
+                    'size'),
+    cfg.BoolOpt('image_fetch_preallocate',
+                default=False,
+                help='Preallocate disk space for downloaded images with '
+                     'fallocate before writing them'),
+    cfg.ListOpt('image_mirror_servers',
+                default=[],
+                help='A list of image mirrors (http://host:port) to try, in '
+                     'random order, before downloading an image from glance. '
+                     'Images fetched from a mirror are verified against the '
+                     'checksum glance has for them'),
+    cfg.IntOpt('image_mirror_timeout',
+               default=30,
+               help='Seconds to wait for an image mirror to respond'),
+    cfg.StrOpt('image_mirror_secret',
+               default=None,
+               help='Secret shared by the image mirrors and the hosts '
+                    'fetching from them. Requests are signed with it, '
+                    'mirrors refuse unsigned ones and do not run without '
+                    'it',
+               secret=True),
 ]
 
 CONF = cfg.CONF
@@ -190,21 +219,179 @@ def convert_image(source, dest, out_format):
     utils.execute(*cmd)
 
 
+class ImageWriter(object):
+    """File-like object that checksums image data and writes it in bulk.
+
+    Image services hand out image data in small pieces. They are gathered
+    and written out in multiples of buffer_size, and the md5 glance keeps
+    for the image as well as the sha1 the image cache keeps for base files
+    are computed as the data streams through, so the downloaded file never
+    has to be read back to be verified.
+    """
+
+    def __init__(self, image_file, buffer_size):
+        self.image_file = image_file
+        self.buffer_size = max(buffer_size, 1)
+        self.md5 = hashlib.md5()
+        self.sha1 = hashlib.sha1()
+        self.size = 0
+        self._pending = []
+        self._pending_size = 0
+
+    def write(self, data):
+        self.md5.update(data)
+        self.sha1.update(data)
+        self.size += len(data)
+        self._pending.append(data)
+        self._pending_size += len(data)
+        if self._pending_size >= self.buffer_size:
+            self._write_pending(aligned=True)
+
+    def _write_pending(self, aligned=False):
+        data = ''.join(self._pending)
+        length = len(data)
+        if aligned:
+            length -= length % self.buffer_size
+        self.image_file.write(buffer(data, 0, length))
+        self._pending = [data[length:]] if length < len(data) else []
+        self._pending_size = len(data) - length
+
+    def flush(self):
+        if self._pending:
+            self._write_pending()
+        self.image_file.flush()
+
+
+def _preallocate(path, size):
+    """Reserve size bytes on disk for path, if the filesystem allows it."""
+    try:
+        utils.execute('fallocate', '-n', '-l', size, path)
+    except exception.ProcessExecutionError:
+        LOG.debug(_("Unable to preallocate %(size)s bytes for %(path)s"),
+                  {'size': size, 'path': path})
+
+
+def _write_image(path, image_meta, download):
+    """Stream an image into path with download(writer) and verify it.
+
+    Returns the ImageWriter the data was written through.
+    """
+    with utils.remove_path_on_error(path):
+        with open(path, "wb") as image_file:
+            if CONF.image_fetch_preallocate and image_meta.get('size'):
+                _preallocate(path, image_meta['size'])
+            writer = ImageWriter(image_file, CONF.image_fetch_buffer_size)
+            download(writer)
+            writer.flush()
+
+        expected = image_meta.get('checksum')
+        actual = writer.md5.hexdigest()
+        if expected and expected != actual:
+            raise exception.ImageUnacceptable(image_id=image_meta.get('id'),
+                reason=_("checksum %(actual)s does not match the expected "
+                         "checksum %(expected)s") % locals())
+    return writer
+
+
+def mirror_signature(image_id, checksum):
+    """Sign a request for an image from an image mirror."""
+    return hmac.new(CONF.image_mirror_secret or '',
+                    '%s:%s' % (image_id, checksum),
+                    hashlib.sha256).hexdigest()
+
+
+def _download_from_mirror(mirror, image_meta, writer):
+    url = '%s/images/%s?checksum=%s' % (mirror.rstrip('/'),
+                                         image_meta['id'],
+                                         image_meta['checksum'])
+    request = urllib2.Request(url, headers={
+        'X-Image-Mirror-Signature': mirror_signature(image_meta['id'],
+                                                     image_meta['checksum'])})
+    response = urllib2.urlopen(request, timeout=CONF.image_mirror_timeout)
+    try:
+        for chunk in iter(lambda: response.read(CONF.image_fetch_buffer_size),
+                          ''):
+            writer.write(chunk)
+    finally:
+        response.close()
+
+
+def _fetch_from_mirrors(image_meta, path):
+    """Try to fetch an image from the configured image mirrors.
+
+    Returns the ImageWriter the image was written through, or None if no
+    mirror could provide it.
+    """
+    # Without a checksum from glance there is nothing to verify the data
+    # served by a mirror against.
+    if not image_meta.get('checksum'):
+        return None
+
+    # Mirrors refuse unsigned requests
+    if not CONF.image_mirror_secret:
+        LOG.warn(_("image_mirror_secret is not set, not fetching images "
+                   "from the image mirrors"))
+        return None
+
+    mirrors = list(CONF.image_mirror_servers)
+    random.shuffle(mirrors)
+    for mirror in mirrors:
+        if '//' not in mirror:
+            mirror = 'http://' + mirror
+        download = lambda writer: _download_from_mirror(mirror, image_meta,
+                                                        writer)
+        try:
+            writer = _write_image(path, image_meta, download)
+        except urllib2.HTTPError as e:
+            LOG.debug(_("Image mirror %(mirror)s does not have image "
+                        "%(image_id)s: %(error)s"),
+                      {'mirror': mirror, 'image_id': image_meta['id'],
+                       'error': e})
+        except Exception as e:
+            LOG.warn(_("Unable to fetch image %(image_id)s from image "
+                       "mirror %(mirror)s: %(error)s"),
+                     {'mirror': mirror, 'image_id': image_meta['id'],
+                      'error': e})
+        else:
+            LOG.info(_("Fetched image %(image_id)s from image mirror "
+                       "%(mirror)s"),
+                     {'mirror': mirror, 'image_id': image_meta['id']})
+            return writer
+    return None
+
+
 def fetch(context, image_href, path, _user_id, _project_id):
+    """Download an image to path, verifying it against glance's checksum.
+
+    Image mirrors are tried first, glance is used if none of them has the
+    image. Returns a dict with the md5 and sha1 hex digests of the data.
+    """
     # TODO(vish): Improve context handling and add owner and auth data
     #             when it is added to glance.  Right now there is no
     #             auth checking in glance, so we assume that access was
     #             checked before we got here.
     (image_service, image_id) = glance.get_remote_image_service(context,
                                                                 image_href)
-    with utils.remove_path_on_error(path):
-        with open(path, "wb") as image_file:
-            image_service.download(context, image_id, image_file)
+    image_meta = image_service.show(context, image_id)
+
+    writer = None
+    if CONF.image_mirror_servers:
+        writer = _fetch_from_mirrors(image_meta, path)
+    if writer is None:
+        download = lambda writer: image_service.download(context, image_id,
+                                                         writer)
+        writer = _write_image(path, image_meta, download)
+    return {'md5': writer.md5.hexdigest(), 'sha1': writer.sha1.hexdigest()}
 
 
 def fetch_to_raw(context, image_href, path, user_id, project_id):
+    """Download an image to path, converting it to raw if needed.
+
+    Returns the checksums returned by fetch when the image was stored as
+    downloaded, or None when it had to be converted.
+    """
     path_tmp = "%s.part" % path
-    fetch(context, image_href, path_tmp, user_id, project_id)
+    checksums = fetch(context, image_href, path_tmp, user_id, project_id)
 
     with utils.remove_path_on_error(path_tmp):
         data = qemu_img_info(path_tmp)
@@ -225,6 +412,7 @@ def fetch_to_raw(context, image_href, path, user_id, project_id):
             LOG.debug("%s was %s, converting to raw" % (image_href, fmt))
             with utils.remove_path_on_error(staged):
                 convert_image(path_tmp, staged, 'raw')
+                os.unlink(path_tmp)
 
                 data = qemu_img_info(staged)
                 if data.file_format != "raw":
@@ -233,6 +421,8 @@ def fetch_to_raw(context, image_href, path, user_id, project_id):
                         data.file_format)
 
                 os.rename(staged, path)
+            return None
 
         else:
             os.rename(path_tmp, path)
+            return checksums
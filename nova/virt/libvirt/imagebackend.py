@@ -26,6 +26,7 @@ from nova.openstack.common import lockutils
 from nova import utils
 from nova.virt.disk import api as disk
 from nova.virt.libvirt import config as vconfig
+from nova.virt.libvirt import imagecache
 from nova.virt.libvirt import snapshots
 from nova.virt.libvirt import utils as libvirt_utils
 
@@ -48,6 +49,7 @@ __imagebackend_opts = [
 CONF = cfg.CONF
 CONF.register_opts(__imagebackend_opts)
 CONF.import_opt('base_dir_name', 'nova.virt.libvirt.imagecache')
+CONF.import_opt('checksum_base_images', 'nova.virt.libvirt.imagecache')
 
 
 class Image(object):
@@ -110,7 +112,10 @@ class Image(object):
         Synchronizes on template fetching.
 
         :fetch_func: Function that creates the base image
-                     Should accept `target` argument.
+                     Should accept `target` argument. It may return a
+                     dict with the md5 and sha1 checksums of the image it
+                     downloaded, which are recorded for the image cache
+                     manager and the image mirror.
         :filename: Name of the file in the image directory
         :size: Size of created image in bytes (optional)
         """
@@ -118,7 +123,13 @@ class Image(object):
                                 lock_path=self.lock_path)
         def call_if_not_exists(target, *args, **kwargs):
             if not os.path.exists(target):
-                fetch_func(target=target, *args, **kwargs)
+                checksums = fetch_func(target=target, *args, **kwargs)
+                if checksums:
+                    imagecache.write_stored_info(target, field='md5',
+                                                 value=checksums['md5'])
+                    if CONF.checksum_base_images:
+                        imagecache.write_stored_checksum(target,
+                                                         checksums['sha1'])
 
         base_dir = os.path.join(CONF.instances_path, CONF.base_dir_name)
         if not os.path.exists(base_dir):
@@ -202,11 +202,16 @@ def read_stored_checksum(target, timestamped=True):
     return read_stored_info(target, field='sha1', timestamped=timestamped)
 
 
-def write_stored_checksum(target):
-    """Write a checksum to disk for a file in _base."""
+def write_stored_checksum(target, checksum=None):
+    """Write a checksum to disk for a file in _base.
 
-    with open(target, 'r') as img_file:
-        checksum = utils.hash_file(img_file)
+    If the checksum is already known, for example because it was computed
+    while the file was downloaded, the file is not read again.
+    """
+
+    if checksum is None:
+        with open(target, 'r') as img_file:
+            checksum = utils.hash_file(img_file)
     write_stored_info(target, field='sha1', value=checksum)
 
 
@@ -0,0 +1,135 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Image mirror serving base images to other compute hosts.
+
+A compute host (or a dedicated cache host sharing instances_path with one)
+that already has an image in _base can hand it out to its peers, which
+list it in their image_mirror_servers, instead of every host pulling the
+same image from glance. Only base files that were stored exactly as
+downloaded are served, and only when the checksum requested by the peer
+matches the one glance had for the image; the peer verifies the data it
+receives against that checksum as well.
+
+    GET /images/<image_id>?checksum=<md5 from glance>
+    X-Image-Mirror-Signature: <see nova.virt.images.mirror_signature>
+
+Images are served over plain HTTP, to the hosts that sign their requests
+with image_mirror_secret. The signature only proves that the peer knows
+the secret: anybody able to watch the traffic can read the images, and
+replay the requests, so the mirror should only listen on a management
+network.
+"""
+
+import hashlib
+import os
+
+import webob.dec
+import webob.exc
+
+from nova import exception
+from nova.openstack.common import cfg
+from nova.openstack.common import log as logging
+from nova import utils
+from nova.virt import images
+from nova.virt.libvirt import imagecache
+from nova import wsgi
+
+
+image_mirror_opts = [
+    cfg.StrOpt('image_mirror_listen',
+               default='$my_ip',
+               help='IP address for the image mirror to listen on. Images '
+                    'are served over plain HTTP to whoever knows '
+                    'image_mirror_secret, keep this on a management '
+                    'network'),
+    cfg.IntOpt('image_mirror_listen_port',
+               default=9393,
+               help='port for the image mirror to listen'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(image_mirror_opts)
+CONF.import_opt('base_dir_name', 'nova.virt.libvirt.imagecache')
+CONF.import_opt('instances_path', 'nova.compute.manager')
+CONF.import_opt('image_fetch_buffer_size', 'nova.virt.images')
+CONF.import_opt('image_mirror_secret', 'nova.virt.images')
+CONF.import_opt('my_ip', 'nova.netconf')
+
+LOG = logging.getLogger(__name__)
+
+
+def get_wsgi_server():
+    if not CONF.image_mirror_secret:
+        raise exception.NovaException(
+            _("image_mirror_secret must be set to run an image mirror"))
+    base_dir = os.path.join(CONF.instances_path, CONF.base_dir_name)
+    return wsgi.Server("Image mirror",
+                       ImageMirrorApplication(base_dir),
+                       port=CONF.image_mirror_listen_port,
+                       host=CONF.image_mirror_listen)
+
+
+def _file_iter(path, chunk_size):
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), ''):
+            yield chunk
+
+
+class ImageMirrorApplication(object):
+    """Serves unconverted base images out of a _base directory."""
+
+    def __init__(self, base_dir):
+        self.base_dir = base_dir
+
+    @webob.dec.wsgify
+    def __call__(self, req):
+        if req.method != 'GET':
+            raise webob.exc.HTTPMethodNotAllowed()
+
+        parts = req.path_info.strip('/').split('/')
+        if len(parts) != 2 or parts[0] != 'images' or not parts[1]:
+            raise webob.exc.HTTPNotFound()
+        image_id = parts[1]
+        checksum = req.params.get('checksum')
+
+        signature = req.headers.get('X-Image-Mirror-Signature')
+        if (not CONF.image_mirror_secret or not signature or
+                not utils.strcmp_const_time(
+                    signature, images.mirror_signature(image_id, checksum))):
+            raise webob.exc.HTTPForbidden()
+
+        # Base files are named after the sha1 of the image id, see
+        # LibvirtDriver._create_image.
+        base_file = os.path.join(self.base_dir,
+                                 hashlib.sha1(image_id).hexdigest())
+        if not checksum or not os.path.exists(base_file):
+            raise webob.exc.HTTPNotFound()
+
+        # The md5 is only recorded for base files that were not converted
+        # after being downloaded, so this also guarantees that the file is
+        # byte for byte what glance has.
+        stored_checksum = imagecache.read_stored_info(base_file, field='md5')
+        if stored_checksum != checksum:
+            raise webob.exc.HTTPNotFound()
+
+        LOG.debug(_("Serving image %(image_id)s from %(base_file)s"),
+                  locals())
+        resp = webob.Response(content_type='application/octet-stream')
+        resp.app_iter = _file_iter(base_file, CONF.image_fetch_buffer_size)
+        resp.content_length = os.path.getsize(base_file)
+        return resp
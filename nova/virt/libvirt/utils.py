@@ -27,6 +27,7 @@ from nova import exception
 from nova.openstack.common import cfg
 from nova.openstack.common import log as logging
 from nova import utils
+from nova.virt.disk import sparsecopy
 from nova.virt import images
 
 libvirt_opts = [
@@ -324,11 +325,11 @@ def copy_image(src, dest, host=None):
     """
 
     if not host:
-        # We shell out to cp because that will intelligently copy
-        # sparse files.  I.E. holes will not be written to DEST,
-        # rather recreated efficiently.  In addition, since
-        # coreutils 8.11, holes can be read efficiently too.
-        execute('cp', src, dest)
+        # The holes of src are not read, and neither they nor its runs
+        # of zeros are written to dest, which is left sparse.
+        if os.path.isdir(dest):
+            dest = os.path.join(dest, os.path.basename(src))
+        sparsecopy.copy(src, dest)
     else:
         dest = "%s:%s" % (host, dest)
         # Try rsync first as that can compress and create sparse dest files.
@@ -510,8 +511,13 @@ def get_fs_info(path):
 
 
 def fetch_image(context, target, image_id, user_id, project_id):
-    """Grab image."""
-    images.fetch_to_raw(context, image_id, target, user_id, project_id)
+    """Grab image.
+
+    Returns the md5 and sha1 checksums of target if they were computed
+    while fetching.
+    """
+    return images.fetch_to_raw(context, image_id, target, user_id,
+                               project_id)
 
 
 def get_instance_path(instance):
@@ -53,6 +53,7 @@ from nova.virt import driver
 from nova.virt.xenapi import host
 from nova.virt.xenapi import pool
 from nova.virt.xenapi import pool_states
+from nova.virt.xenapi import record_cache
 from nova.virt.xenapi import vm_utils
 from nova.virt.xenapi import vmops
 from nova.virt.xenapi import volumeops
@@ -160,6 +161,9 @@ class XenAPIDriver(driver.ComputeDriver):
         except Exception:
             LOG.exception(_('Failure while cleaning up attached VDIs'))
 
+        if self._session.records is not None:
+            self._session.records.start()
+
     def list_instances(self):
         """List VM instances."""
         return self._vmops.list_instances()
@@ -621,10 +625,16 @@ class XenAPISession(object):
                                           "(is the Dom0 disk full?)"))
         url = self._create_first_session(url, user, pw, exception)
         self._populate_session_pool(url, user, pw, exception)
+        self._url = url
+        self._user = user
+        self._pw = pw
         self.host_uuid = self._get_host_uuid()
         self.product_version, self.product_brand = \
             self._get_product_version_and_brand()
         self._virtapi = virtapi
+        self.records = None
+        if CONF.xenapi_record_cache:
+            self.records = record_cache.RecordCache(self)
 
     def _create_first_session(self, url, user, pw, exception):
         try:
@@ -686,6 +696,15 @@ class XenAPISession(object):
         host = self.get_xenapi_host()
         return self.call_xenapi('host.get_software_version', host)
 
+    def create_session(self):
+        """Return a new session, outside of the session pool."""
+        session = self._create_session(self._url)
+        exception = self.XenAPI.Failure(_("Unable to log in to XenAPI "
+                                          "(is the Dom0 disk full?)"))
+        with timeout.Timeout(CONF.xenapi_login_timeout, exception):
+            session.login_with_password(self._user, self._pw)
+        return session
+
     def get_session_id(self):
         """Return a string session_id.  Used for vnc consoles."""
         with self._get_session() as session:
@@ -707,8 +726,14 @@ class XenAPISession(object):
 
     def call_xenapi(self, method, *args):
         """Call the specified XenAPI method on a background thread."""
-        with self._get_session() as session:
-            return session.xenapi_request(method, args)
+        result = None
+        try:
+            with self._get_session() as session:
+                result = session.xenapi_request(method, args)
+                return result
+        finally:
+            if self.records is not None:
+                self.records.changed(method, args, result)
 
     def call_plugin(self, plugin, fn, args):
         """Call host.call_plugin on a background thread."""
@@ -759,6 +784,11 @@ class XenAPISession(object):
             raise
 
     def get_rec(self, record_type, ref):
+        if self.records is not None and record_type in record_cache.CLASSES:
+            rec = self.records.get(record_type, ref)
+            if rec is not None:
+                return rec
+
         try:
             return self.call_xenapi('%s.get_record' % record_type, ref)
         except self.XenAPI.Failure, e:
@@ -774,7 +804,13 @@ class XenAPISession(object):
         the `get_all` call and the `get_record` call.
         """
 
-        for ref in self.call_xenapi('%s.get_all' % record_type):
+        refs = None
+        if self.records is not None and record_type in record_cache.CLASSES:
+            refs = self.records.refs(record_type)
+        if refs is None:
+            refs = self.call_xenapi('%s.get_all' % record_type)
+
+        for ref in refs:
             rec = self.get_rec(record_type, ref)
             # Check to make sure the record still exists. It may have
             # been deleted between the get_all call and get_record call
@@ -50,6 +50,7 @@
 A fake XenAPI SDK.
 """
 
+import copy
 import pickle
 import random
 import uuid
@@ -68,6 +69,9 @@ _CLASSES = ['host', 'network', 'session', 'pool', 'SR', 'VBD',
 
 _db_content = {}
 
+# Records returned by event.from, by the token it returned with them
+_event_snapshots = {}
+
 LOG = logging.getLogger(__name__)
 
 
@@ -80,6 +84,7 @@ def log_db_contents(msg=None):
 def reset():
     for c in _CLASSES:
         _db_content[c] = {}
+    _event_snapshots.clear()
     host = create_host('fake')
     create_vm('fake',
               'Running',
@@ -666,6 +671,36 @@ class SessionBase(object):
     def network_get_all_records_where(self, _1, filter):
         return self.xenapi.network.get_all_records()
 
+    def event_from(self, _1, classes, token, timeout):
+        """Return the records changed since token was returned.
+
+        Unlike XenAPI, it does not wait for changes.
+        """
+        old = _event_snapshots.pop(token, {})
+        snapshot = {}
+        events = []
+        for cls in _CLASSES:
+            if cls.lower() not in classes:
+                continue
+            records = snapshot[cls] = copy.deepcopy(_db_content[cls])
+            old_records = old.get(cls, {})
+            for ref, rec in records.iteritems():
+                if ref not in old_records:
+                    operation = 'add'
+                elif rec != old_records[ref]:
+                    operation = 'mod'
+                else:
+                    continue
+                events.append({'class': cls.lower(), 'operation': operation,
+                               'ref': ref, 'snapshot': copy.deepcopy(rec)})
+            for ref in old_records:
+                if ref not in records:
+                    events.append({'class': cls.lower(), 'operation': 'del',
+                                   'ref': ref})
+        token = str(uuid.uuid4())
+        _event_snapshots[token] = snapshot
+        return {'events': events, 'valid_ref_counts': {}, 'token': token}
+
     def xenapi_request(self, methodname, params):
         if methodname.startswith('login'):
             self._login(methodname, params)
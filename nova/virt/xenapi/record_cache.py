@@ -0,0 +1,176 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Local copies of the VM, VBD and VIF records of the pool.
+
+The copies are kept up to date with event.from, on a session of their own
+so that waiting for events does not hold one of the session pool. Its
+first call returns every record, the following ones the records changed
+since the token the previous call returned.
+
+A record changed through the session itself is stale until the events of
+a call to event.from made after the change have been applied: until then
+it is fetched from XenAPI, as are the records the cache does not have.
+"""
+
+from eventlet import greenthread
+
+from nova.openstack.common import cfg
+from nova.openstack.common import log as logging
+
+LOG = logging.getLogger(__name__)
+
+record_cache_opts = [
+    cfg.BoolOpt('xenapi_record_cache',
+                default=False,
+                help='Whether to keep the VM, VBD and VIF records of the '
+                     'pool up to date with XenAPI events, and read them '
+                     'from there rather than ask XenAPI for them'),
+    cfg.FloatOpt('xenapi_event_timeout',
+                 default=30.0,
+                 help='Number of seconds a call to event.from waits for '
+                      'events'),
+    ]
+
+CONF = cfg.CONF
+CONF.register_opts(record_cache_opts)
+
+CLASSES = ('VM', 'VBD', 'VIF')
+
+# Seconds to wait before getting all the records again after a failure
+RETRY_INTERVAL = 5
+
+
+class RecordCache(object):
+    """Records of the pool, updated from XenAPI events."""
+
+    def __init__(self, session):
+        self._session = session
+        self._event_session = None
+        self._token = ''
+        self._running = False
+        self.ready = False
+        self.records = dict((cls, {}) for cls in CLASSES)
+        # Number of calls to event.from made
+        self._calls = 0
+        # Refs changed through the session, with their class and the
+        # number of calls to event.from made before they were
+        self._stale = {}
+
+    def start(self):
+        if not self._running:
+            self._running = True
+            greenthread.spawn_n(self._run)
+
+    def stop(self):
+        self._running = False
+
+    def _run(self):
+        while self._running:
+            try:
+                self.poll()
+            except Exception:
+                LOG.exception(_('Failed to get XenAPI events'))
+                self.reset()
+                greenthread.sleep(RETRY_INTERVAL)
+
+    def reset(self):
+        """Forget the records, and get them all again."""
+        self.ready = False
+        self._token = ''
+        if self._event_session is not None:
+            try:
+                self._event_session.xenapi.session.logout()
+            except Exception:
+                pass
+            self._event_session = None
+
+    def poll(self):
+        """Wait for events, and apply them."""
+        if self._event_session is None:
+            self._event_session = self._session.create_session()
+
+        self._calls += 1
+        call = self._calls
+        result = self._event_session.xenapi_request(
+            'event.from', ([cls.lower() for cls in CLASSES], self._token,
+                           CONF.xenapi_event_timeout))
+
+        if not self._token:
+            for records in self.records.itervalues():
+                records.clear()
+        for event in result['events']:
+            self._apply(event)
+        self._token = result['token']
+        self._stale = dict((ref, (cls, calls))
+                           for ref, (cls, calls) in self._stale.iteritems()
+                           if calls >= call)
+        self.ready = True
+
+    def _apply(self, event):
+        cls = event['class'].upper()
+        if cls not in self.records:
+            return
+        if event['operation'] == 'del':
+            self.records[cls].pop(event['ref'], None)
+        elif 'snapshot' in event:
+            self.records[cls][event['ref']] = event['snapshot']
+
+    def changed(self, method, args, result):
+        """Mark the records a call to XenAPI may have changed stale."""
+        parts = method.split('.')
+        is_async = parts[0] == 'Async'
+        if is_async:
+            parts = parts[1:]
+        if (len(parts) != 2 or parts[0] not in CLASSES or
+                parts[1].startswith('get_')):
+            return
+
+        cls = parts[0]
+        refs = []
+        if args and isinstance(args[0], basestring):
+            refs.append((cls, args[0]))
+        elif args and isinstance(args[0], dict):
+            # Creating a VBD or a VIF changes its VM too
+            refs.append(('VM', args[0].get('VM')))
+        if not is_async and isinstance(result, basestring):
+            # The ref of a new record
+            refs.append((cls, result))
+        for cls, ref in refs:
+            if ref:
+                self._stale[ref] = (cls, self._calls)
+
+    def get(self, cls, ref):
+        """Return a copy of a record, or None if it is stale or unknown."""
+        if not self.ready or ref in self._stale:
+            return None
+        record = self.records[cls].get(ref)
+        if record is not None:
+            return dict(record)
+
+    def refs(self, cls):
+        """Return the refs of the records of a class, or None.
+
+        The refs include those of the stale records, some of which may
+        be new and some of which may no longer exist.
+        """
+        if not self.ready:
+            return None
+        refs = set(self.records[cls])
+        refs.update(ref for ref, (stale_cls, _calls) in self._stale.iteritems()
+                    if stale_cls == cls)
+        return list(refs)
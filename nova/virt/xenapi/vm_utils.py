@@ -46,6 +46,7 @@ from nova.openstack.common import log as logging
 from nova import utils
 from nova.virt import configdrive
 from nova.virt.disk import api as disk
+from nova.virt.disk import sparsecopy
 from nova.virt.disk.vfs import localfs as vfsimpl
 from nova.virt.xenapi import agent
 from nova.virt.xenapi import volume_utils
@@ -1345,8 +1346,9 @@ def set_vm_name_label(session, vm_ref, name_label):
 
 
 def list_vms(session):
+    host_ref = session.get_xenapi_host()
     for vm_ref, vm_rec in session.get_all_refs_and_recs('VM'):
-        if (vm_rec["resident_on"] != session.get_xenapi_host() or
+        if (vm_rec["resident_on"] != host_ref or
             vm_rec["is_a_template"] or vm_rec["is_control_domain"]):
             continue
         else:
@@ -1378,7 +1380,12 @@ def lookup_vm_vdis(session, vm_ref):
 
 def lookup(session, name_label):
     """Look the instance up and return it if available."""
-    vm_refs = session.call_xenapi("VM.get_by_name_label", name_label)
+    if session.records is not None and session.records.ready:
+        vm_refs = [vm_ref for vm_ref, vm_rec
+                   in session.get_all_refs_and_recs('VM')
+                   if vm_rec['name_label'] == name_label]
+    else:
+        vm_refs = session.call_xenapi("VM.get_by_name_label", name_label)
     n = len(vm_refs)
     if n == 0:
         return None
@@ -1978,9 +1985,11 @@ def _stream_disk(image_service_func, image_type, virtual_size, dev):
 
     dev_path = utils.make_dev_path(dev)
 
+    # The VDI was just created, so it reads back zeros where nothing is
+    # written
     with utils.temporary_chown(dev_path):
-        with open(dev_path, 'wb') as f:
-            f.seek(offset)
+        with sparsecopy.SparseFile(dev_path, offset,
+                                   sparse=CONF.xenapi_sparse_copy) as f:
             image_service_func(f)
 
 
@@ -2048,48 +2057,14 @@ def _resize_part_and_fs(dev, start, old_sectors, new_sectors):
     utils.execute('tune2fs', '-j', partition_path, run_as_root=True)
 
 
-def _sparse_copy(src_path, dst_path, virtual_size, block_size=4096):
+def _sparse_copy(src_path, dst_path, virtual_size):
     """Copy data, skipping long runs of zeros to create a sparse file."""
-    start_time = time.time()
-    EMPTY_BLOCK = '\0' * block_size
-    bytes_read = 0
-    skipped_bytes = 0
-    left = virtual_size
-
-    LOG.debug(_("Starting sparse_copy src=%(src_path)s dst=%(dst_path)s "
-                "virtual_size=%(virtual_size)d block_size=%(block_size)d"),
-              locals())
-
     # NOTE(sirp): we need read/write access to the devices; since we don't have
     # the luxury of shelling out to a sudo'd command, we temporarily take
     # ownership of the devices.
     with utils.temporary_chown(src_path):
         with utils.temporary_chown(dst_path):
-            with open(src_path, "r") as src:
-                with open(dst_path, "w") as dst:
-                    data = src.read(min(block_size, left))
-                    while data:
-                        if data == EMPTY_BLOCK:
-                            dst.seek(block_size, os.SEEK_CUR)
-                            left -= block_size
-                            bytes_read += block_size
-                            skipped_bytes += block_size
-                        else:
-                            dst.write(data)
-                            data_len = len(data)
-                            left -= data_len
-                            bytes_read += data_len
-
-                        if left <= 0:
-                            break
-
-                        data = src.read(min(block_size, left))
-
-    duration = time.time() - start_time
-    compression_pct = float(skipped_bytes) / bytes_read * 100
-
-    LOG.debug(_("Finished sparse_copy in %(duration).2f secs, "
-                "%(compression_pct).2f%% reduction in size"), locals())
+            sparsecopy.copy(src_path, dst_path, virtual_size)
 
 
 def _copy_partition(session, src_ref, dst_ref, partition, virtual_size):
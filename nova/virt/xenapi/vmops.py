@@ -1292,20 +1292,28 @@ class VMOps(object):
     def get_info(self, instance, vm_ref=None):
         """Return data about VM instance."""
         vm_ref = vm_ref or self._get_vm_opaque_ref(instance)
-        vm_rec = self._session.call_xenapi("VM.get_record", vm_ref)
+        vm_rec = self._get_vm_rec(instance, vm_ref)
         return vm_utils.compile_info(vm_rec)
 
     def get_diagnostics(self, instance):
         """Return data about VM diagnostics."""
         vm_ref = self._get_vm_opaque_ref(instance)
-        vm_rec = self._session.call_xenapi("VM.get_record", vm_ref)
+        vm_rec = self._get_vm_rec(instance, vm_ref)
         return vm_utils.compile_diagnostics(vm_rec)
 
+    def _get_vm_rec(self, instance, vm_ref):
+        vm_rec = self._session.get_rec("VM", vm_ref)
+        if vm_rec is None:
+            raise exception.NotFound(_('Could not find VM with name %s') %
+                                     instance['name'])
+        return vm_rec
+
     def _get_vif_device_map(self, vm_rec):
         vif_map = {}
-        for vif in [self._session.call_xenapi("VIF.get_record", vrec)
-                    for vrec in vm_rec['VIFs']]:
-            vif_map[vif['device']] = vif['MAC']
+        for vif_ref in vm_rec['VIFs']:
+            vif = self._session.get_rec("VIF", vif_ref)
+            if vif is not None:
+                vif_map[vif['device']] = vif['MAC']
         return vif_map
 
     def get_all_bw_counters(self):
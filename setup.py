@@ -60,11 +60,13 @@ setuptools.setup(name='nova',
                'bin/nova-console',
                'bin/nova-consoleauth',
                'bin/nova-dhcpbridge',
+               'bin/nova-image-mirror',
                'bin/nova-manage',
                'bin/nova-network',
                'bin/nova-novncproxy',
                'bin/nova-objectstore',
                'bin/nova-rootwrap',
+               'bin/nova-rootwrap-daemon',
                'bin/nova-scheduler',
                'bin/nova-spicehtml5proxy',
                'bin/nova-xvpvncproxy',
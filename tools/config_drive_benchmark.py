@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Compare the time taken to build a config drive.
+
+Builds the config drive of an instance with user data, a few injected
+files and both the openstack and ec2 metadata, in each format, in process
+and with the external tools (genisoimage, or mkfs and a loop mount as
+root for vfat) when they can be run.  Prints the time per drive.
+
+    tools/config_drive_benchmark.py [--drives N]
+"""
+
+import gettext
+import optparse
+import os
+import sys
+import time
+
+possible_topdir = os.path.normpath(os.path.join(os.path.abspath(sys.argv[0]),
+                                                os.pardir,
+                                                os.pardir))
+if os.path.exists(os.path.join(possible_topdir, 'nova', '__init__.py')):
+    sys.path.insert(0, possible_topdir)
+
+gettext.install('nova', unicode=1)
+
+from nova import config
+from nova import exception
+from nova.openstack.common import cfg
+from nova.openstack.common import jsonutils
+from nova import utils
+from nova.virt import configdrive
+
+CONF = cfg.CONF
+
+
+def drive_files():
+    meta_data = {'uuid': 'b5d8c9b2-4b8f-4a0c-9d3c-4a2b2c8f0a11',
+                 'hostname': 'server-1', 'name': 'server-1',
+                 'availability_zone': 'nova', 'launch_index': 0,
+                 'public_keys': {'mykey': 'ssh-rsa ' + 'A' * 372},
+                 'meta': dict(('key%d' % i, 'value%d' % i)
+                              for i in range(5)),
+                 'files': [{'path': '/etc/file%d' % i,
+                            'content_path': '/content/%04d' % i}
+                           for i in range(3)]}
+    ec2_meta_data = {'instance-id': 'i-00000001', 'hostname': 'server-1',
+                     'local-ipv4': '10.0.0.2', 'ami-id': 'ami-00000001',
+                     'reservation-id': 'r-abcdefgh',
+                     'block-device-mapping': {'ami': 'vda', 'root': 'vda'}}
+    user_data = '#!/bin/sh\n' + 'echo configuring\n' * 1000
+    files = []
+    for version in ('2012-08-10', 'latest'):
+        files.append(('openstack/%s/meta_data.json' % version,
+                      jsonutils.dumps(meta_data)))
+        files.append(('openstack/%s/user_data' % version, user_data))
+    for version in ('2009-04-04', 'latest'):
+        files.append(('ec2/%s/meta-data.json' % version,
+                      jsonutils.dumps(ec2_meta_data)))
+        files.append(('ec2/%s/user-data' % version, user_data))
+    for i in range(3):
+        files.append(('openstack/content/%04d' % i, 'x' * 4096))
+    return files
+
+
+def measure(drives, files, path):
+    start = time.time()
+    for _i in xrange(drives):
+        builder = configdrive.ConfigDriveBuilder()
+        try:
+            for filepath, data in files:
+                builder._add_file(filepath, data)
+            builder.make_drive(path)
+        finally:
+            builder.cleanup()
+    return (time.time() - start) / drives
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option('--drives', type='int', default=50,
+                      help='number of config drives to build in each run')
+    options, _args = parser.parse_args()
+
+    config.parse_args(sys.argv[:1])
+    files = drive_files()
+    with utils.tempdir() as tmpdir:
+        path = os.path.join(tmpdir, 'disk.config')
+        for drive_format in ('iso9660', 'vfat'):
+            CONF.set_override('config_drive_format', drive_format)
+            for external in (False, True):
+                CONF.set_override('config_drive_external_tools', external)
+                name = '%s %s' % (drive_format,
+                                  'external' if external else 'in process')
+                try:
+                    elapsed = measure(options.drives, files, path)
+                except (exception.ProcessExecutionError, OSError) as e:
+                    print '%-20s cannot be run: %s' % (name, e)
+                    continue
+                print '%-20s %8.2f ms per drive, %8d bytes written' % (
+                    name, elapsed * 1000, os.stat(path).st_blocks * 512)
+
+
+if __name__ == '__main__':
+    main()
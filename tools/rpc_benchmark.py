@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Benchmark rpc.call() round trips.
+
+Runs an echo server and client in one process on the kombu driver's
+in-memory transport (fake_rabbit), once declaring a reply queue per
+call and once with amqp_rpc_single_reply_queue, and prints the number
+of calls per second for each.  Pass --real to use the rabbit_* options
+from the config files instead of the in-memory transport.
+
+    tools/rpc_benchmark.py [--calls N] [--concurrency N] [--real]
+"""
+
+import eventlet
+eventlet.monkey_patch()
+
+import gettext
+import optparse
+import os
+import sys
+import time
+
+possible_topdir = os.path.normpath(os.path.join(os.path.abspath(sys.argv[0]),
+                                                os.pardir,
+                                                os.pardir))
+if os.path.exists(os.path.join(possible_topdir, 'nova', '__init__.py')):
+    sys.path.insert(0, possible_topdir)
+
+gettext.install('nova', unicode=1)
+
+from nova import config
+from nova import context
+from nova.openstack.common import cfg
+from nova.openstack.common import rpc
+from nova.openstack.common.rpc import dispatcher
+
+CONF = cfg.CONF
+TOPIC = 'rpc_benchmark'
+
+
+class EchoAPI(object):
+    RPC_API_VERSION = '1.0'
+
+    def echo(self, context, value):
+        return value
+
+
+def run_calls(calls, concurrency):
+    ctxt = context.get_admin_context()
+    msg = {'method': 'echo', 'args': {'value': 'x' * 100}}
+
+    def _call(_idx):
+        return rpc.call(ctxt, TOPIC, dict(msg))
+
+    pool = eventlet.GreenPool(concurrency)
+    start = time.time()
+    for _result in pool.imap(_call, xrange(calls)):
+        pass
+    return calls / (time.time() - start)
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option('--calls', type='int', default=2000,
+                      help='number of calls to make')
+    parser.add_option('--concurrency', type='int', default=10,
+                      help='number of calls in flight at a time')
+    parser.add_option('--real', action='store_true', default=False,
+                      help='use a real broker rather than fake_rabbit')
+    options, _args = parser.parse_args()
+
+    config.parse_args(sys.argv[:1])
+    CONF.set_override('rpc_backend', 'nova.openstack.common.rpc.impl_kombu')
+    CONF.set_override('fake_rabbit', not options.real)
+
+    server = rpc.create_connection(new=True)
+    server.create_consumer(TOPIC, dispatcher.RpcDispatcher([EchoAPI()]))
+    server.consume_in_thread()
+
+    for single_reply_queue in (False, True):
+        CONF.set_override('amqp_rpc_single_reply_queue', single_reply_queue)
+        # Warm up the connection pool (and the reply queue)
+        run_calls(options.concurrency, options.concurrency)
+        rate = run_calls(options.calls, options.concurrency)
+        print 'amqp_rpc_single_reply_queue=%-5s %8.1f calls/s' % (
+            single_reply_queue, rate)
+
+    server.close()
+    rpc.cleanup()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Compare the JSON and binary rpc envelopes.
+
+Encodes and decodes the reply to a conductor instance_update (an instance
+with its joined fields) the way it goes over the wire: the envelope is
+handed to the messaging library, which JSON encodes it.  Prints the time
+per message and the size on the wire of each format.
+
+    tools/rpc_serialization_benchmark.py [--messages N] [--compress N]
+"""
+
+import datetime
+import gettext
+import optparse
+import os
+import sys
+import time
+
+possible_topdir = os.path.normpath(os.path.join(os.path.abspath(sys.argv[0]),
+                                                os.pardir,
+                                                os.pardir))
+if os.path.exists(os.path.join(possible_topdir, 'nova', '__init__.py')):
+    sys.path.insert(0, possible_topdir)
+
+gettext.install('nova', unicode=1)
+
+from nova import config
+from nova.openstack.common import cfg
+from nova.openstack.common import jsonutils
+from nova.openstack.common.rpc import common as rpc_common
+
+CONF = cfg.CONF
+
+
+def fake_instance():
+    now = datetime.datetime(2013, 3, 1, 12, 30, 15, 123456)
+    instance = {
+        'id': 1, 'uuid': 'b5d8c9b2-4b8f-4a0c-9d3c-4a2b2c8f0a11',
+        'created_at': now, 'updated_at': now, 'launched_at': now,
+        'deleted_at': None, 'terminated_at': None, 'deleted': 0,
+        'user_id': 'fake-user', 'project_id': 'fake-project',
+        'image_ref': 'c6a1a4e2-1d0b-4b8e-8b43-6a2b0f3c9e12',
+        'kernel_id': '', 'ramdisk_id': '', 'hostname': 'server-1',
+        'host': 'compute-1', 'node': 'compute-1.example.org',
+        'launched_on': 'compute-1', 'instance_type_id': 2,
+        'memory_mb': 2048, 'vcpus': 1, 'root_gb': 20, 'ephemeral_gb': 0,
+        'vm_state': 'active', 'task_state': None, 'power_state': 1,
+        'display_name': 'server-1', 'display_description': 'server-1',
+        'availability_zone': 'nova', 'access_ip_v4': None,
+        'access_ip_v6': None, 'progress': 0, 'vm_mode': None,
+        'root_device_name': '/dev/vda', 'config_drive': '',
+        'security_groups': [{'id': 1, 'name': 'default', 'rules': [],
+                             'created_at': now, 'deleted': 0}],
+        'metadata': [{'key': 'key%d' % i, 'value': 'value%d' % i}
+                     for i in range(5)],
+        'system_metadata': [{'key': 'instance_type_%s' % key,
+                             'value': str(value)}
+                            for key, value in (('name', 'm1.small'),
+                                               ('memory_mb', 2048),
+                                               ('vcpus', 1),
+                                               ('root_gb', 20),
+                                               ('flavorid', 2))],
+        'info_cache': {'network_info': jsonutils.dumps([{
+            'id': 'port-%d' % i, 'address': 'fa:16:3e:00:00:%02x' % i,
+            'network': {'label': 'private', 'subnets': [{
+                'cidr': '10.0.0.0/24',
+                'ips': [{'address': '10.0.0.%d' % i, 'type': 'fixed'}]}]},
+            } for i in range(2)])},
+    }
+    return {'result': instance, 'failure': None,
+            '_msg_id': 'a5b7c1d4e8f94b2c9d0e1f2a3b4c5d6e'}
+
+
+def measure(messages, encode, decode):
+    msg = fake_instance()
+    start = time.time()
+    for _i in xrange(messages):
+        wire = encode(msg)
+    encode_time = (time.time() - start) / messages
+    start = time.time()
+    for _i in xrange(messages):
+        decode(wire)
+    decode_time = (time.time() - start) / messages
+    return encode_time, decode_time, len(wire)
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option('--messages', type='int', default=5000,
+                      help='number of messages to encode and decode')
+    parser.add_option('--compress', type='int', default=1024,
+                      help='rpc_compress_threshold of the compressed run')
+    options, _args = parser.parse_args()
+
+    config.parse_args(sys.argv[:1])
+    if rpc_common.msgpack is None:
+        sys.exit('msgpack is not installed')
+
+    def json_encode(msg):
+        # What the messaging library does with a message sent without
+        # the binary envelope
+        return jsonutils.dumps(msg)
+
+    def json_decode(wire):
+        return rpc_common.deserialize_msg(jsonutils.loads(wire))
+
+    def binary_encode(msg):
+        return jsonutils.dumps(rpc_common.serialize_msg(msg, binary=True))
+
+    runs = [('json', json_encode, json_decode, 0),
+            ('msgpack', binary_encode, json_decode, 0),
+            ('msgpack+zlib', binary_encode, json_decode, options.compress)]
+    for name, encode, decode, threshold in runs:
+        CONF.set_override('rpc_compress_threshold', threshold)
+        encode_time, decode_time, size = measure(options.messages,
+                                                 encode, decode)
+        print '%-13s encode %7.1f us  decode %7.1f us  %6d bytes' % (
+            name, encode_time * 1e6, decode_time * 1e6, size)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Benchmark the ZeroMQ rpc driver.
+
+Runs the ZeroMQ proxy (what nova-rpc-zmq-receiver runs), an echo server
+and a client in one process, with the IPC sockets in a temporary
+directory, and prints the number of casts and calls per second.  It runs
+once with rpc_zmq_socket_idle_timeout=0, which closes the outbound
+sockets between messages as before they were cached, and once with the
+default.
+
+    tools/rpc_zmq_benchmark.py [--messages N] [--concurrency N] [--port N]
+"""
+
+import eventlet
+eventlet.monkey_patch()
+
+import gettext
+import optparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+possible_topdir = os.path.normpath(os.path.join(os.path.abspath(sys.argv[0]),
+                                                os.pardir,
+                                                os.pardir))
+if os.path.exists(os.path.join(possible_topdir, 'nova', '__init__.py')):
+    sys.path.insert(0, possible_topdir)
+
+gettext.install('nova', unicode=1)
+
+from eventlet.green import zmq
+
+from nova import config
+from nova import context
+from nova.openstack.common import cfg
+from nova.openstack.common import rpc
+from nova.openstack.common.rpc import dispatcher
+from nova.openstack.common.rpc import impl_zmq
+
+CONF = cfg.CONF
+TOPIC = 'rpc_zmq_benchmark'
+
+
+class EchoAPI(object):
+    RPC_API_VERSION = '1.0'
+
+    def __init__(self):
+        self.casts = eventlet.queue.Queue()
+
+    def echo(self, context, value):
+        return value
+
+    def count(self, context):
+        self.casts.put(None)
+
+
+def run(send, messages, concurrency):
+    pool = eventlet.GreenPool(concurrency)
+    start = time.time()
+    for _result in pool.imap(send, xrange(messages)):
+        pass
+    return start
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option('--messages', type='int', default=2000,
+                      help='number of casts and of calls to make')
+    parser.add_option('--concurrency', type='int', default=10,
+                      help='number of messages in flight at a time')
+    parser.add_option('--port', type='int', default=19501,
+                      help='port of the proxy')
+    options, _args = parser.parse_args()
+
+    config.parse_args(sys.argv[:1])
+    ipc_dir = tempfile.mkdtemp()
+    CONF.set_override('rpc_backend', 'nova.openstack.common.rpc.impl_zmq')
+    CONF.set_override('rpc_zmq_ipc_dir', ipc_dir)
+    CONF.set_override('rpc_zmq_port', options.port)
+    CONF.set_override('rpc_zmq_host', 'localhost')
+
+    proxy = impl_zmq.ZmqProxy(CONF)
+    proxy.register(impl_zmq.InternalContext(None),
+                   'tcp://127.0.0.1:%d' % options.port, zmq.PULL,
+                   out_bind=True)
+    proxy.consume_in_thread()
+
+    api = EchoAPI()
+    server = rpc.create_connection(new=True)
+    server.create_consumer(TOPIC, dispatcher.RpcDispatcher([api]))
+    server.consume_in_thread()
+
+    ctxt = context.get_admin_context()
+    cast_msg = {'method': 'count', 'args': {}}
+    call_msg = {'method': 'echo', 'args': {'value': 'x' * 100}}
+
+    def _cast(_idx):
+        rpc.cast(ctxt, TOPIC, dict(cast_msg))
+
+    def _call(_idx):
+        return rpc.call(ctxt, TOPIC, dict(call_msg))
+
+    try:
+        # Let the proxy create its sockets
+        _cast(None)
+        api.casts.get()
+        _call(None)
+        for idle_timeout in (0, CONF.rpc_zmq_socket_idle_timeout):
+            CONF.set_override('rpc_zmq_socket_idle_timeout', idle_timeout)
+            start = run(_cast, options.messages, options.concurrency)
+            for _i in xrange(options.messages):
+                api.casts.get()
+            cast_rate = options.messages / (time.time() - start)
+            start = run(_call, options.messages, options.concurrency)
+            call_rate = options.messages / (time.time() - start)
+            print ('rpc_zmq_socket_idle_timeout=%-4d %8.1f casts/s '
+                   '%8.1f calls/s' % (idle_timeout, cast_rate, call_rate))
+    finally:
+        server.close()
+        proxy.close()
+        rpc.cleanup()
+        shutil.rmtree(ipc_dir)
+
+
+if __name__ == '__main__':
+    main()
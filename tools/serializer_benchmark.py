@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Benchmark the OpenStack API response serializers.
+
+Serializes a detailed server list, the way GET /servers/detail does,
+as XML (with a couple of extension templates attached, which is what
+happens on every request) and as JSON, and prints the time taken per
+response.
+
+    tools/serializer_benchmark.py [--servers N] [--repeat N]
+"""
+
+import datetime
+import gettext
+import optparse
+import os
+import sys
+import timeit
+
+possible_topdir = os.path.normpath(os.path.join(os.path.abspath(sys.argv[0]),
+                                                os.pardir,
+                                                os.pardir))
+if os.path.exists(os.path.join(possible_topdir, 'nova', '__init__.py')):
+    sys.path.insert(0, possible_topdir)
+
+gettext.install('nova', unicode=1)
+
+from nova.api.openstack.compute.contrib import disk_config
+from nova.api.openstack.compute.contrib import extended_status
+from nova.api.openstack.compute import servers
+from nova.api.openstack import wsgi
+
+
+def make_server(idx, created):
+    link = 'http://localhost/v2/fake/servers/%d' % idx
+    return {
+        'id': 'b6e6d6b3-00f4-4a29-9a33-%012d' % idx,
+        'name': 'server%d' % idx,
+        'user_id': 'fake_user',
+        'tenant_id': 'fake_tenant',
+        'created': created,
+        'updated': created,
+        'hostId': 'b9ff3ee2a7d4c8e5f2f5e4e9c3a7a0fc0c0a63e6e7e1f1c7a3a0c2d5',
+        'accessIPv4': '192.168.0.%d' % (idx % 256),
+        'accessIPv6': '',
+        'status': 'ACTIVE',
+        'progress': 100,
+        'image': {
+            'id': '10',
+            'links': [{'rel': 'bookmark',
+                       'href': 'http://localhost/fake/images/10'}],
+        },
+        'flavor': {
+            'id': '1',
+            'links': [{'rel': 'bookmark',
+                       'href': 'http://localhost/fake/flavors/1'}],
+        },
+        'metadata': {'key1': 'value1', 'key2': 'value2'},
+        'addresses': {
+            'private': [{'version': 4, 'addr': '10.0.0.%d' % (idx % 256)},
+                        {'version': 6, 'addr': 'fe80::%x' % idx}],
+        },
+        'links': [{'rel': 'self', 'href': link},
+                  {'rel': 'bookmark', 'href': link}],
+        'OS-EXT-STS:task_state': None,
+        'OS-EXT-STS:vm_state': 'active',
+        'OS-EXT-STS:power_state': 1,
+        'OS-DCF:diskConfig': 'AUTO',
+    }
+
+
+def serialize_xml(data):
+    serializer = servers.ServersTemplate()
+    serializer.attach(extended_status.ExtendedStatusesTemplate())
+    serializer.attach(disk_config.ServersDiskConfigTemplate())
+    return serializer.serialize(data)
+
+
+def serialize_json(data):
+    return wsgi.JSONDictSerializer().serialize(data)
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option('--servers', type='int', default=1000,
+                      help='number of servers in the response')
+    parser.add_option('--repeat', type='int', default=20,
+                      help='number of responses to serialize')
+    options, _args = parser.parse_args()
+
+    now = datetime.datetime.utcnow()
+    created = now.strftime('%Y-%m-%dT%H:%M:%SZ')
+    cases = [
+        ('xml', serialize_xml, created),
+        ('json', serialize_json, created),
+        ('json (datetimes)', serialize_json, now),
+    ]
+
+    print 'Serializing %d servers, %d times' % (options.servers,
+                                                options.repeat)
+    for name, func, created in cases:
+        data = {'servers': [make_server(idx, created)
+                            for idx in xrange(options.servers)]}
+        # Warm up: builds and compiles the templates
+        size = len(func(data))
+        elapsed = timeit.timeit(lambda: func(data), number=options.repeat)
+        print '%-18s %8.2f ms/response %10d bytes' % (
+            name, elapsed * 1000 / options.repeat, size)
+
+
+if __name__ == '__main__':
+    main()